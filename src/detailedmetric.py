@@ -1,6 +1,11 @@
-import json
+import argparse
 from datetime import datetime, timezone
 
+from workspace_metrics.loader import decode_export, get_created_at_str, get_hashable_workspace_id, parse_iso_datetime, read_export
+from workspace_metrics.memo import add_cache_argument, configure_from_args, memoize
+from workspace_metrics.profiling import NULL_PROFILER, add_profile_argument, profiler_from_args
+from workspace_metrics.results import ExportSummary, GrowthMetricsResult, NoDataError, render_processing_summary
+
 # --- Configuration ---
 JSON_FILE_PATH = "workspaces.json" # Make sure this points to p_msde_szr.workspaces_2.json for your run
 
@@ -10,110 +15,74 @@ START_OF_CURRENT_YEAR = datetime(2025, 1, 1, 0, 0, 0, tzinfo=timezone.utc)
 CURRENT_SNAPSHOT_DATE_CUTOFF = datetime(2025, 6, 3, 23, 59, 59, 999999, tzinfo=timezone.utc) # End of June 3rd
 # --- End Configuration ---
 
-def parse_iso_datetime(date_str):
-    if not date_str: return None
-    if date_str.endswith('Z'): date_str = date_str[:-1] + '+00:00'
-    try: return datetime.fromisoformat(date_str)
-    except ValueError:
-        try: return datetime.strptime(date_str, '%Y-%m-%dT%H:%M:%S.%f+00:00')
-        except ValueError:
-            try: return datetime.strptime(date_str, '%Y-%m-%dT%H:%M:%S+00:00')
-            except ValueError: return None
-
-def get_hashable_workspace_id(ws_id_value):
+def normalise_workspaces(data_objects):
     """
-    Ensures the workspace ID is hashable (e.g., string or number).
-    If it's a dict like {"$oid": "value"}, extracts "value".
+    (hashable workspaceId, raw workspaceId, created_at, archived) for every doc
+    with a parseable createdAt.$date.
+    Returns (records, missing createdAt count, date parse error count).
     """
-    if isinstance(ws_id_value, dict):
-        # Attempt common patterns, e.g., MongoDB's $oid
-        if "$oid" in ws_id_value:
-            return str(ws_id_value["$oid"])
-        # Add other patterns if your workspaceId dict has a different structure
-        # For now, if it's a dict and not recognized, we might return a string representation
-        # or raise an error, or return None. Returning None will skip it.
-        # print(f"Warning: workspaceId is a dictionary with unrecognized structure: {ws_id_value}")
-        return None # Or str(ws_id_value) if you want to try hashing the string form (less reliable for uniqueness)
-    elif ws_id_value is not None:
-        return str(ws_id_value) # Ensure it's a string if it's a number, etc.
-    return None
-
-
-def analyze_growth_metrics(file_path):
-    active_ws_end_prev_year = 0
-    active_ws_current_snapshot = 0
-    
-    new_ws_created_this_year_gross = 0
-    new_ws_created_this_year_and_active = 0
-    new_ws_created_this_year_and_archived = 0
-
-    ids_active_at_start_of_year = set()
-    ids_archived_by_snapshot_that_were_active_start_of_year = set()
-
-    processed_entries = 0
+    records = []
     missing_created_at_count = 0
     date_parse_errors_count = 0
-    json_line_parse_errors = 0
-    unhashable_id_skips = 0
+    for ws in data_objects:
+        raw_workspace_id_val = ws.get("workspaceId")
+        hashable_workspace_id = get_hashable_workspace_id(raw_workspace_id_val)
 
+        created_at_str = get_created_at_str(ws)
+        if not created_at_str:
+            missing_created_at_count += 1
+            continue
+        created_at_date = parse_iso_datetime(created_at_str)
+        if not created_at_date:
+            date_parse_errors_count += 1
+            continue
 
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            try:
-                data_objects = json.load(f)
-                if not isinstance(data_objects, list): data_objects = [data_objects]
-            except json.JSONDecodeError:
-                f.seek(0)
-                data_objects = []
-                for line_number, line in enumerate(f, 1): # Added line_number for better error reporting
-                    line = line.strip()
-                    if line:
-                        try: 
-                            data_objects.append(json.loads(line))
-                        except json.JSONDecodeError as e_line: 
-                            # print(f"Warning: Skipping invalid JSON on line {line_number}: {e_line}")
-                            json_line_parse_errors += 1
-        
-        if not data_objects and not json_line_parse_errors:
-            print("No data objects found.")
-            return
-        processed_entries = len(data_objects)
-
-        for ws in data_objects:
-            # --- MODIFICATION START ---
-            raw_workspace_id_val = ws.get("workspaceId")
-            hashable_workspace_id = get_hashable_workspace_id(raw_workspace_id_val)
-            # --- MODIFICATION END ---
-            
-            created_at_str = ws.get("createdAt", {}).get("$date")
-            if not created_at_str:
-                missing_created_at_count += 1
-                continue
-            created_at_date = parse_iso_datetime(created_at_str)
-            if not created_at_date:
-                date_parse_errors_count += 1
-                continue
-            
-            is_archived = ws.get("archived") is True
+        records.append((hashable_workspace_id, raw_workspace_id_val, created_at_date, ws.get("archived") is True))
+    return records, missing_created_at_count, date_parse_errors_count
 
+
+def compute_growth_metrics(file_path, profiler=NULL_PROFILER):
+    ids_active_at_start_of_year = set()
+    ids_archived_by_snapshot_that_were_active_start_of_year = set()
+
+    with profiler.stage("read"):
+        text = read_export(file_path)
+    with profiler.stage("decode") as stage:
+        data_objects, json_line_parse_errors = decode_export(text)
+        del text
+        stage.records = len(data_objects)
+    
+    if not data_objects and not json_line_parse_errors:
+        raise NoDataError(file_path)
+    summary = ExportSummary(processed_entries=len(data_objects), json_line_parse_errors=json_line_parse_errors)
+
+    with profiler.stage("normalise") as stage:
+        records, summary.missing_created_at, summary.date_parse_errors = normalise_workspaces(data_objects)
+        del data_objects
+        stage.records = len(records)
+
+    result = GrowthMetricsResult(summary)
+    with profiler.stage("aggregate") as stage:
+        stage.records = len(records)
+        for hashable_workspace_id, raw_workspace_id_val, created_at_date, is_archived in records:
             if created_at_date <= END_OF_PREVIOUS_YEAR_CUTOFF and not is_archived:
-                active_ws_end_prev_year += 1
+                result.active_end_prev_year += 1
                 # --- MODIFICATION ---
                 if hashable_workspace_id:
                     ids_active_at_start_of_year.add(hashable_workspace_id)
                 elif raw_workspace_id_val is not None: # It existed but wasn't hashable by our function
-                    unhashable_id_skips +=1
+                    result.unhashable_id_skips +=1
 
 
             if created_at_date <= CURRENT_SNAPSHOT_DATE_CUTOFF and not is_archived:
-                active_ws_current_snapshot += 1
+                result.active_current_snapshot += 1
             
             if START_OF_CURRENT_YEAR <= created_at_date <= CURRENT_SNAPSHOT_DATE_CUTOFF:
-                new_ws_created_this_year_gross += 1
+                result.created_this_year += 1
                 if not is_archived:
-                    new_ws_created_this_year_and_active += 1
+                    result.created_this_year_active += 1
                 else:
-                    new_ws_created_this_year_and_archived += 1
+                    result.created_this_year_archived += 1
             
             # --- MODIFICATION ---
             if hashable_workspace_id and hashable_workspace_id in ids_active_at_start_of_year and \
@@ -122,57 +91,65 @@ def analyze_growth_metrics(file_path):
             elif raw_workspace_id_val is not None and hashable_workspace_id is None and \
                  hashable_workspace_id in ids_active_at_start_of_year: # check if the original check would have triggered
                  # This case is less likely now due to hashable_id check first
-                 unhashable_id_skips +=1
-
-
-        net_growth_absolute_this_year = active_ws_current_snapshot - active_ws_end_prev_year
-        percentage_growth_this_year = 0
-        if active_ws_end_prev_year > 0:
-            percentage_growth_this_year = (net_growth_absolute_this_year / active_ws_end_prev_year) * 100
-        elif net_growth_absolute_this_year > 0:
-            percentage_growth_this_year = float('inf')
-
-        lost_previously_active_ws_count = len(ids_archived_by_snapshot_that_were_active_start_of_year)
-
-        print("\n--- Workspace Growth Metrics (Year 2025 up to June 3rd) ---")
-        # ... (rest of the print statements are the same) ...
-        print(f"Baseline: End of December 31, 2024")
-        print(f"Current Snapshot: June 3, 2025")
-        print("-----------------------------------------------------------------")
-        
-        print(f"\n1. Active Workspaces:")
-        print(f"   - At end of Dec 2024: {active_ws_end_prev_year}")
-        print(f"   - As at June 3, 2025: {active_ws_current_snapshot}")
-        
-        print(f"\n2. Net Growth in Active Workspaces (Jan 1, 2025 - June 3, 2025):")
-        print(f"   - Absolute Growth: {net_growth_absolute_this_year:+} active workspaces")
-        if percentage_growth_this_year == float('inf'):
-            print(f"   - Percentage Growth: N/A (started from 0, now have {active_ws_current_snapshot})")
-        else:
-            print(f"   - Percentage Growth: {percentage_growth_this_year:+.2f}%")
-
-        print(f"\n3. Workspace Creation & Archival This Year (Jan 1, 2025 - June 3, 2025):")
-        print(f"   - Total New Workspaces Created: {new_ws_created_this_year_gross}")
-        print(f"   - Of those, Currently Active: {new_ws_created_this_year_and_active}")
-        print(f"   - Of those, Currently Archived: {new_ws_created_this_year_and_archived}")
-        
-        print(f"\n4. Workspace Attrition This Year (Jan 1, 2025 - June 3, 2025):")
-        print(f"   - Workspaces Active at Start of 2025 but Archived by June 3, 2025: {lost_previously_active_ws_count}")
-        print(f"     (Note: This indicates loss of workspaces that existed before 2025 or were created early in 2025 and then archived.)")
-        
-
-        print("\n--- Data Processing Summary ---")
-        print(f"- Total raw entries processed from file: {processed_entries}")
-        if json_line_parse_errors > 0:
-            print(f"- Lines skipped due to invalid JSON structure: {json_line_parse_errors}")
-        if missing_created_at_count > 0:
-            print(f"- Entries skipped due to missing 'createdAt.$date': {missing_created_at_count}")
-        if date_parse_errors_count > 0:
-            print(f"- Entries skipped due to 'createdAt.$date' parsing errors: {date_parse_errors_count}")
-        if unhashable_id_skips > 0:
-            print(f"- Workspace entries skipped for set operations due to unhashable/unrecognized 'workspaceId' structure: {unhashable_id_skips}")
+                 result.unhashable_id_skips +=1
 
+    result.lost_previously_active = len(ids_archived_by_snapshot_that_were_active_start_of_year)
+    return result
+
+
+def render_growth_metrics(result):
+    net_growth_absolute_this_year = result.net_growth
+    percentage_growth_this_year = 0
+    if result.active_end_prev_year > 0:
+        percentage_growth_this_year = (net_growth_absolute_this_year / result.active_end_prev_year) * 100
+    elif net_growth_absolute_this_year > 0:
+        percentage_growth_this_year = float('inf')
+
+    print("\n--- Workspace Growth Metrics (Year 2025 up to June 3rd) ---")
+    print(f"Baseline: End of December 31, 2024")
+    print(f"Current Snapshot: June 3, 2025")
+    print("-----------------------------------------------------------------")
+
+    print(f"\n1. Active Workspaces:")
+    print(f"   - At end of Dec 2024: {result.active_end_prev_year}")
+    print(f"   - As at June 3, 2025: {result.active_current_snapshot}")
+
+    print(f"\n2. Net Growth in Active Workspaces (Jan 1, 2025 - June 3, 2025):")
+    print(f"   - Absolute Growth: {net_growth_absolute_this_year:+} active workspaces")
+    if percentage_growth_this_year == float('inf'):
+        print(f"   - Percentage Growth: N/A (started from 0, now have {result.active_current_snapshot})")
+    else:
+        print(f"   - Percentage Growth: {percentage_growth_this_year:+.2f}%")
+
+    print(f"\n3. Workspace Creation & Archival This Year (Jan 1, 2025 - June 3, 2025):")
+    print(f"   - Total New Workspaces Created: {result.created_this_year}")
+    print(f"   - Of those, Currently Active: {result.created_this_year_active}")
+    print(f"   - Of those, Currently Archived: {result.created_this_year_archived}")
+
+    print(f"\n4. Workspace Attrition This Year (Jan 1, 2025 - June 3, 2025):")
+    print(f"   - Workspaces Active at Start of 2025 but Archived by June 3, 2025: {result.lost_previously_active}")
+    print(f"     (Note: This indicates loss of workspaces that existed before 2025 or were created early in 2025 and then archived.)")
+
+
+    render_processing_summary(result.summary)
+    if result.unhashable_id_skips > 0:
+        print(f"- Workspace entries skipped for set operations due to unhashable/unrecognized 'workspaceId' structure: {result.unhashable_id_skips}")
+
+
+def cached_result(file_path, profiler=NULL_PROFILER):
+    """compute_growth_metrics() memoized on the export's fingerprint and this script's configuration."""
+    config = (END_OF_PREVIOUS_YEAR_CUTOFF, START_OF_CURRENT_YEAR, CURRENT_SNAPSHOT_DATE_CUTOFF)
+    return memoize("detailedmetric", config, file_path, lambda: compute_growth_metrics(file_path, profiler))
+
+
+def analyze_growth_metrics(file_path, profiler=NULL_PROFILER):
+    try:
+        result = cached_result(file_path, profiler)
+        with profiler.stage("render"):
+            render_growth_metrics(result)
 
+    except NoDataError:
+        print("No data objects found.")
     except FileNotFoundError:
         print(f"Error: File not found at {file_path}")
     except Exception as e:
@@ -181,7 +158,15 @@ def analyze_growth_metrics(file_path):
         traceback.print_exc()
 
 if __name__ == "__main__":
-    # Get the script name for the file path if needed, or keep it hardcoded
-    # SCRIPT_NAME = "monthmetricscript.py" # Or whatever you named it
-    print(f"Analyzing workspace data from: {JSON_FILE_PATH}")
-    analyze_growth_metrics(JSON_FILE_PATH)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Active workspace growth and attrition for 2025 up to the snapshot date.")
+    parser.add_argument("file_path", nargs="?", default=JSON_FILE_PATH)
+    add_profile_argument(parser)
+    add_cache_argument(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+
+    profiler = profiler_from_args(args, "detailedmetric.py", args.file_path)
+    print(f"Analyzing workspace data from: {args.file_path}")
+    analyze_growth_metrics(args.file_path, profiler)
+    if args.profile:
+        profiler.emit(args.profile)
\ No newline at end of file
@@ -1,6 +1,11 @@
-import json
+import argparse
 from datetime import datetime, timedelta, timezone
-from collections import Counter # For eonid frequency
+
+from workspace_metrics.loader import decode_export, get_created_at_str, parse_iso_datetime, read_export
+from workspace_metrics.memo import add_cache_argument, configure_from_args, memoize
+from workspace_metrics.profiling import NULL_PROFILER, add_profile_argument, profiler_from_args
+from workspace_metrics.results import ExportSummary, NoDataError, SampledWorkspaceMetricsResult, WorkspaceMetricsResult
+from workspace_metrics.sampling import add_sample_arguments, render_sample_summary, sample_from_args
 
 # --- Configuration ---
 JSON_FILE_PATH = "workspaces.json"
@@ -20,23 +25,6 @@ P2_START = datetime(2024, 7, 1, 0, 0, 0, tzinfo=timezone.utc)
 P2_END = datetime(2024, 12, 31, 23, 59, 59, 999999, tzinfo=timezone.utc)
 # --- End Configuration ---
 
-def parse_iso_datetime(date_str):
-    if not date_str:
-        return None
-    if date_str.endswith('Z'):
-        date_str = date_str[:-1] + '+00:00'
-    try:
-        return datetime.fromisoformat(date_str)
-    except ValueError:
-        try:
-            return datetime.strptime(date_str, '%Y-%m-%dT%H:%M:%S.%f+00:00')
-        except ValueError:
-            try:
-                return datetime.strptime(date_str, '%Y-%m-%dT%H:%M:%S+00:00')
-            except ValueError:
-                # print(f"Warning: Could not parse date string: {date_str}") # Optional: more verbose logging
-                return None
-
 def get_comparison_text(current_val, previous_val, item_name="items"):
     if previous_val == 0:
         if current_val > 0:
@@ -57,173 +45,269 @@ def get_comparison_text(current_val, previous_val, item_name="items"):
     else:
         return f"Remained the same at {current_val}."
 
-def analyze_workspace_data(file_path):
-    all_workspace_ids = set()
-    
-    created_p1_count = 0
-    created_p2_count = 0
-    
-    archived_created_p1_count = 0 
-    archived_created_p2_count = 0
-
-    eonids_p1 = Counter()
-    eonids_p2 = Counter()
-    
-    instance_counts = Counter()
-    read_role_counts = Counter()
-    write_role_counts = Counter()
-    
-    processed_entries = 0
+def normalise_workspaces(data_objects):
+    """
+    One (workspaceId, instance, readRole, writeRole, eonid, created_at, archived)
+    tuple per doc; created_at is None when createdAt.$date is missing or unparseable.
+    Returns (records, missing createdAt count, date parse error count).
+    """
+    records = []
     missing_created_at_count = 0
     date_parse_errors_count = 0
-    json_line_parse_errors = 0
+    for ws in data_objects:
+        workspace_id = ws.get("workspaceId")
+        if workspace_id is not None:
+            workspace_id = str(workspace_id)
 
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            try:
-                data_objects = json.load(f)
-                if not isinstance(data_objects, list):
-                    data_objects = [data_objects]
-            except json.JSONDecodeError:
-                f.seek(0)
-                data_objects = []
-                for line_number, line in enumerate(f, 1):
-                    line = line.strip()
-                    if line:
-                        try:
-                            data_objects.append(json.loads(line))
-                        except json.JSONDecodeError as e_line:
-                            # print(f"Warning: Skipping invalid JSON on line {line_number}: {e_line}")
-                            json_line_parse_errors += 1
-        
-        if not data_objects and json_line_parse_errors == 0 and processed_entries == 0 :
-            print("No data objects found or successfully parsed from the file.")
-            return
-
-        processed_entries = len(data_objects)
-
-        for ws in data_objects:
-            workspace_id = ws.get("workspaceId")
-            if workspace_id is not None:
-                all_workspace_ids.add(str(workspace_id))
+        current_eonid = ws.get("eonid") # Can be number or string, or None
+        if current_eonid is not None:
+            current_eonid = str(current_eonid) # Standardize to string for Counter keys
+        else:
+            current_eonid = "Unknown"
 
-            instance_counts[ws.get("instance", "Unknown")] += 1
-            read_role_counts[ws.get("readRole", "Unknown")] += 1
-            write_role_counts[ws.get("writeRole", "Unknown")] += 1
+        created_at_date = None
+        created_at_str = get_created_at_str(ws)
+        if not created_at_str:
+            missing_created_at_count += 1
+        else:
+            created_at_date = parse_iso_datetime(created_at_str)
+            if not created_at_date:
+                date_parse_errors_count += 1
 
-            current_eonid = ws.get("eonid") # Can be number or string, or None
-            if current_eonid is not None:
-                current_eonid = str(current_eonid) # Standardize to string for Counter keys
-            else:
-                current_eonid = "Unknown"
+        records.append((
+            workspace_id,
+            ws.get("instance", "Unknown"),
+            ws.get("readRole", "Unknown"),
+            ws.get("writeRole", "Unknown"),
+            current_eonid,
+            created_at_date,
+            ws.get("archived") is True,
+        ))
+    return records, missing_created_at_count, date_parse_errors_count
 
 
-            created_at_str = ws.get("createdAt", {}).get("$date")
-            if not created_at_str:
-                missing_created_at_count +=1
-                continue 
+def compute_workspace_metrics(file_path, profiler=NULL_PROFILER):
+    all_workspace_ids = set()
+
+    with profiler.stage("read"):
+        text = read_export(file_path)
+    with profiler.stage("decode") as stage:
+        data_objects, json_line_parse_errors = decode_export(text)
+        del text
+        stage.records = len(data_objects)
+    
+    if not data_objects and json_line_parse_errors == 0:
+        raise NoDataError(file_path)
+
+    summary = ExportSummary(processed_entries=len(data_objects), json_line_parse_errors=json_line_parse_errors)
+
+    with profiler.stage("normalise") as stage:
+        records, summary.missing_created_at, summary.date_parse_errors = normalise_workspaces(data_objects)
+        del data_objects
+        stage.records = len(records)
+
+    result = WorkspaceMetricsResult(summary)
+    eonids_p1 = result.eonids_p1
+    eonids_p2 = result.eonids_p2
+    instance_counts = result.instance_counts
+    read_role_counts = result.read_role_counts
+    write_role_counts = result.write_role_counts
+    with profiler.stage("aggregate") as stage:
+        stage.records = len(records)
+        for workspace_id, instance, read_role, write_role, current_eonid, created_at_date, is_archived in records:
+            if workspace_id is not None:
+                all_workspace_ids.add(workspace_id)
+
+            instance_counts[instance] += 1
+            read_role_counts[read_role] += 1
+            write_role_counts[write_role] += 1
 
-            created_at_date = parse_iso_datetime(created_at_str)
             if not created_at_date:
-                date_parse_errors_count +=1
                 continue 
 
-            is_archived = ws.get("archived") is True
-
             if P1_START <= created_at_date <= P1_END:
-                created_p1_count += 1
+                result.created_p1 += 1
                 eonids_p1[current_eonid] += 1
                 if is_archived:
-                    archived_created_p1_count += 1
+                    result.archived_created_p1 += 1
             
             elif P2_START <= created_at_date <= P2_END:
-                created_p2_count += 1
+                result.created_p2 += 1
                 eonids_p2[current_eonid] += 1
                 if is_archived:
-                    archived_created_p2_count += 1
-        
-        total_unique_workspaces = len(all_workspace_ids)
-
-        print("\n--- Workspace Metrics ---")
-        print(f"Reporting for Period 1 (P1): {P1_START_STR} to {P1_END_STR}")
-        print(f"Compared against Period 2 (P2): {P2_START_STR} to {P2_END_STR}")
-        print("--------------------------------------------------")
-
-        print(f"\n1. Total Unique Workspaces (overall, across all time in data): {total_unique_workspaces}")
-        
-        print(f"\n2. Newly Created Workspaces (workspaces with creation date in period):")
-        print(f"   - P1 (Jan-June 2025): {created_p1_count}")
-        print(f"   - P2 (July-Dec 2024): {created_p2_count}")
-        comparison_created = get_comparison_text(created_p1_count, created_p2_count, "newly created workspaces")
-        print(f"   - Comparison (P1 vs P2): {comparison_created}")
-
-        print(f"\n3. Archived Workspaces:")
-        print(f"   NOTE: This counts workspaces *created* within the specified period that are *currently* marked as 'archived'.")
-        print(f"         It does NOT indicate that the archival action itself took place within this period (due to no 'archivedAt' timestamp).")
-        print(f"   - P1 (Created Jan-June 2025 AND now archived): {archived_created_p1_count}")
-        print(f"   - P2 (Created July-Dec 2024 AND now archived): {archived_created_p2_count}")
-        comparison_archived = get_comparison_text(archived_created_p1_count, archived_created_p2_count, "archived workspaces (created in period)")
-        print(f"   - Comparison (P1 vs P2): {comparison_archived}")
-
-        print(f"\n4. `eonid` (Department/Entity ID) Analysis (for workspaces created in period):")
-        unique_eonids_p1_count = len(eonids_p1)
-        unique_eonids_p2_count = len(eonids_p2)
-        
-        print(f"   Unique `eonid`s associated with workspaces created in:")
-        print(f"     - P1: {unique_eonids_p1_count}")
-        print(f"     - P2: {unique_eonids_p2_count}")
-        comparison_eonid_unique_count = get_comparison_text(unique_eonids_p1_count, unique_eonids_p2_count, "unique eonids")
-        print(f"     - Comparison (P1 vs P2): {comparison_eonid_unique_count}")
-
-        print(f"\n   Most Frequent `eonid`s for workspaces created in P1 (Top {TOP_N_EONIDS}):")
-        if eonids_p1:
-            for eonid, count in eonids_p1.most_common(TOP_N_EONIDS):
-                print(f"     - {eonid}: {count} occurrences")
-        else:
-            print("     - No eonids found for P1.")
+                    result.archived_created_p2 += 1
 
-        print(f"\n   Most Frequent `eonid`s for workspaces created in P2 (Top {TOP_N_EONIDS}):")
-        if eonids_p2:
-            for eonid, count in eonids_p2.most_common(TOP_N_EONIDS):
-                print(f"     - {eonid}: {count} occurrences")
-        else:
-            print("     - No eonids found for P2.")
-        
-        print("\n--- Other Data Insights (Overall Data) ---")
-        print(f"- Total raw entries processed from file: {processed_entries}")
-        if json_line_parse_errors > 0:
-            print(f"- Lines skipped due to invalid JSON structure: {json_line_parse_errors}")
-        if missing_created_at_count > 0:
-            print(f"- Entries skipped due to missing 'createdAt.$date': {missing_created_at_count}")
-        if date_parse_errors_count > 0:
-            print(f"- Entries skipped due to 'createdAt.$date' parsing errors: {date_parse_errors_count}")
-        
-        print("\n- Distribution of Workspaces by 'instance' (Overall):")
-        if instance_counts:
-            for inst, count in instance_counts.most_common(): # Show all, sorted by freq
-                print(f"  - {inst}: {count}")
-        else:
-            print("  - No instance data found or all were 'Unknown'.")
+    result.total_unique_workspaces = len(all_workspace_ids)
+    return result
 
-        print("\n- Distribution of 'readRole' (Overall):")
-        if read_role_counts:
-            for role, count in read_role_counts.most_common():
-                print(f"  - {role}: {count}")
-        else:
-            print("  - No readRole data found.")
 
-        print("\n- Distribution of 'writeRole' (Overall):")
-        if write_role_counts:
-            for role, count in write_role_counts.most_common():
-                print(f"  - {role}: {count}")
+def render_workspace_metrics(result):
+    summary = result.summary
+
+    print("\n--- Workspace Metrics ---")
+    print(f"Reporting for Period 1 (P1): {P1_START_STR} to {P1_END_STR}")
+    print(f"Compared against Period 2 (P2): {P2_START_STR} to {P2_END_STR}")
+    print("--------------------------------------------------")
+
+    print(f"\n1. Total Unique Workspaces (overall, across all time in data): {result.total_unique_workspaces}")
+
+    print(f"\n2. Newly Created Workspaces (workspaces with creation date in period):")
+    print(f"   - P1 (Jan-June 2025): {result.created_p1}")
+    print(f"   - P2 (July-Dec 2024): {result.created_p2}")
+    comparison_created = get_comparison_text(result.created_p1, result.created_p2, "newly created workspaces")
+    print(f"   - Comparison (P1 vs P2): {comparison_created}")
+
+    print(f"\n3. Archived Workspaces:")
+    print(f"   NOTE: This counts workspaces *created* within the specified period that are *currently* marked as 'archived'.")
+    print(f"         It does NOT indicate that the archival action itself took place within this period (due to no 'archivedAt' timestamp).")
+    print(f"   - P1 (Created Jan-June 2025 AND now archived): {result.archived_created_p1}")
+    print(f"   - P2 (Created July-Dec 2024 AND now archived): {result.archived_created_p2}")
+    comparison_archived = get_comparison_text(result.archived_created_p1, result.archived_created_p2, "archived workspaces (created in period)")
+    print(f"   - Comparison (P1 vs P2): {comparison_archived}")
+
+    print(f"\n4. `eonid` (Department/Entity ID) Analysis (for workspaces created in period):")
+    unique_eonids_p1_count = len(result.eonids_p1)
+    unique_eonids_p2_count = len(result.eonids_p2)
+
+    print(f"   Unique `eonid`s associated with workspaces created in:")
+    print(f"     - P1: {unique_eonids_p1_count}")
+    print(f"     - P2: {unique_eonids_p2_count}")
+    comparison_eonid_unique_count = get_comparison_text(unique_eonids_p1_count, unique_eonids_p2_count, "unique eonids")
+    print(f"     - Comparison (P1 vs P2): {comparison_eonid_unique_count}")
+
+    print(f"\n   Most Frequent `eonid`s for workspaces created in P1 (Top {TOP_N_EONIDS}):")
+    if result.eonids_p1:
+        for eonid, count in result.eonids_p1.most_common(TOP_N_EONIDS):
+            print(f"     - {eonid}: {count} occurrences")
+    else:
+        print("     - No eonids found for P1.")
+
+    print(f"\n   Most Frequent `eonid`s for workspaces created in P2 (Top {TOP_N_EONIDS}):")
+    if result.eonids_p2:
+        for eonid, count in result.eonids_p2.most_common(TOP_N_EONIDS):
+            print(f"     - {eonid}: {count} occurrences")
+    else:
+        print("     - No eonids found for P2.")
+
+    print("\n--- Other Data Insights (Overall Data) ---")
+    print(f"- Total raw entries processed from file: {summary.processed_entries}")
+    if summary.json_line_parse_errors > 0:
+        print(f"- Lines skipped due to invalid JSON structure: {summary.json_line_parse_errors}")
+    if summary.missing_created_at > 0:
+        print(f"- Entries skipped due to missing 'createdAt.$date': {summary.missing_created_at}")
+    if summary.date_parse_errors > 0:
+        print(f"- Entries skipped due to 'createdAt.$date' parsing errors: {summary.date_parse_errors}")
+
+    print("\n- Distribution of Workspaces by 'instance' (Overall):")
+    if result.instance_counts:
+        for inst, count in result.instance_counts.most_common(): # Show all, sorted by freq
+            print(f"  - {inst}: {count}")
+    else:
+        print("  - No instance data found or all were 'Unknown'.")
+
+    print("\n- Distribution of 'readRole' (Overall):")
+    if result.read_role_counts:
+        for role, count in result.read_role_counts.most_common():
+            print(f"  - {role}: {count}")
+    else:
+        print("  - No readRole data found.")
+
+    print("\n- Distribution of 'writeRole' (Overall):")
+    if result.write_role_counts:
+        for role, count in result.write_role_counts.most_common():
+            print(f"  - {role}: {count}")
+    else:
+        print("  - No writeRole data found.")
+    
+    print("\n--- Key Data Limitations (Reminder) ---")
+    print("  - No 'updatedAt' field: Cannot determine workspace activity levels or when updates occurred.")
+    print("  - No 'archivedAt' field: Cannot determine *when* a workspace was archived. 'Archived' metrics are based on workspaces *created* in a period that are *currently* archived.")
+    print("  - Many originally requested metrics (line count, views, size, visualization type, node types, API/CLI usage) remain unavailable with this dataset.")
+
+
+def compute_sampled_workspace_metrics(sample, profiler=NULL_PROFILER):
+    """compute_workspace_metrics() estimated from a workspace_metrics.sampling.LineSample."""
+    with profiler.stage("normalise") as stage:
+        records = sample.map(lambda docs: normalise_workspaces(docs)[0])
+        stage.records = sample.drawn
+
+    def in_p1(record):
+        return record[5] is not None and P1_START <= record[5] <= P1_END
+
+    def in_p2(record):
+        return record[5] is not None and P2_START <= record[5] <= P2_END
+
+    with profiler.stage("aggregate") as stage:
+        stage.records = sample.drawn
+        return SampledWorkspaceMetricsResult(
+            sample=records.summary(),
+            created_p1=records.count(in_p1),
+            created_p2=records.count(in_p2),
+            archived_created_p1=records.count(lambda r: in_p1(r) and r[6]),
+            archived_created_p2=records.count(lambda r: in_p2(r) and r[6]),
+            archived_share_p1=records.ratio(lambda r: in_p1(r) and r[6], in_p1),
+            archived_share_p2=records.ratio(lambda r: in_p2(r) and r[6], in_p2),
+            top_eonids_p1=records.top(lambda r: r[4] if in_p1(r) else None, TOP_N_EONIDS),
+            top_eonids_p2=records.top(lambda r: r[4] if in_p2(r) else None, TOP_N_EONIDS),
+        )
+
+
+def render_sampled_workspace_metrics(result):
+    print("\n--- Workspace Metrics (APPROXIMATE, from a sample) ---")
+    print(f"Reporting for Period 1 (P1): {P1_START_STR} to {P1_END_STR}")
+    print(f"Compared against Period 2 (P2): {P2_START_STR} to {P2_END_STR}")
+    render_sample_summary(result.sample)
+    print("--------------------------------------------------")
+
+    print(f"\n1. Newly Created Workspaces (workspaces with creation date in period):")
+    print(f"   - P1 (Jan-June 2025): {result.created_p1}")
+    print(f"   - P2 (July-Dec 2024): {result.created_p2}")
+
+    print(f"\n2. Archived Workspaces (created in period AND now archived):")
+    print(f"   - P1: {result.archived_created_p1} ({result.archived_share_p1.as_percent()} of those created)")
+    print(f"   - P2: {result.archived_created_p2} ({result.archived_share_p2.as_percent()} of those created)")
+
+    for number, label, top_eonids in ((3, "P1", result.top_eonids_p1), (4, "P2", result.top_eonids_p2)):
+        print(f"\n{number}. Most Frequent `eonid`s for workspaces created in {label} (Top {TOP_N_EONIDS}, estimated):")
+        if top_eonids:
+            for eonid, estimate in top_eonids:
+                print(f"     - {eonid}: {estimate} occurrences")
         else:
-            print("  - No writeRole data found.")
-            
-        print("\n--- Key Data Limitations (Reminder) ---")
-        print("  - No 'updatedAt' field: Cannot determine workspace activity levels or when updates occurred.")
-        print("  - No 'archivedAt' field: Cannot determine *when* a workspace was archived. 'Archived' metrics are based on workspaces *created* in a period that are *currently* archived.")
-        print("  - Many originally requested metrics (line count, views, size, visualization type, node types, API/CLI usage) remain unavailable with this dataset.")
+            print(f"     - No eonids found for {label} in the sample.")
+
+    print("\nNOTE: Distinct counts (unique workspaces, unique eonids) and the overall distributions")
+    print("      are not estimated from a sample; run without --sample for the exact report.")
+
+
+def analyze_workspace_sample(file_path, args, profiler=NULL_PROFILER):
+    try:
+        with profiler.stage("read") as stage:
+            sample = sample_from_args(file_path, args)
+            stage.records = sample.drawn
+        result = compute_sampled_workspace_metrics(sample, profiler)
+        with profiler.stage("render"):
+            render_sampled_workspace_metrics(result)
+
+    except FileNotFoundError:
+        print(f"Error: File not found at {file_path}")
+    except ValueError as e:
+        print(f"Error: cannot sample {file_path}: {e}")
+
+
+def cached_result(file_path, profiler=NULL_PROFILER):
+    """compute_workspace_metrics() memoized on the export's fingerprint and this script's configuration."""
+    config = (P1_START, P1_END, P2_START, P2_END)
+    return memoize("metric", config, file_path, lambda: compute_workspace_metrics(file_path, profiler))
+
 
+def analyze_workspace_data(file_path, profiler=NULL_PROFILER):
+    try:
+        result = cached_result(file_path, profiler)
+        with profiler.stage("render"):
+            render_workspace_metrics(result)
+
+    except NoDataError:
+        print("No data objects found or successfully parsed from the file.")
     except FileNotFoundError:
         print(f"Error: File not found at {file_path}")
     except Exception as e:
@@ -232,5 +316,19 @@ def analyze_workspace_data(file_path):
         traceback.print_exc()
 
 if __name__ == "__main__":
-    print(f"Analyzing workspace data from: {JSON_FILE_PATH}")
-    analyze_workspace_data(JSON_FILE_PATH)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Workspace metrics for P1 vs P2.")
+    parser.add_argument("file_path", nargs="?", default=JSON_FILE_PATH)
+    add_profile_argument(parser)
+    add_cache_argument(parser)
+    add_sample_arguments(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+
+    profiler = profiler_from_args(args, "metric.py", args.file_path)
+    print(f"Analyzing workspace data from: {args.file_path}")
+    if args.sample:
+        analyze_workspace_sample(args.file_path, args, profiler)
+    else:
+        analyze_workspace_data(args.file_path, profiler)
+    if args.profile:
+        profiler.emit(args.profile)
\ No newline at end of file
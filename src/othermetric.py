@@ -1,7 +1,12 @@
-import json
+import argparse
 from datetime import datetime, timezone
 from collections import Counter
 
+from workspace_metrics.loader import creation_records, decode_export, read_export
+from workspace_metrics.memo import add_cache_argument, configure_from_args, memoize
+from workspace_metrics.profiling import NULL_PROFILER, add_profile_argument, profiler_from_args
+from workspace_metrics.results import ExportSummary, MonthlyCreationsResult, NoDataError, render_processing_summary
+
 # --- Configuration ---
 JSON_FILE_PATH = "workspaces.json"
 
@@ -12,77 +17,35 @@ RANGE_END_YEAR = 2025
 RANGE_END_MONTH = 6
 # --- End Configuration ---
 
-def parse_iso_datetime(date_str):
-    """
-    Parses an ISO 8601 datetime string, handling the 'Z' for UTC.
-    Returns a timezone-aware datetime object or None if parsing fails.
-    """
-    if not date_str:
-        return None
-    if date_str.endswith('Z'):
-        date_str = date_str[:-1] + '+00:00'
-    try:
-        return datetime.fromisoformat(date_str)
-    except ValueError:
-        try:
-            return datetime.strptime(date_str, '%Y-%m-%dT%H:%M:%S.%f+00:00')
-        except ValueError:
-            try:
-                return datetime.strptime(date_str, '%Y-%m-%dT%H:%M:%S+00:00')
-            except ValueError:
-                # print(f"Warning: Could not parse date string: {date_str}")
-                return None
-
-def count_creations_for_month_range(file_path):
+def compute_monthly_creations(file_path, profiler=NULL_PROFILER):
     """
     Counts workspaces created for each month in the specified range.
     """
-    monthly_creations_count = Counter() # Stores counts as {(year, month): count}
-    
-    processed_entries = 0
-    missing_created_at_count = 0
-    date_parse_errors_count = 0
-    json_line_parse_errors = 0
-
     # Define the start and end points for tuple comparison
     range_start_tuple = (RANGE_START_YEAR, RANGE_START_MONTH)
     range_end_tuple = (RANGE_END_YEAR, RANGE_END_MONTH)
 
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            try:
-                data_objects = json.load(f)
-                if not isinstance(data_objects, list):
-                    data_objects = [data_objects]
-            except json.JSONDecodeError:
-                f.seek(0)
-                data_objects = []
-                for line_number, line in enumerate(f, 1):
-                    line = line.strip()
-                    if line:
-                        try:
-                            data_objects.append(json.loads(line))
-                        except json.JSONDecodeError as e_line:
-                            # print(f"Warning: Skipping invalid JSON on line {line_number}: {e_line}")
-                            json_line_parse_errors += 1
-        
-        if not data_objects and json_line_parse_errors == 0 and processed_entries == 0:
-            print("No data objects found or successfully parsed from the file.")
-            return
-
-        processed_entries = len(data_objects)
-
-        for ws in data_objects:
-            created_at_str = ws.get("createdAt", {}).get("$date")
-            if not created_at_str:
-                missing_created_at_count += 1
-                continue
-
-            created_at_date = parse_iso_datetime(created_at_str)
-            if not created_at_date:
-                date_parse_errors_count += 1
-                continue
+    with profiler.stage("read"):
+        text = read_export(file_path)
+    with profiler.stage("decode") as stage:
+        data_objects, json_line_parse_errors = decode_export(text)
+        del text
+        stage.records = len(data_objects)
+
+    if not data_objects and json_line_parse_errors == 0:
+        raise NoDataError(file_path)
 
+    summary = ExportSummary(processed_entries=len(data_objects), json_line_parse_errors=json_line_parse_errors)
+
+    with profiler.stage("normalise") as stage:
+        records, summary.missing_created_at, summary.date_parse_errors = creation_records(data_objects)
+        del data_objects
+        stage.records = len(records)
+
+    monthly_creations_count = Counter() # Stores counts as {(year, month): count}
+    with profiler.stage("aggregate") as stage:
+        stage.records = len(records)
+        for created_at_date, _ in records:
             created_year = created_at_date.year
             created_month = created_at_date.month
             created_year_month_tuple = (created_year, created_month)
@@ -90,33 +53,43 @@ def count_creations_for_month_range(file_path):
             # Check if the creation month is within our desired range
             if range_start_tuple <= created_year_month_tuple <= range_end_tuple:
                 monthly_creations_count[created_year_month_tuple] += 1
-        
-        print("\n--- Workspace Creation Counts per Month ---")
-        print(f"For the period: {datetime(RANGE_START_YEAR, RANGE_START_MONTH, 1).strftime('%B %Y')} to {datetime(RANGE_END_YEAR, RANGE_END_MONTH, 1).strftime('%B %Y')}\n")
-
-        current_year = RANGE_START_YEAR
-        current_month = RANGE_START_MONTH
-        
-        while (current_year, current_month) <= range_end_tuple:
-            month_name = datetime(current_year, current_month, 1).strftime("%B")
-            count = monthly_creations_count.get((current_year, current_month), 0)
-            print(f"- {month_name} {current_year}: {count} workspaces created")
-            
-            # Move to the next month
-            current_month += 1
-            if current_month > 12:
-                current_month = 1
-                current_year += 1
-        
-        print("\n--- Data Processing Summary ---")
-        print(f"- Total raw entries processed from file: {processed_entries}")
-        if json_line_parse_errors > 0:
-            print(f"- Lines skipped due to invalid JSON structure: {json_line_parse_errors}")
-        if missing_created_at_count > 0:
-            print(f"- Entries skipped due to missing 'createdAt.$date': {missing_created_at_count}")
-        if date_parse_errors_count > 0:
-            print(f"- Entries skipped due to 'createdAt.$date' parsing errors: {date_parse_errors_count}")
+    return MonthlyCreationsResult(summary, dict(sorted(monthly_creations_count.items())))
 
+def render_monthly_creations(result):
+    range_end_tuple = (RANGE_END_YEAR, RANGE_END_MONTH)
+
+    print("\n--- Workspace Creation Counts per Month ---")
+    print(f"For the period: {datetime(RANGE_START_YEAR, RANGE_START_MONTH, 1).strftime('%B %Y')} to {datetime(RANGE_END_YEAR, RANGE_END_MONTH, 1).strftime('%B %Y')}\n")
+
+    current_year = RANGE_START_YEAR
+    current_month = RANGE_START_MONTH
+
+    while (current_year, current_month) <= range_end_tuple:
+        month_name = datetime(current_year, current_month, 1).strftime("%B")
+        count = result.monthly_counts.get((current_year, current_month), 0)
+        print(f"- {month_name} {current_year}: {count} workspaces created")
+    
+        # Move to the next month
+        current_month += 1
+        if current_month > 12:
+            current_month = 1
+            current_year += 1
+
+    render_processing_summary(result.summary)
+
+def cached_result(file_path, profiler=NULL_PROFILER):
+    """compute_monthly_creations() memoized on the export's fingerprint and this script's configuration."""
+    config = (RANGE_START_YEAR, RANGE_START_MONTH, RANGE_END_YEAR, RANGE_END_MONTH)
+    return memoize("othermetric", config, file_path, lambda: compute_monthly_creations(file_path, profiler))
+
+def count_creations_for_month_range(file_path, profiler=NULL_PROFILER):
+    try:
+        result = cached_result(file_path, profiler)
+        with profiler.stage("render"):
+            render_monthly_creations(result)
+
+    except NoDataError:
+        print("No data objects found or successfully parsed from the file.")
     except FileNotFoundError:
         print(f"Error: File not found at {file_path}")
     except Exception as e:
@@ -125,5 +98,15 @@ def count_creations_for_month_range(file_path):
         traceback.print_exc()
 
 if __name__ == "__main__":
-    print(f"Analyzing workspace data from: {JSON_FILE_PATH}")
-    count_creations_for_month_range(JSON_FILE_PATH)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Workspaces created per month over a range of months.")
+    parser.add_argument("file_path", nargs="?", default=JSON_FILE_PATH)
+    add_profile_argument(parser)
+    add_cache_argument(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+
+    profiler = profiler_from_args(args, "othermetric.py", args.file_path)
+    print(f"Analyzing workspace data from: {args.file_path}")
+    count_creations_for_month_range(args.file_path, profiler)
+    if args.profile:
+        profiler.emit(args.profile)
\ No newline at end of file
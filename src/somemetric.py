@@ -1,6 +1,12 @@
-import json
+import argparse
 from datetime import datetime, timezone
 
+from workspace_metrics.loader import creation_records, decode_export, read_export
+from workspace_metrics.memo import add_cache_argument, configure_from_args, memoize
+from workspace_metrics.partitions import PartitionStore, is_store
+from workspace_metrics.profiling import NULL_PROFILER, add_profile_argument, profiler_from_args
+from workspace_metrics.results import ExportSummary, MonthCreationsResult, NoDataError, render_processing_summary
+
 # --- Configuration ---
 JSON_FILE_PATH = "workspaces.json"
 
@@ -20,99 +26,87 @@ JUNE_2025_START = datetime(JUNE_2025_YEAR, JUNE_2025_MONTH, 1, 0, 0, 0, tzinfo=t
 JUNE_2025_END = datetime(JUNE_2025_YEAR, JUNE_2025_MONTH, 30, 23, 59, 59, 999999, tzinfo=timezone.utc)
 # --- End Configuration ---
 
-def parse_iso_datetime(date_str):
-    """
-    Parses an ISO 8601 datetime string, handling the 'Z' for UTC.
-    Returns a timezone-aware datetime object or None if parsing fails.
-    """
-    if not date_str:
-        return None
-    if date_str.endswith('Z'):
-        date_str = date_str[:-1] + '+00:00'
-    try:
-        return datetime.fromisoformat(date_str)
-    except ValueError:
-        try:
-            # Fallback for slightly different ISO formats if needed
-            return datetime.strptime(date_str, '%Y-%m-%dT%H:%M:%S.%f+00:00')
-        except ValueError:
-            try:
-                return datetime.strptime(date_str, '%Y-%m-%dT%H:%M:%S+00:00')
-            except ValueError:
-                # print(f"Warning: Could not parse date string: {date_str}") # Optional
-                return None
-
-def count_creations_for_months(file_path):
+def compute_month_creations(file_path, profiler=NULL_PROFILER):
     """
     Counts workspaces created in specified months.
     """
-    dec_2024_creations = 0
-    june_2025_creations = 0
-    
-    processed_entries = 0
-    missing_created_at_count = 0
-    date_parse_errors_count = 0
-    json_line_parse_errors = 0
+    if is_store(file_path):
+        return compute_month_creations_from_store(file_path, profiler)
 
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            try:
-                data_objects = json.load(f)
-                if not isinstance(data_objects, list): # If it's a single object, make it a list
-                    data_objects = [data_objects]
-            except json.JSONDecodeError:
-                # If loading as array fails, try JSON Lines format
-                f.seek(0) # Reset file pointer
-                data_objects = []
-                for line_number, line in enumerate(f, 1):
-                    line = line.strip()
-                    if line: # Skip empty lines
-                        try:
-                            data_objects.append(json.loads(line))
-                        except json.JSONDecodeError as e_line:
-                            # print(f"Warning: Skipping invalid JSON on line {line_number}: {e_line}")
-                            json_line_parse_errors += 1
-        
-        if not data_objects and json_line_parse_errors == 0 and processed_entries == 0:
-            print("No data objects found or successfully parsed from the file.")
-            return
-
-        processed_entries = len(data_objects)
-
-        for ws in data_objects:
-            created_at_str = ws.get("createdAt", {}).get("$date")
-            if not created_at_str:
-                missing_created_at_count +=1
-                continue # Skip to next workspace if no creation date
-
-            created_at_date = parse_iso_datetime(created_at_str)
-            if not created_at_date:
-                date_parse_errors_count +=1
-                continue # Skip if date parsing failed
+    with profiler.stage("read"):
+        text = read_export(file_path)
+    with profiler.stage("decode") as stage:
+        data_objects, json_line_parse_errors = decode_export(text)
+        del text
+        stage.records = len(data_objects)
 
+    if not data_objects and json_line_parse_errors == 0:
+        raise NoDataError(file_path)
+
+    summary = ExportSummary(processed_entries=len(data_objects), json_line_parse_errors=json_line_parse_errors)
+
+    with profiler.stage("normalise") as stage:
+        records, summary.missing_created_at, summary.date_parse_errors = creation_records(data_objects)
+        del data_objects
+        stage.records = len(records)
+
+    result = MonthCreationsResult(summary)
+    with profiler.stage("aggregate") as stage:
+        stage.records = len(records)
+        for created_at_date, _ in records:
             # Check for December 2024 creations
             if DEC_2024_START <= created_at_date <= DEC_2024_END:
-                dec_2024_creations += 1
+                result.dec_2024_creations += 1
             
             # Check for June 2025 creations
             # Using 'elif' is fine here since a workspace can't be created in both distinct months
             # but separate 'if' also works and might be slightly clearer if you add more months later.
             if JUNE_2025_START <= created_at_date <= JUNE_2025_END:
-                june_2025_creations += 1
-        
-        print("\n--- Workspace Creation Counts ---")
-        print(f"Number of workspaces created in December 2024: {dec_2024_creations}")
-        print(f"Number of workspaces created in June 2025: {june_2025_creations}")
-
-        print("\n--- Data Processing Summary ---")
-        print(f"- Total raw entries processed from file: {processed_entries}")
-        if json_line_parse_errors > 0:
-            print(f"- Lines skipped due to invalid JSON structure: {json_line_parse_errors}")
-        if missing_created_at_count > 0:
-            print(f"- Entries skipped due to missing 'createdAt.$date': {missing_created_at_count}")
-        if date_parse_errors_count > 0:
-            print(f"- Entries skipped due to 'createdAt.$date' parsing errors: {date_parse_errors_count}")
+                result.june_2025_creations += 1
+    return result
+
+def compute_month_creations_from_store(store_path, profiler=NULL_PROFILER):
+    """
+    compute_month_creations() over a workspace_metrics.partitions store. Whole
+    months come straight from partition statistics; rows dated from the
+    ObjectId are left out, as this script only reads createdAt.$date.
+    """
+    store = PartitionStore(store_path)
+    if store.documents == 0 and store.json_line_parse_errors == 0:
+        raise NoDataError(store_path)
+
+    summary = ExportSummary(
+        processed_entries=store.documents,
+        json_line_parse_errors=store.json_line_parse_errors,
+        missing_created_at=store.missing_created_at,
+        date_parse_errors=store.date_parse_errors,
+    )
+    result = MonthCreationsResult(summary)
+    with profiler.stage("aggregate"):
+        result.dec_2024_creations = store.count(DEC_2024_START, DEC_2024_END, created_at_only=True)
+        result.june_2025_creations = store.count(JUNE_2025_START, JUNE_2025_END, created_at_only=True)
+    return result
+
+def render_month_creations(result):
+    print("\n--- Workspace Creation Counts ---")
+    print(f"Number of workspaces created in December 2024: {result.dec_2024_creations}")
+    print(f"Number of workspaces created in June 2025: {result.june_2025_creations}")
+
+    render_processing_summary(result.summary)
 
+def cached_result(file_path, profiler=NULL_PROFILER):
+    """compute_month_creations() memoized on the export's fingerprint and this script's configuration."""
+    config = (DEC_2024_START, DEC_2024_END, JUNE_2025_START, JUNE_2025_END)
+    return memoize("somemetric", config, file_path, lambda: compute_month_creations(file_path, profiler))
+
+def count_creations_for_months(file_path, profiler=NULL_PROFILER):
+    try:
+        result = cached_result(file_path, profiler)
+        with profiler.stage("render"):
+            render_month_creations(result)
+
+    except NoDataError:
+        print("No data objects found or successfully parsed from the file.")
     except FileNotFoundError:
         print(f"Error: File not found at {file_path}")
     except Exception as e:
@@ -121,5 +115,15 @@ def count_creations_for_months(file_path):
         traceback.print_exc()
 
 if __name__ == "__main__":
-    print(f"Analyzing workspace data from: {JSON_FILE_PATH}")
-    count_creations_for_months(JSON_FILE_PATH)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Workspaces created in December 2024 and June 2025.")
+    parser.add_argument("file_path", nargs="?", default=JSON_FILE_PATH)
+    add_profile_argument(parser)
+    add_cache_argument(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+
+    profiler = profiler_from_args(args, "somemetric.py", args.file_path)
+    print(f"Analyzing workspace data from: {args.file_path}")
+    count_creations_for_months(args.file_path, profiler)
+    if args.profile:
+        profiler.emit(args.profile)
\ No newline at end of file
@@ -3,7 +3,7 @@
 """
 Daily workspace metrics.
 
-Outputs two CSV files:
+Outputs three CSV files, and a fourth with --by-dimension:
 
 1) daily_created.csv
    - date, created_count
@@ -12,15 +12,75 @@ Outputs two CSV files:
    - date, cumulative_active
      (only workspaces where archived == false, counted cumulatively)
 
+3) daily_rolling.csv
+   - date, created_7d, created_30d, created_90d,
+     net_growth_7d, net_growth_30d, net_growth_90d
+     (trailing windows ending on `date`; net growth is the change in
+     cumulative_active over the window)
+
+4) daily_rolling_by_dimension.csv (--by-dimension)
+   - date, dimension, value, then the same window columns
+     (the rolling series per eonid and per instance, ordered by date,
+     dimension, value; days where every window is 0 are left out)
+
 Creation time is taken from:
 - createdAt.$date (if present), else
 - ObjectId timestamp from _id.$oid
+
+The export is streamed a document at a time straight into per-day buckets,
+overall and per (dimension, value), so memory depends on the number of
+days and dimension values covered, not on the export's size.
+
+With --format parquet|arrow the overall series are written instead as one
+typed table, daily_metrics.parquet / .arrow (date32 date, int64 counts),
+and with --by-dimension the per-dimension series as
+daily_rolling_by_dimension.parquet / .arrow; this needs the optional
+pyarrow package.
+
+--write-records PATH saves the normalised workspace table (created_at as a
+UTC timestamp, archived, eonid, instance) as Parquet or Arrow IPC, streamed
+a batch at a time. Such a file can be passed back as the input in place of
+the JSON export, so reruns and downstream jobs skip JSON parsing.
+
+The input may also be a month-partitioned store written by
+`python -m workspace_metrics.partitions convert`; with DATE_RANGE_START /
+DATE_RANGE_END set, only the months inside the range are read.
+
+--incremental updates existing CSVs in place of rewriting them: only the
+tail of each file is read, the rows from its last intact days on are
+rendered and compared, and the bytes before the first changed day are
+copied unrendered into a temporary file that atomically replaces the CSV.
+Days before that tail are taken as final.
 """
 
-import json
+import argparse
+import itertools
+import os
 import sys
-from datetime import datetime, timezone, timedelta
-from typing import Any, Dict, List, Optional
+import tempfile
+from datetime import date, datetime, timezone, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# The shared workspace_metrics package lives in src/, one level up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from workspace_metrics.columnar import (  # noqa: E402
+    COMPRESSIONS,
+    DEFAULT_COMPRESSION,
+    FORMATS,
+    MissingDependencyError,
+    columnar_format,
+    open_table_writer,
+    output_path,
+    read_table,
+    require_pyarrow,
+    write_table,
+)
+from workspace_metrics.loader import iter_export  # noqa: E402
+from workspace_metrics.memo import add_cache_argument, configure_from_args, memoize  # noqa: E402
+from workspace_metrics.partitions import PartitionStore, is_store  # noqa: E402
+from workspace_metrics.profiling import NULL_PROFILER, add_profile_argument, profiler_from_args  # noqa: E402
+from workspace_metrics.results import DailyMetricsResult  # noqa: E402
 
 # ---------- CONFIG ---------- #
 
@@ -29,11 +89,31 @@ DEFAULT_JSON_PATH = "workspaces.json"
 
 OUTPUT_CREATED_CSV = "daily_created.csv"
 OUTPUT_ACTIVE_CSV = "daily_active.csv"
+OUTPUT_ROLLING_CSV = "daily_rolling.csv"
+OUTPUT_DIMENSION_ROLLING = "daily_rolling_by_dimension"
+OUTPUT_DIMENSION_ROLLING_CSV = OUTPUT_DIMENSION_ROLLING + ".csv"
+# --format parquet|arrow: one table, extension added per format
+OUTPUT_COLUMNAR = "daily_metrics"
+
+# Document fields the rolling series are also broken down by
+DIMENSIONS: Tuple[str, ...] = ("eonid", "instance")
+
+# Trailing window sizes (days) for daily_rolling.csv
+ROLLING_WINDOWS: Tuple[int, ...] = (7, 30, 90)
 
 # Optional hard bounds (YYYY-MM-DD). Set to None to auto-detect from data.
 DATE_RANGE_START: Optional[str] = None
 DATE_RANGE_END: Optional[str] = None
 
+# --write-records: documents normalised and written per record batch
+RECORDS_BATCH_ROWS = 100_000
+
+# --incremental reads this much of the end of an existing CSV to find its last
+# intact days (more if a single day does not fit), and copies the rows kept
+# before them this many bytes at a time
+_TAIL_BYTES = 64 << 10
+_COPY_BLOCK_BYTES = 1 << 20
+
 
 # ---------- HELPERS: DATE PARSING ---------- #
 
@@ -84,63 +164,151 @@ def get_effective_created_at(doc: Dict[str, Any]) -> Optional[datetime]:
 
 # ---------- CORE LOGIC ---------- #
 
-def load_workspaces(path: str) -> List[Dict[str, Any]]:
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+def workspace_dimensions(doc: Dict[str, Any]) -> Tuple[str, str]:
+    """(eonid, instance), "Unknown" where missing."""
+    eonid = doc.get("eonid")
+    return (str(eonid) if eonid is not None else "Unknown"), str(doc.get("instance", "Unknown"))
 
 
-def prepare_records(raw_docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def iter_creations(raw_docs: Iterable[Dict[str, Any]]) -> Iterator[Tuple[datetime, bool, str, str]]:
     """
-    Normalize to: { created_at: datetime, archived: bool }
+    (created_at, archived, eonid, instance) for every doc with a creation
+    time. created_at is in UTC, so days are bucketed as they are from a
+    workspace table or a partitioned store.
     """
-    records: List[Dict[str, Any]] = []
     for doc in raw_docs:
         ts = get_effective_created_at(doc)
         if ts is None:
             continue
-        records.append(
-            {
-                "created_at": ts,
-                "archived": bool(doc.get("archived", False)),
-            }
-        )
-    records.sort(key=lambda r: r["created_at"])
-    return records
+        if ts.tzinfo is not None and ts.utcoffset():
+            ts = ts.astimezone(timezone.utc)
+        yield (ts, bool(doc.get("archived", False))) + workspace_dimensions(doc)
 
 
-def determine_date_range(records: List[Dict[str, Any]]) -> (datetime, datetime):
-    if not records:
-        raise ValueError("No valid records found.")
+def workspace_table(creations: Iterable[Tuple[datetime, bool, str, str]]):
+    """
+    iter_creations() tuples as a pyarrow Table of the normalised workspace
+    table: created_at (timestamp[us, UTC]), archived, eonid and instance.
+    """
+    pa = require_pyarrow()
+    created, archived, eonids, instances = [], [], [], []
+    for ts, is_archived, eonid, instance in creations:
+        created.append(ts)
+        archived.append(is_archived)
+        eonids.append(eonid)
+        instances.append(instance)
+    return pa.table(
+        {
+            "created_at": pa.array(created, type=pa.timestamp("us", tz="UTC")),
+            "archived": pa.array(archived, type=pa.bool_()),
+            "eonid": pa.array(eonids, type=pa.string()),
+            "instance": pa.array(instances, type=pa.string()),
+        }
+    )
+
+
+def write_workspace_table(path: str, raw_docs: Iterable[Dict[str, Any]], fmt: str, compression: str = DEFAULT_COMPRESSION) -> int:
+    """
+    Stream the normalised workspace table to a Parquet or Arrow IPC file,
+    RECORDS_BATCH_ROWS documents at a time in export order, so memory does
+    not grow with the export. Documents without a creation time are left
+    out. Written to a temporary file renamed into place; returns the rows.
+    """
+    creations = iter_creations(raw_docs)
+    batch = workspace_table(itertools.islice(creations, RECORDS_BATCH_ROWS))
+    tmp_path = path + ".tmp"
+    rows = 0
+    try:
+        writer = open_table_writer(tmp_path, batch.schema, fmt, compression)
+        try:
+            while batch.num_rows:
+                writer.write(batch)
+                rows += batch.num_rows
+                batch = workspace_table(itertools.islice(creations, RECORDS_BATCH_ROWS))
+        finally:
+            writer.close()
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return rows
+
+
+def creations_from_table(table) -> Iterator[Tuple[datetime, bool, str, str]]:
+    """iter_creations() over a workspace_table(), a batch at a time."""
+    for batch in table.select(["created_at", "archived", "eonid", "instance"]).to_batches():
+        yield from zip(
+            batch.column(0).to_pylist(),
+            map(bool, batch.column(1).to_pylist()),
+            batch.column(2).to_pylist(),
+            batch.column(3).to_pylist(),
+        )
+
 
+def date_range_between(earliest: Optional[datetime], latest: Optional[datetime]) -> (datetime, datetime):
+    """Whole days from the earliest to the latest creation, unless DATE_RANGE_START / DATE_RANGE_END are set."""
     if DATE_RANGE_START:
         start = datetime.fromisoformat(DATE_RANGE_START + "T00:00:00+00:00")
     else:
-        start = min(r["created_at"] for r in records)
-        start = datetime.combine(start.date(), datetime.min.time(), tzinfo=start.tzinfo)
+        start = datetime.combine(earliest.date(), datetime.min.time(), tzinfo=earliest.tzinfo)
 
     if DATE_RANGE_END:
         end = datetime.fromisoformat(DATE_RANGE_END + "T23:59:59+00:00")
     else:
-        end = max(r["created_at"] for r in records)
-        end = datetime.combine(end.date(), datetime.max.time(), tzinfo=end.tzinfo)
+        end = datetime.combine(latest.date(), datetime.max.time(), tzinfo=latest.tzinfo)
 
     return start, end
 
 
-def build_daily_metrics(records: List[Dict[str, Any]]):
-    # Count creations per day (all workspaces)
+def count_daily_creations(creations: Iterable[Tuple[datetime, bool, str, str]]):
+    """
+    Per-day creation counts from (created_at, archived, eonid, instance)
+    tuples in any order, holding only O(days x dimension values) state.
+    Returns (created per day, active created per day, both per (dimension,
+    value), earliest created_at, latest created_at, tuples counted).
+    """
     created_counts: Dict[datetime.date, int] = {}
-    # Count creations per day for active (non-archived) only
     active_created_counts: Dict[datetime.date, int] = {}
-
-    for r in records:
-        day = r["created_at"].date()
+    dimension_counts: Dict[Tuple[str, str], Tuple[Dict[datetime.date, int], Dict[datetime.date, int]]] = {}
+    earliest = latest = None
+    count = 0
+    for created_at, archived, *values in creations:
+        day = created_at.date()
         created_counts[day] = created_counts.get(day, 0) + 1
-        if not r["archived"]:
+        if not archived:
             active_created_counts[day] = active_created_counts.get(day, 0) + 1
+        for key in zip(DIMENSIONS, values):
+            counts = dimension_counts.get(key)
+            if counts is None:
+                counts = dimension_counts[key] = ({}, {})
+            counts[0][day] = counts[0].get(day, 0) + 1
+            if not archived:
+                counts[1][day] = counts[1].get(day, 0) + 1
+        # Strict comparisons keep the first of equal instants, like min() / max()
+        if earliest is None or created_at < earliest:
+            earliest = created_at
+        if latest is None or created_at > latest:
+            latest = created_at
+        count += 1
+    return created_counts, active_created_counts, dimension_counts, earliest, latest, count
+
+
+def build_daily_metrics_streaming(creations: Iterable[Tuple[datetime, bool, str, str]]):
+    """
+    Daily rows from iter_creations() tuples, bucketed as they arrive, so
+    memory is bounded by the number of days, not workspaces. Returns (daily created rows, daily active rows, per-dimension counts,
+    tuples counted).
+    """
+    created_counts, active_created_counts, dimension_counts, earliest, latest, count = count_daily_creations(creations)
+    if not count:
+        raise ValueError("No valid records found.")
+
+    start_dt, end_dt = date_range_between(earliest, latest)
+    return daily_rows(created_counts, active_created_counts, start_dt, end_dt) + (dimension_counts, count)
 
-    start_dt, end_dt = determine_date_range(records)
 
+def daily_rows(created_counts, active_created_counts, start_dt: datetime, end_dt: datetime):
     # Build full day-by-day list
     days = []
     current = start_dt.date()
@@ -169,6 +337,90 @@ def build_daily_metrics(records: List[Dict[str, Any]]):
     return daily_created_rows, daily_active_rows
 
 
+def build_rolling_metrics(
+    daily_created_rows: List[tuple],
+    daily_active_rows: List[tuple],
+    windows: Sequence[int] = ROLLING_WINDOWS,
+):
+    """
+    Trailing-window sums over the daily buckets, for every window in one pass.
+
+    Prefix sums make each window a subtraction, so the cost is O(days x
+    windows) however wide the windows are. Windows that reach back before
+    the first day only cover the days there are.
+    """
+    # prefix_created[i] = creations over the first i days
+    prefix_created = [0]
+    for _, count in daily_created_rows:
+        prefix_created.append(prefix_created[-1] + count)
+    # cumulative_active is already a prefix sum of active creations
+    prefix_active = [0] + [cumulative for _, cumulative in daily_active_rows]
+
+    header = ["date"] + [f"created_{w}d" for w in windows] + [f"net_growth_{w}d" for w in windows]
+    rows = []
+    for i, (day, _) in enumerate(daily_created_rows, start=1):
+        starts = [max(0, i - w) for w in windows]
+        rows.append(
+            (day,)
+            + tuple(prefix_created[i] - prefix_created[s] for s in starts)
+            + tuple(prefix_active[i] - prefix_active[s] for s in starts)
+        )
+    return header, rows
+
+
+def build_dimension_rolling_metrics(
+    dimension_counts: Dict[Tuple[str, str], Tuple[Dict[date, int], Dict[date, int]]],
+    daily_created_rows: List[tuple],
+    windows: Sequence[int] = ROLLING_WINDOWS,
+):
+    """
+    build_rolling_metrics() for every (dimension, value) over the same days as
+    the overall series, as rows keyed by (date, dimension, value).
+
+    Rows whose windows are all 0 are left out. Every other day lies less than
+    the widest window after one of the value's creation days, so only those
+    days are visited, with each window's start carried forward over the
+    value's creation days: the cost follows the rows written, not days x
+    values. Rows are bucketed by day, so there is no sort over all of them.
+    """
+    header = ["date", "dimension", "value"] + build_rolling_metrics([], [], windows)[0][1:]
+    if not daily_created_rows:
+        return header, []
+    first_day = date.fromisoformat(daily_created_rows[0][0]).toordinal()
+    last_day = first_day + len(daily_created_rows) - 1
+    widest = max(windows)
+
+    by_day: List[List[tuple]] = [[] for _ in daily_created_rows]
+    for (dimension, value), (created_counts, active_created_counts) in sorted(dimension_counts.items()):
+        days = sorted(d for d in created_counts if first_day <= d.toordinal() <= last_day)
+        ordinals = [d.toordinal() for d in days]
+        prefix_created, prefix_active = [0], [0]
+        for d in days:
+            prefix_created.append(prefix_created[-1] + created_counts[d])
+            prefix_active.append(prefix_active[-1] + active_created_counts.get(d, 0))
+
+        # end: creation days up to `day`; starts[k]: those up to day - windows[k]
+        end = 0
+        starts = [0] * len(windows)
+        covered = first_day - 1
+        for ordinal in ordinals:
+            for day in range(max(ordinal, covered + 1), min(ordinal + widest - 1, last_day) + 1):
+                while end < len(ordinals) and ordinals[end] <= day:
+                    end += 1
+                for k, w in enumerate(windows):
+                    while starts[k] < end and ordinals[starts[k]] <= day - w:
+                        starts[k] += 1
+                index = day - first_day
+                created, active = prefix_created[end], prefix_active[end]
+                by_day[index].append((
+                    daily_created_rows[index][0], dimension, value,
+                    *[created - prefix_created[s] for s in starts],
+                    *[active - prefix_active[s] for s in starts],
+                ))
+            covered = max(covered, ordinal + widest - 1)
+    return header, [row for rows in by_day for row in rows]
+
+
 def write_csv(path: str, header: List[str], rows: List[tuple]) -> None:
     import csv
 
@@ -179,20 +431,298 @@ def write_csv(path: str, header: List[str], rows: List[tuple]) -> None:
             writer.writerow(row)
 
 
-def main():
-    # --- input path ---
-    json_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_JSON_PATH
+def _csv_line(writer, buffer, row) -> bytes:
+    buffer.seek(0)
+    buffer.truncate()
+    writer.writerow(row)
+    return buffer.getvalue().encode("utf-8")
 
-    raw_docs = load_workspaces(json_path)
-    records = prepare_records(raw_docs)
 
-    daily_created_rows, daily_active_rows = build_daily_metrics(records)
+def _line_date(line: bytes) -> Optional[str]:
+    """The leading date of a complete CSV data line, or None if it is not one."""
+    if not line.endswith(b"\n"):
+        return None
+    field = line.split(b",", 1)[0]
+    try:
+        return date.fromisoformat(field.decode("ascii")).isoformat()
+    except (UnicodeDecodeError, ValueError):
+        return None
 
-    write_csv(OUTPUT_CREATED_CSV, ["date", "created_count"], daily_created_rows)
-    write_csv(OUTPUT_ACTIVE_CSV, ["date", "cumulative_active"], daily_active_rows)
 
-    print(f"Wrote {OUTPUT_CREATED_CSV} and {OUTPUT_ACTIVE_CSV}")
+def _intact_tail(f, size: int, header_end: int) -> Tuple[int, Optional[str], List[bytes]]:
+    """
+    The last intact lines of an open CSV, reading only its tail: returns
+    (offset, first date, lines) where the lines run from `offset` up to the
+    first torn, unparsable or out-of-order line. The first day seen in a tail
+    that does not reach the header is skipped, since it may be cut short.
+    """
+    tail = _TAIL_BYTES
+    while True:
+        begin = max(header_end, size - tail)
+        f.seek(begin)
+        data = f.read()
+        lines = data.splitlines(keepends=True)
+        offset = begin
+        if begin > header_end and lines:
+            offset += len(lines[0])  # Starts mid-line
+            lines = lines[1:]
+        intact = []
+        for line in lines:
+            day = _line_date(line)
+            if day is None or (intact and day < intact[-1][1]):
+                break
+            intact.append((offset, day, line))
+            offset += len(line)
+        if begin > header_end:
+            intact = [entry for entry in intact if entry[1] != intact[0][1]]
+            if not intact:
+                tail *= 2
+                continue
+        if not intact:
+            return header_end, None, []
+        return intact[0][0], intact[0][1], [line for _, _, line in intact]
+
+
+def _copy_prefix(src, dst, length: int) -> None:
+    src.seek(0)
+    while length > 0:
+        block = src.read(min(length, _COPY_BLOCK_BYTES))
+        if not block:
+            return
+        dst.write(block)
+        length -= len(block)
+
+
+def update_csv(path: str, header: List[str], rows: List[tuple]) -> Optional[str]:
+    """
+    Make `path` hold exactly what write_csv() would write, replacing only the
+    last days. Returns the date the rewrite starts at, or None if the file
+    was already up to date.
+
+    Only the file's tail is read: from its last intact days on (see
+    _intact_tail()) it is compared with the same days of `rows`, and the
+    rows before those are taken as already written, so a change further back
+    needs a full rewrite (without --incremental). The kept bytes and the
+    newly rendered rows go to a temporary file that then replaces `path`.
+    A different header or first day rewrites the whole file.
+    """
+    import csv
+    import io
+
+    buffer = io.StringIO(newline="")
+    writer = csv.writer(buffer)
+    header_line = _csv_line(writer, buffer, header)
+
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        f = io.BytesIO()
+    with f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(0)
+        first_lines = [f.readline(), f.readline()]
+        offset, first_day, old_lines = 0, None, []
+        if first_lines[0] == header_line and (not rows or _line_date(first_lines[1]) in (None, rows[0][0])):
+            offset, first_day, old_lines = _intact_tail(f, size, len(header_line))
+        start = len(rows)
+        while first_day is not None and start > 0 and rows[start - 1][0] >= first_day:
+            start -= 1
+        if offset == 0 or (first_day is not None and start == len(rows)):
+            # Another header, first day or a shorter series than the file holds: rewrite it all
+            offset, start, old_lines, new_lines = 0, 0, [], [header_line]
+        else:
+            if first_day is None:
+                start = 0
+            new_lines = []
+        new_lines = itertools.chain(new_lines, (_csv_line(writer, buffer, row) for row in rows[start:]))
+
+        # Keep every line that matches, up to the first one that does not
+        kept = offset
+        changed = 0
+        for changed, new in enumerate(itertools.chain(new_lines, [None])):
+            old = old_lines[changed] if changed < len(old_lines) else None
+            if new is None or old != new:
+                break
+            kept += len(new)
+        if new is None and kept == size:
+            return None
+
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                _copy_prefix(f, out, kept)
+                if new is not None:
+                    out.write(new)
+                    out.writelines(new_lines)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    if offset == 0:
+        changed -= 1  # Line 0 was the header
+        if changed < 0:
+            return "header"
+    index = min(start + changed, len(rows) - 1)
+    return rows[index][0] if rows else "header"
+
+
+def dimension_rolling_table(header, rows):
+    """build_dimension_rolling_metrics() output as a pyarrow Table."""
+    pa = require_pyarrow()
+    dimension = pa.dictionary(pa.int32(), pa.string())
+    columns = {
+        "date": pa.array([date.fromisoformat(row[0]) for row in rows], type=pa.date32()),
+        "dimension": pa.array([row[1] for row in rows], type=pa.string()).cast(dimension),
+        "value": pa.array([row[2] for row in rows], type=pa.string()).cast(dimension),
+    }
+    for i, name in enumerate(header[3:], start=3):
+        columns[name] = pa.array([row[i] for row in rows], type=pa.int64())
+    return pa.table(columns)
+
+
+def daily_metrics_table(daily_created_rows, daily_active_rows, rolling_header, rolling_rows):
+    """The created, cumulative active and rolling series as one pyarrow Table keyed by date."""
+    pa = require_pyarrow()
+    columns = {
+        "date": pa.array([date.fromisoformat(day) for day, _ in daily_created_rows], type=pa.date32()),
+        "created_count": pa.array([count for _, count in daily_created_rows], type=pa.int64()),
+        "cumulative_active": pa.array([cumulative for _, cumulative in daily_active_rows], type=pa.int64()),
+    }
+    for i, name in enumerate(rolling_header[1:], start=1):
+        columns[name] = pa.array([row[i] for row in rolling_rows], type=pa.int64())
+    return pa.table(columns)
+
+
+def _date_range_bounds() -> Tuple[Optional[datetime], Optional[datetime]]:
+    start = datetime.fromisoformat(DATE_RANGE_START + "T00:00:00+00:00") if DATE_RANGE_START else None
+    end = datetime.fromisoformat(DATE_RANGE_END + "T23:59:59.999999+00:00") if DATE_RANGE_END else None
+    return start, end
+
+
+def compute_daily_metrics(path: str, profiler=NULL_PROFILER) -> DailyMetricsResult:
+    if is_store(path):
+        # A workspace_metrics.partitions store: only months inside DATE_RANGE_* are read
+        with profiler.stage("read") as stage:
+            table = PartitionStore(path).read(*_date_range_bounds(), columns=["created_at", "archived", "eonid", "instance"])
+            stage.records = table.num_rows
+    elif columnar_format(path):
+        # A table written by --write-records: no JSON to decode
+        with profiler.stage("read") as stage:
+            table = read_table(path, columns=["created_at", "archived", "eonid", "instance"])
+            stage.records = table.num_rows
+    else:
+        table = None
+
+    if table is not None:
+        with profiler.stage("aggregate") as stage:
+            daily_created_rows, daily_active_rows, dimension_counts, records = build_daily_metrics_streaming(
+                creations_from_table(table)
+            )
+            stage.records = records
+    else:
+        # Streamed a document at a time: the stages interleave, but each is still timed on its own
+        with profiler.streamed(("read", "decode", "normalise", "aggregate")) as stages:
+            docs = stages.wrap("decode", iter_export(path, wrap_file=stages.file("read")))
+            with stages.charge("aggregate") as stage:
+                daily_created_rows, daily_active_rows, dimension_counts, records = build_daily_metrics_streaming(
+                    stages.wrap("normalise", iter_creations(docs))
+                )
+                stage.records = records
+
+    return DailyMetricsResult(daily_created_rows, daily_active_rows, records, dimension_counts)
+
+
+def cached_result(path: str, profiler=NULL_PROFILER) -> DailyMetricsResult:
+    """compute_daily_metrics() memoized on the export's fingerprint and the date range."""
+    return memoize("dailymetrics", (DATE_RANGE_START, DATE_RANGE_END), path, lambda: compute_daily_metrics(path, profiler))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write daily created / cumulative active workspace CSVs.")
+    parser.add_argument("json_path", nargs="?", default=DEFAULT_JSON_PATH)
+    add_profile_argument(parser)
+    parser.add_argument(
+        "--windows",
+        default=",".join(str(w) for w in ROLLING_WINDOWS),
+        help="comma-separated rolling window sizes in days (default: %(default)s)",
+    )
+    parser.add_argument("--format", choices=("csv",) + FORMATS, default="csv", help="output format (default: %(default)s)")
+    parser.add_argument(
+        "--compression",
+        default=DEFAULT_COMPRESSION,
+        help="codec for --format/--write-records parquet or arrow (default: %(default)s; 'none' to disable)",
+    )
+    parser.add_argument("--by-dimension", action="store_true", help="also write the rolling series per eonid and instance")
+    parser.add_argument("--incremental", action="store_true", help="update existing CSVs, rewriting only the days that changed")
+    parser.add_argument("--write-records", metavar="PATH", help="also save the normalised workspace table (.parquet or .arrow)")
+    add_cache_argument(parser)
+    args = parser.parse_args()
+    records_format = None
+    if args.write_records:
+        records_format = "arrow" if args.write_records.endswith((".arrow", ".feather", ".ipc")) else "parquet"
+    for fmt in {args.format, records_format} & set(FORMATS):
+        if args.compression not in COMPRESSIONS[fmt]:
+            parser.error(f"{fmt} supports --compression {', '.join(COMPRESSIONS[fmt])}")
+    if args.incremental and args.format != "csv":
+        parser.error("--incremental only applies to --format csv")
+    if args.format in FORMATS or records_format:
+        try:
+            require_pyarrow()
+        except MissingDependencyError as e:
+            parser.error(str(e))
+    try:
+        windows = tuple(int(w) for w in args.windows.split(",") if w.strip())
+    except ValueError:
+        parser.error(f"--windows must be comma-separated day counts, got {args.windows!r}")
+    if not windows or min(windows) < 1:
+        parser.error("--windows needs at least one window of 1 day or more")
+    configure_from_args(args)
+    profiler = profiler_from_args(args, "ticket3/dailymetrics.py", args.json_path)
+
+    result = cached_result(args.json_path, profiler)
+
+    with profiler.stage("render") as stage:
+        rolling_header, rolling_rows = build_rolling_metrics(result.created_rows, result.active_rows, windows)
+        csv_outputs = [
+            (OUTPUT_CREATED_CSV, ["date", "created_count"], result.created_rows),
+            (OUTPUT_ACTIVE_CSV, ["date", "cumulative_active"], result.active_rows),
+            (OUTPUT_ROLLING_CSV, rolling_header, rolling_rows),
+        ]
+        if args.by_dimension:
+            dimension_header, dimension_rows = build_dimension_rolling_metrics(result.dimension_counts, result.created_rows, windows)
+            csv_outputs.append((OUTPUT_DIMENSION_ROLLING_CSV, dimension_header, dimension_rows))
+        if args.incremental:
+            updates = []
+            for csv_path, header, rows in csv_outputs:
+                first_changed = update_csv(csv_path, header, rows)
+                updates.append(f"{csv_path} (from {first_changed})" if first_changed else f"{csv_path} (unchanged)")
+            written = ", ".join(updates)
+        elif args.format == "csv":
+            for csv_path, header, rows in csv_outputs:
+                write_csv(csv_path, header, rows)
+            written = ", ".join(csv_path for csv_path, _, _ in csv_outputs[:-1]) + f" and {csv_outputs[-1][0]}"
+        else:
+            written = output_path(OUTPUT_COLUMNAR, args.format)
+            table = daily_metrics_table(result.created_rows, result.active_rows, rolling_header, rolling_rows)
+            write_table(table, written, args.format, args.compression)
+            if args.by_dimension:
+                dimension_path = output_path(OUTPUT_DIMENSION_ROLLING, args.format)
+                write_table(dimension_rolling_table(dimension_header, dimension_rows), dimension_path, args.format, args.compression)
+                written += f" and {dimension_path}"
+        stage.records = len(result.created_rows)
+
+    if args.write_records:
+        if columnar_format(args.json_path) or is_store(args.json_path):
+            parser.error("--write-records needs a JSON export as input")
+        write_workspace_table(args.write_records, iter_export(args.json_path), records_format, args.compression)
+        written += f" and {args.write_records}"
+
+    print(f"{'Updated' if args.incremental else 'Wrote'} {written}")
+    if args.profile:
+        profiler.emit(args.profile)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
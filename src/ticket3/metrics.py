@@ -1,6 +1,22 @@
-import json
+import argparse
+import os
+import sys
 from datetime import datetime, timedelta, timezone
-from collections import Counter
+
+# The shared workspace_metrics package lives in src/, one level up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from workspace_metrics.loader import decode_export, get_timestamp_from_oid, parse_iso_datetime, read_export  # noqa: E402
+from workspace_metrics.memo import add_cache_argument, configure_from_args, memoize  # noqa: E402
+from workspace_metrics.partitions import PartitionStore, is_store  # noqa: E402
+from workspace_metrics.profiling import NULL_PROFILER, add_profile_argument, profiler_from_args  # noqa: E402
+from workspace_metrics.results import (  # noqa: E402
+    PeriodMetrics,
+    PeriodReportResult,
+    SampledPeriodMetrics,
+    SampledPeriodReportResult,
+)
+from workspace_metrics.sampling import add_sample_arguments, render_sample_summary, sample_from_args  # noqa: E402
 
 # ==============================================================================
 # --- SCRIPT CONFIGURATION (EDIT THIS SECTION FOR FUTURE REPORTS) ---
@@ -37,32 +53,41 @@ BASELINE_PERIOD_KEY = 'Full Year 2024'
 # --- END OF CONFIGURATION ---
 # ==============================================================================
 
-def parse_iso_datetime(date_str):
-    if not date_str: return None
-    if date_str.endswith('Z'): date_str = date_str[:-1] + '+00:00'
-    try: return datetime.fromisoformat(date_str)
-    except ValueError:
-        try: return datetime.strptime(date_str, '%Y-%m-%dT%H:%M:%S.%f+00:00')
-        except ValueError:
-            try: return datetime.strptime(date_str, '%Y-%m-%dT%H:%M:%S+00:00')
-            except ValueError: return None
-
-# --- NEW FUNCTION: Get timestamp from ObjectId string ---
-def get_timestamp_from_oid(oid_str):
+def normalise_workspaces(data_objects):
     """
-    Extracts the creation timestamp from a MongoDB ObjectId string.
+    (created_at, archived, workspaceId, eonid) for every doc with a creation
+    time: createdAt.$date first, falling back to the `_id.$oid` timestamp.
+    Returns (records, number of dates taken from the ObjectId).
     """
-    if not isinstance(oid_str, str) or len(oid_str) != 24:
-        return None
-    try:
-        # The first 8 hex characters represent the Unix timestamp
-        timestamp_hex = oid_str[:8]
-        timestamp_unix = int(timestamp_hex, 16)
-        # Return a timezone-aware datetime object
-        return datetime.fromtimestamp(timestamp_unix, tz=timezone.utc)
-    except (ValueError, TypeError):
-        # Handles cases where the string isn't valid hex, etc.
-        return None
+    records = []
+    oid_fallback_count = 0
+    for ws in data_objects:
+        created_at_date = None # Reset for each record
+
+        # --- Try 'createdAt' first, then fall back to '_id.$oid' ---
+        created_at_str = ws.get("createdAt", {}).get("$date")
+        if created_at_str:
+            created_at_date = parse_iso_datetime(created_at_str)
+        
+        # If createdAt was missing or failed to parse, try the fallback
+        if not created_at_date:
+            oid_str = ws.get("_id", {}).get("$oid")
+            if oid_str:
+                created_at_date = get_timestamp_from_oid(oid_str)
+                if created_at_date:
+                    oid_fallback_count += 1
+        
+        # If we still don't have a date, skip this record
+        if not created_at_date:
+            continue
+
+        records.append((
+            created_at_date,
+            ws.get("archived") is True,
+            str(ws.get("workspaceId", "Unknown")),
+            str(ws.get("eonid", "Unknown")),
+        ))
+    return records, oid_fallback_count
 
 def get_comparison_text(current_val, previous_val, item_name="items"):
     if previous_val == 0:
@@ -79,109 +104,204 @@ def get_comparison_text(current_val, previous_val, item_name="items"):
     else:
         return f"Remained the same at {current_val}."
 
-def analyze_workspace_data(file_path, periods_config, baseline_key):
+def period_bounds(periods_config):
+    """(start, end, start minus one day) per configured period."""
+    bounds = {}
     for key, period in periods_config.items():
-        period['start'] = datetime.fromisoformat(period['start_date']).replace(tzinfo=timezone.utc)
-        period['end'] = datetime.fromisoformat(period['end_date']).replace(hour=23, minute=59, second=59, tzinfo=timezone.utc)
-        period['start_minus_one_day'] = period['start'] - timedelta(days=1)
+        period_start = datetime.fromisoformat(period['start_date']).replace(tzinfo=timezone.utc)
+        period_end = datetime.fromisoformat(period['end_date']).replace(hour=23, minute=59, second=59, tzinfo=timezone.utc)
+        bounds[key] = (period_start, period_end, period_start - timedelta(days=1))
+    return bounds
 
-    period_results = {key: {
-        'newly_created': 0, 'active_in_period': 0, 'archived_in_period': 0,
-        'eonid_counts': Counter(), 'cumulative_active_at_start': 0, 'cumulative_active_at_end': 0,
-    } for key in periods_config}
+def compute_period_metrics(file_path, periods_config, profiler=NULL_PROFILER):
+    if is_store(file_path):
+        return compute_period_metrics_from_store(file_path, periods_config, profiler)
+    bounds = period_bounds(periods_config)
 
+    result = PeriodReportResult({key: PeriodMetrics() for key in periods_config})
     all_workspace_ids = set()
-    total_processed_entries = 0
-    oid_fallback_count = 0  # --- NEW: Counter for diagnostics
-    
+
+    with profiler.stage("read"):
+        text = read_export(file_path)
+    with profiler.stage("decode") as stage:
+        data_objects, _ = decode_export(text)
+        del text
+        stage.records = len(data_objects)
+
+    result.processed_entries = len(data_objects)
+
+    with profiler.stage("normalise") as stage:
+        records, result.oid_fallback_count = normalise_workspaces(data_objects)
+        del data_objects
+        stage.records = len(records)
+
+    periods = [(result.periods[key],) + bounds[key] for key in periods_config]
+    with profiler.stage("aggregate") as stage:
+        stage.records = len(records)
+        for created_at_date, is_archived, workspace_id, current_eonid in records:
+            all_workspace_ids.add(workspace_id)
+
+            for metrics, period_start, period_end, start_minus_one_day in periods:
+                if created_at_date <= start_minus_one_day and not is_archived:
+                    metrics.cumulative_active_at_start += 1
+                if created_at_date <= period_end and not is_archived:
+                    metrics.cumulative_active_at_end += 1
+                if period_start <= created_at_date <= period_end:
+                    metrics.newly_created += 1
+                    metrics.eonid_counts[current_eonid] += 1
+                    if is_archived: metrics.archived_in_period += 1
+                    else: metrics.active_in_period += 1
+
+    result.total_unique_workspaces = len(all_workspace_ids)
+    return result
+
+def render_period_report(result, periods_config, baseline_key):
+    print("\n" + "="*80)
+    print(" " * 25 + "WORKSPACE METRICS REPORT")
+    print("="*80)
+
+    baseline_results = result.periods[baseline_key]
+    print(f"\n--- BASELINE PERIOD: {baseline_key} ({periods_config[baseline_key]['start_date']} to {periods_config[baseline_key]['end_date']}) ---\n")
+    print(f"1. Active Workspaces Created in Period: {baseline_results.active_in_period}")
+    print(f"2. Cumulative Active Workspaces at End of Period: {baseline_results.cumulative_active_at_end}")
+    print(f"3. Net Change in Active Workspaces During Period: {baseline_results.net_change:+}")
+    print(f"4. Newly Created Workspaces (Total): {baseline_results.newly_created}")
+    print(f"5. Unique `eonid`s in Period: {len(baseline_results.eonid_counts)}")
+
+
+    for key, results in result.periods.items():
+        if key == baseline_key: continue
+        print("\n" + "-"*80)
+        print(f"\n--- COMPARISON PERIOD: {key} ({periods_config[key]['start_date']} to {periods_config[key]['end_date']}) ---\n")
+        print(f"1. Active Workspaces Created in Period: {results.active_in_period}")
+        print(f"   - Comparison to Baseline: {get_comparison_text(results.active_in_period, baseline_results.active_in_period)}")
+        print(f"\n2. Cumulative Active Workspaces at End of Period: {results.cumulative_active_at_end}")
+        print(f"   - Comparison to Baseline: {get_comparison_text(results.cumulative_active_at_end, baseline_results.cumulative_active_at_end)}")
+        print(f"\n3. Net Change in Active Workspaces During Period: {results.net_change:+}")
+        print(f"   - Comparison to Baseline: {get_comparison_text(results.net_change, baseline_results.net_change)}")
+        print(f"\n4. Newly Created Workspaces (Total): {results.newly_created}")
+        print(f"   - Comparison to Baseline: {get_comparison_text(results.newly_created, baseline_results.newly_created)}")
+        print(f"\n5. Unique `eonid`s in Period: {len(results.eonid_counts)}")
+        print(f"   - Comparison to Baseline: {get_comparison_text(len(results.eonid_counts), len(baseline_results.eonid_counts))}")
+        print(f"   Most Frequent `eonid`s (Top {TOP_N_EONIDS}):")
+        if results.eonid_counts:
+            for eonid, count in results.eonid_counts.most_common(TOP_N_EONIDS): print(f"     - {eonid}: {count} occurrences")
+        else:
+            print("     - No eonids found for this period.")
+
+    print("\n" + "="*80)
+    print(" " * 28 + "DATA PROCESSING SUMMARY")
+    print("="*80)
+    print(f"Total Unique Workspaces (Overall): {result.total_unique_workspaces}")
+    print(f"Total Raw Entries Processed: {result.processed_entries}")
+    print(f"Creation dates extracted from `_id.$oid` (fallback): {result.oid_fallback_count} times") # --- NEW: Diagnostic output ---
+
+def compute_period_metrics_from_store(store_path, periods_config, profiler=NULL_PROFILER):
+    """
+    compute_period_metrics() over a workspace_metrics.partitions store: only
+    the partitions overlapping a period are read, and cumulative counts come
+    from partition statistics plus the one partition holding each bound.
+    """
+    store = PartitionStore(store_path)
+    bounds = period_bounds(periods_config)
+    result = PeriodReportResult({key: PeriodMetrics() for key in periods_config})
+    result.processed_entries = store.documents
+    result.oid_fallback_count = store.from_oid
+    result.total_unique_workspaces = store.distinct_workspace_ids
+
+    with profiler.stage("read") as stage:
+        tables = {key: store.read(period_start, period_end, columns=["archived", "eonid"])
+                  for key, (period_start, period_end, _) in bounds.items()}
+        stage.records = sum(table.num_rows for table in tables.values())
+
+    with profiler.stage("aggregate") as stage:
+        stage.records = sum(table.num_rows for table in tables.values())
+        for key, (period_start, period_end, start_minus_one_day) in bounds.items():
+            metrics = result.periods[key]
+            archived = tables[key].column("archived").to_pylist()
+            metrics.newly_created = len(archived)
+            metrics.archived_in_period = sum(archived)
+            metrics.active_in_period = metrics.newly_created - metrics.archived_in_period
+            metrics.eonid_counts.update(tables[key].column("eonid").to_pylist())
+            metrics.cumulative_active_at_start = store.count(end=start_minus_one_day, active_only=True)
+            metrics.cumulative_active_at_end = store.count(end=period_end, active_only=True)
+    return result
+
+def compute_sampled_period_metrics(sample, periods_config, profiler=NULL_PROFILER):
+    """compute_period_metrics() estimated from a workspace_metrics.sampling.LineSample."""
+    with profiler.stage("normalise") as stage:
+        records = sample.map(lambda docs: normalise_workspaces(docs)[0])
+        stage.records = sample.drawn
+
+    result = SampledPeriodReportResult(records.summary(), {})
+    with profiler.stage("aggregate") as stage:
+        stage.records = sample.drawn
+        for key, (period_start, period_end, start_minus_one_day) in period_bounds(periods_config).items():
+            def in_period(record, period_start=period_start, period_end=period_end):
+                return period_start <= record[0] <= period_end
+
+            result.periods[key] = SampledPeriodMetrics(
+                newly_created=records.count(in_period),
+                active_in_period=records.count(lambda r, in_period=in_period: in_period(r) and not r[1]),
+                archived_in_period=records.count(lambda r, in_period=in_period: in_period(r) and r[1]),
+                archived_share=records.ratio(lambda r, in_period=in_period: in_period(r) and r[1], in_period),
+                cumulative_active_at_end=records.count(lambda r, period_end=period_end: r[0] <= period_end and not r[1]),
+                # Active at end but not at start, estimated directly rather than as a difference of two estimates
+                net_change=records.count(
+                    lambda r, lo=start_minus_one_day, hi=period_end: lo < r[0] <= hi and not r[1]
+                ),
+                top_eonids=records.top(lambda r, in_period=in_period: r[3] if in_period(r) else None, TOP_N_EONIDS),
+            )
+    return result
+
+def render_sampled_period_report(result, periods_config, baseline_key):
+    print("\n" + "="*80)
+    print(" " * 17 + "WORKSPACE METRICS REPORT (APPROXIMATE, SAMPLED)")
+    print("="*80)
+    render_sample_summary(result.sample)
+
+    for key, results in result.periods.items():
+        role = "BASELINE PERIOD" if key == baseline_key else "COMPARISON PERIOD"
+        print("\n" + "-"*80)
+        print(f"\n--- {role}: {key} ({periods_config[key]['start_date']} to {periods_config[key]['end_date']}) ---\n")
+        print(f"1. Active Workspaces Created in Period: {results.active_in_period}")
+        print(f"2. Cumulative Active Workspaces at End of Period: {results.cumulative_active_at_end}")
+        print(f"3. Net Change in Active Workspaces During Period: {results.net_change}")
+        print(f"4. Newly Created Workspaces (Total): {results.newly_created}")
+        print(f"   - Archived since: {results.archived_in_period} ({results.archived_share.as_percent()} of those created)")
+        print(f"5. Most Frequent `eonid`s (Top {TOP_N_EONIDS}, estimated):")
+        if results.top_eonids:
+            for eonid, estimate in results.top_eonids: print(f"     - {eonid}: {estimate} occurrences")
+        else:
+            print("     - No eonids found for this period in the sample.")
+
+    print("\n" + "="*80)
+    print("NOTE: Unique counts (workspaces, eonids) are not estimated from a sample; run without --sample for them.")
+
+def analyze_workspace_sample(file_path, periods_config, baseline_key, args, profiler=NULL_PROFILER):
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            try: data_objects = json.load(f)
-            except json.JSONDecodeError:
-                f.seek(0)
-                data_objects = [json.loads(line) for line in f if line.strip()]
-
-        total_processed_entries = len(data_objects)
-
-        for ws in data_objects:
-            created_at_date = None # Reset for each record
-
-            # --- MODIFIED LOGIC: Try 'createdAt' first, then fall back to '_id.$oid' ---
-            created_at_str = ws.get("createdAt", {}).get("$date")
-            if created_at_str:
-                created_at_date = parse_iso_datetime(created_at_str)
-            
-            # If createdAt was missing or failed to parse, try the fallback
-            if not created_at_date:
-                oid_str = ws.get("_id", {}).get("$oid")
-                if oid_str:
-                    created_at_date = get_timestamp_from_oid(oid_str)
-                    if created_at_date:
-                        oid_fallback_count += 1 # --- NEW: Increment diagnostic counter
-            
-            # If we still don't have a date, skip this record
-            if not created_at_date:
-                continue
-            # --- END OF MODIFIED LOGIC ---
-
-            is_archived = ws.get("archived") is True
-            all_workspace_ids.add(str(ws.get("workspaceId", "Unknown")))
-
-            for key, period in periods_config.items():
-                if created_at_date <= period['start_minus_one_day'] and not is_archived:
-                    period_results[key]['cumulative_active_at_start'] += 1
-                if created_at_date <= period['end'] and not is_archived:
-                    period_results[key]['cumulative_active_at_end'] += 1
-                if period['start'] <= created_at_date <= period['end']:
-                    period_results[key]['newly_created'] += 1
-                    current_eonid = str(ws.get("eonid", "Unknown"))
-                    period_results[key]['eonid_counts'][current_eonid] += 1
-                    if is_archived: period_results[key]['archived_in_period'] += 1
-                    else: period_results[key]['active_in_period'] += 1
-
-        # --- The rest of the script (printing results) is unchanged ---
-        print("\n" + "="*80)
-        print(" " * 25 + "WORKSPACE METRICS REPORT")
-        print("="*80)
-
-        baseline_results = period_results[baseline_key]
-        print(f"\n--- BASELINE PERIOD: {baseline_key} ({periods_config[baseline_key]['start_date']} to {periods_config[baseline_key]['end_date']}) ---\n")
-        # ... (rest of the printing logic is the same) ...
-        print(f"1. Active Workspaces Created in Period: {baseline_results['active_in_period']}")
-        print(f"2. Cumulative Active Workspaces at End of Period: {baseline_results['cumulative_active_at_end']}")
-        print(f"3. Net Change in Active Workspaces During Period: {(baseline_results['cumulative_active_at_end'] - baseline_results['cumulative_active_at_start']):+}")
-        print(f"4. Newly Created Workspaces (Total): {baseline_results['newly_created']}")
-        print(f"5. Unique `eonid`s in Period: {len(baseline_results['eonid_counts'])}")
-
-
-        for key, results in period_results.items():
-            if key == baseline_key: continue
-            print("\n" + "-"*80)
-            print(f"\n--- COMPARISON PERIOD: {key} ({periods_config[key]['start_date']} to {periods_config[key]['end_date']}) ---\n")
-            print(f"1. Active Workspaces Created in Period: {results['active_in_period']}")
-            print(f"   - Comparison to Baseline: {get_comparison_text(results['active_in_period'], baseline_results['active_in_period'])}")
-            print(f"\n2. Cumulative Active Workspaces at End of Period: {results['cumulative_active_at_end']}")
-            print(f"   - Comparison to Baseline: {get_comparison_text(results['cumulative_active_at_end'], baseline_results['cumulative_active_at_end'])}")
-            net_change = results['cumulative_active_at_end'] - results['cumulative_active_at_start']
-            baseline_net_change = baseline_results['cumulative_active_at_end'] - baseline_results['cumulative_active_at_start']
-            print(f"\n3. Net Change in Active Workspaces During Period: {net_change:+}")
-            print(f"   - Comparison to Baseline: {get_comparison_text(net_change, baseline_net_change)}")
-            print(f"\n4. Newly Created Workspaces (Total): {results['newly_created']}")
-            print(f"   - Comparison to Baseline: {get_comparison_text(results['newly_created'], baseline_results['newly_created'])}")
-            print(f"\n5. Unique `eonid`s in Period: {len(results['eonid_counts'])}")
-            print(f"   - Comparison to Baseline: {get_comparison_text(len(results['eonid_counts']), len(baseline_results['eonid_counts']))}")
-            print(f"   Most Frequent `eonid`s (Top {TOP_N_EONIDS}):")
-            if results['eonid_counts']:
-                for eonid, count in results['eonid_counts'].most_common(TOP_N_EONIDS): print(f"     - {eonid}: {count} occurrences")
-            else:
-                print("     - No eonids found for this period.")
-
-        print("\n" + "="*80)
-        print(" " * 28 + "DATA PROCESSING SUMMARY")
-        print("="*80)
-        print(f"Total Unique Workspaces (Overall): {len(all_workspace_ids)}")
-        print(f"Total Raw Entries Processed: {total_processed_entries}")
-        print(f"Creation dates extracted from `_id.$oid` (fallback): {oid_fallback_count} times") # --- NEW: Diagnostic output ---
+        with profiler.stage("read") as stage:
+            sample = sample_from_args(file_path, args)
+            stage.records = sample.drawn
+        result = compute_sampled_period_metrics(sample, periods_config, profiler)
+        with profiler.stage("render"):
+            render_sampled_period_report(result, periods_config, baseline_key)
+
+    except FileNotFoundError:
+        print(f"Error: File not found at {file_path}")
+    except ValueError as e:
+        print(f"Error: cannot sample {file_path}: {e}")
+
+def cached_result(file_path, periods_config=PERIODS, profiler=NULL_PROFILER):
+    """compute_period_metrics() memoized on the export's fingerprint and the configured periods."""
+    config = tuple((key, period['start_date'], period['end_date']) for key, period in periods_config.items())
+    return memoize("ticket3.metrics", config, file_path, lambda: compute_period_metrics(file_path, periods_config, profiler))
+
+def analyze_workspace_data(file_path, periods_config, baseline_key, profiler=NULL_PROFILER):
+    try:
+        result = cached_result(file_path, periods_config, profiler)
+        with profiler.stage("render"):
+            render_period_report(result, periods_config, baseline_key)
 
     except FileNotFoundError:
         print(f"Error: File not found at {file_path}")
@@ -191,4 +311,18 @@ def analyze_workspace_data(file_path, periods_config, baseline_key):
         traceback.print_exc()
 
 if __name__ == "__main__":
-    analyze_workspace_data(JSON_FILE_PATH, PERIODS, BASELINE_PERIOD_KEY)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Workspace metrics per configured period, compared to a baseline period.")
+    parser.add_argument("file_path", nargs="?", default=JSON_FILE_PATH)
+    add_profile_argument(parser)
+    add_cache_argument(parser)
+    add_sample_arguments(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+
+    profiler = profiler_from_args(args, "ticket3/metrics.py", args.file_path)
+    if args.sample:
+        analyze_workspace_sample(args.file_path, PERIODS, BASELINE_PERIOD_KEY, args, profiler)
+    else:
+        analyze_workspace_data(args.file_path, PERIODS, BASELINE_PERIOD_KEY, profiler)
+    if args.profile:
+        profiler.emit(args.profile)
\ No newline at end of file
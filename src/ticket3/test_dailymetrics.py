@@ -0,0 +1,154 @@
+import json
+import os
+import random
+from datetime import date, timedelta
+
+import pytest
+
+import dailymetrics
+from dailymetrics import (
+    build_dimension_rolling_metrics,
+    build_rolling_metrics,
+    compute_daily_metrics,
+    update_csv,
+    write_csv,
+    write_workspace_table,
+)
+from workspace_metrics.loader import iter_export
+
+WINDOWS = (1, 7, 30)
+
+
+def _export(tmp_path, name, docs):
+    path = tmp_path / name
+    path.write_text(json.dumps(docs))
+    return str(path)
+
+
+def _days(n):
+    return [date(2024, 1, 1) + timedelta(days=i) for i in range(n)]
+
+
+def _window_sums(values, windows):
+    """Trailing window sums the slow way: add up every day in the window."""
+    return [[sum(values[max(0, i - w + 1):i + 1]) for w in windows] for i in range(len(values))]
+
+
+def _random_counts(rng, days):
+    created = {d: rng.choice([0, 0, 1, 2, 5]) for d in days}
+    active = {d: rng.randint(0, count) for d, count in created.items()}
+    return {d: c for d, c in created.items() if c}, {d: c for d, c in active.items() if c}
+
+
+def test_rolling_windows_match_a_naive_window_sum():
+    rng = random.Random(7)
+    days = _days(120)
+    created, active = _random_counts(rng, days)
+    created_rows = [(d.isoformat(), created.get(d, 0)) for d in days]
+    cumulative = 0
+    active_rows = []
+    for d in days:
+        cumulative += active.get(d, 0)
+        active_rows.append((d.isoformat(), cumulative))
+
+    header, rows = build_rolling_metrics(created_rows, active_rows, WINDOWS)
+
+    assert header == ["date", "created_1d", "created_7d", "created_30d", "net_growth_1d", "net_growth_7d", "net_growth_30d"]
+    created_sums = _window_sums([created.get(d, 0) for d in days], WINDOWS)
+    active_sums = _window_sums([active.get(d, 0) for d in days], WINDOWS)
+    assert rows == [(d.isoformat(), *c, *a) for d, c, a in zip(days, created_sums, active_sums)]
+
+
+def test_dimension_rolling_windows_match_a_naive_window_sum():
+    rng = random.Random(11)
+    days = _days(90)
+    dimension_counts = {("eonid", str(v)): _random_counts(rng, rng.sample(days, 10)) for v in range(4)}
+    dimension_counts[("instance", "prod")] = _random_counts(rng, days)
+
+    _, rows = build_dimension_rolling_metrics(dimension_counts, [(d.isoformat(), 0) for d in days], WINDOWS)
+
+    expected = []
+    for d_index, d in enumerate(days):
+        for (dimension, value), (created, active) in sorted(dimension_counts.items()):
+            created_sums = _window_sums([created.get(day, 0) for day in days], WINDOWS)[d_index]
+            active_sums = _window_sums([active.get(day, 0) for day in days], WINDOWS)[d_index]
+            if any(created_sums) or any(active_sums):
+                expected.append((d.isoformat(), dimension, value, *created_sums, *active_sums))
+    assert rows == expected
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_workspace_table_gives_the_same_metrics_as_the_export(tmp_path, monkeypatch, fmt):
+    pytest.importorskip("pyarrow")
+    monkeypatch.setattr(dailymetrics, "RECORDS_BATCH_ROWS", 2)
+    export = _export(tmp_path, "workspaces.json", [
+        {"createdAt": {"$date": "2024-01-01T10:00:00Z"}, "archived": False, "eonid": 1, "instance": "prod"},
+        {"_id": {"$oid": "65b0a2800000000000000000"}, "archived": True, "eonid": 2},
+        {"createdAt": {"$date": "2024-01-03T23:59:59.999Z"}, "instance": "uat"},
+        {"archived": False},  # no creation time: left out of both
+        {"createdAt": {"$date": "2024-01-05T00:00:00+01:00"}, "eonid": 1},
+    ])
+    records = str(tmp_path / f"workspaces.{fmt}")
+
+    assert write_workspace_table(records, iter_export(export), fmt) == 4
+    assert compute_daily_metrics(records) == compute_daily_metrics(export)
+
+
+HEADER = ["date", "created_count"]
+
+
+def _daily(n, changed=None):
+    return [(d.isoformat(), i + (100 if changed is not None and i == changed else 0)) for i, d in enumerate(_days(n))]
+
+
+def _updated(tmp_path, old_rows, new_rows, junk=b""):
+    path = tmp_path / "daily_created.csv"
+    write_csv(str(path), HEADER, old_rows)
+    with open(path, "ab") as f:
+        f.write(junk)
+    expected = tmp_path / "expected.csv"
+    write_csv(str(expected), HEADER, new_rows)
+
+    first_changed = update_csv(str(path), HEADER, new_rows)
+    assert path.read_bytes() == expected.read_bytes()
+    return first_changed
+
+
+def test_update_csv_leaves_an_unchanged_file_alone(tmp_path):
+    path = tmp_path / "daily_created.csv"
+    write_csv(str(path), HEADER, _daily(40))
+    before = os.stat(path)
+
+    assert update_csv(str(path), HEADER, _daily(40)) is None
+    assert os.stat(path).st_ino == before.st_ino and os.stat(path).st_mtime_ns == before.st_mtime_ns
+
+
+def test_update_csv_appends_new_days(tmp_path):
+    assert _updated(tmp_path, _daily(40), _daily(42)) == "2024-02-10"
+
+
+def test_update_csv_rewrites_from_a_changed_row_in_the_tail(tmp_path):
+    assert _updated(tmp_path, _daily(40), _daily(41, changed=35)) == "2024-02-05"
+
+
+def test_update_csv_keeps_rows_before_the_tail_as_final(tmp_path, monkeypatch):
+    monkeypatch.setattr(dailymetrics, "_TAIL_BYTES", 64)
+    path = tmp_path / "daily_created.csv"
+    write_csv(str(path), HEADER, _daily(40))
+
+    assert update_csv(str(path), HEADER, _daily(41, changed=5)) == "2024-02-10"
+    assert path.read_text().splitlines()[6] == "2024-01-06,5"
+
+
+def test_update_csv_drops_a_torn_or_unparsable_tail(tmp_path):
+    assert _updated(tmp_path, _daily(40), _daily(40), junk=b"2024-02-10,4") == "2024-02-09"
+    assert _updated(tmp_path, _daily(40), _daily(41), junk=b"not,a,row\n2024-02-10,39\n") == "2024-02-10"
+
+
+def test_update_csv_rewrites_everything_for_another_header_or_start(tmp_path):
+    assert _updated(tmp_path, [], _daily(3)) == "2024-01-01"
+    assert _updated(tmp_path, _daily(40)[1:], _daily(40)) == "header"
+
+
+def test_update_csv_cuts_days_no_longer_reported(tmp_path):
+    assert _updated(tmp_path, _daily(40), _daily(20)) == "2024-01-20"
@@ -0,0 +1,214 @@
+"""
+Admission control for TAI lookups.
+
+Budgets are held in memory, so they are per worker process: a deployment
+running N workers admits up to N times the configured ids per env and per
+caller. Size METADATA_ADMISSION_* for one worker accordingly.
+"""
+
+from dataclasses import dataclass, field
+from typing import Collection, Dict, List, Optional
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+
+from app.metrics import ADMISSION_DECISIONS, ADMISSION_QUEUED_IDS
+from app.tai_client import TAI_BASE_URLS
+
+# Budgets are in user ids, the unit TAI load scales with. Per env: ids being
+# resolved at once across all callers; per caller: ids one caller may have
+# in flight or queued; queue: ids allowed to wait for an env slot.
+ADMISSION_ENV_IDS = int(os.environ.get("METADATA_ADMISSION_ENV_IDS", "5000"))
+ADMISSION_CALLER_IDS = int(os.environ.get("METADATA_ADMISSION_CALLER_IDS", "2000"))
+ADMISSION_QUEUE_IDS = int(os.environ.get("METADATA_ADMISSION_QUEUE_IDS", "20000"))
+# Longest a request waits in the queue before it is turned away
+ADMISSION_MAX_WAIT_SECONDS = 5.0
+
+ANONYMOUS_CALLER = "anonymous"
+
+
+class AdmissionRejected(RuntimeError):
+    """Raised instead of queueing; `status` is 429 (caller over budget) or 503 (service overloaded)."""
+
+    def __init__(self, message: str, status: int, retry_after: float):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+@dataclass(order=True)
+class _Waiter:
+    finish_tag: float
+    seq: int
+    caller: str = field(compare=False)
+    cost: int = field(compare=False)
+    admitted: bool = field(default=False, compare=False)
+    cancelled: bool = field(default=False, compare=False)
+
+
+@dataclass
+class Ticket:
+    env: str
+    caller: str
+    cost: int
+    admitted_at: float
+
+
+class _EnvState:
+    def __init__(self):
+        self.in_flight = 0
+        self.queued = 0
+        self.by_caller: Dict[str, int] = {}
+        self.queue: List[_Waiter] = []
+        # Weighted fair queueing: virtual time and each caller's last finish tag
+        self.virtual_time = 0.0
+        self.last_finish: Dict[str, float] = {}
+
+
+class AdmissionController:
+    """
+    Bounded, id-weighted concurrency per env and per caller.
+
+    A request costs as many units as the ids it sends to TAI. It runs at once
+    if its env has room and nobody is queued; otherwise it waits in a weighted
+    fair queue, where each caller's requests are ordered by virtual finish time
+    (previous finish + cost), so a caller sending huge lists or many requests
+    only delays itself. Over-budget callers get AdmissionRejected(429), a full
+    queue or too long a wait AdmissionRejected(503), both with a Retry-After
+    estimated from recent hold times.
+    """
+
+    def __init__(
+        self,
+        env_ids: int = ADMISSION_ENV_IDS,
+        caller_ids: int = ADMISSION_CALLER_IDS,
+        queue_ids: int = ADMISSION_QUEUE_IDS,
+        max_wait_seconds: float = ADMISSION_MAX_WAIT_SECONDS,
+        envs: Collection[str] = TAI_BASE_URLS,
+        clock=time.monotonic,
+    ):
+        # Only known envs get state, so arbitrary path segments cannot grow _envs
+        self.envs = envs
+        self.env_ids = env_ids
+        self.caller_ids = caller_ids
+        self.queue_ids = queue_ids
+        self.max_wait_seconds = max_wait_seconds
+        self._clock = clock
+        self._envs: Dict[str, _EnvState] = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        # Moving average of how long an admitted request holds its slot
+        self._avg_hold_seconds = 1.0
+
+    def _retry_after(self, state: _EnvState) -> float:
+        backlog = (state.in_flight + state.queued) / max(1, self.env_ids)
+        return max(1.0, math.ceil(self._avg_hold_seconds * (1 + backlog)))
+
+    def _dispatch(self, state: _EnvState) -> None:
+        # Lowest finish tag first; stop at the first one that does not fit so large requests are not starved
+        while state.queue:
+            head = state.queue[0]
+            if head.cancelled:
+                heapq.heappop(state.queue)
+                continue
+            if state.in_flight + head.cost > self.env_ids:
+                break
+            heapq.heappop(state.queue)
+            state.queued -= head.cost
+            state.in_flight += head.cost
+            state.virtual_time = max(state.virtual_time, head.finish_tag)
+            head.admitted = True
+        self._cond.notify_all()
+
+    def acquire(self, env: str, caller: Optional[str], ids: int, timeout: Optional[float] = None) -> Ticket:
+        """
+        Wait for room for `ids` ids; raises AdmissionRejected instead of waiting
+        past the budget and ValueError for an unknown env.
+        """
+        if env.upper() not in self.envs:
+            raise ValueError(f"Unknown environment [{env}]")
+        env = env.upper()
+        caller = caller or ANONYMOUS_CALLER
+        # A single request larger than any budget still runs, alone
+        cost = max(1, min(ids, self.caller_ids, self.env_ids))
+        wait = self.max_wait_seconds if timeout is None else min(timeout, self.max_wait_seconds)
+
+        with self._cond:
+            state = self._envs.setdefault(env, _EnvState())
+            if state.by_caller.get(caller, 0) + cost > self.caller_ids:
+                ADMISSION_DECISIONS.inc(env=env, result="rejected_caller")
+                raise AdmissionRejected(
+                    f"Too many user ids in flight for {caller}", 429, self._retry_after(state),
+                )
+
+            if not state.queue and state.in_flight + cost <= self.env_ids:
+                state.in_flight += cost
+            else:
+                if state.queued + cost > self.queue_ids:
+                    ADMISSION_DECISIONS.inc(env=env, result="rejected_queue_full")
+                    raise AdmissionRejected(
+                        f"User metadata service for {env} is overloaded", 503, self._retry_after(state),
+                    )
+                finish_tag = max(state.virtual_time, state.last_finish.get(caller, 0.0)) + cost
+                state.last_finish[caller] = finish_tag
+                waiter = _Waiter(finish_tag, next(self._seq), caller, cost)
+                heapq.heappush(state.queue, waiter)
+                state.queued += cost
+                ADMISSION_QUEUED_IDS.inc(cost, env=env)
+                state.by_caller[caller] = state.by_caller.get(caller, 0) + cost
+
+                deadline = self._clock() + wait
+                try:
+                    self._dispatch(state)
+                    while not waiter.admitted:
+                        remaining = deadline - self._clock()
+                        if remaining <= 0:
+                            waiter.cancelled = True
+                            state.queued -= cost
+                            self._release_caller(state, caller, cost)
+                            self._dispatch(state)
+                            ADMISSION_DECISIONS.inc(env=env, result="timed_out")
+                            raise AdmissionRejected(
+                                f"Timed out waiting for capacity for {env}", 503, self._retry_after(state),
+                            )
+                        self._cond.wait(remaining)
+                finally:
+                    ADMISSION_QUEUED_IDS.dec(cost, env=env)
+                ADMISSION_DECISIONS.inc(env=env, result="queued")
+                return Ticket(env, caller, cost, self._clock())
+
+            state.by_caller[caller] = state.by_caller.get(caller, 0) + cost
+            ADMISSION_DECISIONS.inc(env=env, result="admitted")
+            return Ticket(env, caller, cost, self._clock())
+
+    @staticmethod
+    def _release_caller(state: _EnvState, caller: str, cost: int) -> None:
+        remaining = state.by_caller.get(caller, 0) - cost
+        if remaining > 0:
+            state.by_caller[caller] = remaining
+        else:
+            state.by_caller.pop(caller, None)
+            if not any(w.caller == caller and not w.cancelled for w in state.queue):
+                state.last_finish.pop(caller, None)
+
+    def release(self, ticket: Ticket) -> None:
+        with self._cond:
+            state = self._envs[ticket.env]
+            state.in_flight -= ticket.cost
+            self._release_caller(state, ticket.caller, ticket.cost)
+            held = self._clock() - ticket.admitted_at
+            self._avg_hold_seconds = 0.9 * self._avg_hold_seconds + 0.1 * held
+            self._dispatch(state)
+
+    def status(self) -> Dict[str, Dict]:
+        with self._cond:
+            return {
+                env: {"inFlightIds": state.in_flight, "queuedIds": state.queued, "callers": len(state.by_caller)}
+                for env, state in self._envs.items()
+            }
+
+
+admission = AdmissionController()
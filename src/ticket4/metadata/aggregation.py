@@ -0,0 +1,274 @@
+from collections import Counter, OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from contextlib import nullcontext
+from typing import Callable, ContextManager, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import logging
+import threading
+import time
+
+from app.analytics_logs import LOG_ENVIRONMENTS, fetch_access_logs
+from app.cache import MetadataCache, has_columns
+from app.resilience import CircuitOpenError, Deadline, DeadlineExceeded
+from app.snapshot import UserSnapshot
+from app.tai_client import TAI_BATCH_SIZE, TAI_REGION_COLUMN, get_user_metadata
+
+log = logging.getLogger(__name__)
+
+BUCKETS = ("day", "week", "month")
+# Longest range one request may aggregate over
+MAX_RANGE_DAYS = 366
+# Today's logs are still growing; re-read them at most this often
+OPEN_DAY_REFRESH_SECONDS = 5 * 60
+# (env, day) entries kept by the usage index: room for two full-range queries over every env
+MAX_INDEXED_DAYS = 2 * MAX_RANGE_DAYS * len(LOG_ENVIRONMENTS)
+
+DEPARTMENT_COLUMN = "user.division"
+# See tai_client.TAI_REGION_COLUMN; without it every user's region is Unknown
+REGION_COLUMN: Optional[str] = TAI_REGION_COLUMN or None
+DIMENSION_COLUMNS = [DEPARTMENT_COLUMN] + ([REGION_COLUMN] if REGION_COLUMN else [])
+UNKNOWN = "Unknown"
+
+
+def _event_day(event: Dict) -> Optional[date]:
+    raw = event.get("createdAt") or event.get("created_at")
+    if isinstance(raw, dict):
+        raw = raw.get("$date")
+    if not isinstance(raw, str) or not raw:
+        return None
+    try:
+        return datetime.fromisoformat(raw.replace("Z", "+00:00")).date()
+    except ValueError:
+        return None
+
+
+def bucket_start(day: date, bucket: str) -> date:
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def _utc_today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+class UsageIndex:
+    """
+    Per (log env, day) event counts by userId, built from the access logs.
+
+    Days are bucketed in UTC (see _event_day), so "today" is the UTC date.
+    Closed days are fetched once and kept; the current day is re-read at most
+    every OPEN_DAY_REFRESH_SECONDS, and a day last fetched while it was still
+    open is re-read once more after it has closed. At most MAX_INDEXED_DAYS
+    (env, day) entries are kept, least recently used first out. Aggregations
+    then scan (day, user, count) triples instead of raw events.
+    """
+
+    def __init__(
+        self,
+        fetch_logs: Callable[[str, date, date], List[Dict]] = fetch_access_logs,
+        today: Callable[[], date] = _utc_today,
+        clock=time.monotonic,
+        max_days: int = MAX_INDEXED_DAYS,
+    ):
+        self.fetch_logs = fetch_logs
+        self._today = today
+        self._clock = clock
+        self.max_days = max_days
+        self._days: "OrderedDict[Tuple[str, date], Counter]" = OrderedDict()
+        # (env, day) -> when it was fetched, for days fetched while still open
+        self._open_days: Dict[Tuple[str, date], float] = {}
+        self._lock = threading.Lock()
+
+    def _missing_days(self, env: str, start: date, end: date) -> List[date]:
+        today = self._today()
+        missing = []
+        day = start
+        while day <= end and day <= today:
+            fetched_at = self._open_days.get((env, day))
+            if (env, day) not in self._days:
+                missing.append(day)
+            elif fetched_at is not None and (day < today or self._clock() - fetched_at >= OPEN_DAY_REFRESH_SECONDS):
+                missing.append(day)
+            day += timedelta(days=1)
+        return missing
+
+    def _store(self, env: str, by_day: Dict[date, Counter]) -> None:
+        today = self._today()
+        now = self._clock()
+        for day, counts in by_day.items():
+            self._days[(env, day)] = counts
+            self._days.move_to_end((env, day))
+            if day >= today:
+                self._open_days[(env, day)] = now
+            else:
+                self._open_days.pop((env, day), None)
+        while len(self._days) > self.max_days:
+            key, _ = self._days.popitem(last=False)
+            self._open_days.pop(key, None)
+
+    def ensure(self, env: str, start: date, end: date) -> Dict[date, Counter]:
+        """
+        Fetch whatever days of [start, end] are not indexed yet (or due a
+        re-read), one log query per contiguous gap, and return the range's
+        indexed days: userId -> event count, per day.
+        """
+        env = env.upper()
+        with self._lock:
+            missing = self._missing_days(env, start, end)
+        for gap_start, gap_end in _contiguous_ranges(missing):
+            by_day: Dict[date, Counter] = {}
+            day = gap_start
+            while day <= gap_end:
+                by_day[day] = Counter()
+                day += timedelta(days=1)
+
+            for event in self.fetch_logs(env, gap_start, gap_end):
+                day = _event_day(event)
+                user_id = event.get("user")
+                if day in by_day and isinstance(user_id, str) and user_id:
+                    by_day[day][user_id] += 1
+
+            with self._lock:
+                self._store(env, by_day)
+
+        indexed: Dict[date, Counter] = {}
+        with self._lock:
+            day = start
+            while day <= end:
+                counts = self._days.get((env, day))
+                if counts is not None:
+                    self._days.move_to_end((env, day))
+                    indexed[day] = counts
+                day += timedelta(days=1)
+        return indexed
+
+
+def _contiguous_ranges(days: List[date]) -> Iterator[Tuple[date, date]]:
+    if not days:
+        return
+    range_start = previous = days[0]
+    for day in days[1:]:
+        if day != previous + timedelta(days=1):
+            yield range_start, previous
+            range_start = day
+        previous = day
+    yield range_start, previous
+
+
+def resolve_dimensions(
+    cache: MetadataCache,
+    snapshot: UserSnapshot,
+    env: str,
+    user_ids: List[str],
+    deadline: Optional[Deadline] = None,
+    admit: Callable[[int], ContextManager] = lambda ids: nullcontext(),
+) -> Dict[str, Tuple[str, str]]:
+    """
+    userId -> (department, region), from the cache, then the snapshot, then TAI.
+
+    The TAI lookups are bounded by `deadline` and run inside `admit(ids)` (e.g.
+    an admission ticket for that many ids). If TAI is unavailable part-way,
+    expired cache entries are used for the rest, provided there are some for all of them.
+    """
+    rows, missing = cache.get_many(env, user_ids, columns=DIMENSION_COLUMNS)
+    if missing:
+        snapshot_rows, pending = snapshot.get_many(env, missing)
+        if snapshot_rows:
+            rows.update(cache.put_many(env, list(snapshot_rows), [row for row in snapshot_rows.values() if row]))
+        if pending:
+            with admit(len(pending)):
+                try:
+                    for start in range(0, len(pending), TAI_BATCH_SIZE):
+                        batch = pending[start:start + TAI_BATCH_SIZE]
+                        live_rows = get_user_metadata(env, batch, deadline=deadline)
+                        snapshot.upsert(env, batch, live_rows)
+                        rows.update(cache.put_many(env, batch, live_rows))
+                except (CircuitOpenError, DeadlineExceeded) as e:
+                    rest = [user_id for user_id in pending if user_id not in rows]
+                    stale_rows = {
+                        user_id: row for user_id, row in cache.get_stale(env, rest).items()
+                        if has_columns(row, DIMENSION_COLUMNS)
+                    }
+                    if len(stale_rows) < len(rest):
+                        raise
+                    log.warning("Resolving dimensions from stale user metadata for %s: %s", env, e)
+                    rows.update(stale_rows)
+
+    dimensions = {}
+    for user_id in user_ids:
+        row = rows.get(user_id) or {}
+        department = row.get(DEPARTMENT_COLUMN) or UNKNOWN
+        region = (row.get(REGION_COLUMN) if REGION_COLUMN else None) or UNKNOWN
+        dimensions[user_id] = (department, region)
+    return dimensions
+
+
+def aggregate_usage(
+    index: UsageIndex,
+    resolve: Callable[[List[str]], Dict[str, Tuple[str, str]]],
+    start: date,
+    end: date,
+    bucket: str = "day",
+    environments: Optional[Iterable[str]] = None,
+    departments: Optional[Set[str]] = None,
+    regions: Optional[Set[str]] = None,
+) -> Dict:
+    """
+    Access-log event counts grouped by (time bucket, department, region, environment).
+
+    Raises ValueError for an invalid bucket or date range, or a regions filter
+    without a configured region column.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {list(BUCKETS)}")
+    if end < start:
+        raise ValueError("endDate must not be before startDate")
+    if (end - start).days >= MAX_RANGE_DAYS:
+        raise ValueError(f"date range must be at most {MAX_RANGE_DAYS} days")
+
+    if regions and not REGION_COLUMN:
+        raise ValueError("regions filter needs a region column (TAI_REGION_COLUMN) to be configured")
+
+    envs = [env.upper() for env in (environments or LOG_ENVIRONMENTS)]
+    unknown_envs = [env for env in envs if env not in LOG_ENVIRONMENTS]
+    if unknown_envs:
+        raise ValueError(f"Unknown environments {unknown_envs}")
+
+    # Held here, so days evicted from the index meanwhile still count
+    indexed = {env: index.ensure(env, start, end) for env in envs}
+
+    user_ids = sorted({user_id for by_day in indexed.values() for day_counts in by_day.values() for user_id in day_counts})
+    dimensions = resolve(user_ids) if user_ids else {}
+
+    counts: Counter = Counter()
+    for env, by_day in indexed.items():
+        for day, day_counts in by_day.items():
+            for user_id, count in day_counts.items():
+                department, region = dimensions.get(user_id, (UNKNOWN, UNKNOWN))
+                if departments and department not in departments:
+                    continue
+                if regions and region not in regions:
+                    continue
+                counts[(bucket_start(day, bucket), department, region, env)] += count
+
+    return {
+        "bucket": bucket,
+        "startDate": start.isoformat(),
+        "endDate": end.isoformat(),
+        "users": len(user_ids),
+        "rows": [
+            {
+                "bucket": bucket_day.isoformat(),
+                "department": department,
+                "region": region,
+                "environment": env,
+                "count": count,
+            }
+            for (bucket_day, department, region, env), count in sorted(counts.items())
+        ],
+    }
+
+
+usage_index = UsageIndex()
@@ -0,0 +1,49 @@
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+import logging
+import os
+
+from app import http_client
+
+log = logging.getLogger(__name__)
+
+# Same query service the analytics frontend reads its C4TS access logs from
+ANALYTICS_API_BASE_URL = os.environ.get("ANALYTICS_API_BASE_URL", "")
+C4TS_ACCESS_LOGS_QUERY = "/query/305522/c4ts_access_logs/{env}"
+LOG_ENVIRONMENTS = ["DEV", "QA", "PROD"]
+
+
+def _format_date(value: date) -> str:
+    # Matches formatDateForApi on the frontend (dd-MM-yyyy)
+    return value.strftime("%d-%m-%Y")
+
+
+def fetch_access_logs(env: str, start_date: date, end_date: date) -> List[Dict]:
+    if not ANALYTICS_API_BASE_URL:
+        raise RuntimeError("ANALYTICS_API_BASE_URL is not configured")
+
+    url = ANALYTICS_API_BASE_URL.rstrip("/") + C4TS_ACCESS_LOGS_QUERY.format(env=env.upper())
+    params = {"startDate": _format_date(start_date), "endDate": _format_date(end_date)}
+
+    log.info("Analytics GET %s params=%s", url, params)
+
+    resp = http_client.get(url, params=params, timeout=60)
+    if not resp.ok:
+        raise RuntimeError(f"Analytics log request failed: {resp.status_code} {resp.reason}")
+
+    return resp.json() or []
+
+
+def collect_user_ids(lookback_days: int, envs: Optional[List[str]] = None) -> List[str]:
+    """Distinct, sorted userIds (the `user` field) seen in the access logs of the last N days."""
+    end_date = date.today()
+    start_date = end_date - timedelta(days=lookback_days)
+
+    user_ids = set()
+    for env in envs or LOG_ENVIRONMENTS:
+        for event in fetch_access_logs(env, start_date, end_date):
+            user_id = event.get("user")
+            if isinstance(user_id, str) and user_id.strip():
+                user_ids.add(user_id.strip())
+
+    return sorted(user_ids)
@@ -1,40 +1,396 @@
 
 
 
+import hashlib
+import itertools
+import json
+import logging
+import os
+from contextlib import contextmanager
+from datetime import date
+from functools import partial
 from http import HTTPStatus
-from flask import request
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from flask import Response, request, stream_with_context
 from flask_restx import Resource
 
-from app.tai_client import get_user_department  # adjust import to your layout
+from app.admission import AdmissionRejected, admission
+from app.aggregation import aggregate_usage, resolve_dimensions, usage_index
+from app.cache import has_columns, metadata_cache
+from app.constants import AUTHENTICATED_WEBSTACK_USER_HEADER
+from app.metrics import METADATA_IDS_PER_REQUEST, PROMETHEUS_MIMETYPE, record_cache_lookup, registry, track_request
+from app.resilience import CircuitOpenError, Deadline, DeadlineExceeded
+from app.snapshot import snapshot_refresher, user_snapshot
+from app.tai_client import DEPARTMENT_COLUMNS, get_user_department, iter_user_metadata  # adjust import to your layout
+from app.warmer import metadata_warmer
+
+log = logging.getLogger(__name__)
+
+# Bulk lookups take ids in the body, so the cap is about TAI load, not URL length
+BULK_MAX_IDS = 10000
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+# Response field -> TAI column
+METADATA_FIELDS = {
+    "department": "user.division",
+    "division": "user.division",
+    "subDepartment": "user.department",
+    "jobTitle": "user.job_title",
+}
+DEFAULT_METADATA_FIELDS = ["department"]
+
+# Time budget for one request, shared by every TAI call it makes. Callers may
+# ask for less with an X-Request-Timeout header (seconds).
+REQUEST_DEADLINE_SECONDS = 10
+BULK_REQUEST_DEADLINE_SECONDS = 60
+REQUEST_TIMEOUT_HEADER = "X-Request-Timeout"
+
+# Pre-fetch metadata for every analytics user at startup and on a schedule.
+# Under a pre-fork server call metadata_warmer.start() from a post-fork hook instead.
+if os.environ.get("METADATA_WARMER_ENABLED") == "1":
+    metadata_warmer.start()
+# A configured snapshot is refreshed unless another process does it (set to "0" there)
+if user_snapshot.enabled and os.environ.get("METADATA_SNAPSHOT_REFRESH_ENABLED", "1") == "1":
+    snapshot_refresher.start()
+
+
+def _parse_bulk_request(body) -> Tuple[List[str], List[str]]:
+    """Validate a bulk POST body: {"ids": [...], "columns": [...]?}."""
+    if not isinstance(body, dict):
+        raise ValueError("request body must be a JSON object")
+
+    raw_ids = body.get("ids")
+    if not isinstance(raw_ids, list):
+        raise ValueError("ids must be a list of user ids")
+
+    # De-duplicate while keeping the caller's order
+    user_ids = list(dict.fromkeys(str(uid).strip() for uid in raw_ids if str(uid).strip()))
+    if not user_ids:
+        raise ValueError("ids is required")
+    if len(user_ids) > BULK_MAX_IDS:
+        raise ValueError(f"at most {BULK_MAX_IDS} ids can be requested at once")
+
+    fields = body.get("columns") or DEFAULT_METADATA_FIELDS
+    if not isinstance(fields, list):
+        raise ValueError("columns must be a list")
+    unknown = [f for f in fields if f not in METADATA_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown columns {unknown}; expected any of {sorted(METADATA_FIELDS)}")
+
+    return user_ids, fields
+
+
+def _request_deadline(default_seconds: float) -> Deadline:
+    try:
+        requested = float(request.headers.get(REQUEST_TIMEOUT_HEADER, default_seconds))
+    except ValueError:
+        requested = default_seconds
+    return Deadline(min(max(requested, 0.0), default_seconds))
+
+
+def _metadata_etag(env: str, metadata: Dict) -> str:
+    # A hash of the body itself, so every worker gives the same rows the same ETag
+    body = json.dumps(metadata, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(f"{env.upper()}|{body}".encode("utf-8")).hexdigest()
+
+
+def _project_row(row: Dict, fields: List[str]) -> Dict:
+    return {field: row.get(METADATA_FIELDS[field]) for field in fields}
+
+
+def _caller() -> str:
+    return request.headers.get(AUTHENTICATED_WEBSTACK_USER_HEADER, "").strip()
+
+
+def _parse_date_arg(name: str) -> date:
+    value = request.args.get(name, "").strip()
+    if not value:
+        raise ValueError(f"{name} query parameter is required (YYYY-MM-DD)")
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a date in YYYY-MM-DD format") from None
+
+
+def _list_arg(name: str) -> Optional[Set[str]]:
+    values = {value.strip() for value in request.args.get(name, "").split(",") if value.strip()}
+    return values or None
+
 
 @api.route("/user-metadata/<env>")
 class UserMetadataResource(Resource):
+    method_decorators = [track_request("/user-metadata/<env>")]
+
     def get(self, env: str):
         raw_ids = request.args.get("ids", "")
-        user_ids = [uid.strip() for uid in raw_ids.split(",") if uid.strip()]
+        user_ids = sorted({uid.strip() for uid in raw_ids.split(",") if uid.strip()})
 
         if not user_ids:
             return {"message": "ids query parameter is required"}, HTTPStatus.BAD_REQUEST
 
+        METADATA_IDS_PER_REQUEST.observe(len(user_ids), route="get")
+        deadline = _request_deadline(REQUEST_DEADLINE_SECONDS)
+        stale = False
+
+        rows_by_id, missing = metadata_cache.get_many(env, user_ids)
+        record_cache_lookup("memory", len(user_ids) - len(missing), len(missing))
+        if missing:
+            # Snapshot first; live TAI only for ids the snapshot has never seen
+            snapshot_rows, pending = user_snapshot.get_many(env, missing)
+            record_cache_lookup("snapshot", len(missing) - len(pending), len(pending))
+            rows = [row for row in snapshot_rows.values() if row]
+            if pending:
+                try:
+                    ticket = admission.acquire(env, _caller(), len(pending), timeout=deadline.remaining())
+                except ValueError as e:
+                    return {"message": str(e)}, HTTPStatus.BAD_REQUEST
+                except AdmissionRejected as e:
+                    return _admission_rejected(e)
+                try:
+                    rows += get_user_department(env, pending, deadline=deadline)
+                except ValueError as e:
+                    return {"message": str(e)}, HTTPStatus.BAD_REQUEST
+                except (CircuitOpenError, DeadlineExceeded) as e:
+                    # TAI is unhealthy or too slow: serve expired cache entries if we have them all
+                    stale_rows = metadata_cache.get_stale(env, pending)
+                    if len(stale_rows) < len(pending):
+                        return _upstream_unavailable(e)
+                    log.warning("Serving stale user metadata for %s: %s", env, e)
+                    rows += [row for row in stale_rows.values() if row]
+                    stale = True
+                except Exception as e:
+                    # Return real error (at least until stable). You can later swap to logging only.
+                    return {"message": f"Failed to retrieve user metadata: {e}"}, HTTPStatus.INTERNAL_SERVER_ERROR
+                finally:
+                    admission.release(ticket)
+                # The refresher pulls the full rows into the snapshot on its next cycle
+                user_snapshot.track(env, pending)
+
+            if stale:
+                # Keep stale rows out of the cache so the next request retries TAI
+                rows_by_id.update({row["user.user"]: row for row in rows if row.get("user.user")})
+            else:
+                rows_by_id.update(metadata_cache.put_many(env, missing, rows))
+
+        # Build response: { userId: { department: "..." } }
+        result = {}
+        for user_id in user_ids:
+            row = rows_by_id.get(user_id)
+            if not row:
+                continue
+
+            # Match your columns in tai_client columns=
+            result[user_id] = {"department": row.get("user.division")}
+
+        etag = _metadata_etag(env, result)
+        headers = {
+            "ETag": f'"{etag}"',
+            "Cache-Control": f"private, max-age={metadata_cache.remaining_ttl(env, user_ids)}",
+        }
+        if stale:
+            headers["Cache-Control"] = "private, no-cache"
+            headers["Warning"] = '110 - "Response is Stale"'
+        elif request.if_none_match.contains(etag):
+            return Response(status=HTTPStatus.NOT_MODIFIED, headers=headers)
+
+        return {"metadata": result}, HTTPStatus.OK, headers
+
+    def post(self, env: str):
+        """
+        Bulk lookup: ids (and optional columns) in the body instead of the URL.
+
+        The response is streamed as TAI batches resolve. Send
+        `Accept: application/x-ndjson` for one {"userId": ..., <columns>} per line;
+        otherwise the body is the same {"metadata": {...}} document as GET.
+        """
+        try:
+            user_ids, fields = _parse_bulk_request(request.get_json(silent=True))
+            METADATA_IDS_PER_REQUEST.observe(len(user_ids), route="post")
+            # Only the TAI columns behind the requested fields are needed
+            columns = list(dict.fromkeys(METADATA_FIELDS[field] for field in fields))
+            cached_rows, missing = metadata_cache.get_many(env, user_ids, columns=columns)
+            record_cache_lookup("memory", len(user_ids) - len(missing), len(missing))
+            snapshot_rows, pending = user_snapshot.get_many(env, missing) if missing else ({}, [])
+            record_cache_lookup("snapshot", len(missing) - len(pending), len(pending))
+            if snapshot_rows:
+                metadata_cache.put_many(env, list(snapshot_rows), [row for row in snapshot_rows.values() if row])
+            deadline = _request_deadline(BULK_REQUEST_DEADLINE_SECONDS)
+            # Fetched rows are cached, so they also carry what GET reads
+            live_rows = iter_user_metadata(
+                env,
+                pending,
+                deadline=deadline,
+                columns=list(dict.fromkeys(DEPARTMENT_COLUMNS + columns)),
+                on_batch=lambda batch, rows: metadata_cache.put_many(env, batch, rows),
+            ) if pending else iter(())
+        except ValueError as e:
+            return {"message": str(e)}, HTTPStatus.BAD_REQUEST
+
+        ticket = None
+        if pending:
+            # Held until the stream has been sent, since TAI is read while streaming
+            try:
+                ticket = admission.acquire(env, _caller(), len(pending), timeout=deadline.remaining())
+            except AdmissionRejected as e:
+                return _admission_rejected(e)
+            user_snapshot.track(env, pending)
+            live_rows = _with_stale_fallback(env, pending, columns, live_rows)
+        # Cache and snapshot hits go out immediately, live TAI batches follow as they resolve
+        known_rows = itertools.chain(cached_rows.values(), snapshot_rows.values())
+        rows = itertools.chain((row for row in known_rows if row), live_rows)
+
+        ndjson = request.accept_mimetypes.best_match(["application/json", NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+        stream = _stream_ndjson(rows, fields) if ndjson else _stream_json(rows, fields)
+
+        response = Response(
+            stream_with_context(stream),
+            status=HTTPStatus.OK,
+            mimetype=NDJSON_MIMETYPE if ndjson else "application/json",
+        )
+        if ticket is not None:
+            response.call_on_close(lambda: admission.release(ticket))
+        return response
+
+
+@api.route("/user-metadata/<env>/aggregates")
+class UserMetadataAggregatesResource(Resource):
+    method_decorators = [track_request("/user-metadata/<env>/aggregates")]
+
+    def get(self, env: str):
+        """
+        Access-log event counts by (bucket, department, region, environment).
+
+        Query: startDate, endDate (YYYY-MM-DD, inclusive), bucket=day|week|month,
+        and optional comma-separated environments, departments and regions filters.
+        `env` is the TAI env used to resolve departments, as for UserMetadataResource.
+        """
+        deadline = _request_deadline(BULK_REQUEST_DEADLINE_SECONDS)
         try:
-            rows = get_user_department(env, user_ids)
+            result = aggregate_usage(
+                usage_index,
+                lambda user_ids: resolve_dimensions(
+                    metadata_cache, user_snapshot, env, user_ids, deadline=deadline, admit=partial(_admitted, env, deadline),
+                ),
+                _parse_date_arg("startDate"),
+                _parse_date_arg("endDate"),
+                bucket=request.args.get("bucket", "day"),
+                environments=_list_arg("environments"),
+                departments=_list_arg("departments"),
+                regions=_list_arg("regions"),
+            )
         except ValueError as e:
             return {"message": str(e)}, HTTPStatus.BAD_REQUEST
+        except AdmissionRejected as e:
+            return _admission_rejected(e)
+        except (CircuitOpenError, DeadlineExceeded) as e:
+            return _upstream_unavailable(e)
         except Exception as e:
-            # Return real error (at least until stable). You can later swap to logging only.
-            return {"message": f"Failed to retrieve user metadata: {e}"}, HTTPStatus.INTERNAL_SERVER_ERROR
+            return {"message": f"Failed to aggregate analytics logs: {e}"}, HTTPStatus.INTERNAL_SERVER_ERROR
 
-        # Build response: { userId: { department: "..." } }
-        result = {}
+        return result, HTTPStatus.OK
+
+
+@api.route("/user-metadata/warmup")
+class UserMetadataWarmupResource(Resource):
+    method_decorators = [track_request("/user-metadata/warmup")]
+
+    def get(self):
+        """Background warm-up progress, plus snapshot size and staleness per env."""
+        status = metadata_warmer.status()
+        status["snapshot"] = {env: user_snapshot.stats(env) for env in user_snapshot.envs()}
+        return status, HTTPStatus.OK
+
+
+@api.route("/metrics")
+class MetricsResource(Resource):
+    def get(self):
+        """Prometheus text exposition of the service's latency, TAI and cache metrics."""
+        return Response(registry.render(), mimetype=PROMETHEUS_MIMETYPE)
+
+
+@contextmanager
+def _admitted(env: str, deadline: Deadline, ids: int) -> Iterator[None]:
+    """Hold an admission ticket for `ids` TAI lookups on behalf of the caller."""
+    ticket = admission.acquire(env, _caller(), ids, timeout=deadline.remaining())
+    try:
+        yield
+    finally:
+        admission.release(ticket)
+
+
+def _upstream_unavailable(error: Exception):
+    if isinstance(error, CircuitOpenError):
+        return (
+            {"message": f"User metadata temporarily unavailable: {error}"},
+            HTTPStatus.SERVICE_UNAVAILABLE,
+            {"Retry-After": str(max(1, int(error.retry_after)))},
+        )
+    return {"message": f"Timed out retrieving user metadata: {error}"}, HTTPStatus.GATEWAY_TIMEOUT
+
+
+def _admission_rejected(error: AdmissionRejected):
+    return (
+        {"message": str(error)},
+        error.status,
+        {"Retry-After": str(max(1, int(error.retry_after)))},
+    )
+
+
+def _with_stale_fallback(env: str, user_ids: List[str], columns: List[str], rows: Iterator[Dict]) -> Iterator[Dict]:
+    """
+    Pass live TAI rows through; if TAI becomes unavailable part-way, finish with
+    expired cache entries for the ids not yet sent, provided there are some for all of them.
+    """
+    sent = set()
+    try:
         for row in rows:
-            # Match your columns in tai_client columns=
-            user_id = row.get("user.user")
-            if not user_id:
-                continue
+            sent.add(row.get("user.user"))
+            yield row
+    except (CircuitOpenError, DeadlineExceeded) as e:
+        rest = [user_id for user_id in user_ids if user_id not in sent]
+        stale_rows = {user_id: row for user_id, row in metadata_cache.get_stale(env, rest).items() if has_columns(row, columns)}
+        if len(stale_rows) < len(rest):
+            raise
+        log.warning("Serving stale user metadata for %s: %s", env, e)
+        yield from (row for row in stale_rows.values() if row)
 
-            result[user_id] = {"department": row.get("user.division")}
 
-        return {"metadata": result}, HTTPStatus.OK
-    
-    curl "http://localhost:5173/user-metadata/QA?ids=12345;67890"
-    curl -v "http://localhost:8081/user-metadata/QA?ids=user1,user2"
\ No newline at end of file
+def _unique_rows(rows: Iterator[Dict]) -> Iterator[Tuple[str, Dict]]:
+    seen = set()
+    for row in rows:
+        user_id = row.get("user.user")
+        if not user_id or user_id in seen:
+            continue
+        seen.add(user_id)
+        yield user_id, row
+
+
+def _stream_ndjson(rows: Iterator[Dict], fields: List[str]) -> Iterator[str]:
+    try:
+        for user_id, row in _unique_rows(rows):
+            yield json.dumps({"userId": user_id, **_project_row(row, fields)}) + "\n"
+    except Exception as e:
+        # Headers are already sent, so the failure is reported in-band
+        log.exception("Bulk user metadata stream failed")
+        yield json.dumps({"error": f"Failed to retrieve user metadata: {e}"}) + "\n"
+
+
+def _stream_json(rows: Iterator[Dict], fields: List[str]) -> Iterator[str]:
+    yield '{"metadata": {'
+    try:
+        separator = ""
+        for user_id, row in _unique_rows(rows):
+            yield f"{separator}{json.dumps(user_id)}: {json.dumps(_project_row(row, fields))}"
+            separator = ", "
+    except Exception as e:
+        log.exception("Bulk user metadata stream failed")
+        yield "}, " + f'"error": {json.dumps(f"Failed to retrieve user metadata: {e}")}' + "}"
+        return
+    yield "}}"
+
+# curl "http://localhost:5173/user-metadata/QA?ids=12345;67890"
+# curl -v "http://localhost:8081/user-metadata/QA?ids=user1,user2"
+# curl "http://localhost:8081/user-metadata/PROD/aggregates?startDate=2025-01-01&endDate=2025-03-31&bucket=week&environments=PROD"
+# curl -X POST -H "Content-Type: application/json" -H "Accept: application/x-ndjson" \
+#      -d '{"ids": ["user1", "user2"], "columns": ["department", "jobTitle"]}' \
+#      "http://localhost:8081/user-metadata/QA"
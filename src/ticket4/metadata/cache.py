@@ -0,0 +1,264 @@
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# How long a TAI row is served before it is refetched. Responses advertise
+# Cache-Control max-age from the same clock so browsers never outlive us.
+METADATA_CACHE_TTL_SECONDS = 15 * 60
+# Rows the in-process cache holds before evicting the least recently used;
+# bulk POSTs fill it with every id they resolve
+METADATA_CACHE_MAX_ENTRIES = int(os.environ.get("METADATA_CACHE_MAX_ENTRIES", "200000"))
+
+# Set to a file path to share one cache between all worker processes on a host
+# (e.g. under a pre-fork server); unset keeps the cache in-process.
+METADATA_SHARED_CACHE_PATH = os.environ.get("METADATA_SHARED_CACHE_PATH", "")
+# Expired rows are kept this long for stale serving, then purged
+SHARED_CACHE_STALE_RETENTION_SECONDS = 24 * 60 * 60
+
+_SHARED_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata_cache (
+    env TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    -- JSON of the TAI row, NULL when TAI has no such user
+    row TEXT,
+    stored_at REAL NOT NULL,
+    PRIMARY KEY (env, user_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS metadata_cache_stored_at ON metadata_cache (stored_at);
+"""
+
+# SQLite caps bound parameters per statement; stay well under it
+_SQL_CHUNK = 500
+
+
+def has_columns(row: Optional[Dict], columns: Sequence[str]) -> bool:
+    """Whether a cached row holds every TAI column in `columns` (a None row, an unknown user, always does)."""
+    return row is None or all(column in row for column in columns)
+
+
+class MetadataCache:
+    """
+    In-process TTL cache of TAI user rows, keyed by (env, userId).
+
+    Ids TAI has no row for are cached as None so unknown users do not
+    trigger a TAI call on every request. Past `max_entries` the least
+    recently used rows are evicted, expired or not.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: int = METADATA_CACHE_TTL_SECONDS,
+        max_entries: int = METADATA_CACHE_MAX_ENTRIES,
+        clock=time.monotonic,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Optional[Dict], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(
+        self,
+        env: str,
+        user_ids: Iterable[str],
+        refresh_within: float = 0,
+        columns: Sequence[str] = (),
+    ) -> Tuple[Dict[str, Optional[Dict]], List[str]]:
+        """
+        Return (fresh cached rows, ids that need fetching).
+
+        Entries expiring within `refresh_within` seconds count as needing a fetch,
+        which lets a background refresh renew them before requests see a miss.
+        So do rows lacking any of the TAI `columns`, since callers cache rows
+        with only the columns they asked TAI for.
+        """
+        env = env.upper()
+        now = self._clock()
+        found: Dict[str, Optional[Dict]] = {}
+        missing: List[str] = []
+
+        with self._lock:
+            for user_id in user_ids:
+                entry = self._entries.get((env, user_id))
+                if entry is not None and now - entry[1] < self.ttl_seconds - refresh_within and has_columns(entry[0], columns):
+                    self._entries.move_to_end((env, user_id))
+                    found[user_id] = entry[0]
+                else:
+                    missing.append(user_id)
+            return found, missing
+
+    def get_stale(self, env: str, user_ids: Iterable[str]) -> Dict[str, Optional[Dict]]:
+        """Cached rows regardless of age, for serving while TAI is unavailable."""
+        env = env.upper()
+        with self._lock:
+            return {
+                user_id: self._entries[(env, user_id)][0]
+                for user_id in user_ids
+                if (env, user_id) in self._entries
+            }
+
+    def put_many(self, env: str, user_ids: Iterable[str], rows: Iterable[Dict]) -> Dict[str, Optional[Dict]]:
+        """
+        Store TAI rows for the requested ids; ids with no row are stored as None.
+        Returns the stored rows by id.
+        """
+        env = env.upper()
+        by_id: Dict[str, Optional[Dict]] = {user_id: None for user_id in user_ids}
+        for row in rows:
+            user_id = row.get("user.user")
+            if user_id:
+                by_id[user_id] = row
+
+        now = self._clock()
+        with self._lock:
+            for user_id, row in by_id.items():
+                self._entries[(env, user_id)] = (row, now)
+                self._entries.move_to_end((env, user_id))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return by_id
+
+    def remaining_ttl(self, env: str, user_ids: Iterable[str]) -> int:
+        """Seconds until the oldest of these entries expires (0 if any are missing)."""
+        env = env.upper()
+        now = self._clock()
+        with self._lock:
+            remaining = self.ttl_seconds
+            for user_id in user_ids:
+                entry = self._entries.get((env, user_id))
+                if entry is None:
+                    return 0
+                remaining = min(remaining, self.ttl_seconds - (now - entry[1]))
+        return max(0, int(remaining))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class SharedMetadataCache(MetadataCache):
+    """
+    MetadataCache with the same interface and TTL semantics, stored in a SQLite
+    file so every worker process on the host reads and warms one copy.
+
+    Writes run in a single IMMEDIATE transaction, so readers in other workers
+    see either the old or the new rows, and clear() empties it for all of them.
+    Ages use wall-clock time, since monotonic clocks are not comparable between
+    processes.
+    """
+
+    # Nothing of MetadataCache's in-process state is used, so its __init__ is not called
+    def __init__(self, path: str, ttl_seconds: int = METADATA_CACHE_TTL_SECONDS, clock=time.time):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; write transactions are opened explicitly below
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SHARED_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _entries(self, conn: sqlite3.Connection, env: str, user_ids: List[str]) -> Dict[str, Tuple[Optional[Dict], float]]:
+        entries = {}
+        for start in range(0, len(user_ids), _SQL_CHUNK):
+            chunk = user_ids[start:start + _SQL_CHUNK]
+            cursor = conn.execute(
+                "SELECT user_id, row, stored_at FROM metadata_cache "
+                f"WHERE env = ? AND user_id IN ({','.join('?' * len(chunk))})",
+                [env, *chunk],
+            )
+            for user_id, row, stored_at in cursor:
+                entries[user_id] = (json.loads(row) if row is not None else None, stored_at)
+        return entries
+
+    def get_many(
+        self,
+        env: str,
+        user_ids: Iterable[str],
+        refresh_within: float = 0,
+        columns: Sequence[str] = (),
+    ) -> Tuple[Dict[str, Optional[Dict]], List[str]]:
+        env = env.upper()
+        user_ids = list(user_ids)
+        now = self._clock()
+        conn = self._conn()
+
+        # One read transaction, so rows split across chunks are from the same state
+        conn.execute("BEGIN")
+        try:
+            entries = self._entries(conn, env, user_ids)
+        finally:
+            conn.execute("COMMIT")
+
+        found: Dict[str, Optional[Dict]] = {}
+        missing: List[str] = []
+        for user_id in user_ids:
+            entry = entries.get(user_id)
+            if entry is not None and now - entry[1] < self.ttl_seconds - refresh_within and has_columns(entry[0], columns):
+                found[user_id] = entry[0]
+            else:
+                missing.append(user_id)
+        return found, missing
+
+    def get_stale(self, env: str, user_ids: Iterable[str]) -> Dict[str, Optional[Dict]]:
+        entries = self._entries(self._conn(), env.upper(), list(user_ids))
+        return {user_id: row for user_id, (row, _) in entries.items()}
+
+    def put_many(self, env: str, user_ids: Iterable[str], rows: Iterable[Dict]) -> Dict[str, Optional[Dict]]:
+        env = env.upper()
+        by_id: Dict[str, Optional[Dict]] = {user_id: None for user_id in user_ids}
+        for row in rows:
+            user_id = row.get("user.user")
+            if user_id:
+                by_id[user_id] = row
+
+        now = self._clock()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO metadata_cache (env, user_id, row, stored_at) VALUES (?, ?, ?, ?)",
+                [(env, user_id, json.dumps(row) if row is not None else None, now) for user_id, row in by_id.items()],
+            )
+            conn.execute(
+                "DELETE FROM metadata_cache WHERE stored_at < ?",
+                (now - self.ttl_seconds - SHARED_CACHE_STALE_RETENTION_SECONDS,),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return by_id
+
+    def remaining_ttl(self, env: str, user_ids: Iterable[str]) -> int:
+        user_ids = list(user_ids)
+        entries = self._entries(self._conn(), env.upper(), user_ids)
+        if len(entries) < len(set(user_ids)):
+            return 0
+        now = self._clock()
+        remaining = min((self.ttl_seconds - (now - stored_at) for _, stored_at in entries.values()), default=self.ttl_seconds)
+        return max(0, int(min(remaining, self.ttl_seconds)))
+
+    def clear(self) -> None:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM metadata_cache")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+
+metadata_cache = SharedMetadataCache(METADATA_SHARED_CACHE_PATH) if METADATA_SHARED_CACHE_PATH else MetadataCache()
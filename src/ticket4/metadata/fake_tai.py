@@ -0,0 +1,156 @@
+"""
+Local stand-in for the TAI query service, for load tests and benchmarks.
+
+Answers GET .../services/query/user?c=<columns>&f=user.user=<id;id;...> with
+the same {"errorCode", "errorMessage", "data"} envelope TAI uses, with
+configurable latency, jitter, error rate and row size.
+
+    python -m app.fake_tai --port 8099 --latency 0.15 --jitter 0.05 --error-rate 0.01
+"""
+
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+import argparse
+import json
+import random
+import threading
+import time
+
+DIVISIONS = [
+    "ENTERPRISE TECH & SERVICES",
+    "WEALTH MANAGEMENT",
+    "INSTITUTIONAL SECURITIES",
+    "INVESTMENT MANAGEMENT",
+    "FIRM RISK MANAGEMENT",
+]
+# Served as user.region, for running with TAI_REGION_COLUMN=user.region
+REGIONS = ["AMERICAS", "EMEA", "APAC"]
+
+
+class FakeTaiServer:
+    def __init__(
+        self,
+        port: int = 0,
+        latency: float = 0.1,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        row_padding: int = 0,
+        missing_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        # Extra bytes per row, to mimic wide TAI rows
+        self.row_padding = row_padding
+        # Share of ids TAI "does not know" (no row returned)
+        self.missing_rate = missing_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.ids_requested = 0
+
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server._handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/web/1/services/query/"
+
+    def start(self) -> "FakeTaiServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-tai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def reset_counts(self) -> None:
+        with self._lock:
+            self.calls = 0
+            self.ids_requested = 0
+
+    def _row(self, user_id: str, columns: List[str]) -> Dict:
+        # Stable per id, so repeated lookups agree with each other
+        rng = random.Random(user_id)
+        full = {
+            "user.user": user_id,
+            "user.job_title": rng.choice(["Associate", "Vice President", "Executive Director", "Managing Director"]),
+            "user.division": rng.choice(DIVISIONS),
+            "user.department": f"DEPT-{rng.randint(1, 400):03d}" + "x" * self.row_padding,
+            "user.region": rng.choice(REGIONS),
+        }
+        return {column: full.get(column) for column in columns}
+
+    def _handle(self, handler: BaseHTTPRequestHandler) -> None:
+        query = parse_qs(urlparse(handler.path).query)
+        columns = (query.get("c") or ["user.user"])[0].split(",")
+        filter_expr = (query.get("f") or [""])[0]
+        user_ids = [uid for uid in filter_expr.partition("=")[2].split(";") if uid]
+
+        with self._lock:
+            self.calls += 1
+            self.ids_requested += len(user_ids)
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            fail = self._random.random() < self.error_rate
+            known = [uid for uid in user_ids if self._random.random() >= self.missing_rate]
+
+        time.sleep(delay)
+
+        if fail:
+            status = HTTPStatus.SERVICE_UNAVAILABLE
+            body = {"errorCode": 503, "errorMessage": "fake TAI injected failure", "data": []}
+        else:
+            status = HTTPStatus.OK
+            body = {"errorCode": 0, "errorMessage": None, "data": [self._row(uid, columns) for uid in known]}
+
+        encoded = json.dumps(body).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(encoded)))
+        handler.end_headers()
+        handler.wfile.write(encoded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.1, help="base response latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- uniform jitter (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls answered with 503")
+    parser.add_argument("--row-padding", type=int, default=0, help="extra bytes per row")
+    parser.add_argument("--missing-rate", type=float, default=0.0, help="share of ids with no row")
+    args = parser.parse_args()
+
+    server = FakeTaiServer(
+        port=args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        row_padding=args.row_padding,
+        missing_rate=args.missing_rate,
+    ).start()
+    print(f"Fake TAI listening on {server.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+HTTP plumbing shared by the TAI and analytics clients.
+
+`requests` and `requests_kerberos` (GSSAPI bindings) are the slowest imports
+in the service, so they are loaded on the first outbound call rather than when
+a worker imports the app. `http_client.Timeout` resolves lazily too, which keeps
+`except http_client.Timeout:` free until an exception is actually raised.
+"""
+
+from typing import Callable, Optional
+
+# Optional replacement for requests.get, e.g. a pooled Session's get
+_get: Optional[Callable] = None
+
+
+def requests_module():
+    import requests
+
+    return requests
+
+
+def kerberos_auth():
+    from requests_kerberos import HTTPKerberosAuth
+
+    return HTTPKerberosAuth(principal="")
+
+
+def use_session(session) -> None:
+    """Send GETs through `session` (None restores plain requests.get)."""
+    global _get
+    _get = session.get if session is not None else None
+
+
+def get(url: str, **kwargs):
+    """requests.get with Kerberos auth."""
+    return (_get or requests_module().get)(url, auth=kerberos_auth(), **kwargs)
+
+
+def __getattr__(name: str):
+    if name == "Timeout":
+        return requests_module().Timeout
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
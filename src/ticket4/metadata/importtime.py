@@ -0,0 +1,85 @@
+"""
+Import-time benchmark for the metadata service.
+
+Imports a module (default app.app) in fresh interpreters with
+`python -X importtime`, and reports the median cumulative import time of the
+module itself and of the slowest packages it pulls in, plus whether the lazily
+loaded HTTP stack (requests, requests_kerberos) was imported at all.
+
+    python -m app.importtime --runs 10
+    python -m app.importtime --module app.tai_client --top 15 --json importtime.json
+"""
+
+from typing import Dict, List, Optional
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+LAZY_MODULES = ["requests", "requests_kerberos"]
+
+
+def _import_once(module: str) -> Dict[str, int]:
+    """Cumulative import time (us) per top-level module name, for one cold interpreter."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p)),
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+    cumulative: Dict[str, int] = {}
+    for line in proc.stderr.splitlines():
+        # "import time:   self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, self_us, cumulative_us, name = (part.strip() for part in line.replace("import time:", "|", 1).split("|"))
+        cumulative[name.strip()] = int(cumulative_us)
+    return cumulative
+
+
+def measure(module: str, runs: int, top: int) -> Dict:
+    samples = [_import_once(module) for _ in range(runs)]
+
+    def median_ms(name: str) -> float:
+        return round(statistics.median(s.get(name, 0) for s in samples) / 1000, 2)
+
+    top_level = {name for sample in samples for name in sample if "." not in name and name != module}
+    slowest = sorted(top_level, key=median_ms, reverse=True)[:top]
+    return {
+        "module": module,
+        "runs": runs,
+        "medianMs": median_ms(module),
+        "slowest": {name: median_ms(name) for name in slowest},
+        "lazyModulesImported": {name: any(name in s for s in samples) for name in LAZY_MODULES},
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> Dict:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app.app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest top-level imports to list")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    result = measure(args.module, args.runs, args.top)
+
+    print(f"import {result['module']}: median {result['medianMs']} ms over {result['runs']} runs")
+    for name, ms in result["slowest"].items():
+        print(f"  {name:<30} {ms:>9} ms")
+    for name, imported in result["lazyModulesImported"].items():
+        print(f"  {name} imported at startup: {'yes' if imported else 'no'}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    return result
+
+
+if __name__ == "__main__":
+    main()
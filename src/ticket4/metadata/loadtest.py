@@ -0,0 +1,267 @@
+"""
+Load test for /user-metadata/<env> against a local fake TAI.
+
+Starts app.fake_tai, points tai_client at it, then drives the Flask app
+(in-process, or a running server with --app-url) at a fixed request rate
+with realistic id lists: sizes are log-normal around a few dozen ids and
+ids are drawn from a Zipf-like population, so a few users are very common.
+Each scenario is run in turn and reported as p50/p95/p99 latency, achieved
+rate, errors and the number of TAI calls/ids it cost.
+
+    python -m app.loadtest --rps 50 --duration 20 --scenarios uncached,cached,pooled,snapshot
+    python -m app.loadtest --route post --batch-size 50 --scenarios uncached
+
+Scenarios (in-process only; with --app-url the server's own setup is measured):
+    uncached  memory cache TTL forced to 0, empty snapshot: every request goes to TAI
+    cached    default memory cache
+    pooled    cached, with TAI calls over one pooled requests.Session
+    snapshot  memory cache TTL 0, snapshot pre-loaded with the whole population
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, List, Optional
+import argparse
+import bisect
+import itertools
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+from app.fake_tai import FakeTaiServer
+
+SCENARIOS = ["uncached", "cached", "pooled", "snapshot"]
+ENV = "QA"
+
+
+class IdListGenerator:
+    def __init__(self, population: int, median_ids: int, max_ids: int, seed: int):
+        self.user_ids = [f"user{i:06d}" for i in range(population)]
+        self.median_ids = median_ids
+        self.max_ids = max_ids
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        weights = [1 / (rank + 1) ** 1.1 for rank in range(population)]
+        self._cumulative = list(itertools.accumulate(weights))
+
+    def next_ids(self) -> List[str]:
+        with self._lock:
+            size = int(min(self.max_ids, max(1, self._random.lognormvariate(0, 1) * self.median_ids)))
+            total = self._cumulative[-1]
+            picked = {
+                self.user_ids[bisect.bisect_left(self._cumulative, self._random.random() * total)]
+                for _ in range(size)
+            }
+        return sorted(picked)
+
+
+def _percentile(ordered: List[float], pct: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def _in_process_sender(route: str) -> Callable[[List[str]], int]:
+    from app.app import app as flask_app
+
+    local = threading.local()
+
+    def send(user_ids: List[str]) -> int:
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = flask_app.test_client()
+        if route == "post":
+            resp = client.post(f"/user-metadata/{ENV}", json={"ids": user_ids})
+            resp.get_data()  # drain the stream
+            resp.close()  # runs call_on_close, which releases the admission slot
+        else:
+            resp = client.get(f"/user-metadata/{ENV}?ids={','.join(user_ids)}")
+        return resp.status_code
+
+    return send
+
+
+def _http_sender(app_url: str, route: str) -> Callable[[List[str]], int]:
+    import requests
+
+    local = threading.local()
+
+    def send(user_ids: List[str]) -> int:
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        url = f"{app_url.rstrip('/')}/user-metadata/{ENV}"
+        if route == "post":
+            resp = session.post(url, json={"ids": user_ids}, timeout=120)
+        else:
+            resp = session.get(url, params={"ids": ",".join(user_ids)}, timeout=120)
+        return resp.status_code
+
+    return send
+
+
+def _configure_scenario(scenario: str, fake: FakeTaiServer, workdir: str, args) -> Callable[[], None]:
+    """Point the in-process app at the fake TAI and apply the scenario; returns an undo callable."""
+    import requests
+    from app import app as app_module
+    from app import http_client, tai_client
+    from app.cache import METADATA_CACHE_TTL_SECONDS
+    from app.snapshot import UserSnapshot
+
+    for env in tai_client.TAI_BASE_URLS:
+        tai_client.TAI_BASE_URLS[env] = fake.base_url
+    # Fresh breaker and latency history, so scenarios do not influence each other
+    tai_client._breakers.clear()
+    tai_client._latencies.clear()
+
+    app_module.metadata_cache.clear()
+    app_module.metadata_cache.ttl_seconds = METADATA_CACHE_TTL_SECONDS
+    app_module.user_snapshot = UserSnapshot(os.path.join(workdir, f"{scenario}.db"))
+    original_iter = app_module.iter_user_metadata
+    app_module.iter_user_metadata = partial(original_iter, batch_size=args.batch_size)
+
+    if scenario in ("uncached", "snapshot"):
+        app_module.metadata_cache.ttl_seconds = 0
+    if scenario == "snapshot":
+        population = [f"user{i:06d}" for i in range(args.population)]
+        for start in range(0, len(population), tai_client.TAI_BATCH_SIZE):
+            batch = population[start:start + tai_client.TAI_BATCH_SIZE]
+            app_module.user_snapshot.upsert(ENV, batch, tai_client.get_user_metadata(ENV, batch))
+    if scenario == "pooled":
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=args.concurrency)
+        session.mount("http://", adapter)
+        http_client.use_session(session)
+
+    def undo():
+        http_client.use_session(None)
+        app_module.iter_user_metadata = original_iter
+        app_module.metadata_cache.ttl_seconds = METADATA_CACHE_TTL_SECONDS
+
+    return undo
+
+
+def run_load(send: Callable[[List[str]], int], ids: IdListGenerator, rps: float, duration: float, concurrency: int) -> Dict:
+    """
+    Open-loop load: request i is scheduled at start + i/rps regardless of how
+    earlier ones did, and latency is measured from the scheduled time, so
+    queueing behind a saturated app shows up in the percentiles.
+    """
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    lock = threading.Lock()
+
+    def one(scheduled_at: float, user_ids: List[str]) -> None:
+        try:
+            status = str(send(user_ids))
+        except Exception as e:
+            status = type(e).__name__
+        elapsed = time.perf_counter() - scheduled_at
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    total = int(rps * duration)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i in range(total):
+            scheduled_at = started + i / rps
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(one, scheduled_at, ids.next_ids())
+    wall = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+    ok = sum(count for status, count in statuses.items() if status.startswith("2") or status == "304")
+    return {
+        "requests": len(ordered),
+        "achievedRps": round(len(ordered) / wall, 2) if wall else 0,
+        "okRatio": round(ok / len(ordered), 4) if ordered else 0,
+        "statuses": statuses,
+        "p50Ms": round(_percentile(ordered, 50) * 1000, 2),
+        "p95Ms": round(_percentile(ordered, 95) * 1000, 2),
+        "p99Ms": round(_percentile(ordered, 99) * 1000, 2),
+        "maxMs": round((ordered[-1] if ordered else 0) * 1000, 2),
+    }
+
+
+def _print_report(results: Dict[str, Dict]) -> None:
+    header = f"{'scenario':<10} {'reqs':>6} {'rps':>7} {'ok':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'TAI calls':>10} {'TAI ids':>9}"
+    print("\n" + header)
+    print("-" * len(header))
+    for name, r in results.items():
+        print(
+            f"{name:<10} {r['requests']:>6} {r['achievedRps']:>7} {r['okRatio']:>7.2%} "
+            f"{r['p50Ms']:>9} {r['p95Ms']:>9} {r['p99Ms']:>9} {r['taiCalls']:>10} {r['taiIds']:>9}"
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Dict]:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--route", choices=["get", "post"], default="get")
+    parser.add_argument("--rps", type=float, default=50)
+    parser.add_argument("--duration", type=float, default=10, help="seconds per scenario")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--population", type=int, default=5000, help="distinct user ids")
+    parser.add_argument("--median-ids", type=int, default=40, help="median ids per request")
+    parser.add_argument("--max-ids", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=200, help="TAI batch size for the bulk POST route")
+    parser.add_argument("--tai-latency", type=float, default=0.1)
+    parser.add_argument("--tai-jitter", type=float, default=0.03)
+    parser.add_argument("--tai-error-rate", type=float, default=0.0)
+    parser.add_argument("--tai-row-padding", type=int, default=0)
+    parser.add_argument("--tai-port", type=int, default=0)
+    parser.add_argument("--app-url", help="drive a running server instead of the in-process app")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    fake = FakeTaiServer(
+        port=args.tai_port,
+        latency=args.tai_latency,
+        jitter=args.tai_jitter,
+        error_rate=args.tai_error_rate,
+        row_padding=args.tai_row_padding,
+        seed=args.seed,
+    ).start()
+    print(f"Fake TAI at {fake.base_url}")
+
+    results: Dict[str, Dict] = {}
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            scenarios = ["external"] if args.app_url else [s.strip() for s in args.scenarios.split(",") if s.strip()]
+            for scenario in scenarios:
+                if args.app_url:
+                    undo, send = (lambda: None), _http_sender(args.app_url, args.route)
+                else:
+                    if scenario not in SCENARIOS:
+                        parser.error(f"unknown scenario {scenario}; expected one of {SCENARIOS}")
+                    undo, send = _configure_scenario(scenario, fake, workdir, args), _in_process_sender(args.route)
+
+                fake.reset_counts()
+                ids = IdListGenerator(args.population, args.median_ids, args.max_ids, args.seed)
+                print(f"Running {scenario}: {args.rps} rps for {args.duration}s ...")
+                try:
+                    result = run_load(send, ids, args.rps, args.duration, args.concurrency)
+                finally:
+                    undo()
+                result.update(taiCalls=fake.calls, taiIds=fake.ids_requested)
+                results[scenario] = result
+    finally:
+        fake.stop()
+
+    _print_report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"\nWrote {args.json}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from functools import wraps
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import atexit
+import fcntl
+import glob
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from flask import Response
+
+log = logging.getLogger(__name__)
+
+# Default latency buckets (seconds), from cache hits up to the TAI timeout
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+BYTES_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+PROMETHEUS_MIMETYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Set to a directory shared by every worker process (e.g. under a pre-fork
+# server) so /metrics reports the sum over all workers, whichever one answers
+# the scrape; unset reports the answering process only. Each worker writes its
+# values there every METRICS_FLUSH_SECONDS, so other workers' share of a
+# scrape can be that much behind.
+METRICS_MULTIPROC_DIR = os.environ.get("METRICS_MULTIPROC_DIR", "")
+METRICS_FLUSH_SECONDS = 5
+# Where exited workers' counters and histograms are summed, so their files
+# (and PIDs the OS hands out again) do not pile up
+METRICS_ARCHIVE_FILE = "archive.json"
+_ARCHIVE_LOCK_FILE = "archive.lock"
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self, others: Sequence[Dict[LabelValues, Any]] = ()) -> List[str]:
+        """Exposition lines for this process's values plus `others` (other workers' values())."""
+        values = self.values()
+        for other in others:
+            for key, value in other.items():
+                values[key] = self._merge(values[key], value) if key in values else value
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"] + self._samples(values)
+
+    @abstractmethod
+    def values(self) -> Dict[LabelValues, Any]:
+        """A copy of the current value per label set (JSON-serialisable)."""
+
+    @abstractmethod
+    def _merge(self, value: Any, other: Any) -> Any:
+        """The value of one label set summed over two processes."""
+
+    @abstractmethod
+    def _samples(self, values: Dict[LabelValues, Any]) -> List[str]:
+        """Exposition lines (without HELP/TYPE) for `values`."""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self) -> Dict[LabelValues, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def _merge(self, value: float, other: float) -> float:
+        return value + other
+
+    def _samples(self, values: Dict[LabelValues, float]) -> List[str]:
+        return [f"{self.name}{_format_labels(self.label_names, key)} {value}" for key, value in sorted(values.items())]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [count per bucket (+Inf last)], sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def values(self) -> Dict[LabelValues, Tuple[List[int], float]]:
+        with self._lock:
+            return {key: (list(counts), total[0]) for key, (counts, total) in self._values.items()}
+
+    def _merge(self, value: Tuple[List[int], float], other: Tuple[List[int], float]) -> Tuple[List[int], float]:
+        return [a + b for a, b in zip(value[0], other[0])], value[1] + other[1]
+
+    def _samples(self, values: Dict[LabelValues, Tuple[List[int], float]]) -> List[str]:
+        lines = []
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _pid_of(path: str) -> Optional[int]:
+    name = os.path.basename(path)[:-len(".json")]
+    return int(name) if name.isdigit() else None
+
+
+def _read_state(path: str) -> Optional[Dict[str, Dict[LabelValues, Any]]]:
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None  # Removed or being replaced
+    return {name: {tuple(key): value for key, value in samples} for name, samples in state.items()}
+
+
+def _write_state(path: str, values: Dict[str, Dict[LabelValues, Any]]) -> None:
+    state = {name: [[list(key), value] for key, value in samples.items()] for name, samples in values.items()}
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class Registry:
+    """
+    The service's metrics. With a `multiprocess_dir`, each process writes its
+    values to <dir>/<pid>.json (see flush()) and render() adds up every
+    process's file. Counters and histograms of exited workers keep counting,
+    so totals never go backwards; their gauges are dropped. Flushing folds
+    exited workers' files into one archive file and deletes them, as
+    prometheus_client's mark_process_dead does.
+    """
+
+    def __init__(self, multiprocess_dir: str = ""):
+        self.multiprocess_dir = multiprocess_dir
+        self._metrics: List[_Metric] = []
+        self._flusher_pid = None
+        self._flushed_pid = None
+        self._flusher_lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        others = self._other_processes()
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render([
+                values[metric.name] for values, alive in others
+                if metric.name in values and (alive or metric.kind != "gauge")
+            ]))
+        return "\n".join(lines) + "\n"
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.multiprocess_dir, f"{pid}.json")
+
+    def flush(self) -> None:
+        """Write this process's values to the multiprocess directory (atomically)."""
+        if not self.multiprocess_dir:
+            return
+        pid = os.getpid()
+        # Before our first write, a file under our pid was left by an exited process the pid belonged to
+        self._archive_exited(reused_pid=pid if self._flushed_pid != pid else None)
+        _write_state(self._path(pid), {metric.name: metric.values() for metric in self._metrics})
+        self._flushed_pid = pid
+
+    def _archive_exited(self, reused_pid: Optional[int] = None) -> None:
+        """Add exited processes' counters and histograms to the archive file and delete their files."""
+        def exited(path: str) -> bool:
+            pid = _pid_of(path)
+            return pid is not None and (pid == reused_pid or not _process_alive(pid))
+
+        if not any(exited(path) for path in glob.glob(os.path.join(self.multiprocess_dir, "*.json"))):
+            return
+        archive_path = os.path.join(self.multiprocess_dir, METRICS_ARCHIVE_FILE)
+        metrics = {metric.name: metric for metric in self._metrics if metric.kind != "gauge"}
+        with open(os.path.join(self.multiprocess_dir, _ARCHIVE_LOCK_FILE), "a") as lock:
+            # Other workers archive too; checked again under the lock so no file is counted twice
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            archive = _read_state(archive_path) or {}
+            archived = []
+            for path in glob.glob(os.path.join(self.multiprocess_dir, "*.json")):
+                if not exited(path):
+                    continue
+                values = _read_state(path)
+                if values is None:
+                    continue
+                for name, samples in values.items():
+                    if name not in metrics:
+                        continue
+                    merged = archive.setdefault(name, {})
+                    for key, value in samples.items():
+                        merged[key] = metrics[name]._merge(merged[key], value) if key in merged else value
+                archived.append(path)
+            if archived:
+                _write_state(archive_path, archive)
+                for path in archived:
+                    os.unlink(path)
+
+    def _other_processes(self) -> List[Tuple[Dict[str, Dict[LabelValues, Any]], bool]]:
+        if not self.multiprocess_dir:
+            return []
+        own = self._path(os.getpid())
+        others = []
+        for path in glob.glob(os.path.join(self.multiprocess_dir, "*.json")):
+            if path == own:
+                continue
+            values = _read_state(path)
+            if values is None:
+                continue  # Picked up on the next scrape
+            pid = _pid_of(path)
+            # The archive holds only exited processes' values
+            others.append((values, pid is not None and _process_alive(pid)))
+        return others
+
+    def ensure_flusher(self) -> None:
+        """Start writing this process's values every METRICS_FLUSH_SECONDS (again after a fork)."""
+        if not self.multiprocess_dir or self._flusher_pid == os.getpid():
+            return
+        with self._flusher_lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+            os.makedirs(self.multiprocess_dir, exist_ok=True)
+            threading.Thread(target=self._flush_forever, name="metrics-flusher", daemon=True).start()
+            atexit.register(self.flush)
+
+    def _flush_forever(self) -> None:
+        while True:
+            try:
+                self.flush()
+            except Exception:
+                log.exception("Writing metrics to %s failed", self.multiprocess_dir)
+            time.sleep(METRICS_FLUSH_SECONDS)
+
+
+registry = Registry(METRICS_MULTIPROC_DIR)
+
+TAI_REQUEST_SECONDS = registry.register(Histogram(
+    "tai_request_duration_seconds", "TAI query latency by env and outcome.", ["env", "outcome"],
+))
+TAI_REQUESTS_IN_FLIGHT = registry.register(Gauge(
+    "tai_requests_in_flight", "TAI queries currently in progress.", ["env"],
+))
+TAI_ROWS_RETURNED = registry.register(Histogram(
+    "tai_rows_returned", "Rows returned per TAI query.", ["env"], buckets=COUNT_BUCKETS,
+))
+TAI_RESPONSE_BYTES = registry.register(Histogram(
+    "tai_response_bytes", "TAI response body size.", ["env"], buckets=BYTES_BUCKETS,
+))
+METADATA_IDS_PER_REQUEST = registry.register(Histogram(
+    "metadata_ids_per_request", "User ids asked for per request.", ["route"], buckets=COUNT_BUCKETS,
+))
+METADATA_CACHE_LOOKUPS = registry.register(Counter(
+    "metadata_cache_lookups_total", "User id lookups by cache tier and result (hit/miss).", ["tier", "result"],
+))
+ADMISSION_DECISIONS = registry.register(Counter(
+    "metadata_admission_decisions_total",
+    "Admission results for requests that need TAI (admitted, queued, rejected_caller, rejected_queue_full, timed_out).",
+    ["env", "result"],
+))
+ADMISSION_QUEUED_IDS = registry.register(Gauge(
+    "metadata_admission_queued_ids", "User ids waiting for TAI capacity.", ["env"],
+))
+HTTP_REQUESTS_IN_FLIGHT = registry.register(Gauge(
+    "http_requests_in_flight", "Requests currently being handled.", ["route"],
+))
+HTTP_REQUEST_SECONDS = registry.register(Histogram(
+    "http_request_duration_seconds", "Server-side request latency.", ["route", "method", "status"],
+))
+
+
+def record_cache_lookup(tier: str, hits: int, misses: int) -> None:
+    if hits:
+        METADATA_CACHE_LOOKUPS.inc(hits, tier=tier, result="hit")
+    if misses:
+        METADATA_CACHE_LOOKUPS.inc(misses, tier=tier, result="miss")
+
+
+def _status_of(result) -> int:
+    if isinstance(result, Response):
+        return result.status_code
+    if isinstance(result, tuple) and len(result) > 1:
+        return int(result[1])
+    return 200
+
+
+def track_request(route: str):
+    """
+    Resource method decorator recording in-flight and latency for `route`.
+
+    A streamed response is timed until its body has been sent (call_on_close),
+    not just until the method returns it.
+    """
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            registry.ensure_flusher()
+            HTTP_REQUESTS_IN_FLIGHT.inc(route=route)
+            started = time.perf_counter()
+            status = 500
+
+            def finish() -> None:
+                HTTP_REQUESTS_IN_FLIGHT.dec(route=route)
+                HTTP_REQUEST_SECONDS.observe(
+                    time.perf_counter() - started, route=route, method=method.__name__.upper(), status=status,
+                )
+
+            streamed = False
+            try:
+                result = method(*args, **kwargs)
+                status = _status_of(result)
+                if isinstance(result, Response) and result.is_streamed:
+                    result.call_on_close(finish)
+                    streamed = True
+                return result
+            finally:
+                if not streamed:
+                    finish()
+
+        return wrapper
+
+    return decorator
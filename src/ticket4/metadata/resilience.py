@@ -0,0 +1,264 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Optional, Tuple, TypeVar
+import threading
+import time
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(RuntimeError):
+    pass
+
+
+class CircuitOpenError(RuntimeError):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit for {name} is open; retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class Deadline:
+    """
+    Absolute time budget for one incoming request, passed down to every
+    upstream call so no call can outlive the request that made it.
+    """
+
+    def __init__(self, seconds: float, clock=time.monotonic):
+        self._clock = clock
+        self.expires_at = clock() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - self._clock())
+
+    def timeout(self, cap: float) -> float:
+        """Socket timeout for the next call: the remaining budget, at most `cap`."""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded("Request deadline exceeded before calling upstream")
+        return min(remaining, cap)
+
+
+class LatencyWindow:
+    """Last N latencies (seconds) of successful calls, for percentile estimates."""
+
+    def __init__(self, size: int = 200):
+        self._samples: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float, min_samples: int = 20) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class CircuitBreaker:
+    """
+    Opens when, over the last `window_seconds`, at least `min_calls` were made
+    and either the error rate reaches `error_rate_threshold` or p95 latency
+    reaches `slow_call_seconds`. While open, calls fail fast with
+    CircuitOpenError; after `cooldown_seconds` a single probe call is let
+    through (half-open) and its outcome closes or re-opens the circuit.
+
+    before_call() returns a token that must be passed to record(). The token
+    changes whenever the circuit opens, closes or lets a probe through, so the
+    outcome of a call started before the last change (a slow call still running
+    when the circuit tripped) is ignored rather than mistaken for the probe's.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window_seconds: float = 60,
+        min_calls: int = 10,
+        error_rate_threshold: float = 0.5,
+        slow_call_seconds: float = 10,
+        cooldown_seconds: float = 30,
+        clock=time.monotonic,
+    ):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.error_rate_threshold = error_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self._clock = clock
+        self._calls: Deque[Tuple[float, bool, float]] = deque()  # (at, ok, seconds)
+        self._opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._clock() - self._opened_at < self.cooldown_seconds:
+                return "open"
+            return "half_open"
+
+    def before_call(self) -> int:
+        with self._lock:
+            if self._opened_at is None:
+                return self._generation
+            waited = self._clock() - self._opened_at
+            if waited < self.cooldown_seconds or self._probe_in_flight:
+                raise CircuitOpenError(self.name, max(0.0, self.cooldown_seconds - waited))
+            self._probe_in_flight = True
+            self._generation += 1
+            return self._generation
+
+    def record(self, token: int, ok: bool, seconds: float) -> None:
+        now = self._clock()
+        with self._lock:
+            if token != self._generation:
+                return  # Started before the circuit last changed state
+            if self._opened_at is not None:
+                # Only the half-open probe holds the current token while open
+                self._probe_in_flight = False
+                self._calls.clear()
+                self._opened_at = None if ok else now
+                self._generation += 1
+                return
+
+            self._calls.append((now, ok, seconds))
+            while self._calls and now - self._calls[0][0] > self.window_seconds:
+                self._calls.popleft()
+            if len(self._calls) < self.min_calls:
+                return
+
+            errors = sum(1 for _, call_ok, _ in self._calls if not call_ok)
+            latencies = sorted(call_seconds for _, _, call_seconds in self._calls)
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            if errors / len(self._calls) >= self.error_rate_threshold or p95 >= self.slow_call_seconds:
+                self._opened_at = now
+                self._generation += 1
+
+    def release(self, token: int) -> None:
+        """Forget a call that ended without an outcome (e.g. its caller went away), freeing the probe slot."""
+        with self._lock:
+            if token == self._generation and self._opened_at is not None:
+                self._probe_in_flight = False
+
+    def call(self, fn: Callable[[], T]) -> T:
+        token = self.before_call()
+        started = time.monotonic()
+        try:
+            result = fn()
+        except Exception:
+            self.record(token, False, time.monotonic() - started)
+            raise
+        self.record(token, True, time.monotonic() - started)
+        return result
+
+
+class AttemptSuperseded(Exception):
+    """Raised by a hedged attempt that stops early because the other attempt already succeeded."""
+
+
+# Hedges beyond this many in flight are not sent; the primary attempt just runs on
+MAX_HEDGES_IN_FLIGHT = 8
+
+_hedge_pool: Optional[ThreadPoolExecutor] = None
+_hedge_pool_lock = threading.Lock()
+_hedge_slots = threading.BoundedSemaphore(MAX_HEDGES_IN_FLIGHT)
+
+
+def _get_hedge_pool() -> ThreadPoolExecutor:
+    global _hedge_pool
+    with _hedge_pool_lock:
+        if _hedge_pool is None:
+            # One worker per hedge slot, so a hedge never waits for a thread
+            _hedge_pool = ThreadPoolExecutor(max_workers=MAX_HEDGES_IN_FLIGHT, thread_name_prefix="tai-hedge")
+        return _hedge_pool
+
+
+class _HedgeRace:
+    """The primary attempt and at most one hedge of one hedged() call; the first success wins."""
+
+    def __init__(self, fn: Callable[[threading.Event], T]):
+        self._fn = fn
+        self._cond = threading.Condition()
+        self._running = 0
+        self._won = False
+        self._result: Optional[T] = None
+        self._errors: Dict[str, BaseException] = {}
+        self.superseded = threading.Event()  # Set once either attempt has succeeded
+
+    def start_primary(self) -> None:
+        with self._cond:
+            self._running += 1
+        threading.Thread(target=self._run, args=("primary",), name="tai-primary", daemon=True).start()
+
+    def launch_hedge(self) -> None:
+        with self._cond:
+            if self._won or self._running == 0 or not _hedge_slots.acquire(blocking=False):
+                return
+            try:
+                _get_hedge_pool().submit(self._run, "hedge")
+            except BaseException:
+                _hedge_slots.release()
+                raise
+            self._running += 1
+
+    def _run(self, attempt: str) -> None:
+        try:
+            result = self._fn(self.superseded)
+        except BaseException as e:
+            with self._cond:
+                self._errors[attempt] = e
+        else:
+            with self._cond:
+                if not self._won:
+                    self._won = True
+                    self._result = result
+                    self.superseded.set()
+        finally:
+            if attempt == "hedge":
+                _hedge_slots.release()
+            with self._cond:
+                self._running -= 1
+                self._cond.notify_all()
+
+    def wait(self, timeout: Optional[float]) -> bool:
+        """Until an attempt has succeeded or all have failed; False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._won or self._running == 0, timeout)
+
+    def outcome(self) -> T:
+        with self._cond:
+            if self._won:
+                return self._result
+            raise self._errors.get("primary") or self._errors["hedge"]
+
+
+def hedged(fn: Callable[[threading.Event], T], hedge_after: Optional[float], deadline: Optional[Deadline] = None) -> T:
+    """
+    Run `fn`; if it has not finished after `hedge_after` seconds, send a second
+    identical attempt to the hedge pool (unless MAX_HEDGES_IN_FLIGHT are
+    already out) and return whichever succeeds first, as soon as it does.
+    With no hedge delay (not enough latency samples yet) there is no hedge and
+    `fn` runs on the calling thread.
+
+    Otherwise the primary runs on its own thread so the caller never waits on
+    a loser, even one stalled before the response headers. `fn` is passed an
+    Event that is set once either attempt has succeeded; the abandoned attempt
+    should stop at its next chance by raising AttemptSuperseded, and is in any
+    case bounded by its own socket timeout and the deadline.
+    """
+    race = _HedgeRace(fn)
+    if hedge_after is None:
+        return fn(race.superseded)
+
+    race.start_primary()
+    if not race.wait(hedge_after):
+        race.launch_hedge()
+    if not race.wait(deadline.remaining() if deadline is not None else None):
+        raise DeadlineExceeded("Request deadline exceeded waiting for upstream")
+    return race.outcome()
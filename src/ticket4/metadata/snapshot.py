@@ -0,0 +1,257 @@
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from app.tai_client import TAI_BATCH_SIZE, TAI_REGION_COLUMN, get_user_metadata
+
+log = logging.getLogger(__name__)
+
+# Opt-in: absolute path of the snapshot file, shared by the workers on a host.
+# Unset disables the snapshot; lookups then go from the cache straight to TAI.
+SNAPSHOT_PATH = os.environ.get("METADATA_SNAPSHOT_PATH", "")
+# Least-recently-refreshed rows re-read from TAI per cycle; 2000 every 5 min turns
+# over ~575k rows a day, far more than there are analytics users.
+SNAPSHOT_REFRESH_INTERVAL_SECONDS = 5 * 60
+SNAPSHOT_REFRESH_ROWS_PER_CYCLE = 2000
+
+# TAI column -> snapshot column
+SNAPSHOT_COLUMNS = {
+    "user.user": "user_id",
+    "user.job_title": "job_title",
+    "user.division": "division",
+    "user.department": "department",
+}
+if TAI_REGION_COLUMN:
+    SNAPSHOT_COLUMNS[TAI_REGION_COLUMN] = "region"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tai_user (
+    env TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    job_title TEXT,
+    division TEXT,
+    department TEXT,
+    region TEXT,
+    -- 1: TAI has the user, 0: TAI has no such user, NULL: not fetched yet
+    found INTEGER,
+    refreshed_at REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (env, user_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tai_user_refreshed_at ON tai_user (env, refreshed_at);
+"""
+
+# SQLite caps bound parameters per statement; stay well under it
+_SQL_CHUNK = 500
+
+
+class UserSnapshot:
+    """
+    File-backed snapshot of the TAI `user` dataset, keyed by (env, userId).
+
+    Lookups never touch TAI: they return the rows we have, None for users TAI
+    is known not to have, and a list of ids still pending a fetch. Connections
+    are per-thread, and WAL mode lets readers run while the refresher writes.
+    """
+
+    enabled = True
+
+    def __init__(self, path: str):
+        if not os.path.isabs(path):
+            raise ValueError(f"Snapshot path must be absolute, got {path!r}")
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            if "region" not in {column for _, column, *_ in conn.execute("PRAGMA table_info(tai_user)")}:
+                conn.execute("ALTER TABLE tai_user ADD COLUMN region TEXT")  # Snapshot from before regions
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, env: str, user_ids: List[str]) -> Tuple[Dict[str, Optional[Dict]], List[str]]:
+        """Return (rows by id, None for users TAI does not have; ids not in the snapshot yet)."""
+        env = env.upper()
+        rows: Dict[str, Optional[Dict]] = {}
+        conn = self._conn()
+
+        for start in range(0, len(user_ids), _SQL_CHUNK):
+            chunk = user_ids[start:start + _SQL_CHUNK]
+            cursor = conn.execute(
+                "SELECT user_id, job_title, division, department, region, found FROM tai_user "
+                f"WHERE env = ? AND found IS NOT NULL AND user_id IN ({','.join('?' * len(chunk))})",
+                [env, *chunk],
+            )
+            for user_id, job_title, division, department, region, found in cursor:
+                if not found:
+                    rows[user_id] = None
+                    continue
+                rows[user_id] = {
+                    "user.user": user_id,
+                    "user.job_title": job_title,
+                    "user.division": division,
+                    "user.department": department,
+                }
+                if TAI_REGION_COLUMN:
+                    rows[user_id][TAI_REGION_COLUMN] = region
+
+        pending = [user_id for user_id in user_ids if user_id not in rows]
+        return rows, pending
+
+    def track(self, env: str, user_ids: Iterable[str]) -> None:
+        """Register ids so the refresher fetches them next (they sort first with refreshed_at 0)."""
+        env = env.upper()
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO tai_user (env, user_id) VALUES (?, ?)",
+                [(env, user_id) for user_id in user_ids],
+            )
+
+    def upsert(self, env: str, user_ids: Iterable[str], rows: Iterable[Dict]) -> None:
+        """Store full TAI rows for the requested ids; requested ids without a row are marked not found."""
+        env = env.upper()
+        now = time.time()
+        by_id: Dict[str, Optional[Dict]] = {user_id: None for user_id in user_ids}
+        for row in rows:
+            if row.get("user.user"):
+                by_id[row["user.user"]] = row
+
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO tai_user (env, user_id, job_title, division, department, region, found, refreshed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        env,
+                        user_id,
+                        row.get("user.job_title") if row else None,
+                        row.get("user.division") if row else None,
+                        row.get("user.department") if row else None,
+                        row.get(TAI_REGION_COLUMN) if row and TAI_REGION_COLUMN else None,
+                        1 if row else 0,
+                        now,
+                    )
+                    for user_id, row in by_id.items()
+                ],
+            )
+
+    def least_recently_refreshed(self, env: str, limit: int) -> List[str]:
+        cursor = self._conn().execute(
+            "SELECT user_id FROM tai_user WHERE env = ? ORDER BY refreshed_at LIMIT ?",
+            (env.upper(), limit),
+        )
+        return [user_id for (user_id,) in cursor]
+
+    def envs(self) -> List[str]:
+        return [env for (env,) in self._conn().execute("SELECT DISTINCT env FROM tai_user")]
+
+    def stats(self, env: str) -> Dict:
+        rows, pending, oldest = self._conn().execute(
+            "SELECT COUNT(*), SUM(found IS NULL), MIN(CASE WHEN found IS NOT NULL THEN refreshed_at END) "
+            "FROM tai_user WHERE env = ?",
+            (env.upper(),),
+        ).fetchone()
+        return {
+            "rows": rows,
+            "pending": pending or 0,
+            "oldestRefreshAgeSeconds": None if oldest is None else int(time.time() - oldest),
+        }
+
+
+class DisabledSnapshot:
+    """Stand-in for UserSnapshot when none is configured: every id is pending and nothing is stored."""
+
+    enabled = False
+
+    def get_many(self, env: str, user_ids: List[str]) -> Tuple[Dict[str, Optional[Dict]], List[str]]:
+        return {}, list(user_ids)
+
+    def track(self, env: str, user_ids: Iterable[str]) -> None:
+        pass
+
+    def upsert(self, env: str, user_ids: Iterable[str], rows: Iterable[Dict]) -> None:
+        pass
+
+    def least_recently_refreshed(self, env: str, limit: int) -> List[str]:
+        return []
+
+    def envs(self) -> List[str]:
+        return []
+
+
+class SnapshotRefresher:
+    """
+    Incrementally refreshes the snapshot on a daemon thread: every cycle it
+    re-reads the least recently refreshed rows (pending ids first) from TAI.
+    """
+
+    def __init__(
+        self,
+        snapshot: UserSnapshot,
+        fetch: Callable[[str, List[str]], List[Dict]] = get_user_metadata,
+        interval_seconds: float = SNAPSHOT_REFRESH_INTERVAL_SECONDS,
+        rows_per_cycle: int = SNAPSHOT_REFRESH_ROWS_PER_CYCLE,
+        batch_size: int = TAI_BATCH_SIZE,
+    ):
+        self.snapshot = snapshot
+        self.fetch = fetch
+        self.interval_seconds = interval_seconds
+        self.rows_per_cycle = rows_per_cycle
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="metadata-snapshot-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.refresh_once()
+            except Exception:
+                log.exception("Metadata snapshot refresh failed")
+            self._stop.wait(self.interval_seconds)
+
+    def refresh_once(self) -> int:
+        refreshed = 0
+        for env in self.snapshot.envs():
+            user_ids = self.snapshot.least_recently_refreshed(env, self.rows_per_cycle)
+            for start in range(0, len(user_ids), self.batch_size):
+                if self._stop.is_set():
+                    return refreshed
+                batch = user_ids[start:start + self.batch_size]
+                self.snapshot.upsert(env, batch, self.fetch(env, batch))
+                refreshed += len(batch)
+        return refreshed
+
+
+def fetch_with_snapshot(snapshot: UserSnapshot, env: str, user_ids: List[str]) -> List[Dict]:
+    """Rows for `user_ids`, from the snapshot where possible and live TAI (full columns) for the rest."""
+    rows, pending = snapshot.get_many(env, user_ids)
+    found = [row for row in rows.values() if row]
+    if not pending:
+        return found
+
+    live_rows = get_user_metadata(env, pending)
+    snapshot.upsert(env, pending, live_rows)
+    return found + live_rows
+
+
+user_snapshot = UserSnapshot(SNAPSHOT_PATH) if SNAPSHOT_PATH else DisabledSnapshot()
+snapshot_refresher = SnapshotRefresher(user_snapshot)
@@ -1,7 +1,14 @@
-from typing import List, Dict
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+import codecs
+import json
 import logging
-import requests
-from requests_kerberos import HTTPKerberosAuth
+import os
+import threading
+import time
+
+from app import http_client
+from app.metrics import TAI_REQUEST_SECONDS, TAI_REQUESTS_IN_FLIGHT, TAI_RESPONSE_BYTES, TAI_ROWS_RETURNED
+from app.resilience import AttemptSuperseded, CircuitBreaker, Deadline, DeadlineExceeded, LatencyWindow, hedged
 
 log = logging.getLogger(__name__)
 
@@ -11,44 +18,307 @@ TAI_BASE_URLS = {
     "PROD": "http://taidss.webfarm.ms.com/web/1/services/query/",
 }
 
+# TAI user column holding the user's region/location. Not every TAI env carries
+# the same one, so it is configured (e.g. TAI_REGION_COLUMN=user.region); unset,
+# region is not fetched and usage aggregates cannot group or filter by it.
+TAI_REGION_COLUMN = os.environ.get("TAI_REGION_COLUMN", "")
+
+# Columns of the TAI `user` dataset we know how to use; user.user is always requested
+USER_COLUMNS = ["user.user", "user.job_title", "user.division", "user.department"] + (
+    [TAI_REGION_COLUMN] if TAI_REGION_COLUMN else []
+)
+DEPARTMENT_COLUMNS = ["user.user", "user.division"]
+
+# Max ids per TAI request when a lookup is split into batches
+TAI_BATCH_SIZE = 200
+# Response bytes read per chunk while decoding rows incrementally
+TAI_STREAM_CHUNK_BYTES = 64 * 1024
+
+# Upper bound for a single TAI call; a request Deadline can only shorten it
+TAI_TIMEOUT_SECONDS = 60
+# Opt-in: send a second, identical request once the first is slower than this percentile
+TAI_HEDGE_ENABLED = os.environ.get("TAI_HEDGE_ENABLED", "0") == "1"
+TAI_HEDGE_PERCENTILE = 95
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_latencies: Dict[str, LatencyWindow] = {}
+_resilience_lock = threading.Lock()
+
 def _get_base_url(env: str) -> str:
     env_upper = env.upper()
     if env_upper not in TAI_BASE_URLS:
         raise ValueError(f"Unknown environment [{env}]")
     return TAI_BASE_URLS[env_upper]
 
-def get_user_metadata(env: str, user_ids: List[str]) -> List[Dict]:
-    if not user_ids:
-        return []
+def _columns_param(columns: Optional[List[str]]) -> str:
+    if not columns:
+        return ",".join(USER_COLUMNS)
+    unknown = [c for c in columns if c not in USER_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown TAI user columns {unknown}")
+    return ",".join(["user.user"] + [c for c in dict.fromkeys(columns) if c != "user.user"])
+
+def get_circuit_breaker(env: str) -> CircuitBreaker:
+    env_upper = env.upper()
+    with _resilience_lock:
+        if env_upper not in _breakers:
+            _breakers[env_upper] = CircuitBreaker(f"TAI {env_upper}")
+            _latencies[env_upper] = LatencyWindow()
+        return _breakers[env_upper]
+
+
+class _TaiRowDecoder:
+    """
+    Incremental decoder for the TAI envelope {"errorCode", "errorMessage", "data": [...]}.
+
+    rows() yields each element of `data` as soon as it has been read, holding
+    only the undecoded tail of the body in memory. The other top-level fields
+    end up in `envelope`; a non-zero errorCode raises RuntimeError as soon as it
+    is seen (before or after the rows, depending on where TAI puts it).
+    """
+
+    _WHITESPACE = " \t\r\n"
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self.envelope: Dict = {}
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        # Drop what has been consumed so memory stays bounded by one chunk + one row
+        self._buf = self._buf[self._pos:]
+        self._pos = 0
+        for chunk in self._chunks:
+            if chunk:
+                self._buf += self._text.decode(chunk)
+                return True
+        self._buf += self._text.decode(b"", final=True)
+        self._eof = True
+        return False
+
+    def _peek(self) -> str:
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in self._WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                raise ValueError("TAI response ended unexpectedly")
+
+    def _expect(self, char: str) -> None:
+        if self._peek() != char:
+            raise ValueError(f"Malformed TAI response: expected {char!r} at offset {self._pos}")
+        self._pos += 1
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A number or literal running to the end of the buffer may continue in the next chunk
+            if end == len(self._buf) and not self._eof and self._fill():
+                continue
+            self._pos = end
+            return value
 
+    def _check_error_code(self) -> None:
+        if self.envelope.get("errorCode") not in (0, "0", None):
+            raise RuntimeError(f"TAI errorCode={self.envelope.get('errorCode')} msg={self.envelope.get('errorMessage')}")
+
+    def rows(self) -> Iterator[Dict]:
+        self._expect("{")
+        if self._peek() == "}":
+            return
+        while True:
+            key = self._value()
+            self._expect(":")
+            if key == "data" and self._peek() == "[":
+                self._check_error_code()
+                self._pos += 1
+                if self._peek() == "]":
+                    self._pos += 1
+                else:
+                    while True:
+                        yield self._value()
+                        if self._peek() == "]":
+                            self._pos += 1
+                            break
+                        self._expect(",")
+            else:
+                self.envelope[key] = self._value()
+                if key == "errorCode":
+                    self._check_error_code()
+            if self._peek() == "}":
+                return
+            self._expect(",")
+
+
+def _stream_rows(
+    env: str,
+    user_ids: List[str],
+    columns: Optional[List[str]],
+    deadline: Optional[Deadline],
+    superseded: Optional[threading.Event] = None,
+) -> Iterator[Dict]:
+    """One TAI query, decoded row by row from the response stream; stops early once `superseded` is set."""
     base_url = _get_base_url(env)
 
     dataset = "user"
-    columns = "user.user,user.job_title,user.division,user.department"
 
     # TAI expects ; between values
     filter_values = ";".join(user_ids)
     filter_expr = f"user.user={filter_values}"
 
     url = f"{base_url}{dataset}"
-    params = {"c": columns, "f": filter_expr}
+    params = {"c": _columns_param(columns), "f": filter_expr}
+
+    timeout = deadline.timeout(TAI_TIMEOUT_SECONDS) if deadline is not None else TAI_TIMEOUT_SECONDS
+    log.info("TAI GET %s params=%s timeout=%.1fs", url, params, timeout)
+
+    env_upper = env.upper()
+    outcome = "connection_error"
+    received = 0
+    rows = 0
+    TAI_REQUESTS_IN_FLIGHT.inc(env=env_upper)
+    started = time.monotonic()
+    try:
+        try:
+            resp = http_client.get(url, params=params, timeout=timeout, stream=True)
+        except http_client.Timeout as e:
+            outcome = "timeout"
+            if deadline is not None and deadline.remaining() <= 0:
+                raise DeadlineExceeded(f"Request deadline exceeded waiting for TAI: {e}") from e
+            raise
+
+        with resp:
+            if not resp.ok:
+                outcome = f"http_{resp.status_code // 100}xx"
+                raise RuntimeError(f"TAI request failed: {resp.status_code} {resp.reason}. Body: {resp.text}")
+
+            def _chunks() -> Iterator[bytes]:
+                nonlocal received
+                for chunk in resp.iter_content(chunk_size=TAI_STREAM_CHUNK_BYTES):
+                    received += len(chunk)
+                    # The socket timeout only bounds gaps between chunks, not the whole body
+                    if deadline is not None and deadline.remaining() <= 0:
+                        raise DeadlineExceeded("Request deadline exceeded while reading TAI response")
+                    if superseded is not None and superseded.is_set():
+                        raise AttemptSuperseded("A hedged TAI request already succeeded")
+                    yield chunk
+
+            outcome = "decode_error"
+            try:
+                for row in _TaiRowDecoder(_chunks()).rows():
+                    rows += 1
+                    yield row
+            except DeadlineExceeded:
+                outcome = "timeout"
+                raise
+            except AttemptSuperseded:
+                outcome = "superseded"
+                raise
+            except RuntimeError:
+                outcome = "tai_error"
+                raise
+        outcome = "ok"
+    finally:
+        elapsed = time.monotonic() - started
+        TAI_REQUESTS_IN_FLIGHT.dec(env=env_upper)
+        TAI_REQUEST_SECONDS.observe(elapsed, env=env_upper, outcome=outcome)
+        if received:
+            TAI_RESPONSE_BYTES.observe(received, env=env_upper)
+
+    TAI_ROWS_RETURNED.observe(rows, env=env_upper)
+    if env_upper in _latencies:
+        _latencies[env_upper].add(elapsed)
 
-    log.info("TAI GET %s params=%s", url, params)
 
-    resp = requests.get(
-        url,
-        params=params,
-        auth=HTTPKerberosAuth(principal=""),
-        timeout=60,
+def get_user_metadata(
+    env: str,
+    user_ids: List[str],
+    deadline: Optional[Deadline] = None,
+    columns: Optional[List[str]] = None,
+) -> List[Dict]:
+    """
+    Fetch TAI user rows for `user_ids`, requesting only `columns` (default: USER_COLUMNS).
+
+    The call is bounded by `deadline` (if given) and TAI_TIMEOUT_SECONDS, may be
+    hedged once it runs past the env's p95 latency (with TAI_HEDGE_ENABLED), and
+    goes through the env's circuit breaker, which raises CircuitOpenError while
+    TAI is unhealthy.
+    """
+    if not user_ids:
+        return []
+
+    _get_base_url(env)
+    _columns_param(columns)
+    if deadline is not None:
+        deadline.timeout(TAI_TIMEOUT_SECONDS)  # DeadlineExceeded before we spend anything
+
+    breaker = get_circuit_breaker(env)
+    hedge_after = _latencies[env.upper()].percentile(TAI_HEDGE_PERCENTILE) if TAI_HEDGE_ENABLED else None
+    return breaker.call(
+        lambda: hedged(lambda superseded: list(_stream_rows(env, user_ids, columns, deadline, superseded)), hedge_after, deadline)
     )
 
-    if not resp.ok:
-        raise RuntimeError(f"TAI request failed: {resp.status_code} {resp.reason}. Body: {resp.text}")
 
-    payload = resp.json()
+def get_user_department(env: str, user_ids: List[str], deadline: Optional[Deadline] = None) -> List[Dict]:
+    """Only user.user and user.division, which is all the department lookup reads."""
+    return get_user_metadata(env, user_ids, deadline=deadline, columns=DEPARTMENT_COLUMNS)
+
+
+def iter_user_metadata(
+    env: str,
+    user_ids: List[str],
+    batch_size: int = TAI_BATCH_SIZE,
+    deadline: Optional[Deadline] = None,
+    columns: Optional[List[str]] = None,
+    on_batch: Optional[Callable[[List[str], List[Dict]], None]] = None,
+) -> Iterator[Dict]:
+    """
+    Yield TAI rows as they are decoded, one batch of ids at a time, so callers
+    can start responding before the whole id list is resolved. Streaming calls
+    are not hedged, but still go through the circuit breaker.
+
+    `on_batch(batch_ids, rows)` is called after each batch has been read in full,
+    e.g. to cache it; ids of the batch without a row are unknown to TAI.
+
+    The env and columns are validated eagerly (ValueError) rather than on first iteration.
+    """
+    _get_base_url(env)
+    _columns_param(columns)
+    breaker = get_circuit_breaker(env)
 
-    # optional: fail fast if TAI returned a non-zero errorCode
-    if payload.get("errorCode") not in (0, "0", None):
-        raise RuntimeError(f"TAI errorCode={payload.get('errorCode')} msg={payload.get('errorMessage')}")
+    def _rows() -> Iterator[Dict]:
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            batch_rows: List[Dict] = []
+            token = breaker.before_call()
+            started = time.monotonic()
+            try:
+                for row in _stream_rows(env, batch, columns, deadline):
+                    if on_batch is not None:
+                        batch_rows.append(row)
+                    yield row
+            except GeneratorExit:
+                # Closed mid-batch by the consumer (client disconnect): no verdict on TAI
+                breaker.release(token)
+                raise
+            except BaseException:
+                breaker.record(token, False, time.monotonic() - started)
+                raise
+            breaker.record(token, True, time.monotonic() - started)
+            if on_batch is not None:
+                on_batch(batch, batch_rows)
 
-    return payload.get("data", [])
\ No newline at end of file
+    return _rows()
@@ -1,4 +1,5 @@
 import json
+import os
 import sys
 from unittest.mock import MagicMock, patch
 
@@ -22,6 +23,25 @@ def client():
         yield client
 
 
+@pytest.fixture(autouse=True)
+def empty_user_snapshot(tmp_path, monkeypatch):
+    from app.snapshot import UserSnapshot
+
+    snapshot = UserSnapshot(str(tmp_path / "snapshot.db"))
+    monkeypatch.setattr("app.app.user_snapshot", snapshot)
+    yield snapshot
+
+
+@pytest.fixture(autouse=True)
+def empty_metadata_cache():
+    # The metadata cache is process-wide; keep tests independent of each other
+    from app.app import metadata_cache
+
+    metadata_cache.clear()
+    yield
+    metadata_cache.clear()
+
+
 def test_user_metadata_route_exists():
     routes = [rule.rule for rule in app.url_map.iter_rules()]
     # Flask-RESTX typically registers the route exactly as defined
@@ -92,4 +112,1009 @@ def test_user_metadata_unexpected_error_returns_500(mock_get_user_department, cl
 
     assert resp.status_code == HTTPStatus.INTERNAL_SERVER_ERROR
     data = json.loads(resp.data)
-    assert data["message"] == "Failed to retrieve user metadata"
\ No newline at end of file
+    assert data["message"] == "Failed to retrieve user metadata"
+
+@patch("app.app.iter_user_metadata")
+def test_user_metadata_bulk_post_streams_json(mock_iter_user_metadata, client):
+    mock_iter_user_metadata.return_value = iter([
+        {"user.user": "user_a", "user.division": "ENTERPRISE TECH & SERVICES", "user.job_title": "VP"},
+        {"user.user": "user_b", "user.division": "WEALTH MANAGEMENT", "user.job_title": "Associate"},
+    ])
+
+    resp = client.post(
+        "/user-metadata/QA",
+        json={"ids": ["user_a", "user_b", "user_a"], "columns": ["department", "jobTitle"]},
+        headers={AUTHENTICATED_WEBSTACK_USER_HEADER: "test.user@example.com"},
+    )
+
+    assert resp.status_code == HTTPStatus.OK
+    payload = json.loads(resp.data)
+    assert payload["metadata"]["user_a"] == {"department": "ENTERPRISE TECH & SERVICES", "jobTitle": "VP"}
+    assert payload["metadata"]["user_b"] == {"department": "WEALTH MANAGEMENT", "jobTitle": "Associate"}
+
+    called_env, called_ids = mock_iter_user_metadata.call_args[0]
+    assert called_env == "QA"
+    assert called_ids == ["user_a", "user_b"]
+
+
+@patch("app.app.iter_user_metadata")
+def test_user_metadata_bulk_post_streams_ndjson(mock_iter_user_metadata, client):
+    mock_iter_user_metadata.return_value = iter([
+        {"user.user": "user_a", "user.division": "ENTERPRISE TECH & SERVICES"},
+        {"user.user": "user_b", "user.division": "WEALTH MANAGEMENT"},
+    ])
+
+    resp = client.post(
+        "/user-metadata/QA",
+        json={"ids": ["user_a", "user_b"]},
+        headers={
+            AUTHENTICATED_WEBSTACK_USER_HEADER: "test.user@example.com",
+            "Accept": "application/x-ndjson",
+        },
+    )
+
+    assert resp.status_code == HTTPStatus.OK
+    assert resp.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in resp.data.decode().splitlines()]
+    assert lines == [
+        {"userId": "user_a", "department": "ENTERPRISE TECH & SERVICES"},
+        {"userId": "user_b", "department": "WEALTH MANAGEMENT"},
+    ]
+
+
+@patch("app.app.iter_user_metadata")
+def test_user_metadata_bulk_post_reports_tai_failure_in_band(mock_iter_user_metadata, client):
+    def failing_rows():
+        yield {"user.user": "user_a", "user.division": "WEALTH MANAGEMENT"}
+        raise RuntimeError("TAI is down")
+
+    mock_iter_user_metadata.return_value = failing_rows()
+
+    resp = client.post(
+        "/user-metadata/QA",
+        json={"ids": ["user_a", "user_b"]},
+        headers={AUTHENTICATED_WEBSTACK_USER_HEADER: "test.user@example.com"},
+    )
+
+    payload = json.loads(resp.data)
+    assert payload["metadata"] == {"user_a": {"department": "WEALTH MANAGEMENT"}}
+    assert "TAI is down" in payload["error"]
+
+
+@patch("app.app.iter_user_metadata")
+def test_user_metadata_bulk_post_reads_and_fills_the_metadata_cache(mock_iter_user_metadata, client):
+    from app.app import metadata_cache
+
+    # user_a is cached with the needed column; user_c only with the department (as GET caches it)
+    metadata_cache.put_many("QA", ["user_a"], [{"user.user": "user_a", "user.division": "WM", "user.job_title": "VP"}])
+    metadata_cache.put_many("QA", ["user_c"], [{"user.user": "user_c", "user.division": "FIRM"}])
+
+    def fetch(env, ids, deadline=None, columns=None, on_batch=None):
+        rows = [{"user.user": "user_b", "user.division": "IS", "user.job_title": "Associate"}]
+        yield from rows
+        on_batch(ids, rows)
+
+    mock_iter_user_metadata.side_effect = fetch
+    resp = client.post(
+        "/user-metadata/QA",
+        json={"ids": ["user_a", "user_b", "user_c"], "columns": ["jobTitle"]},
+        headers={AUTHENTICATED_WEBSTACK_USER_HEADER: "test.user@example.com"},
+    )
+
+    assert json.loads(resp.data)["metadata"] == {"user_a": {"jobTitle": "VP"}, "user_b": {"jobTitle": "Associate"}}
+    assert mock_iter_user_metadata.call_args[0][1] == ["user_b", "user_c"]
+    assert mock_iter_user_metadata.call_args.kwargs["columns"] == ["user.user", "user.division", "user.job_title"]
+    found, missing = metadata_cache.get_many("QA", ["user_b", "user_c"])
+    assert missing == []
+    assert found == {"user_b": {"user.user": "user_b", "user.division": "IS", "user.job_title": "Associate"}, "user_c": None}
+
+
+@patch("app.app.iter_user_metadata")
+def test_user_metadata_bulk_post_finishes_with_stale_rows_when_tai_fails(mock_iter_user_metadata, client):
+    from app.app import metadata_cache
+    from app.resilience import CircuitOpenError
+
+    metadata_cache.put_many("QA", ["user_b"], [{"user.user": "user_b", "user.division": "IS"}])
+    metadata_cache.ttl_seconds = 0  # everything is expired
+
+    def failing_rows():
+        yield {"user.user": "user_a", "user.division": "WM"}
+        raise CircuitOpenError("TAI QA", retry_after=12)
+
+    mock_iter_user_metadata.return_value = failing_rows()
+    try:
+        resp = client.post(
+            "/user-metadata/QA",
+            json={"ids": ["user_a", "user_b"]},
+            headers={AUTHENTICATED_WEBSTACK_USER_HEADER: "test.user@example.com"},
+        )
+        payload = json.loads(resp.data)
+    finally:
+        metadata_cache.ttl_seconds = 15 * 60
+
+    assert payload == {"metadata": {"user_a": {"department": "WM"}, "user_b": {"department": "IS"}}}
+
+
+def test_user_metadata_bulk_post_rejects_bad_body(client):
+    resp = client.post(
+        "/user-metadata/QA",
+        json={"ids": ["user_a"], "columns": ["salary"]},
+        headers={AUTHENTICATED_WEBSTACK_USER_HEADER: "test.user@example.com"},
+    )
+
+    assert resp.status_code == HTTPStatus.BAD_REQUEST
+    assert "Unknown columns" in json.loads(resp.data)["message"]
+
+    resp = client.post(
+        "/user-metadata/QA",
+        json={"columns": ["department"]},
+        headers={AUTHENTICATED_WEBSTACK_USER_HEADER: "test.user@example.com"},
+    )
+
+    assert resp.status_code == HTTPStatus.BAD_REQUEST
+
+
+@patch("app.app.get_user_department")
+def test_user_metadata_sets_etag_and_cache_control(mock_get_user_department, client):
+    mock_get_user_department.return_value = [
+        {"user.user": "user_a", "user.division": "WEALTH MANAGEMENT"},
+    ]
+
+    resp = client.get(
+        "/user-metadata/QA?ids=user_a",
+        headers={AUTHENTICATED_WEBSTACK_USER_HEADER: "test.user@example.com"},
+    )
+
+    assert resp.status_code == HTTPStatus.OK
+    assert resp.headers["ETag"]
+    assert resp.headers["Cache-Control"].startswith("private, max-age=")
+    assert int(resp.headers["Cache-Control"].split("max-age=")[1]) > 0
+
+
+@patch("app.app.get_user_department")
+def test_user_metadata_if_none_match_returns_304_without_calling_tai(mock_get_user_department, client):
+    mock_get_user_department.return_value = [
+        {"user.user": "user_a", "user.division": "WEALTH MANAGEMENT"},
+        {"user.user": "user_b", "user.division": "ENTERPRISE TECH & SERVICES"},
+    ]
+
+    first = client.get(
+        "/user-metadata/QA?ids=user_a,user_b",
+        headers={AUTHENTICATED_WEBSTACK_USER_HEADER: "test.user@example.com"},
+    )
+    etag = first.headers["ETag"]
+
+    # Same id set in a different order is the same resource
+    second = client.get(
+        "/user-metadata/QA?ids=user_b,user_a",
+        headers={AUTHENTICATED_WEBSTACK_USER_HEADER: "test.user@example.com", "If-None-Match": etag},
+    )
+
+    assert second.status_code == HTTPStatus.NOT_MODIFIED
+    assert second.headers["ETag"] == etag
+    assert second.data == b""
+    mock_get_user_department.assert_called_once()
+
+
+@patch("app.app.get_user_department")
+def test_user_metadata_etag_changes_when_metadata_changes(mock_get_user_department, client):
+    from app.app import metadata_cache
+
+    mock_get_user_department.return_value = [{"user.user": "user_a", "user.division": "WEALTH MANAGEMENT"}]
+    first = client.get(
+        "/user-metadata/QA?ids=user_a",
+        headers={AUTHENTICATED_WEBSTACK_USER_HEADER: "test.user@example.com"},
+    )
+
+    metadata_cache.put_many("QA", ["user_a"], [{"user.user": "user_a", "user.division": "INSTITUTIONAL SECURITIES"}])
+    second = client.get(
+        "/user-metadata/QA?ids=user_a",
+        headers={AUTHENTICATED_WEBSTACK_USER_HEADER: "test.user@example.com", "If-None-Match": first.headers["ETag"]},
+    )
+
+    assert second.status_code == HTTPStatus.OK
+    assert second.headers["ETag"] != first.headers["ETag"]
+    assert json.loads(second.data)["metadata"]["user_a"]["department"] == "INSTITUTIONAL SECURITIES"
+
+
+@patch("app.app.get_user_department")
+def test_user_metadata_etag_depends_only_on_the_returned_rows(mock_get_user_department, client):
+    from app.app import metadata_cache
+
+    # Two workers' caches hold the same rows after different histories
+    mock_get_user_department.return_value = [{"user.user": "user_a", "user.division": "WEALTH MANAGEMENT"}]
+    first = client.get(
+        "/user-metadata/QA?ids=user_a",
+        headers={AUTHENTICATED_WEBSTACK_USER_HEADER: "test.user@example.com"},
+    )
+    metadata_cache.clear()
+    metadata_cache.put_many("QA", ["user_b"], [{"user.user": "user_b", "user.division": "FIRM"}])
+    metadata_cache.put_many("QA", ["user_a"], [{"user.user": "user_a", "user.division": "WEALTH MANAGEMENT"}])
+    second = client.get(
+        "/user-metadata/QA?ids=user_a",
+        headers={AUTHENTICATED_WEBSTACK_USER_HEADER: "test.user@example.com", "If-None-Match": first.headers["ETag"]},
+    )
+
+    assert second.status_code == HTTPStatus.NOT_MODIFIED
+    assert second.headers["ETag"] == first.headers["ETag"]
+
+
+def test_metadata_cache_evicts_least_recently_used_rows():
+    from app.cache import MetadataCache
+
+    cache = MetadataCache(max_entries=3)
+    cache.put_many("QA", ["user_a", "user_b", "user_c"], [])
+    cache.get_many("QA", ["user_a"])
+    cache.put_many("QA", ["user_d"], [{"user.user": "user_d"}])
+
+    found, missing = cache.get_many("QA", ["user_a", "user_b", "user_c", "user_d"])
+    assert sorted(found) == ["user_a", "user_c", "user_d"]
+    assert missing == ["user_b"]
+    assert cache.get_stale("QA", ["user_b"]) == {}
+
+
+def test_user_metadata_warmer_fetches_uncached_ids_in_batches():
+    from app.cache import MetadataCache
+    from app.warmer import MetadataWarmer
+
+    cache = MetadataCache()
+    cache.put_many("PROD", ["user_a"], [{"user.user": "user_a", "user.division": "WEALTH MANAGEMENT"}])
+    fetch = MagicMock(side_effect=lambda env, ids: [{"user.user": uid, "user.division": "FIRM"} for uid in ids])
+
+    warmer = MetadataWarmer(
+        cache=cache,
+        tai_envs=["PROD"],
+        collect_ids=lambda: ["user_a", "user_b", "user_c", "user_d"],
+        fetch=fetch,
+        interval_seconds=0,
+        batch_size=2,
+        batch_pause_seconds=0,
+    )
+    warmer.warm_once()
+
+    assert [call.args[1] for call in fetch.call_args_list] == [["user_b", "user_c"], ["user_d"]]
+    found, missing = cache.get_many("PROD", ["user_a", "user_b", "user_c", "user_d"])
+    assert missing == []
+    assert found["user_d"]["user.division"] == "FIRM"
+
+    status = warmer.status()
+    assert status["state"] == "idle"
+    assert status["envs"]["PROD"] == {"users": 4, "toFetch": 3, "fetched": 3, "failedBatches": 0}
+    assert status["stalenessSeconds"] == 0
+
+
+def test_user_metadata_warmup_status_route(client):
+    resp = client.get(
+        "/user-metadata/warmup",
+        headers={AUTHENTICATED_WEBSTACK_USER_HEADER: "test.user@example.com"},
+    )
+
+    assert resp.status_code == HTTPStatus.OK
+    payload = json.loads(resp.data)
+    assert payload["state"] in ("idle", "collecting", "warming")
+    assert "stalenessSeconds" in payload
+
+
+@patch("app.app.get_user_department")
+def test_user_metadata_served_from_snapshot_without_calling_tai(mock_get_user_department, client, empty_user_snapshot):
+    empty_user_snapshot.upsert(
+        "QA",
+        ["user_a", "user_gone"],
+        [{"user.user": "user_a", "user.division": "WEALTH MANAGEMENT", "user.job_title": "VP"}],
+    )
+    mock_get_user_department.return_value = [{"user.user": "user_new", "user.division": "FIRM"}]
+
+    resp = client.get(
+        "/user-metadata/QA?ids=user_a,user_gone,user_new",
+        headers={AUTHENTICATED_WEBSTACK_USER_HEADER: "test.user@example.com"},
+    )
+
+    assert resp.status_code == HTTPStatus.OK
+    assert json.loads(resp.data)["metadata"] == {
+        "user_a": {"department": "WEALTH MANAGEMENT"},
+        "user_new": {"department": "FIRM"},
+    }
+    # Only the id the snapshot has never seen goes to TAI, and is queued for the refresher
+    mock_get_user_department.assert_called_once()
+    assert mock_get_user_department.call_args[0] == ("QA", ["user_new"])
+    assert empty_user_snapshot.least_recently_refreshed("QA", 1) == ["user_new"]
+
+
+def test_user_metadata_snapshot_refresher_fills_pending_rows(tmp_path):
+    from app.snapshot import SnapshotRefresher, UserSnapshot
+
+    snapshot = UserSnapshot(str(tmp_path / "snapshot.db"))
+    snapshot.track("PROD", ["user_a", "user_b"])
+    assert snapshot.get_many("PROD", ["user_a", "user_b"]) == ({}, ["user_a", "user_b"])
+
+    fetch = MagicMock(return_value=[{"user.user": "user_a", "user.division": "FIRM", "user.job_title": "VP"}])
+    refreshed = SnapshotRefresher(snapshot, fetch=fetch, rows_per_cycle=10).refresh_once()
+
+    assert refreshed == 2
+    rows, pending = snapshot.get_many("PROD", ["user_a", "user_b"])
+    assert pending == []
+    assert rows["user_a"]["user.job_title"] == "VP"
+    assert rows["user_b"] is None
+    assert snapshot.stats("PROD")["pending"] == 0
+
+
+@patch("app.app.get_user_department")
+def test_user_metadata_without_snapshot_goes_from_cache_to_tai(mock_get_user_department, client, monkeypatch):
+    from app.snapshot import DisabledSnapshot, UserSnapshot
+
+    monkeypatch.setattr("app.app.user_snapshot", DisabledSnapshot())
+    mock_get_user_department.return_value = [{"user.user": "user_a", "user.division": "WEALTH MANAGEMENT"}]
+
+    resp = client.get(
+        "/user-metadata/QA?ids=user_a",
+        headers={AUTHENTICATED_WEBSTACK_USER_HEADER: "test.user@example.com"},
+    )
+
+    assert json.loads(resp.data)["metadata"]["user_a"]["department"] == "WEALTH MANAGEMENT"
+    assert mock_get_user_department.call_args[0][1] == ["user_a"]
+    with pytest.raises(ValueError):
+        UserSnapshot("user_metadata_snapshot.db")  # relative to whatever the cwd happens to be
+
+
+@patch("app.app.get_user_department")
+def test_user_metadata_circuit_open_serves_stale_cache(mock_get_user_department, client):
+    from app.app import metadata_cache
+    from app.resilience import CircuitOpenError
+
+    metadata_cache.put_many("QA", ["user_a"], [{"user.user": "user_a", "user.division": "WEALTH MANAGEMENT"}])
+    metadata_cache.ttl_seconds = 0  # everything is expired
+    mock_get_user_department.side_effect = CircuitOpenError("TAI QA", retry_after=12)
+
+    try:
+        resp = client.get(
+            "/user-metadata/QA?ids=user_a",
+            headers={AUTHENTICATED_WEBSTACK_USER_HEADER: "test.user@example.com"},
+        )
+    finally:
+        metadata_cache.ttl_seconds = 15 * 60
+
+    assert resp.status_code == HTTPStatus.OK
+    assert resp.headers["Warning"] == '110 - "Response is Stale"'
+    assert json.loads(resp.data)["metadata"]["user_a"]["department"] == "WEALTH MANAGEMENT"
+
+
+@patch("app.app.get_user_department")
+def test_user_metadata_circuit_open_without_stale_returns_503(mock_get_user_department, client):
+    from app.resilience import CircuitOpenError
+
+    mock_get_user_department.side_effect = CircuitOpenError("TAI QA", retry_after=12)
+
+    resp = client.get(
+        "/user-metadata/QA?ids=user_a",
+        headers={AUTHENTICATED_WEBSTACK_USER_HEADER: "test.user@example.com"},
+    )
+
+    assert resp.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert resp.headers["Retry-After"] == "12"
+
+
+@patch("app.app.get_user_department")
+def test_user_metadata_passes_request_deadline_to_tai(mock_get_user_department, client):
+    mock_get_user_department.return_value = []
+
+    client.get(
+        "/user-metadata/QA?ids=user_a",
+        headers={AUTHENTICATED_WEBSTACK_USER_HEADER: "test.user@example.com", "X-Request-Timeout": "2"},
+    )
+
+    deadline = mock_get_user_department.call_args.kwargs["deadline"]
+    assert 0 < deadline.remaining() <= 2
+
+
+def test_circuit_breaker_opens_on_errors_and_recovers_after_probe():
+    from app.resilience import CircuitBreaker, CircuitOpenError
+
+    now = [0.0]
+    breaker = CircuitBreaker("TAI QA", min_calls=4, error_rate_threshold=0.5, cooldown_seconds=30, clock=lambda: now[0])
+    for ok in (True, False, True, False):
+        breaker.record(breaker.before_call(), ok, 0.1)
+
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    now[0] = 31
+    assert breaker.state == "half_open"
+    probe = breaker.before_call()  # the single probe is let through
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record(probe, True, 0.1)
+    assert breaker.state == "closed"
+
+
+def test_circuit_breaker_ignores_calls_started_before_it_opened():
+    from app.resilience import CircuitBreaker
+
+    now = [0.0]
+    breaker = CircuitBreaker("TAI QA", min_calls=4, error_rate_threshold=0.5, cooldown_seconds=30, clock=lambda: now[0])
+    slow_calls = [breaker.before_call() for _ in range(2)]
+    for _ in range(4):
+        breaker.record(breaker.before_call(), False, 0.1)
+    assert breaker.state == "open"
+
+    now[0] = 1
+    breaker.record(slow_calls[0], True, 1.0)  # a slow success must not close it during cooldown
+    assert breaker.state == "open"
+
+    now[0] = 31
+    probe = breaker.before_call()
+    breaker.record(slow_calls[1], False, 31.0)  # nor a slow failure decide for the probe
+    assert breaker.state == "half_open"
+    breaker.record(probe, True, 0.1)
+    assert breaker.state == "closed"
+
+
+def test_hedged_returns_first_successful_attempt():
+    import threading
+    from app.resilience import AttemptSuperseded, hedged
+
+    caller = threading.current_thread()
+    attempts = []
+
+    def call(superseded):
+        attempts.append(threading.current_thread())
+        if len(attempts) == 1:
+            # The slow primary stops once the hedge has succeeded
+            if superseded.wait(5):
+                raise AttemptSuperseded()
+            return "slow"
+        return "fast"
+
+    assert hedged(call, hedge_after=0.01) == "fast"
+    assert len(attempts) == 2 and caller not in attempts
+
+
+def test_hedged_returns_the_hedge_while_the_primary_is_stuck_before_headers(monkeypatch):
+    import threading
+    import time
+    from app import http_client, tai_client
+    from app.fake_tai import FakeTaiServer
+    from app.resilience import hedged
+
+    fake = FakeTaiServer(latency=0, seed=1).start()
+    unblock = threading.Event()
+    real_get = http_client.get
+    calls = []
+
+    def get(url, **kwargs):
+        calls.append(url)
+        if len(calls) == 1:
+            unblock.wait(10)  # the primary never gets its response headers
+        return real_get(url, **kwargs)
+
+    monkeypatch.setitem(tai_client.TAI_BASE_URLS, "QA", fake.base_url)
+    monkeypatch.setattr(http_client, "get", get)
+    try:
+        started = time.monotonic()
+        rows = hedged(lambda superseded: list(tai_client._stream_rows("QA", ["user_a"], None, None, superseded)), 0.05)
+        elapsed = time.monotonic() - started
+    finally:
+        unblock.set()
+        fake.stop()
+
+    assert [row["user.user"] for row in rows] == ["user_a"]
+    assert len(calls) == 2 and elapsed < 5
+
+
+def test_hedged_skips_the_hedge_when_too_many_are_in_flight(monkeypatch):
+    import threading
+    from app import resilience
+
+    monkeypatch.setattr(resilience, "_hedge_slots", threading.BoundedSemaphore(1))
+    resilience._hedge_slots.acquire()  # the only slot is taken
+    attempts = []
+
+    def call(superseded):
+        attempts.append(1)
+        superseded.wait(0.05)
+        return "primary"
+
+    assert resilience.hedged(call, hedge_after=0.01) == "primary"
+    assert len(attempts) == 1
+
+
+def test_iter_user_metadata_releases_the_probe_when_closed_mid_batch(monkeypatch):
+    from app import tai_client
+    from app.resilience import CircuitBreaker
+
+    now = [0.0]
+    breaker = CircuitBreaker("TAI QA", min_calls=1, cooldown_seconds=30, clock=lambda: now[0])
+    breaker.record(breaker.before_call(), False, 0.1)
+    monkeypatch.setitem(tai_client._breakers, "QA", breaker)
+    monkeypatch.setattr(
+        tai_client, "_stream_rows", lambda env, ids, columns, deadline: iter({"user.user": user_id} for user_id in ids)
+    )
+
+    now[0] = 31
+    rows = tai_client.iter_user_metadata("QA", ["user_a", "user_b"], batch_size=2)
+    assert next(rows) == {"user.user": "user_a"}
+    rows.close()  # the client went away while the probe was streaming
+
+    assert breaker.state == "half_open"
+    breaker.record(breaker.before_call(), True, 0.1)  # the next request may probe
+    assert breaker.state == "closed"
+
+
+@patch("app.app.get_user_department")
+def test_metrics_endpoint_exports_prometheus_text(mock_get_user_department, client):
+    mock_get_user_department.return_value = [{"user.user": "user_a", "user.division": "WEALTH MANAGEMENT"}]
+    for _ in range(2):
+        client.get(
+            "/user-metadata/QA?ids=user_a",
+            headers={AUTHENTICATED_WEBSTACK_USER_HEADER: "test.user@example.com"},
+        )
+
+    resp = client.get("/metrics")
+
+    assert resp.status_code == HTTPStatus.OK
+    assert resp.mimetype == "text/plain"
+    body = resp.data.decode()
+    assert "# TYPE http_request_duration_seconds histogram" in body
+    assert 'http_request_duration_seconds_count{route="/user-metadata/<env>",method="GET",status="200"}' in body
+    assert 'metadata_cache_lookups_total{tier="memory",result="hit"}' in body
+    assert 'metadata_ids_per_request_bucket{route="get",le="1"}' in body
+
+
+def test_histogram_renders_cumulative_buckets():
+    from app.metrics import Histogram
+
+    histogram = Histogram("tai_request_duration_seconds", "TAI latency.", ["env"], buckets=(0.1, 1))
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value, env="QA")
+
+    lines = histogram.render()
+    assert 'tai_request_duration_seconds_bucket{env="QA",le="0.1"} 1' in lines
+    assert 'tai_request_duration_seconds_bucket{env="QA",le="1"} 2' in lines
+    assert 'tai_request_duration_seconds_bucket{env="QA",le="+Inf"} 3' in lines
+    assert 'tai_request_duration_seconds_count{env="QA"} 3' in lines
+
+
+def test_registry_adds_up_other_workers_metrics(tmp_path):
+    from app.metrics import Counter, Gauge, Histogram, Registry
+
+    def worker_registry():
+        registry = Registry(str(tmp_path))
+        return (
+            registry,
+            registry.register(Counter("lookups_total", "Lookups.", ["tier"])),
+            registry.register(Gauge("in_flight", "In flight.")),
+            registry.register(Histogram("latency_seconds", "Latency.", buckets=(1,))),
+        )
+
+    registry, lookups, in_flight, latency = worker_registry()
+    lookups.inc(2, tier="memory")
+    in_flight.inc()
+    latency.observe(0.5)
+    registry.flush()
+    # Pretend the dumped file belongs to another worker: a live one, then one that has exited
+    live = tmp_path / f"{os.getppid()}.json"
+    os.replace(tmp_path / f"{os.getpid()}.json", live)
+
+    scraped, lookups, in_flight, latency = worker_registry()
+    lookups.inc(3, tier="memory")
+    latency.observe(5)
+    body = scraped.render()
+    assert 'lookups_total{tier="memory"} 5' in body
+    assert "in_flight 1" in body
+    assert 'latency_seconds_bucket{le="1"} 1' in body
+    assert "latency_seconds_count 2" in body
+
+    os.replace(live, tmp_path / "999999999.json")
+    body = scraped.render()
+    assert 'lookups_total{tier="memory"} 5' in body
+    assert "\nin_flight " not in body  # an exited worker's gauges are dropped
+
+
+def test_registry_archives_exited_workers_on_flush(tmp_path):
+    from app.metrics import Counter, Gauge, Registry
+
+    def dead_worker(pid, lookups):
+        (tmp_path / f"{pid}.json").write_text(json.dumps({
+            "lookups_total": [[["memory"], lookups]],
+            "in_flight": [[[], 1]],
+        }))
+
+    registry = Registry(str(tmp_path))
+    lookups = registry.register(Counter("lookups_total", "Lookups.", ["tier"]))
+    registry.register(Gauge("in_flight", "In flight."))
+    lookups.inc(1, tier="memory")
+    dead_worker(999999998, 2)
+    dead_worker(999999999, 3)
+    # Left under our pid by an earlier process that had it
+    dead_worker(os.getpid(), 4)
+
+    registry.flush()
+    assert sorted(os.listdir(tmp_path)) == sorted(["archive.json", "archive.lock", f"{os.getpid()}.json"])
+    assert json.loads((tmp_path / "archive.json").read_text()) == {"lookups_total": [[["memory"], 9]]}
+
+    dead_worker(999999999, 5)
+    registry.flush()
+    assert 'lookups_total{tier="memory"} 15' in registry.render()
+    assert not (tmp_path / "999999999.json").exists()
+    assert json.loads((tmp_path / "archive.json").read_text()) == {"lookups_total": [[["memory"], 14]]}
+    # Our own file is kept, not archived, once it is ours
+    assert json.loads((tmp_path / f"{os.getpid()}.json").read_text())["lookups_total"] == [[["memory"], 1]]
+
+
+@patch("app.app.iter_user_metadata")
+def test_bulk_post_is_timed_until_the_stream_is_sent(mock_iter_user_metadata, client):
+    from app.metrics import HTTP_REQUEST_SECONDS
+
+    mock_iter_user_metadata.return_value = iter([{"user.user": "user_a", "user.division": "WM"}])
+    key = ("/user-metadata/<env>", "POST", "200")
+    before = HTTP_REQUEST_SECONDS.values().get(key, ([], 0))[0]
+
+    resp = client.post(
+        "/user-metadata/QA",
+        json={"ids": ["user_a"]},
+        headers={AUTHENTICATED_WEBSTACK_USER_HEADER: "test.user@example.com"},
+    )
+    assert sum(HTTP_REQUEST_SECONDS.values().get(key, ([], 0))[0]) == sum(before)
+    resp.close()
+
+    assert sum(HTTP_REQUEST_SECONDS.values()[key][0]) == sum(before) + 1
+
+
+def test_tai_client_against_fake_tai_server(monkeypatch):
+    from app import tai_client
+    from app.fake_tai import FakeTaiServer
+
+    fake = FakeTaiServer(latency=0, missing_rate=0, seed=1).start()
+    try:
+        monkeypatch.setitem(tai_client.TAI_BASE_URLS, "QA", fake.base_url)
+        rows = tai_client.get_user_metadata("QA", ["user_a", "user_b"])
+    finally:
+        fake.stop()
+
+    assert sorted(row["user.user"] for row in rows) == ["user_a", "user_b"]
+    assert all(row["user.division"] for row in rows)
+    assert fake.calls == 1
+    assert fake.ids_requested == 2
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+def test_tai_row_decoder_yields_rows_across_chunk_boundaries(chunk_size):
+    from app.tai_client import _TaiRowDecoder
+
+    body = json.dumps({
+        "errorCode": 0,
+        "errorMessage": None,
+        "data": [
+            {"user.user": "user_a", "user.division": "WEALTH MANAGEMENT"},
+            {"user.user": "user_é", "user.division": "ENTERPRISE TECH & SERVICES"},
+        ],
+        "rowCount": 12345,
+    }, ensure_ascii=False).encode("utf-8")
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+    decoder = _TaiRowDecoder(chunks)
+    rows = list(decoder.rows())
+
+    assert [row["user.user"] for row in rows] == ["user_a", "user_é"]
+    assert decoder.envelope["rowCount"] == 12345
+
+
+def test_tai_row_decoder_raises_on_error_code():
+    from app.tai_client import _TaiRowDecoder
+
+    body = b'{"errorCode": 42, "errorMessage": "bad filter", "data": [{"user.user": "user_a"}]}'
+    with pytest.raises(RuntimeError, match="errorCode=42"):
+        list(_TaiRowDecoder([body]).rows())
+
+
+def test_tai_client_requests_only_declared_columns(monkeypatch):
+    from app import tai_client
+    from app.fake_tai import FakeTaiServer
+
+    fake = FakeTaiServer(latency=0, seed=1).start()
+    try:
+        monkeypatch.setitem(tai_client.TAI_BASE_URLS, "QA", fake.base_url)
+        rows = tai_client.get_user_department("QA", ["user_a"])
+        streamed = list(tai_client.iter_user_metadata("QA", ["user_a", "user_b"], batch_size=1, columns=["user.job_title"]))
+    finally:
+        fake.stop()
+
+    assert set(rows[0]) == {"user.user", "user.division"}
+    assert [set(row) for row in streamed] == [{"user.user", "user.job_title"}] * 2
+    assert fake.calls == 3
+
+
+@pytest.fixture
+def usage_index(monkeypatch):
+    from datetime import date
+    from app.aggregation import UsageIndex
+
+    events = {
+        "PROD": [
+            {"user": "user_a", "createdAt": "2025-03-03T09:00:00Z"},
+            {"user": "user_a", "createdAt": "2025-03-03T10:00:00Z"},
+            {"user": "user_b", "createdAt": {"$date": "2025-03-04T09:00:00Z"}},
+            {"user": "user_b", "createdAt": "2025-03-11T09:00:00Z"},
+        ],
+        "QA": [{"user": "user_a", "createdAt": "2025-03-05T09:00:00Z"}],
+        "DEV": [],
+    }
+    fetch_logs = MagicMock(side_effect=lambda env, start, end: events[env])
+    index = UsageIndex(fetch_logs=fetch_logs, today=lambda: date(2025, 4, 1))
+    monkeypatch.setattr("app.app.usage_index", index)
+    yield index
+
+
+@patch("app.aggregation.get_user_metadata")
+def test_aggregates_group_by_bucket_department_and_environment(mock_tai, client, usage_index):
+    mock_tai.return_value = [
+        {"user.user": "user_a", "user.division": "WEALTH MANAGEMENT"},
+        {"user.user": "user_b", "user.division": "ENTERPRISE TECH & SERVICES"},
+    ]
+
+    resp = client.get(
+        "/user-metadata/PROD/aggregates?startDate=2025-03-01&endDate=2025-03-31&bucket=week",
+        headers={AUTHENTICATED_WEBSTACK_USER_HEADER: "test_user"},
+    )
+
+    assert resp.status_code == HTTPStatus.OK
+    assert resp.get_json()["users"] == 2
+    assert resp.get_json()["rows"] == [
+        {"bucket": "2025-03-03", "department": "ENTERPRISE TECH & SERVICES", "region": "Unknown", "environment": "PROD", "count": 1},
+        {"bucket": "2025-03-03", "department": "WEALTH MANAGEMENT", "region": "Unknown", "environment": "PROD", "count": 2},
+        {"bucket": "2025-03-03", "department": "WEALTH MANAGEMENT", "region": "Unknown", "environment": "QA", "count": 1},
+        {"bucket": "2025-03-10", "department": "ENTERPRISE TECH & SERVICES", "region": "Unknown", "environment": "PROD", "count": 1},
+    ]
+
+
+@patch("app.aggregation.get_user_metadata")
+def test_aggregates_filter_and_reuse_indexed_days(mock_tai, client, usage_index):
+    mock_tai.return_value = [{"user.user": "user_a", "user.division": "WEALTH MANAGEMENT"}]
+    url = "/user-metadata/PROD/aggregates?startDate=2025-03-01&endDate=2025-03-31&environments=PROD&departments=WEALTH%20MANAGEMENT"
+
+    first = client.get(url, headers={AUTHENTICATED_WEBSTACK_USER_HEADER: "test_user"})
+    second = client.get(url, headers={AUTHENTICATED_WEBSTACK_USER_HEADER: "test_user"})
+
+    assert first.get_json()["rows"] == [
+        {"bucket": "2025-03-03", "department": "WEALTH MANAGEMENT", "region": "Unknown", "environment": "PROD", "count": 2},
+    ]
+    assert second.get_json() == first.get_json()
+    # Closed days are indexed once, and resolved departments come from the cache
+    assert usage_index.fetch_logs.call_count == 1
+    assert mock_tai.call_count == 1
+
+
+def test_usage_index_rereads_a_day_once_after_it_closes():
+    from datetime import date
+    from app.aggregation import UsageIndex
+
+    today = [date(2025, 3, 3)]
+    events = [{"user": "user_a", "createdAt": "2025-03-03T09:00:00Z"}]
+    fetch_logs = MagicMock(side_effect=lambda env, start, end: list(events))
+    index = UsageIndex(fetch_logs=fetch_logs, today=lambda: today[0], clock=lambda: 0.0)
+
+    assert index.ensure("PROD", date(2025, 3, 3), date(2025, 3, 3))[date(2025, 3, 3)] == {"user_a": 1}
+    events.append({"user": "user_b", "createdAt": "2025-03-03T23:30:00Z"})
+    today[0] = date(2025, 3, 4)  # past midnight UTC: the late events are picked up once
+    assert index.ensure("PROD", date(2025, 3, 3), date(2025, 3, 3))[date(2025, 3, 3)] == {"user_a": 1, "user_b": 1}
+    index.ensure("PROD", date(2025, 3, 3), date(2025, 3, 3))
+
+    assert fetch_logs.call_count == 2
+
+
+def test_usage_index_evicts_least_recently_used_days():
+    from datetime import date
+    from app.aggregation import UsageIndex
+
+    fetch_logs = MagicMock(return_value=[])
+    index = UsageIndex(fetch_logs=fetch_logs, today=lambda: date(2025, 4, 1), max_days=2)
+
+    index.ensure("PROD", date(2025, 3, 1), date(2025, 3, 2))
+    index.ensure("PROD", date(2025, 3, 1), date(2025, 3, 1))  # 03-01 is now the most recently used
+    assert set(index.ensure("PROD", date(2025, 3, 3), date(2025, 3, 3))) == {date(2025, 3, 3)}
+    index.ensure("PROD", date(2025, 3, 1), date(2025, 3, 1))
+
+    assert [call.args[1:] for call in fetch_logs.call_args_list] == [
+        (date(2025, 3, 1), date(2025, 3, 2)),
+        (date(2025, 3, 3), date(2025, 3, 3)),
+    ]
+
+
+@patch("app.aggregation.get_user_metadata")
+def test_aggregates_group_and_filter_by_configured_region(mock_tai, client, usage_index, monkeypatch):
+    from app import aggregation
+
+    monkeypatch.setattr(aggregation, "REGION_COLUMN", "user.region")
+    monkeypatch.setattr(aggregation, "DIMENSION_COLUMNS", ["user.division", "user.region"])
+    mock_tai.return_value = [
+        {"user.user": "user_a", "user.division": "WEALTH MANAGEMENT", "user.region": "EMEA"},
+        {"user.user": "user_b", "user.division": "WEALTH MANAGEMENT", "user.region": "AMERICAS"},
+    ]
+
+    resp = client.get(
+        "/user-metadata/PROD/aggregates?startDate=2025-03-01&endDate=2025-03-31&bucket=month&environments=PROD&regions=EMEA",
+        headers={AUTHENTICATED_WEBSTACK_USER_HEADER: "test_user", "X-Request-Timeout": "5"},
+    )
+
+    assert resp.get_json()["rows"] == [
+        {"bucket": "2025-03-01", "department": "WEALTH MANAGEMENT", "region": "EMEA", "environment": "PROD", "count": 2},
+    ]
+    assert 0 < mock_tai.call_args.kwargs["deadline"].remaining() <= 5
+
+
+def test_aggregates_reject_regions_filter_without_region_column(client, usage_index, monkeypatch):
+    monkeypatch.setattr("app.aggregation.REGION_COLUMN", None)
+    resp = client.get(
+        "/user-metadata/PROD/aggregates?startDate=2025-03-01&endDate=2025-03-31&regions=EMEA",
+        headers={AUTHENTICATED_WEBSTACK_USER_HEADER: "test_user"},
+    )
+
+    assert resp.status_code == HTTPStatus.BAD_REQUEST
+    assert "TAI_REGION_COLUMN" in resp.get_json()["message"]
+
+
+@patch("app.aggregation.get_user_metadata")
+def test_aggregates_fall_back_to_stale_rows_when_tai_is_unavailable(mock_tai, client, usage_index, monkeypatch):
+    from app.app import metadata_cache
+    from app.resilience import CircuitOpenError
+
+    monkeypatch.setattr("app.aggregation.DIMENSION_COLUMNS", ["user.division"])
+
+    metadata_cache.put_many("PROD", ["user_a", "user_b"], [{"user.user": "user_a", "user.division": "WEALTH MANAGEMENT"}])
+    metadata_cache.ttl_seconds = 0
+    mock_tai.side_effect = CircuitOpenError("TAI PROD", retry_after=12)
+    try:
+        resp = client.get(
+            "/user-metadata/PROD/aggregates?startDate=2025-03-01&endDate=2025-03-31&bucket=month&environments=QA",
+            headers={AUTHENTICATED_WEBSTACK_USER_HEADER: "test_user"},
+        )
+    finally:
+        metadata_cache.ttl_seconds = 15 * 60
+
+    assert resp.status_code == HTTPStatus.OK
+    assert resp.get_json()["rows"][0]["department"] == "WEALTH MANAGEMENT"
+
+
+@patch("app.aggregation.get_user_metadata")
+def test_aggregates_go_through_admission(mock_tai, client, usage_index, monkeypatch):
+    from app.admission import AdmissionController
+
+    admission = AdmissionController(caller_ids=1, env_ids=1)
+    monkeypatch.setattr("app.app.admission", admission)
+    mock_tai.return_value = []
+    held = admission.acquire("PROD", "test_user", 1)  # the caller's whole budget
+    try:
+        resp = client.get(
+            "/user-metadata/PROD/aggregates?startDate=2025-03-01&endDate=2025-03-31",
+            headers={AUTHENTICATED_WEBSTACK_USER_HEADER: "test_user"},
+        )
+    finally:
+        admission.release(held)
+
+    assert resp.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    mock_tai.assert_not_called()
+
+
+def test_aggregates_rejects_bad_range(client, usage_index):
+    resp = client.get(
+        "/user-metadata/PROD/aggregates?startDate=2025-03-31&endDate=2025-03-01",
+        headers={AUTHENTICATED_WEBSTACK_USER_HEADER: "test_user"},
+    )
+
+    assert resp.status_code == HTTPStatus.BAD_REQUEST
+    assert usage_index.fetch_logs.call_count == 0
+
+
+def test_shared_metadata_cache_is_shared_between_instances(tmp_path):
+    from app.cache import SharedMetadataCache
+
+    now = [1000.0]
+    path = str(tmp_path / "cache.db")
+    worker_a = SharedMetadataCache(path, ttl_seconds=60, clock=lambda: now[0])
+    worker_b = SharedMetadataCache(path, ttl_seconds=60, clock=lambda: now[0])
+
+    worker_a.put_many("qa", ["user_a", "user_x"], [{"user.user": "user_a", "user.division": "WM"}])
+    found, missing = worker_b.get_many("QA", ["user_a", "user_x", "user_b"])
+
+    assert found == {"user_a": {"user.user": "user_a", "user.division": "WM"}, "user_x": None}
+    assert missing == ["user_b"]
+    assert worker_b.remaining_ttl("QA", ["user_a"]) == 60
+
+    # Re-storing a row refreshes its age
+    now[0] += 30
+    worker_b.put_many("QA", ["user_a"], [{"user.user": "user_a", "user.division": "WM"}])
+    assert worker_a.remaining_ttl("QA", ["user_a"]) == 60
+
+    now[0] += 61
+    assert worker_a.get_many("QA", ["user_a"])[1] == ["user_a"]
+    assert worker_a.get_stale("QA", ["user_a"]) == {"user_a": {"user.user": "user_a", "user.division": "WM"}}
+
+    worker_b.clear()
+    assert worker_a.get_stale("QA", ["user_a"]) == {}
+
+
+def test_importing_the_app_does_not_load_the_http_stack():
+    from app.importtime import measure
+
+    result = measure("app.app", runs=1, top=5)
+
+    assert result["lazyModulesImported"] == {"requests": False, "requests_kerberos": False}
+
+
+def test_admission_rejects_caller_over_budget_and_full_queue():
+    from app.admission import AdmissionController, AdmissionRejected
+
+    controller = AdmissionController(env_ids=100, caller_ids=60, queue_ids=50, max_wait_seconds=0)
+    ticket = controller.acquire("QA", "caller_a", 60)
+
+    with pytest.raises(AdmissionRejected) as caller_over:
+        controller.acquire("QA", "caller_a", 1)
+    controller.acquire("QA", "caller_b", 40)
+    with pytest.raises(AdmissionRejected) as queue_full:
+        controller.acquire("QA", "caller_c", 60)
+
+    assert caller_over.value.status == 429
+    assert queue_full.value.status == 503
+    assert queue_full.value.retry_after >= 1
+    controller.release(ticket)
+    assert controller.status()["QA"] == {"inFlightIds": 40, "queuedIds": 0, "callers": 1}
+
+
+def test_admission_rejects_unknown_envs_without_tracking_them():
+    from app.admission import AdmissionController
+
+    controller = AdmissionController()
+
+    for env in ("NOPE", "nope", "favicon.ico"):
+        with pytest.raises(ValueError, match="Unknown environment"):
+            controller.acquire(env, "caller_a", 1)
+    controller.release(controller.acquire("qa", "caller_a", 1))
+    assert list(controller.status()) == ["QA"]
+
+
+def test_admission_queue_is_fair_between_callers():
+    import threading
+    import time
+    from app.admission import AdmissionController
+
+    controller = AdmissionController(env_ids=10, caller_ids=40, queue_ids=100, max_wait_seconds=5)
+    blocker = controller.acquire("QA", "blocker", 10)
+    admitted = []
+
+    def request(caller, ids):
+        ticket = controller.acquire("QA", caller, ids)
+        admitted.append(caller)
+        controller.release(ticket)
+
+    # The heavy caller queues first, with several large requests
+    threads = [threading.Thread(target=request, args=("heavy", 10)) for _ in range(3)]
+    threads.append(threading.Thread(target=request, args=("light", 2)))
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+
+    controller.release(blocker)
+    for thread in threads:
+        thread.join(timeout=5)
+
+    # The light caller is served after the heavy caller's first request, not behind all of them
+    assert admitted.index("light") <= 1
+    assert sorted(admitted) == ["heavy", "heavy", "heavy", "light"]
+
+
+@patch("app.app.get_user_department")
+def test_user_metadata_returns_429_with_retry_after_when_caller_over_budget(mock_get, client, monkeypatch):
+    from app.admission import AdmissionController
+
+    controller = AdmissionController(env_ids=100, caller_ids=1)
+    monkeypatch.setattr("app.app.admission", controller)
+    controller.acquire("QA", "test_user", 1)
+
+    resp = client.get(
+        "/user-metadata/QA?ids=user_a",
+        headers={AUTHENTICATED_WEBSTACK_USER_HEADER: "test_user"},
+    )
+
+    assert resp.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    assert int(resp.headers["Retry-After"]) >= 1
+    mock_get.assert_not_called()
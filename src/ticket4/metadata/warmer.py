@@ -0,0 +1,136 @@
+from typing import Callable, Dict, List, Optional
+import logging
+import os
+import threading
+import time
+
+from app.analytics_logs import collect_user_ids
+from app.cache import METADATA_CACHE_TTL_SECONDS, MetadataCache, metadata_cache
+from app.snapshot import fetch_with_snapshot, user_snapshot
+from app.tai_client import TAI_BATCH_SIZE, get_user_metadata
+
+log = logging.getLogger(__name__)
+
+# TAI env(s) whose cache is kept warm, e.g. "PROD" or "QA,PROD"
+WARM_TAI_ENVS = [e.strip().upper() for e in os.environ.get("METADATA_WARM_ENVS", "PROD").split(",") if e.strip()]
+WARM_LOOKBACK_DAYS = 90
+# Re-run before entries expire so dashboard requests never see a cold cache
+WARM_INTERVAL_SECONDS = METADATA_CACHE_TTL_SECONDS * 2 // 3
+# Pause between TAI batches so a warm-up never competes with live traffic
+WARM_BATCH_PAUSE_SECONDS = 0.5
+
+
+class MetadataWarmer:
+    """
+    Keeps the metadata cache populated for every user seen in the analytics logs.
+
+    Runs once at start() and then every `interval_seconds` on a daemon thread.
+    Each run collects the distinct user ids from the log source and fetches the
+    ones that are missing or about to expire, in throttled TAI batches.
+    """
+
+    def __init__(
+        self,
+        cache: MetadataCache,
+        tai_envs: List[str],
+        collect_ids: Callable[[], List[str]],
+        fetch: Callable[[str, List[str]], List[Dict]] = get_user_metadata,
+        interval_seconds: float = WARM_INTERVAL_SECONDS,
+        batch_size: int = TAI_BATCH_SIZE,
+        batch_pause_seconds: float = WARM_BATCH_PAUSE_SECONDS,
+    ):
+        self.cache = cache
+        self.tai_envs = tai_envs
+        self.collect_ids = collect_ids
+        self.fetch = fetch
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.batch_pause_seconds = batch_pause_seconds
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._status = {
+            "state": "idle",
+            "lastStartedAt": None,
+            "lastCompletedAt": None,
+            "lastError": None,
+            "envs": {},
+        }
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="metadata-warmer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.warm_once()
+            except Exception:
+                log.exception("Metadata warm-up failed")
+            self._stop.wait(self.interval_seconds)
+
+    def warm_once(self) -> None:
+        self._update(state="collecting", lastStartedAt=time.time(), lastError=None)
+        try:
+            user_ids = self.collect_ids()
+        except Exception as e:
+            self._update(state="idle", lastError=f"Failed to collect user ids: {e}")
+            raise
+
+        # Anything that would expire before the next run is refreshed now
+        refresh_within = self.interval_seconds + self.batch_pause_seconds * (len(user_ids) // self.batch_size + 1)
+
+        self._update(state="warming")
+        for env in self.tai_envs:
+            _, stale = self.cache.get_many(env, user_ids, refresh_within=refresh_within)
+            progress = {"users": len(user_ids), "toFetch": len(stale), "fetched": 0, "failedBatches": 0}
+            self._set_env_progress(env, progress)
+
+            for start in range(0, len(stale), self.batch_size):
+                if self._stop.is_set():
+                    return
+                batch = stale[start:start + self.batch_size]
+                try:
+                    self.cache.put_many(env, batch, self.fetch(env, batch))
+                    progress["fetched"] += len(batch)
+                except Exception as e:
+                    log.warning("Metadata warm-up batch failed for %s: %s", env, e)
+                    progress["failedBatches"] += 1
+                    self._update(lastError=str(e))
+                self._set_env_progress(env, progress)
+                self._stop.wait(self.batch_pause_seconds)
+
+        self._update(state="idle", lastCompletedAt=time.time())
+
+    def status(self) -> Dict:
+        """Snapshot of warm-up progress; `stalenessSeconds` is the age of the last completed run."""
+        with self._lock:
+            status = {**self._status, "envs": {env: dict(p) for env, p in self._status["envs"].items()}}
+        last_completed = status["lastCompletedAt"]
+        status["stalenessSeconds"] = None if last_completed is None else int(time.time() - last_completed)
+        return status
+
+    def _update(self, **fields) -> None:
+        with self._lock:
+            self._status.update(fields)
+
+    def _set_env_progress(self, env: str, progress: Dict) -> None:
+        with self._lock:
+            self._status["envs"][env] = dict(progress)
+
+
+metadata_warmer = MetadataWarmer(
+    cache=metadata_cache,
+    tai_envs=WARM_TAI_ENVS,
+    collect_ids=lambda: collect_user_ids(WARM_LOOKBACK_DAYS),
+    fetch=lambda env, user_ids: fetch_with_snapshot(user_snapshot, env, user_ids),
+)
@@ -0,0 +1,14 @@
+"""
+Shared tooling for the workspace metric scripts (src/*metric*.py, src/ticket3/).
+
+Run the tools from src/, e.g.:
+
+    python -m workspace_metrics.synthetic --docs 1000000 --format jsonl --out ws_1m.jsonl
+    python -m workspace_metrics.bench --sizes 10000,100000
+    python -m workspace_metrics.query countmetric ws_1m.jsonl --field active_as_at_june_2025
+    python -m workspace_metrics.batch countmetric "exports/*.json" --out trend.json --csv trend.csv
+    python -m workspace_metrics.snapshot_diff jan.json feb.json --events events.csv
+    python -m workspace_metrics.lifecycle add lifecycle.sqlite jan.json feb.json
+    python -m workspace_metrics.lifecycle active lifecycle.sqlite 2024-12-31T23:59:59Z --by eonid
+    python -m workspace_metrics.partitions convert ws_1m.jsonl store/ && python ticket3/metrics.py store/
+"""
@@ -0,0 +1,50 @@
+"""
+The analyzer scripts, loadable by name.
+
+Every script exposes cached_result(path) - its compute function memoized by
+workspace_metrics.memo - so tools that only want the numbers (the query CLI,
+the benchmark, a dashboard) share one cache with the scripts themselves.
+"""
+
+import importlib.util
+import os
+import sys
+from typing import Any, Dict
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> script path relative to src/
+ANALYZERS: Dict[str, str] = {
+    "metric": "metric.py",
+    "somemetric": "somemetric.py",
+    "detailedmetric": "detailedmetric.py",
+    "percentagemetric": "percentagemetric.py",
+    "countmetric": "countmetric.py",
+    "othermetric": "othermetric.py",
+    "ticket3.metrics": "ticket3/metrics.py",
+    "dailymetrics": "ticket3/dailymetrics.py",
+}
+
+
+def load_script(relative_path: str):
+    """Import an analyzer script by path (the ticket3 ones share names with src/ scripts)."""
+    path = os.path.join(SRC_DIR, relative_path)
+    name = "analyzer_" + relative_path.replace(os.sep, "_").replace("/", "_")[:-3]
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_analyzer(name: str):
+    if name not in ANALYZERS:
+        raise ValueError(f"Unknown analyzer {name!r}; expected one of {list(ANALYZERS)}")
+    return load_script(ANALYZERS[name])
+
+
+def cached_result(name: str, path: str) -> Any:
+    """The analyzer's result for an export with its configured settings, from cache when possible."""
+    return load_analyzer(name).cached_result(path)
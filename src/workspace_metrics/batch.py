@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+"""
+Run one analyzer over a series of dated exports and write a combined time
+series.
+
+Snapshots come from globs and/or a manifest. Each one is analyzed in its own
+worker process from a pool, with an address-space limit (--memory-limit-mb)
+so one oversized export fails with MemoryError on its own instead of taking
+the host down. A worker that dies outright (OOM killer, a hard limit hit
+outside Python) breaks the pool for every snapshot in flight; those are
+rerun one at a time and only the one that dies again is reported as an
+error. Results go through the shared result cache
+(workspace_metrics.memo): a snapshot that is unchanged since it was last
+fingerprinted and already has a cached result is not dispatched at all.
+
+    python -m workspace_metrics.batch countmetric "exports/*.json" --out trend.json --csv trend.csv
+    python -m workspace_metrics.batch metric --manifest snapshots.json --workers 4 --memory-limit-mb 8192
+
+A manifest is either a JSON list of paths / {"path": ..., "date": "YYYY-MM-DD"}
+objects, or a text file with one path per line. Relative paths are resolved
+against the manifest's directory. A snapshot's date is the manifest date,
+else a YYYY-MM-DD / YYYYMMDD in its file name, else its mtime.
+"""
+
+import argparse
+import csv
+import glob
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import fields, is_dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from workspace_metrics import memo
+from workspace_metrics.analyzers import ANALYZERS, cached_result
+from workspace_metrics.results import to_jsonable
+
+DEFAULT_MEMORY_LIMIT_MB = int(os.environ.get("WORKSPACE_METRICS_BATCH_MEMORY_MB", "4096"))
+
+_DATE_IN_NAME = re.compile(r"(20\d{2})-?(0[1-9]|1[0-2])-?(0[1-9]|[12]\d|3[01])")
+
+
+def read_manifest(path: str) -> List[Tuple[str, Optional[str]]]:
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+
+    entries: List[Tuple[str, Optional[str]]] = []
+    if path.endswith(".json"):
+        for item in json.loads(text):
+            if isinstance(item, str):
+                entries.append((item, None))
+            else:
+                entries.append((item["path"], item.get("date")))
+    else:
+        for line in text.splitlines():
+            line = line.strip()
+            if line and not line.startswith("#"):
+                entries.append((line, None))
+    return [(os.path.join(base, p), date) for p, date in entries]
+
+
+def snapshot_date(path: str, manifest_date: Optional[str] = None) -> str:
+    if manifest_date:
+        return manifest_date
+    match = _DATE_IN_NAME.search(os.path.basename(path))
+    if match:
+        return "-".join(match.groups())
+    return datetime.fromtimestamp(os.path.getmtime(path), tz=timezone.utc).date().isoformat()
+
+
+def collect_snapshots(patterns: List[str], manifest: Optional[str]) -> List[Tuple[str, str]]:
+    """(path, date) per distinct snapshot, ordered by date then path."""
+    entries: List[Tuple[str, Optional[str]]] = []
+    if manifest:
+        entries.extend(read_manifest(manifest))
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        if not matches:
+            print(f"Warning: no files match {pattern!r}", file=sys.stderr)
+        entries.extend((p, None) for p in matches)
+
+    seen = set()
+    snapshots = []
+    for path, date in entries:
+        real_path = os.path.realpath(path)
+        if real_path in seen:
+            continue
+        seen.add(real_path)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(path)
+        snapshots.append((path, snapshot_date(path, date)))
+    snapshots.sort(key=lambda s: (s[1], s[0]))
+    return snapshots
+
+
+def _init_worker(memory_limit_bytes: int, cache_enabled: bool, cache_directory: str) -> None:
+    # Workers are spawned, not forked: they only see the cache settings passed here
+    memo.configure(enabled=cache_enabled, directory=cache_directory)
+    if memory_limit_bytes:
+        try:
+            import resource
+        except ImportError:
+            return  # Not available on Windows; run unlimited
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        if hard != resource.RLIM_INFINITY:
+            memory_limit_bytes = min(memory_limit_bytes, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit_bytes, hard))
+
+
+def _max_rss_mib() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    # KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20, 1)
+
+
+def _analyze(analyzer: str, path: str) -> Dict[str, Any]:
+    """Worker body: never raises, so one bad snapshot cannot break the pool."""
+    started = time.perf_counter()
+    outcome: Dict[str, Any] = {}
+    try:
+        outcome["result"] = cached_result(analyzer, path)
+    except MemoryError:
+        outcome["error"] = "MemoryError: exceeded the per-snapshot memory limit"
+    except Exception as e:
+        outcome["error"] = f"{type(e).__name__}: {e}"
+    outcome["seconds"] = round(time.perf_counter() - started, 3)
+    outcome["maxRssMiB"] = _max_rss_mib()
+    return outcome
+
+
+def _pool(workers: int, memory_limit_bytes: int) -> ProcessPoolExecutor:
+    cache = memo.result_cache
+    kwargs: Dict[str, Any] = {"initializer": _init_worker, "initargs": (memory_limit_bytes, cache.enabled, cache.directory)}
+    if sys.version_info >= (3, 11):
+        # A fresh process per snapshot, so the limit and the peak RSS are per file
+        kwargs["max_tasks_per_child"] = 1
+    return ProcessPoolExecutor(max_workers=workers, **kwargs)
+
+
+def _analyze_in_pool(analyzer: str, entries: List[Dict[str, Any]], workers: int, memory_limit_bytes: int) -> List[Dict[str, Any]]:
+    """Fill in each entry's result or error; returns the entries lost to a worker that died."""
+    broken = []
+    with _pool(workers, memory_limit_bytes) as pool:
+        futures = {pool.submit(_analyze, analyzer, entry["path"]): entry for entry in entries}
+        for future in as_completed(futures):
+            entry = futures[future]
+            try:
+                entry.update(future.result())
+            except BrokenProcessPool:
+                broken.append(entry)
+                continue
+            print(f"  {entry['date']} {entry['path']}: {entry.get('error') or 'done'} ({entry['seconds']}s)", file=sys.stderr)
+    return broken
+
+
+def run_batch(
+    analyzer: str,
+    snapshots: List[Tuple[str, str]],
+    workers: Optional[int] = None,
+    memory_limit_mb: int = DEFAULT_MEMORY_LIMIT_MB,
+) -> List[Dict[str, Any]]:
+    """One entry per snapshot, in snapshot order: path, date, cached, and result or error."""
+    entries = [{"path": path, "date": date} for path, date in snapshots]
+
+    pending = []
+    with memo.result_cache.lookup_only():
+        for entry in entries:
+            try:
+                entry["result"] = cached_result(analyzer, entry["path"])
+                entry["cached"] = True
+            except memo.CacheMiss:
+                entry["cached"] = False
+                pending.append(entry)
+
+    if pending:
+        workers = max(1, min(workers or os.cpu_count() or 1, len(pending)))
+        print(f"{len(entries) - len(pending)} snapshot(s) unchanged; analyzing {len(pending)} with {workers} worker(s)", file=sys.stderr)
+        broken = _analyze_in_pool(analyzer, pending, workers, memory_limit_mb * 2 ** 20)
+        for entry in broken:
+            if _analyze_in_pool(analyzer, [entry], 1, memory_limit_mb * 2 ** 20):
+                entry["error"] = "BrokenProcessPool: the worker process died (OOM killer or a hard memory limit?)"
+                print(f"  {entry['date']} {entry['path']}: {entry['error']}", file=sys.stderr)
+    else:
+        print(f"All {len(entries)} snapshot(s) unchanged; nothing to analyze", file=sys.stderr)
+    return entries
+
+
+def scalar_fields(result: Any, prefix: str = "") -> Dict[str, Any]:
+    """
+    The numeric fields of a result, flattened to dotted names, for CSV columns.
+    Nested results (summary, periods) are followed; distributions such as
+    eonid counters are left out.
+    """
+    flat: Dict[str, Any] = {}
+    if not is_dataclass(result):
+        return flat
+    for f in fields(result):
+        value = getattr(result, f.name)
+        name = prefix + f.name
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+        elif is_dataclass(value):
+            flat.update(scalar_fields(value, name + "."))
+        elif isinstance(value, dict) and value and all(is_dataclass(v) for v in value.values()):
+            for key, item in value.items():
+                flat.update(scalar_fields(item, f"{name}.{key}."))
+    return flat
+
+
+def write_time_series_csv(path: str, entries: List[Dict[str, Any]]) -> None:
+    rows = [dict(date=e["date"], path=e["path"], **scalar_fields(e["result"])) for e in entries if "result" in e]
+    columns: List[str] = []
+    for row in rows:
+        columns.extend(c for c in row if c not in columns)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("analyzer", choices=list(ANALYZERS))
+    parser.add_argument("snapshots", nargs="*", help="export paths or glob patterns")
+    parser.add_argument("--manifest", help="JSON or text list of snapshot paths")
+    parser.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    parser.add_argument("--memory-limit-mb", type=int, default=DEFAULT_MEMORY_LIMIT_MB, help="address-space limit per snapshot; 0 for none")
+    parser.add_argument("--out", help="write the JSON time series here (default: stdout)")
+    parser.add_argument("--csv", help="also write the numeric fields as one CSV row per snapshot")
+    memo.add_cache_argument(parser)
+    args = parser.parse_args(argv)
+    memo.configure_from_args(args)
+
+    if not args.snapshots and not args.manifest:
+        parser.error("give snapshot paths/globs or --manifest")
+    try:
+        snapshots = collect_snapshots(args.snapshots, args.manifest)
+    except FileNotFoundError as e:
+        parser.error(f"snapshot not found: {e}")
+    if not snapshots:
+        parser.error("no snapshots matched")
+
+    entries = run_batch(args.analyzer, snapshots, args.workers, args.memory_limit_mb)
+
+    series = {
+        "analyzer": args.analyzer,
+        "generatedAt": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "snapshots": [
+            dict({k: v for k, v in entry.items() if k != "result"}, result=to_jsonable(entry["result"]))
+            if "result" in entry else entry
+            for entry in entries
+        ],
+    }
+    text = json.dumps(series, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.csv:
+        write_time_series_csv(args.csv, entries)
+
+    failed = [e for e in entries if "error" in e]
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark suite for the workspace metric scripts.
+
+Generates synthetic exports (see workspace_metrics.synthetic) for each
+requested size and format, runs every analyzer entry point over them, and
+records wall time, throughput and peak Python allocation (tracemalloc, in a
+separate run so it does not skew timings). Results can be saved as a baseline
+and later runs compared against it; anything slower or bigger than the
+baseline by more than --threshold is flagged and the exit code is 1.
+
+    python -m workspace_metrics.bench --sizes 10000,100000
+    python -m workspace_metrics.bench --sizes 100000 --entry-points metric,dailymetrics --save-baseline
+    python -m workspace_metrics.bench --sizes 1000000 --formats jsonl --no-memory --json run.json
+
+Generated exports are cached in --data-dir and reused across runs.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from workspace_metrics import memo
+from workspace_metrics.analyzers import SRC_DIR, load_script
+from workspace_metrics.synthetic import SyntheticConfig, generate_file
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+DEFAULT_DATA_DIR = os.path.join(SRC_DIR, ".bench_data")
+
+# Lines the analyzers print when they swallow a failure
+FAILURE_MARKERS = ("An unexpected error occurred", "Error: File not found", "No data objects found")
+
+
+def _ticket3_metrics(path: str) -> None:
+    module = load_script("ticket3/metrics.py")
+    module.analyze_workspace_data(path, module.PERIODS, module.BASELINE_PERIOD_KEY)
+
+
+def _dailymetrics(path: str) -> None:
+    load_script("ticket3/dailymetrics.py").compute_daily_metrics(path)
+
+
+# name -> callable(export path); every analyzer entry point, as the scripts' __main__ would call it
+ENTRY_POINTS: Dict[str, Callable[[str], None]] = {
+    "metric": lambda path: load_script("metric.py").analyze_workspace_data(path),
+    "somemetric": lambda path: load_script("somemetric.py").count_creations_for_months(path),
+    "detailedmetric": lambda path: load_script("detailedmetric.py").analyze_growth_metrics(path),
+    "percentagemetric": lambda path: load_script("percentagemetric.py").calculate_workspace_metrics(path),
+    "countmetric": lambda path: load_script("countmetric.py").count_workspaces_as_at_dates(path),
+    "othermetric": lambda path: load_script("othermetric.py").count_creations_for_month_range(path),
+    "ticket3.metrics": _ticket3_metrics,
+    "dailymetrics": _dailymetrics,
+}
+
+
+def ensure_export(data_dir: str, docs: int, fmt: str, seed: int) -> str:
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"workspaces_{docs}_{seed}.{'jsonl' if fmt == 'jsonl' else 'json'}")
+    if not os.path.exists(path):
+        print(f"Generating {path} ...")
+        tmp_path = path + ".tmp"
+        generate_file(tmp_path, SyntheticConfig(docs=docs, seed=seed), fmt)
+        os.replace(tmp_path, path)
+    return path
+
+
+def _run_quietly(entry_point: Callable[[str], None], path: str) -> Optional[str]:
+    """Run with stdout captured; returns an error description if the analyzer failed."""
+    captured = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(captured):
+            entry_point(path)
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    output = captured.getvalue()
+    for marker in FAILURE_MARKERS:
+        if marker in output:
+            line = next(l for l in output.splitlines() if marker in l)
+            return line.strip()
+    return None
+
+
+def bench_entry_point(entry_point: Callable[[str], None], path: str, docs: int, repeat: int, memory: bool) -> Dict:
+    timings: List[float] = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        error = _run_quietly(entry_point, path)
+        timings.append(time.perf_counter() - started)
+        if error:
+            return {"error": error}
+
+    result = {
+        "seconds": round(statistics.median(timings), 4),
+        "minSeconds": round(min(timings), 4),
+        "docsPerSecond": round(docs / statistics.median(timings)),
+    }
+    if memory:
+        tracemalloc.start()
+        try:
+            _run_quietly(entry_point, path)
+            result["peakMiB"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """Regressions as readable lines: slower or bigger than baseline * (1 + threshold)."""
+    regressions = []
+    for case, result in sorted(results.items()):
+        base = baseline.get(case)
+        if not base or "error" in base:
+            continue
+        if "error" in result:
+            regressions.append(f"{case}: now fails ({result['error']})")
+            continue
+        for metric in ("seconds", "peakMiB"):
+            if metric in result and metric in base and base[metric] > 0:
+                ratio = result[metric] / base[metric]
+                if ratio > 1 + threshold:
+                    regressions.append(f"{case}: {metric} {base[metric]} -> {result[metric]} ({ratio - 1:+.0%})")
+    return regressions
+
+
+def _print_report(results: Dict[str, Dict], baseline: Dict[str, Dict]) -> None:
+    header = f"{'case':<42} {'seconds':>9} {'docs/s':>11} {'peak MiB':>9} {'vs base':>8}"
+    print("\n" + header)
+    print("-" * len(header))
+    for case, r in sorted(results.items()):
+        if "error" in r:
+            print(f"{case:<42} ERROR {r['error']}")
+            continue
+        base = baseline.get(case, {})
+        delta = f"{r['seconds'] / base['seconds'] - 1:+.0%}" if base.get("seconds") else "-"
+        print(f"{case:<42} {r['seconds']:>9} {r['docsPerSecond']:>11} {r.get('peakMiB', '-'):>9} {delta:>8}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000", help="comma-separated document counts")
+    parser.add_argument("--formats", default="array,jsonl")
+    parser.add_argument("--entry-points", default=",".join(ENTRY_POINTS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="merge this run into the baseline file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown/growth before flagging")
+    parser.add_argument("--json", help="also write this run's results to this file")
+    args = parser.parse_args(argv)
+    # Every repeat has to do the work, not read it back from the result cache
+    memo.configure(enabled=False)
+
+    names = [n.strip() for n in args.entry_points.split(",") if n.strip()]
+    unknown = [n for n in names if n not in ENTRY_POINTS]
+    if unknown:
+        parser.error(f"unknown entry points {unknown}; expected any of {list(ENTRY_POINTS)}")
+
+    baseline: Dict[str, Dict] = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+
+    results: Dict[str, Dict] = {}
+    for docs in (int(s) for s in args.sizes.split(",") if s.strip()):
+        for fmt in (s.strip() for s in args.formats.split(",") if s.strip()):
+            path = ensure_export(args.data_dir, docs, fmt, args.seed)
+            for name in names:
+                case = f"{name}/{fmt}/{docs}"
+                print(f"Running {case} ...")
+                results[case] = bench_entry_point(ENTRY_POINTS[name], path, docs, args.repeat, not args.no_memory)
+
+    _print_report(results, baseline)
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print("\nRegressions against baseline:")
+        for line in regressions:
+            print(f"  - {line}")
+
+    run = {
+        "recordedAt": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(run, f, indent=2, sort_keys=True)
+    if args.save_baseline:
+        merged = dict(baseline, **results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(dict(run, results=merged), f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nBaseline updated: {args.baseline}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+Optional columnar files (Parquet, Arrow IPC) for the metric scripts.
+
+pyarrow is not needed for the default CSV/text outputs; it is imported on
+first use here and a clear MissingDependencyError is raised if it is not
+installed. Files are told apart by their magic bytes, so a reader does not
+care which of the two formats a table was written in. Reads are memory
+mapped, so an Arrow IPC file is used in place without copying.
+
+    table = pa.table({...})
+    write_table(table, "daily_metrics.parquet", "parquet", compression="zstd")
+    table = read_table("daily_metrics.parquet", columns=["date", "created_count"])
+"""
+
+import os
+from typing import Any, List, Optional
+
+from workspace_metrics.loader import MissingDependencyError
+
+FORMATS = ("parquet", "arrow")
+EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow"}
+# Arrow IPC only supports lz4 and zstd buffers
+COMPRESSIONS = {
+    "parquet": ("zstd", "snappy", "gzip", "lz4", "brotli", "none"),
+    "arrow": ("zstd", "lz4", "none"),
+}
+DEFAULT_COMPRESSION = "zstd"
+
+_PARQUET_MAGIC = b"PAR1"
+_ARROW_MAGIC = b"ARROW1"
+
+
+def require_pyarrow() -> Any:
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise MissingDependencyError(
+            "Parquet/Arrow files need the optional pyarrow package: pip install pyarrow"
+        ) from e
+    return pyarrow
+
+
+def columnar_format(path: str) -> Optional[str]:
+    """"parquet" or "arrow" if the file starts with that format's magic bytes, else None."""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(len(_ARROW_MAGIC))
+    except IsADirectoryError:
+        return None
+    if head.startswith(_PARQUET_MAGIC):
+        return "parquet"
+    if head.startswith(_ARROW_MAGIC):
+        return "arrow"
+    return None
+
+
+def output_path(base: str, fmt: str) -> str:
+    """`base` with the format's extension unless it already has one."""
+    root, ext = os.path.splitext(base)
+    return base if ext else root + EXTENSIONS[fmt]
+
+
+def _check_format(fmt: str, compression: str) -> None:
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown columnar format {fmt!r}; expected one of {', '.join(FORMATS)}")
+    if compression not in COMPRESSIONS[fmt]:
+        raise ValueError(f"{fmt} does not support {compression!r} compression; use one of {', '.join(COMPRESSIONS[fmt])}")
+
+
+def write_table(table: Any, path: str, fmt: str, compression: str = DEFAULT_COMPRESSION) -> None:
+    """Write a pyarrow Table atomically (a temporary file renamed into place)."""
+    _check_format(fmt, compression)
+    pa = require_pyarrow()
+    codec = None if compression == "none" else compression
+
+    tmp_path = path + ".tmp"
+    try:
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+
+            pq.write_table(table, tmp_path, compression=codec or "none")
+        else:
+            options = pa.ipc.IpcWriteOptions(compression=codec)
+            with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema, options=options) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class TableWriter:
+    """Appends record batches to one Parquet or Arrow IPC file; see open_table_writer()."""
+
+    def __init__(self, path: str, schema: Any, fmt: str, compression: str = DEFAULT_COMPRESSION):
+        _check_format(fmt, compression)
+        pa = require_pyarrow()
+        codec = None if compression == "none" else compression
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+
+            self._sink = None
+            self._writer = pq.ParquetWriter(path, schema, compression=codec or "none")
+        else:
+            self._sink = pa.OSFile(path, "wb")
+            self._writer = pa.ipc.new_file(self._sink, schema, options=pa.ipc.IpcWriteOptions(compression=codec))
+
+    def write(self, table: Any) -> None:
+        self._writer.write_table(table)
+
+    def close(self) -> None:
+        self._writer.close()
+        if self._sink is not None:
+            self._sink.close()
+
+
+def open_table_writer(path: str, schema: Any, fmt: str, compression: str = DEFAULT_COMPRESSION) -> TableWriter:
+    """A writer for tables too large to build at once; not atomic, unlike write_table()."""
+    return TableWriter(path, schema, fmt, compression)
+
+
+def read_table(path: str, columns: Optional[List[str]] = None) -> Any:
+    """A pyarrow Table from a Parquet or Arrow IPC file, optionally only some columns."""
+    fmt = columnar_format(path)
+    if fmt is None:
+        raise ValueError(f"{path} is not a Parquet or Arrow IPC file")
+    pa = require_pyarrow()
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        return pq.read_table(path, columns=columns, memory_map=True)
+    table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+    return table.select(columns) if columns is not None else table
@@ -0,0 +1,90 @@
+"""
+External merge sort for fixed-width record tuples.
+
+Records are buffered up to `max_in_memory`, sorted, and spilled to temporary
+files as packed struct runs; the runs are then k-way merged with heapq.merge.
+Memory stays bounded by the buffer whatever the input size, so the analyzers
+can sort tens of millions of records that would not fit as Python tuples.
+Inputs that fit in the buffer never touch disk.
+
+    for record in external_sort(records, "<QQBq", max_in_memory=1_000_000):
+        ...
+"""
+
+import heapq
+import os
+import struct
+import tempfile
+from typing import IO, Iterable, Iterator, List, Optional
+
+DEFAULT_MAX_IN_MEMORY = int(os.environ.get("WORKSPACE_METRICS_SORT_RECORDS", "1000000"))
+# Runs merged at once; more than this are merged in passes to bound open files
+MAX_FAN_IN = 64
+
+_READ_RECORDS = 8192
+
+
+def _spill(records: Iterable[tuple], record: struct.Struct, tmp_dir: Optional[str]) -> IO[bytes]:
+    run = tempfile.TemporaryFile(dir=tmp_dir)
+    pack = record.pack
+    batch = []
+    for r in records:
+        batch.append(pack(*r))
+        if len(batch) >= _READ_RECORDS:
+            run.write(b"".join(batch))
+            batch.clear()
+    run.write(b"".join(batch))
+    run.seek(0)
+    return run
+
+
+def _read_run(run: IO[bytes], record: struct.Struct) -> Iterator[tuple]:
+    block = record.size * _READ_RECORDS
+    try:
+        while True:
+            data = run.read(block)
+            if not data:
+                return
+            yield from record.iter_unpack(data)
+    finally:
+        run.close()
+
+
+def external_sort(
+    records: Iterable[tuple],
+    fmt: str,
+    max_in_memory: int = DEFAULT_MAX_IN_MEMORY,
+    tmp_dir: Optional[str] = None,
+) -> Iterator[tuple]:
+    """
+    Yield `records` in ascending tuple order. Every record must pack with the
+    struct format `fmt`; records that went through a spill come back as the
+    format unpacks them (a bool packed as "B" returns as 0/1).
+    """
+    record = struct.Struct(fmt)
+    runs: List[IO[bytes]] = []
+    buffer: List[tuple] = []
+    try:
+        for r in records:
+            buffer.append(r)
+            if len(buffer) >= max_in_memory:
+                buffer.sort()
+                runs.append(_spill(buffer, record, tmp_dir))
+                buffer = []
+        buffer.sort()
+        if not runs:
+            yield from buffer
+            return
+        if buffer:
+            runs.append(_spill(buffer, record, tmp_dir))
+            buffer = []
+
+        while len(runs) > MAX_FAN_IN:
+            group, runs = runs[:MAX_FAN_IN], runs[MAX_FAN_IN:]
+            merged = heapq.merge(*(_read_run(run, record) for run in group))
+            runs.append(_spill(merged, record, tmp_dir))
+
+        yield from heapq.merge(*(_read_run(run, record) for run in runs))
+    finally:
+        for run in runs:
+            run.close()
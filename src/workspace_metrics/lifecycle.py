@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+
+"""
+Persisted workspace lifecycle log with a point-in-time active index.
+
+Every "as at" report treats today's `archived` flag as if it had always
+applied. This log instead records each workspace's active intervals
+[start, end) from a series of snapshots (via workspace_metrics.snapshot_diff),
+so "how many workspaces were active at T" can be answered for any T - overall
+or per eonid / instance - without rescanning exports.
+
+Dating rules:
+- a snapshot dated D is taken to have been seen at the end of D (00:00 UTC
+  of the next day), since it may have been taken at any time that day
+- a workspace starts at its createdAt (else ObjectId time); one that appears
+  later without a creation time inside the window starts at the snapshot
+  that first saw it
+- archivals, unarchivals and deletions take effect at the snapshot that
+  first observed them (the diff only bounds them between two snapshot dates)
+- workspaces already archived in the first snapshot have no history; with
+  --archived-before-first created (the default, matching the single-export
+  reports) they are never counted active, with `snapshot` they count as
+  active until the first snapshot
+
+Storage is one SQLite file: the snapshots applied so far, each workspace's
+dimensions, its intervals, and the index - per (dimension, value), the sorted
+interval starts and ends as packed int64 blobs. active_at(T) is then
+bisect(starts, T) - bisect(ends, T): O(log n) per dimension value. The index
+is rebuilt with SQL ORDER BY after every added snapshot, so building it never
+needs the whole log in memory.
+
+    python -m workspace_metrics.lifecycle add lifecycle.sqlite jan.json feb.json mar.json
+    python -m workspace_metrics.lifecycle active lifecycle.sqlite 2024-12-31T23:59:59Z
+    python -m workspace_metrics.lifecycle active lifecycle.sqlite 2025-06-30 --by eonid --top 10
+"""
+
+import argparse
+import bisect
+import os
+import sqlite3
+import sys
+from array import array
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from workspace_metrics.batch import collect_snapshots
+from workspace_metrics.extsort import DEFAULT_MAX_IN_MEMORY
+from workspace_metrics.loader import get_timestamp_from_oid, iter_export, parse_iso_datetime
+from workspace_metrics.memo import hash_file
+from workspace_metrics.snapshot_diff import diff_snapshots, format_key, workspace_key
+
+DIMENSIONS = ("eonid", "instance")
+# Pseudo-dimension holding every workspace
+ALL = "all"
+ARCHIVED_BEFORE_FIRST = ("created", "snapshot")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    seq INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    date TEXT NOT NULL,
+    fingerprint TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS workspaces (
+    workspace_id TEXT PRIMARY KEY,
+    eonid TEXT NOT NULL,
+    instance TEXT NOT NULL
+) WITHOUT ROWID;
+-- Active intervals [start_ms, end_ms); end_ms NULL while still active
+CREATE TABLE IF NOT EXISTS intervals (
+    workspace_id TEXT NOT NULL,
+    start_ms INTEGER NOT NULL,
+    end_ms INTEGER
+);
+CREATE INDEX IF NOT EXISTS intervals_workspace ON intervals (workspace_id);
+CREATE TABLE IF NOT EXISTS active_index (
+    dimension TEXT NOT NULL,
+    value TEXT NOT NULL,
+    starts BLOB NOT NULL,
+    ends BLOB NOT NULL,
+    PRIMARY KEY (dimension, value)
+) WITHOUT ROWID;
+"""
+
+_BATCH = 10000
+DAY_MS = 24 * 60 * 60 * 1000
+
+
+def _epoch_ms(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
+
+
+def parse_instant(text: str) -> int:
+    """An ISO date or datetime ('Z' allowed; dates mean 00:00 UTC) as epoch milliseconds."""
+    parsed = parse_iso_datetime(text if "T" in text else text + "T00:00:00+00:00")
+    if parsed is None:
+        raise ValueError(f"Not an ISO date/datetime: {text!r}")
+    return _epoch_ms(parsed)
+
+
+def snapshot_ms(date: str) -> int:
+    """The instant a snapshot dated `date` is taken to have been seen: the end of that day."""
+    return parse_instant(date) + DAY_MS
+
+
+def _created_ms(doc: Dict[str, Any]) -> Optional[int]:
+    created = doc.get("createdAt")
+    if isinstance(created, dict):
+        created = created.get("$date")
+    created_at = parse_iso_datetime(created) if isinstance(created, str) else None
+    if created_at is None:
+        _id = doc.get("_id")
+        created_at = get_timestamp_from_oid(_id.get("$oid") if isinstance(_id, dict) else _id)
+    return _epoch_ms(created_at) if created_at else None
+
+
+def _dimensions(doc: Dict[str, Any]) -> Tuple[str, str]:
+    eonid = doc.get("eonid")
+    return (str(eonid) if eonid is not None else "Unknown"), str(doc.get("instance", "Unknown"))
+
+
+class LifecycleLog:
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, isolation_level=None)
+        self._conn.executescript(_SCHEMA)
+        self._index: Dict[Tuple[str, str], Tuple[array, array]] = {}
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def snapshots(self) -> List[Tuple[str, str, str]]:
+        """(path, date, fingerprint) of every snapshot applied, oldest first."""
+        return self._conn.execute("SELECT path, date, fingerprint FROM snapshots ORDER BY seq").fetchall()
+
+    def add_snapshot(
+        self,
+        path: str,
+        date: str,
+        archived_before_first: str = "created",
+        max_in_memory: int = DEFAULT_MAX_IN_MEMORY,
+    ) -> Dict[str, int]:
+        """Apply one snapshot newer than the last one; returns what changed."""
+        previous = self.snapshots()
+        if previous and date <= previous[-1][1]:
+            raise ValueError(f"Snapshot {path} ({date}) is not newer than the last applied one ({previous[-1][1]})")
+        fingerprint = hash_file(path)
+
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            if not previous:
+                changes = self._load_first(path, date, archived_before_first)
+            else:
+                prev_path, prev_date, prev_fingerprint = previous[-1]
+                if not os.path.isfile(prev_path) or hash_file(prev_path) != prev_fingerprint:
+                    raise ValueError(f"The last applied snapshot {prev_path} is missing or has changed; it is needed to diff against")
+                changes = self._apply_diff(prev_path, prev_date, path, date, max_in_memory)
+            self._conn.execute("INSERT INTO snapshots (path, date, fingerprint) VALUES (?, ?, ?)", (path, date, fingerprint))
+            self._rebuild_index()
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._index.clear()
+        return changes
+
+    def _load_first(self, path: str, date: str, archived_before_first: str) -> Dict[str, int]:
+        seen_ms = snapshot_ms(date)
+        changes = {}
+        workspaces, intervals = [], []
+        for doc in iter_export(path):
+            key = workspace_key(doc.get("workspaceId"))
+            if key is None:
+                continue
+            workspace_id = format_key(key)
+            start = _created_ms(doc)
+            if start is None or start > seen_ms:
+                start = seen_ms
+            end = None
+            if doc.get("archived") is True:
+                end = start if archived_before_first == "created" else max(start, seen_ms)
+            workspaces.append((workspace_id,) + _dimensions(doc))
+            intervals.append((workspace_id, start, end))
+            if len(workspaces) >= _BATCH:
+                self._insert(workspaces, intervals)
+                workspaces, intervals = [], []
+        self._insert(workspaces, intervals)
+
+        # A repeated workspaceId keeps its first document, as the workspaces table already did
+        self._conn.execute(
+            "DELETE FROM intervals WHERE rowid NOT IN (SELECT MIN(rowid) FROM intervals GROUP BY workspace_id)"
+        )
+        changes["workspaces"] = self._conn.execute("SELECT COUNT(*) FROM workspaces").fetchone()[0]
+        changes["archived"] = self._conn.execute("SELECT COUNT(*) FROM intervals WHERE end_ms IS NOT NULL").fetchone()[0]
+        return changes
+
+    def _insert(self, workspaces: List[tuple], intervals: List[tuple]) -> None:
+        self._conn.executemany("INSERT OR IGNORE INTO workspaces VALUES (?, ?, ?)", workspaces)
+        self._conn.executemany("INSERT INTO intervals VALUES (?, ?, ?)", intervals)
+
+    def _apply_diff(self, prev_path: str, prev_date: str, path: str, date: str, max_in_memory: int) -> Dict[str, int]:
+        observed_ms = snapshot_ms(date)
+        window_start_ms = parse_instant(prev_date)
+        created: Dict[str, bool] = {}
+        closes: List[Tuple[int, str]] = []
+        reopened: List[str] = []
+
+        def on_event(row: List[str]) -> None:
+            event, workspace_id = row[0], row[1]
+            if event == "created":
+                created[workspace_id] = False
+            elif event == "archived" and workspace_id in created:
+                created[workspace_id] = True
+            elif event in ("archived", "deleted"):
+                closes.append((observed_ms, workspace_id))
+            elif event == "unarchived":
+                reopened.append(workspace_id)
+
+        diff = diff_snapshots([(prev_path, prev_date), (path, date)], on_event, max_in_memory)[0]
+
+        # The diff carries ids only; one more streaming pass picks up the new workspaces' dimensions
+        workspaces, intervals = [], []
+        if created:
+            for doc in iter_export(path):
+                key = workspace_key(doc.get("workspaceId"))
+                if key is None:
+                    continue
+                workspace_id = format_key(key)
+                archived = created.pop(workspace_id, None)
+                if archived is None:
+                    continue
+                start = _created_ms(doc)
+                if start is None or not window_start_ms < start <= observed_ms:
+                    start = observed_ms
+                workspaces.append((workspace_id,) + _dimensions(doc))
+                intervals.append((workspace_id, start, observed_ms if archived else None))
+                if len(workspaces) >= _BATCH:
+                    self._insert(workspaces, intervals)
+                    workspaces, intervals = [], []
+            self._insert(workspaces, intervals)
+
+        self._conn.executemany("UPDATE intervals SET end_ms = ? WHERE workspace_id = ? AND end_ms IS NULL", closes)
+        self._conn.executemany(
+            "INSERT INTO intervals SELECT workspace_id, ?, NULL FROM workspaces WHERE workspace_id = ?",
+            ((observed_ms, workspace_id) for workspace_id in reopened),
+        )
+        return {"created": diff.created, "archived": diff.archived, "unarchived": diff.unarchived, "deleted": diff.deleted}
+
+    def _rebuild_index(self) -> None:
+        self._conn.execute("DELETE FROM active_index")
+        for dimension in (ALL,) + DIMENSIONS:
+            group = "'*'" if dimension == ALL else f"w.{dimension}"
+            starts = self._sorted_column(group, "i.start_ms", "")
+            ends = self._sorted_column(group, "i.end_ms", "WHERE i.end_ms IS NOT NULL")
+            for value in set(starts) | set(ends):
+                self._conn.execute(
+                    "INSERT INTO active_index VALUES (?, ?, ?, ?)",
+                    (dimension, value, starts.get(value, array("q")).tobytes(), ends.get(value, array("q")).tobytes()),
+                )
+
+    def _sorted_column(self, group: str, column: str, where: str) -> Dict[str, array]:
+        """column per group value, sorted by SQLite (which spills to disk as needed)."""
+        values: Dict[str, array] = {}
+        cursor = self._conn.execute(
+            f"SELECT {group}, {column} FROM intervals i JOIN workspaces w USING (workspace_id) {where} ORDER BY 1, 2"
+        )
+        for value, ms in cursor:
+            if value not in values:
+                values[value] = array("q")
+            values[value].append(ms)
+        return values
+
+    def _arrays(self, dimension: str, value: str) -> Tuple[array, array]:
+        key = (dimension, value)
+        if key not in self._index:
+            row = self._conn.execute(
+                "SELECT starts, ends FROM active_index WHERE dimension = ? AND value = ?", key
+            ).fetchone()
+            starts, ends = array("q"), array("q")
+            if row:
+                starts.frombytes(row[0])
+                ends.frombytes(row[1])
+            self._index[key] = (starts, ends)
+        return self._index[key]
+
+    def active_at(self, at_ms: int, dimension: str = ALL, value: str = "*") -> int:
+        """Workspaces active at an instant (epoch ms): started at or before it and not yet ended."""
+        starts, ends = self._arrays(dimension, value)
+        return bisect.bisect_right(starts, at_ms) - bisect.bisect_right(ends, at_ms)
+
+    def active_by(self, at_ms: int, dimension: str) -> Dict[str, int]:
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"Unknown dimension {dimension!r}; expected one of {DIMENSIONS}")
+        values = [v for (v,) in self._conn.execute("SELECT value FROM active_index WHERE dimension = ?", (dimension,))]
+        counts = {value: self.active_at(at_ms, dimension, value) for value in values}
+        return {value: count for value, count in counts.items() if count}
+
+
+def _print_changes(path: str, date: str, changes: Dict[str, int]) -> None:
+    detail = ", ".join(f"{k} {v}" for k, v in changes.items())
+    print(f"{date} {path}: {detail}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="apply snapshots newer than the last one applied")
+    add.add_argument("log")
+    add.add_argument("snapshots", nargs="*", help="export paths or glob patterns")
+    add.add_argument("--manifest", help="JSON or text list of snapshot paths (see workspace_metrics.batch)")
+    add.add_argument("--archived-before-first", choices=ARCHIVED_BEFORE_FIRST, default="created")
+    add.add_argument("--sort-records", type=int, default=DEFAULT_MAX_IN_MEMORY)
+
+    active = commands.add_parser("active", help="workspaces active at an instant")
+    active.add_argument("log")
+    active.add_argument("at", nargs="+", help="ISO dates/datetimes")
+    active.add_argument("--by", choices=DIMENSIONS)
+    active.add_argument("--top", type=int, default=0, help="with --by, only the N largest values")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "add":
+        try:
+            snapshots = collect_snapshots(args.snapshots, args.manifest)
+        except FileNotFoundError as e:
+            parser.error(f"snapshot not found: {e}")
+        log = LifecycleLog(args.log)
+        try:
+            applied = {date for _, date, _ in log.snapshots()}
+            last = max(applied) if applied else ""
+            for path, date in snapshots:
+                if date in applied:
+                    continue
+                if date < last:
+                    print(f"Skipping {path} ({date}): older than the last applied snapshot ({last})", file=sys.stderr)
+                    continue
+                _print_changes(path, date, log.add_snapshot(path, date, args.archived_before_first, args.sort_records))
+                last = date
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        finally:
+            log.close()
+        return 0
+
+    if not os.path.exists(args.log):
+        parser.error(f"no lifecycle log at {args.log}")
+    log = LifecycleLog(args.log)
+    try:
+        for text in args.at:
+            at_ms = parse_instant(text)
+            if not args.by:
+                print(f"{text}: {log.active_at(at_ms)} active")
+                continue
+            counts = sorted(log.active_by(at_ms, args.by).items(), key=lambda item: (-item[1], item[0]))
+            if args.top:
+                counts = counts[:args.top]
+            print(f"{text}: active by {args.by}")
+            for value, count in counts:
+                print(f"  - {value}: {count}")
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        log.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,309 @@
+"""
+Shared export loading for the workspace metric scripts.
+
+Every analyzer used to carry its own copy of this: read the whole export,
+try it as one JSON document (array or single object), fall back to JSON
+Lines, then pull createdAt.$date / _id.$oid / workspaceId out of each doc.
+
+Exports compressed with gzip, bz2 or zstd (.json.gz, .jsonl.zst, ...) are
+recognised by their magic bytes, whatever the file name, and decompressed
+as a stream; nothing is expanded to disk. Decompression runs on a
+background thread, so it overlaps with JSON decoding on the main one (zlib,
+bz2 and zstd all release the GIL). zstd needs Python 3.14+ or the optional
+zstandard package.
+"""
+
+import bz2
+import gzip
+import io
+import itertools
+import json
+import queue
+import re
+import threading
+from datetime import datetime, timezone
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Characters read per refill when streaming an export
+STREAM_CHUNK_CHARS = 1 << 20
+# Decompressed bytes per read-ahead chunk, and chunks buffered ahead of the reader
+DECOMPRESS_CHUNK_BYTES = 1 << 20
+DECOMPRESS_READ_AHEAD = 4
+
+_MAGIC = (
+    (b"\x1f\x8b", "gzip"),
+    (b"BZh", "bz2"),
+    (b"\x28\xb5\x2f\xfd", "zstd"),
+)
+
+_ARRAY_SEPARATORS = re.compile(r"[\s,]*")
+
+
+class MissingDependencyError(ImportError):
+    """An optional feature was used without its package installed."""
+
+
+def export_compression(file_path: str) -> Optional[str]:
+    """"gzip", "bz2" or "zstd" from the file's magic bytes; None for plain text."""
+    with open(file_path, "rb") as f:
+        head = f.read(4)
+    for magic, codec in _MAGIC:
+        if head.startswith(magic):
+            return codec
+    return None
+
+
+def _open_zstd(file_path: str) -> IO[bytes]:
+    try:
+        from compression import zstd  # Python 3.14+
+    except ImportError:
+        pass
+    else:
+        return zstd.open(file_path, "rb")
+    try:
+        import zstandard
+    except ImportError as e:
+        raise MissingDependencyError(
+            f"{file_path} is zstd-compressed: install the optional zstandard package (pip install zstandard)"
+        ) from e
+    return zstandard.ZstdDecompressor().stream_reader(open(file_path, "rb"), read_across_frames=True, closefd=True)
+
+
+class _ReadAhead(io.RawIOBase):
+    """Reads a binary stream on a background thread, a few chunks ahead of the consumer."""
+
+    def __init__(self, raw: IO[bytes]):
+        self._queue: "queue.Queue[Any]" = queue.Queue(DECOMPRESS_READ_AHEAD)
+        self._chunk = memoryview(b"")
+        self._eof = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._pump, args=(raw,), daemon=True)
+        self._thread.start()
+
+    def _pump(self, raw: IO[bytes]) -> None:
+        try:
+            with raw:
+                while not self._stop.is_set():
+                    chunk = raw.read(DECOMPRESS_CHUNK_BYTES)
+                    self._put(chunk)
+                    if not chunk:
+                        return
+        except BaseException as e:  # Re-raised in the reading thread
+            self._put(e)
+
+    def _put(self, item: Any) -> None:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if not self._chunk and not self._eof:
+            item = self._queue.get()
+            if isinstance(item, BaseException):
+                self._eof = True
+                raise item
+            self._eof = not item
+            self._chunk = memoryview(item)
+        n = min(len(buffer), len(self._chunk))
+        buffer[:n] = self._chunk[:n]
+        self._chunk = self._chunk[n:]
+        return n
+
+    def close(self) -> None:
+        self._stop.set()
+        super().close()
+
+
+def open_export(file_path: str) -> IO[str]:
+    """The export as a text stream, decompressed on the fly if it is compressed."""
+    codec = export_compression(file_path)
+    if codec is None:
+        return open(file_path, "r", encoding="utf-8")
+    if codec == "gzip":
+        raw = gzip.open(file_path, "rb")
+    elif codec == "bz2":
+        raw = bz2.open(file_path, "rb")
+    else:
+        raw = _open_zstd(file_path)
+    return io.TextIOWrapper(io.BufferedReader(_ReadAhead(raw), DECOMPRESS_CHUNK_BYTES), encoding="utf-8")
+
+
+def read_export(file_path: str) -> str:
+    with open_export(file_path) as f:
+        return f.read()
+
+
+def decode_export(text: str) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Decode an export as a JSON array (or single object), else as JSON Lines.
+    Returns (documents, number of JSONL lines skipped as invalid).
+    """
+    try:
+        data_objects = json.loads(text)
+        if not isinstance(data_objects, list):
+            data_objects = [data_objects]
+        return data_objects, 0
+    except json.JSONDecodeError:
+        pass
+
+    data_objects = []
+    json_line_parse_errors = 0
+    for line in text.splitlines():
+        line = line.strip()
+        if line:
+            try:
+                data_objects.append(json.loads(line))
+            except json.JSONDecodeError:
+                json_line_parse_errors += 1
+    return data_objects, json_line_parse_errors
+
+
+def load_export(file_path: str) -> Tuple[List[Dict[str, Any]], int]:
+    return decode_export(read_export(file_path))
+
+
+def iter_export(
+    file_path: str,
+    on_invalid_line: Optional[Callable[[], None]] = None,
+    wrap_file: Optional[Callable[[IO[str]], IO[str]]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Stream the documents of an export without holding the file in memory: a
+    JSON array is decoded one element at a time, JSON Lines one line at a
+    time (invalid lines are skipped, calling `on_invalid_line` for each).
+    Anything else, such as a single pretty-printed object, falls back to
+    load_export(). `wrap_file`, if given, wraps the opened text stream (the
+    profiler uses it to time reads apart from decoding).
+    """
+    with open_export(file_path) as f:
+        if wrap_file is not None:
+            f = wrap_file(f)
+        head = f.read(STREAM_CHUNK_CHARS)
+        stripped = head.lstrip()
+        if stripped.startswith("["):
+            yield from _iter_array(f, stripped[1:])
+            return
+
+        first_line, _, _ = stripped.partition("\n")
+        try:
+            json.loads(first_line)
+        except json.JSONDecodeError:
+            if first_line.strip():
+                docs, invalid_lines = load_export(file_path)
+                if on_invalid_line is not None:
+                    for _ in range(invalid_lines):
+                        on_invalid_line()
+                yield from docs
+                return
+
+        # Compressed streams cannot seek back, so finish the line `head` cut
+        # off and carry on from there
+        if head and not head.endswith("\n"):
+            head += f.readline()
+        for line in itertools.chain(head.splitlines(), f):
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    if on_invalid_line is not None:
+                        on_invalid_line()
+
+
+def _iter_array(f, buffer: str) -> Iterator[Any]:
+    decoder = json.JSONDecoder()
+    pos = 0
+    at_eof = False
+    while True:
+        pos = _ARRAY_SEPARATORS.match(buffer, pos).end()
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+        try:
+            if pos == len(buffer):
+                raise json.JSONDecodeError("buffer exhausted", buffer, pos)
+            value, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # Most likely an element cut off at the end of the buffer; refill and retry
+            if at_eof:
+                if pos == len(buffer):
+                    return  # Truncated export without the closing bracket
+                raise
+            chunk = f.read(STREAM_CHUNK_CHARS)
+            at_eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        yield value
+
+
+def parse_iso_datetime(date_str: Optional[str]) -> Optional[datetime]:
+    """Parse an ISO 8601 string ('Z' meaning UTC); None if missing or unparseable."""
+    if not date_str:
+        return None
+    if date_str.endswith('Z'):
+        date_str = date_str[:-1] + '+00:00'
+    try:
+        return datetime.fromisoformat(date_str)
+    except ValueError:
+        try:
+            return datetime.strptime(date_str, '%Y-%m-%dT%H:%M:%S.%f+00:00')
+        except ValueError:
+            try:
+                return datetime.strptime(date_str, '%Y-%m-%dT%H:%M:%S+00:00')
+            except ValueError:
+                return None
+
+
+def get_timestamp_from_oid(oid_str: Any) -> Optional[datetime]:
+    """Creation time from a Mongo ObjectId: the first 8 hex chars are a Unix timestamp."""
+    if not isinstance(oid_str, str) or len(oid_str) != 24:
+        return None
+    try:
+        return datetime.fromtimestamp(int(oid_str[:8], 16), tz=timezone.utc)
+    except (ValueError, TypeError):
+        return None
+
+
+def get_created_at_str(ws: Dict[str, Any]) -> Optional[str]:
+    return ws.get("createdAt", {}).get("$date")
+
+
+def creation_records(data_objects: List[Dict[str, Any]]) -> Tuple[List[Tuple[datetime, bool]], int, int]:
+    """
+    (created_at, archived) for every doc with a parseable createdAt.$date.
+    Returns (records, missing createdAt count, date parse error count).
+    """
+    records = []
+    missing_created_at_count = 0
+    date_parse_errors_count = 0
+    for ws in data_objects:
+        created_at_str = get_created_at_str(ws)
+        if not created_at_str:
+            missing_created_at_count += 1
+            continue
+        created_at_date = parse_iso_datetime(created_at_str)
+        if not created_at_date:
+            date_parse_errors_count += 1
+            continue
+        records.append((created_at_date, ws.get("archived") is True))
+    return records, missing_created_at_count, date_parse_errors_count
+
+
+def get_hashable_workspace_id(ws_id_value: Any) -> Optional[str]:
+    """
+    workspaceId as a string; {"$oid": ...} dicts give their value, other
+    dict shapes give None (not reliably unique as a string).
+    """
+    if isinstance(ws_id_value, dict):
+        if "$oid" in ws_id_value:
+            return str(ws_id_value["$oid"])
+        return None
+    elif ws_id_value is not None:
+        return str(ws_id_value)
+    return None
@@ -0,0 +1,226 @@
+"""
+Memoized analyzer results, keyed by (export fingerprint, analyzer, config).
+
+The fingerprint is a BLAKE2b digest of the export's bytes, so a copied or
+renamed export still hits and an edited one misses. Hashing is itself a full
+read, so digests are remembered per (path, size, mtime) in the cache
+directory's fingerprints.json and only recomputed when the file changes.
+
+Results (see workspace_metrics.results) are pickled to
+<cache dir>/results/<key>.pickle, written atomically so concurrent processes
+can share a directory, and also kept in a small in-process LRU. Set
+WORKSPACE_METRICS_CACHE=0 or pass --no-cache to bypass the cache; delete the
+directory to clear it.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, TypeVar
+
+from workspace_metrics.results import RESULTS_VERSION
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.environ.get("WORKSPACE_METRICS_CACHE_DIR", os.path.join(SRC_DIR, ".metrics_cache"))
+CACHE_ENABLED = os.environ.get("WORKSPACE_METRICS_CACHE", "1") != "0"
+# Results kept in memory per process
+MEMORY_ENTRIES = 32
+
+_HASH_CHUNK_BYTES = 1 << 20
+# A directory input (a partitioned store, see workspace_metrics.partitions) is
+# fingerprinted by this manifest, which is rewritten whenever a partition changes
+DIRECTORY_MANIFEST = "_partitions.json"
+
+T = TypeVar("T")
+
+
+class CacheMiss(LookupError):
+    """Raised by memoize() under ResultCache.lookup_only() when it would have to compute."""
+
+
+def _write_atomically(path: str, data: bytes) -> None:
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _fingerprint_target(path: str) -> str:
+    real_path = os.path.realpath(path)
+    if os.path.isdir(real_path):
+        return os.path.join(real_path, DIRECTORY_MANIFEST)
+    return real_path
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, directory: str, enabled: bool = True, memory_entries: int = MEMORY_ENTRIES):
+        self.directory = directory
+        self.enabled = enabled
+        self.memory_entries = memory_entries
+        self._memory: "OrderedDict[str, Any]" = OrderedDict()
+        self._fingerprints: Optional[Dict[str, list]] = None
+        self._lookup_only = False
+        self._lock = threading.Lock()
+
+    @property
+    def _fingerprints_path(self) -> str:
+        return os.path.join(self.directory, "fingerprints.json")
+
+    def _result_path(self, key: str) -> str:
+        return os.path.join(self.directory, "results", key + ".pickle")
+
+    def _read_fingerprints(self) -> Dict[str, list]:
+        try:
+            with open(self._fingerprints_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def known_fingerprint(self, path: str) -> Optional[str]:
+        """The digest recorded for this exact (path, size, mtime), without hashing; None if unknown."""
+        real_path = _fingerprint_target(path)
+        st = os.stat(real_path)
+        with self._lock:
+            if self._fingerprints is None:
+                self._fingerprints = self._read_fingerprints()
+            known = self._fingerprints.get(real_path)
+            if not known or known[:2] != [st.st_size, st.st_mtime_ns]:
+                # Possibly recorded since by another process (e.g. a batch worker)
+                self._fingerprints.update(self._read_fingerprints())
+                known = self._fingerprints.get(real_path)
+        if known and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+            return known[2]
+        return None
+
+    def fingerprint(self, path: str) -> str:
+        """Content digest of an export; raises FileNotFoundError like opening it would."""
+        digest = self.known_fingerprint(path)
+        if digest is not None:
+            return digest
+
+        real_path = _fingerprint_target(path)
+        st = os.stat(real_path)
+        digest = hash_file(real_path)
+        with self._lock:
+            # Merge with what other processes recorded since we loaded the index
+            self._fingerprints = dict(self._read_fingerprints(), **self._fingerprints)
+            self._fingerprints[real_path] = [st.st_size, st.st_mtime_ns, digest]
+            try:
+                _write_atomically(self._fingerprints_path, json.dumps(self._fingerprints).encode("utf-8"))
+            except OSError:
+                pass  # Only costs a rehash next time
+        return digest
+
+    def key(self, analyzer: str, config: Any, path: str, digest: Optional[str] = None) -> str:
+        """
+        `config` is everything the compute function reads besides the export;
+        its repr() must be deterministic (tuples of str/int/datetime are).
+        """
+        if digest is None:
+            digest = self.fingerprint(path)
+        material = f"{analyzer}\0{RESULTS_VERSION}\0{config!r}\0{digest}"
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+        try:
+            with open(self._result_path(key), "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            # Unreadable or from an incompatible version; recompute and overwrite
+            return None
+        self._remember(key, value)
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        self._remember(key, value)
+        try:
+            _write_atomically(self._result_path(key), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        except OSError:
+            pass  # A read-only cache directory still leaves the in-memory layer
+
+    def _remember(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def memoize(self, analyzer: str, config: Any, path: str, compute: Callable[[], T]) -> T:
+        if self._lookup_only:
+            digest = self.known_fingerprint(path) if self.enabled else None
+            value = self.get(self.key(analyzer, config, path, digest)) if digest else None
+            if value is None:
+                raise CacheMiss(path)
+            return value
+        if not self.enabled:
+            return compute()
+        key = self.key(analyzer, config, path)
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    @contextmanager
+    def lookup_only(self) -> Iterator[None]:
+        """
+        Within this block memoize() never computes or hashes: it returns a result
+        only if the export is unchanged since it was last fingerprinted and the
+        result is cached, and raises CacheMiss otherwise.
+        """
+        self._lookup_only = True
+        try:
+            yield
+        finally:
+            self._lookup_only = False
+
+
+result_cache = ResultCache(CACHE_DIR, CACHE_ENABLED)
+
+
+def memoize(analyzer: str, config: Any, path: str, compute: Callable[[], T]) -> T:
+    return result_cache.memoize(analyzer, config, path, compute)
+
+
+def configure(enabled: Optional[bool] = None, directory: Optional[str] = None) -> None:
+    if enabled is not None:
+        result_cache.enabled = enabled
+    if directory is not None and directory != result_cache.directory:
+        result_cache.directory = directory
+        result_cache._memory.clear()
+        result_cache._fingerprints = None
+
+
+def add_cache_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--no-cache", action="store_true", help="recompute instead of using cached results")
+
+
+def configure_from_args(args: argparse.Namespace) -> None:
+    if args.no_cache:
+        configure(enabled=False)
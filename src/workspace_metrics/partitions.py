@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+
+"""
+Month-partitioned workspace store.
+
+    python -m workspace_metrics.partitions convert export.json.gz store/
+    python -m workspace_metrics.partitions stats store/
+    python ticket3/metrics.py store/
+
+`convert` streams an export once and writes the normalised workspace table.
+There is one file per creation month (month=YYYY-MM/part-<run>.parquet),
+plus _partitions.json holding:
+
+- per partition: row, active and ObjectId-dated counts, and the min/max
+  creation time
+- export-wide: documents, skipped JSON Lines, missing or unparseable
+  createdAt, and distinct workspaceIds
+
+Creation time follows ticket3/metrics.py: createdAt.$date, else the _id.$oid
+timestamp (from_oid marks those rows). Documents with neither are only
+counted. workspace_id and eonid are kept as that script normalises them.
+
+ticket3/metrics.py, somemetric.py and dailymetrics.py accept a store
+directory in place of an export. They read only the partitions overlapping
+the requested dates. Whole partitions, including the ones behind cumulative
+"as at" totals, are counted from the manifest without being opened.
+
+Partition files get fresh names and the manifest is replaced atomically
+last, so a reader never sees a half-written store. Files from the previous
+conversion are removed afterwards. Needs the optional pyarrow package.
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from workspace_metrics.columnar import (
+    COMPRESSIONS,
+    DEFAULT_COMPRESSION,
+    EXTENSIONS,
+    FORMATS,
+    open_table_writer,
+    read_table,
+    require_pyarrow,
+)
+from workspace_metrics.extsort import DEFAULT_MAX_IN_MEMORY, external_sort
+from workspace_metrics.loader import get_timestamp_from_oid, iter_export, parse_iso_datetime
+from workspace_metrics.memo import DIRECTORY_MANIFEST
+
+MANIFEST = DIRECTORY_MANIFEST
+STORE_VERSION = 1
+# Rows held across all months before they are written out as row groups
+DEFAULT_BUFFER_ROWS = 500_000
+
+_COLUMNS = ("seq", "created_at", "from_oid", "archived", "workspace_id", "eonid", "instance")
+
+
+def _schema():
+    pa = require_pyarrow()
+    return pa.schema(
+        [
+            ("seq", pa.int64()),  # Position of the document in the export
+            ("created_at", pa.timestamp("us", tz="UTC")),
+            ("from_oid", pa.bool_()),
+            ("archived", pa.bool_()),
+            ("workspace_id", pa.string()),
+            ("eonid", pa.string()),
+            ("instance", pa.string()),
+        ]
+    )
+
+
+@dataclass
+class Partition:
+    month: str
+    path: str
+    rows: int
+    active: int
+    from_oid: int
+    min_created: datetime
+    max_created: datetime
+
+    def within(self, start: Optional[datetime], end: Optional[datetime]) -> bool:
+        return (start is None or self.min_created >= start) and (end is None or self.max_created <= end)
+
+    def overlaps(self, start: Optional[datetime], end: Optional[datetime]) -> bool:
+        return (start is None or self.max_created >= start) and (end is None or self.min_created <= end)
+
+
+def is_store(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, MANIFEST))
+
+
+# ---------- CONVERSION ---------- #
+
+def _normalise(doc: Dict[str, Any], stats: Dict[str, int]) -> Optional[Tuple[datetime, bool]]:
+    """(created_at in UTC, from_oid), counting createdAt problems into `stats`; None if undated."""
+    created = doc.get("createdAt")
+    created_str = created.get("$date") if isinstance(created, dict) else None
+    created_at = None
+    if not created_str:
+        stats["missing_created_at"] += 1
+    else:
+        created_at = parse_iso_datetime(created_str) if isinstance(created_str, str) else None
+        if created_at is None:
+            stats["date_parse_errors"] += 1
+
+    from_oid = False
+    if created_at is None:
+        _id = doc.get("_id")
+        created_at = get_timestamp_from_oid(_id.get("$oid") if isinstance(_id, dict) else None)
+        if created_at is None:
+            return None
+        from_oid = True
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at.astimezone(timezone.utc), from_oid
+
+
+def _id_key(workspace_id: str) -> Tuple[int, int]:
+    digest = hashlib.blake2b(workspace_id.encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "big"), int.from_bytes(digest[8:], "big")
+
+
+class _PartitionWriter:
+    def __init__(self, store_dir: str, fmt: str, compression: str, buffer_rows: int):
+        self.store_dir = store_dir
+        self.fmt = fmt
+        self.compression = compression
+        self.buffer_rows = buffer_rows
+        self.run = uuid.uuid4().hex[:12]
+        self.schema = _schema()
+        self.buffers: Dict[str, Dict[str, list]] = {}
+        self.buffered = 0
+        self.writers: Dict[str, Any] = {}
+        self.partitions: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, seq: int, created_at: datetime, from_oid: bool, archived: bool, workspace_id: str, eonid: str, instance: str) -> None:
+        month = f"{created_at.year:04d}-{created_at.month:02d}"
+        buffer = self.buffers.get(month)
+        if buffer is None:
+            buffer = self.buffers[month] = {name: [] for name in _COLUMNS}
+        for name, value in zip(_COLUMNS, (seq, created_at, from_oid, archived, workspace_id, eonid, instance)):
+            buffer[name].append(value)
+
+        stats = self.partitions.get(month)
+        if stats is None:
+            stats = self.partitions[month] = {"rows": 0, "active": 0, "from_oid": 0, "min": created_at, "max": created_at}
+        stats["rows"] += 1
+        stats["active"] += not archived
+        stats["from_oid"] += from_oid
+        if created_at < stats["min"]:
+            stats["min"] = created_at
+        elif created_at > stats["max"]:
+            stats["max"] = created_at
+
+        self.buffered += 1
+        if self.buffered >= self.buffer_rows:
+            self.flush()
+
+    def _relative_path(self, month: str) -> str:
+        return os.path.join(f"month={month}", f"part-{self.run}{EXTENSIONS[self.fmt]}")
+
+    def flush(self) -> None:
+        pa = require_pyarrow()
+        for month, buffer in self.buffers.items():
+            writer = self.writers.get(month)
+            if writer is None:
+                path = os.path.join(self.store_dir, self._relative_path(month))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                writer = self.writers[month] = open_table_writer(path, self.schema, self.fmt, self.compression)
+            writer.write(pa.table(buffer, schema=self.schema))
+        self.buffers = {}
+        self.buffered = 0
+
+    def close(self) -> List[Dict[str, Any]]:
+        self.flush()
+        for writer in self.writers.values():
+            writer.close()
+        return [
+            {
+                "month": month,
+                "path": self._relative_path(month),
+                "rows": stats["rows"],
+                "active": stats["active"],
+                "from_oid": stats["from_oid"],
+                "min_created": stats["min"].isoformat(),
+                "max_created": stats["max"].isoformat(),
+            }
+            for month, stats in sorted(self.partitions.items())
+        ]
+
+
+def _convert_docs(export_path: str, writer: _PartitionWriter, stats: Dict[str, int]) -> Iterator[Tuple[int, int]]:
+    """Feed every dated document to `writer`; yields each one's workspace id key for the distinct count."""
+    def on_invalid_line() -> None:
+        stats["json_line_parse_errors"] += 1
+
+    for seq, doc in enumerate(iter_export(export_path, on_invalid_line)):
+        stats["documents"] += 1
+        if not isinstance(doc, dict):
+            stats["undated"] += 1
+            continue
+        dated = _normalise(doc, stats)
+        if dated is None:
+            stats["undated"] += 1
+            continue
+        workspace_id = str(doc.get("workspaceId", "Unknown"))
+        writer.add(
+            seq,
+            dated[0],
+            dated[1],
+            doc.get("archived") is True,
+            workspace_id,
+            str(doc.get("eonid", "Unknown")),
+            str(doc.get("instance", "Unknown")),
+        )
+        yield _id_key(workspace_id)
+
+
+def _write_manifest(store_dir: str, manifest: Dict[str, Any]) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=store_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+            f.write("\n")
+        os.replace(tmp_path, os.path.join(store_dir, MANIFEST))
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _remove_stale(store_dir: str, keep: List[str]) -> None:
+    keep_paths = {os.path.normpath(os.path.join(store_dir, path)) for path in keep}
+    for path in glob.glob(os.path.join(store_dir, "month=*", "part-*")):
+        if os.path.normpath(path) not in keep_paths:
+            os.unlink(path)
+    for directory in glob.glob(os.path.join(store_dir, "month=*")):
+        if not os.listdir(directory):
+            os.rmdir(directory)
+
+
+def convert_export(
+    export_path: str,
+    store_dir: str,
+    fmt: str = "parquet",
+    compression: str = DEFAULT_COMPRESSION,
+    buffer_rows: int = DEFAULT_BUFFER_ROWS,
+    max_in_memory: int = DEFAULT_MAX_IN_MEMORY,
+) -> Dict[str, Any]:
+    """Write (or replace) the store for an export; returns the manifest."""
+    require_pyarrow()
+    if not os.path.isfile(export_path):
+        raise FileNotFoundError(export_path)
+    os.makedirs(store_dir, exist_ok=True)
+
+    stats = dict.fromkeys(("documents", "json_line_parse_errors", "missing_created_at", "date_parse_errors", "undated"), 0)
+    writer = _PartitionWriter(store_dir, fmt, compression, buffer_rows)
+    distinct = 0
+    previous = None
+    try:
+        for key in external_sort(_convert_docs(export_path, writer, stats), "<QQ", max_in_memory):
+            if key != previous:
+                distinct += 1
+                previous = key
+    finally:
+        partitions = writer.close()
+
+    manifest = dict(
+        version=STORE_VERSION,
+        source=os.path.abspath(export_path),
+        format=fmt,
+        **stats,
+        distinct_workspace_ids=distinct,
+        partitions=partitions,
+    )
+    _write_manifest(store_dir, manifest)
+    _remove_stale(store_dir, [p["path"] for p in partitions])
+    return manifest
+
+
+# ---------- READING ---------- #
+
+class PartitionStore:
+    def __init__(self, directory: str):
+        self.directory = directory
+        try:
+            with open(os.path.join(directory, MANIFEST), encoding="utf-8") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            raise ValueError(f"{directory} is not a partitioned store (no {MANIFEST})") from None
+        if manifest.get("version") != STORE_VERSION:
+            raise ValueError(f"{directory} was written by an incompatible version; convert the export again")
+
+        self.documents: int = manifest["documents"]
+        self.json_line_parse_errors: int = manifest["json_line_parse_errors"]
+        self.missing_created_at: int = manifest["missing_created_at"]
+        self.date_parse_errors: int = manifest["date_parse_errors"]
+        self.undated: int = manifest["undated"]
+        self.distinct_workspace_ids: int = manifest["distinct_workspace_ids"]
+        self.partitions = [
+            Partition(
+                p["month"],
+                p["path"],
+                p["rows"],
+                p["active"],
+                p["from_oid"],
+                datetime.fromisoformat(p["min_created"]),
+                datetime.fromisoformat(p["max_created"]),
+            )
+            for p in manifest["partitions"]
+        ]
+        self.partitions_read = 0
+
+    @property
+    def rows(self) -> int:
+        return sum(p.rows for p in self.partitions)
+
+    @property
+    def from_oid(self) -> int:
+        return sum(p.from_oid for p in self.partitions)
+
+    def overlapping(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[Partition]:
+        return [p for p in self.partitions if p.overlaps(start, end)]
+
+    def _read(self, partitions: List[Partition], start: Optional[datetime], end: Optional[datetime], columns: Optional[List[str]]):
+        pa = require_pyarrow()
+        import pyarrow.compute as pc
+
+        needed = list(columns) if columns is not None else list(_COLUMNS)
+        read_columns = list(dict.fromkeys(needed + ["seq", "created_at"]))
+        tables = []
+        for partition in partitions:
+            table = read_table(os.path.join(self.directory, partition.path), columns=read_columns)
+            self.partitions_read += 1
+            if not partition.within(start, end):
+                created = table.column("created_at")
+                mask = None
+                if start is not None:
+                    mask = pc.greater_equal(created, pa.scalar(start, type=created.type))
+                if end is not None:
+                    upper = pc.less_equal(created, pa.scalar(end, type=created.type))
+                    mask = upper if mask is None else pc.and_(mask, upper)
+                table = table.filter(mask)
+            tables.append(table)
+        if not tables:
+            return _schema().empty_table().select(needed)
+        # Back in export order, so first-seen tie breaks (Counter.most_common) match a scan of the export
+        return pa.concat_tables(tables).sort_by("seq").select(needed)
+
+    def read(self, start: Optional[datetime] = None, end: Optional[datetime] = None, columns: Optional[List[str]] = None):
+        """Rows created in [start, end] (either open), in export order, as a pyarrow Table."""
+        return self._read(self.overlapping(start, end), start, end, columns)
+
+    def count(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        active_only: bool = False,
+        created_at_only: bool = False,
+    ) -> int:
+        """
+        Rows created in [start, end]: partitions wholly inside come from the
+        manifest, only the ones straddling a bound are read.
+        `created_at_only` leaves out rows dated from the ObjectId.
+        """
+        total = 0
+        straddling = []
+        for partition in self.overlapping(start, end):
+            if not partition.within(start, end) or (active_only and created_at_only):
+                straddling.append(partition)
+            elif active_only:
+                total += partition.active
+            elif created_at_only:
+                total += partition.rows - partition.from_oid
+            else:
+                total += partition.rows
+        if straddling:
+            table = self._read(straddling, start, end, ["archived", "from_oid"])
+            archived = table.column("archived").to_pylist()
+            from_oid = table.column("from_oid").to_pylist()
+            total += sum(
+                1 for a, o in zip(archived, from_oid)
+                if not (active_only and a) and not (created_at_only and o)
+            )
+        return total
+
+
+# ---------- CLI ---------- #
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    convert = commands.add_parser("convert", help="write a store from an export")
+    convert.add_argument("export")
+    convert.add_argument("store")
+    convert.add_argument("--format", choices=FORMATS, default="parquet")
+    convert.add_argument("--compression", default=DEFAULT_COMPRESSION, help="partition codec (default: %(default)s)")
+    convert.add_argument("--buffer-rows", type=int, default=DEFAULT_BUFFER_ROWS, help="rows held before writing row groups")
+    convert.add_argument("--sort-records", type=int, default=DEFAULT_MAX_IN_MEMORY, help="ids sorted in memory for the distinct count")
+
+    stats = commands.add_parser("stats", help="print a store's partition statistics")
+    stats.add_argument("store")
+
+    args = parser.parse_args(argv)
+    if args.command == "convert":
+        if args.compression not in COMPRESSIONS[args.format]:
+            parser.error(f"{args.format} supports --compression {', '.join(COMPRESSIONS[args.format])}")
+        try:
+            manifest = convert_export(args.export, args.store, args.format, args.compression, args.buffer_rows, args.sort_records)
+        except FileNotFoundError as e:
+            parser.error(f"export not found: {e}")
+        except ImportError as e:
+            parser.error(str(e))
+        print(f"{args.store}: {len(manifest['partitions'])} monthly partitions, "
+              f"{sum(p['rows'] for p in manifest['partitions'])} of {manifest['documents']} documents dated")
+        return 0
+
+    try:
+        store = PartitionStore(args.store)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"{'month':<8} {'rows':>10} {'active':>10} {'from_oid':>9}  min_created / max_created")
+    for p in store.partitions:
+        print(f"{p.month:<8} {p.rows:>10} {p.active:>10} {p.from_oid:>9}  {p.min_created.isoformat()} / {p.max_created.isoformat()}")
+    print(f"{store.documents} documents, {store.undated} undated, {store.distinct_workspace_ids} distinct workspaceIds")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
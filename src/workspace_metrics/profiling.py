@@ -0,0 +1,260 @@
+"""
+Opt-in per-stage profiling for the analyzers (`--profile`).
+
+Each analyzer runs in the same five stages: read (file I/O), decode (JSON),
+normalise (dates/ids out of each doc), aggregate (the counting loop) and
+render (printing / writing output). With profiling on, every stage records
+wall time, CPU time, records/sec and the tracemalloc peak while it ran, and
+the run is emitted as JSON so hot spots can be tracked across exports.
+
+    python metric.py workspaces.json --profile              # JSON profile to stderr
+    python metric.py workspaces.json --profile metric.prof.json
+
+A streamed analyzer runs its stages interleaved, a document at a time;
+profiler.streamed() charges the time to whichever stage is innermost at
+the moment, so such a run still reports every stage on its own.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from typing import IO, ContextManager, Dict, Iterable, Iterator, List, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+
+STAGES = ("read", "decode", "normalise", "aggregate", "render")
+
+
+class StageStats:
+    __slots__ = ("name", "wall_seconds", "cpu_seconds", "records", "peak_bytes")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        # Set by the caller: documents/records the stage handled
+        self.records: Optional[int] = None
+        self.peak_bytes: Optional[int] = None
+
+    def to_dict(self) -> Dict:
+        result = {
+            "name": self.name,
+            "wallSeconds": round(self.wall_seconds, 6),
+            "cpuSeconds": round(self.cpu_seconds, 6),
+            "records": self.records,
+            "recordsPerSecond": round(self.records / self.wall_seconds) if self.records and self.wall_seconds else None,
+        }
+        if self.peak_bytes is not None:
+            result["peakAllocMiB"] = round(self.peak_bytes / 2 ** 20, 3)
+        return result
+
+
+class StreamedStages:
+    """
+    Stage times for a pipeline of generators, each pulling from the next.
+    Wall and CPU time go to the innermost stage running, so a stage's time
+    excludes the stages it pulls from. The tracemalloc peak covers the
+    whole pipeline and is reported on every one of its stages.
+    """
+
+    def __init__(self, names: Sequence[str]):
+        self.stats = {name: StageStats(name) for name in names}
+        self._running: List[StageStats] = []
+        self._mark = (time.perf_counter(), time.process_time())
+
+    def _switch(self) -> None:
+        wall, cpu = time.perf_counter(), time.process_time()
+        if self._running:
+            stats = self._running[-1]
+            stats.wall_seconds += wall - self._mark[0]
+            stats.cpu_seconds += cpu - self._mark[1]
+        self._mark = (wall, cpu)
+
+    # enter()/leave() rather than a context manager per record: cheaper under tracemalloc
+    def enter(self, stats: StageStats) -> None:
+        self._switch()
+        self._running.append(stats)
+
+    def leave(self) -> None:
+        self._switch()
+        self._running.pop()
+
+    @contextmanager
+    def charge(self, name: str) -> Iterator[StageStats]:
+        """Time spent in this block (outside stages nested in it) goes to `name`."""
+        self.enter(self.stats[name])
+        try:
+            yield self.stats[name]
+        finally:
+            self.leave()
+
+    def wrap(self, name: str, items: Iterable[T]) -> Iterator[T]:
+        """`items`, with the time taken to produce each one charged to `name`, which counts them as records."""
+        iterator = iter(items)
+        stats = self.stats[name]
+        stats.records = 0
+        while True:
+            self.enter(stats)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.leave()
+            stats.records += 1
+            yield item
+
+    def file(self, name: str):
+        """A wrap_file for loader.iter_export() charging reads from the export to `name`."""
+        return lambda f: _ChargedFile(f, self, name)
+
+
+class _ChargedFile:
+    """The read side of a text stream, with every read charged to one stage."""
+
+    def __init__(self, f: IO[str], stages: StreamedStages, name: str):
+        self._f = f
+        self._stages = stages
+        self._stats = stages.stats[name]
+
+    def read(self, size: int = -1) -> str:
+        self._stages.enter(self._stats)
+        try:
+            return self._f.read(size)
+        finally:
+            self._stages.leave()
+
+    def readline(self) -> str:
+        self._stages.enter(self._stats)
+        try:
+            return self._f.readline()
+        finally:
+            self._stages.leave()
+
+    def __iter__(self) -> "_ChargedFile":
+        return self
+
+    def __next__(self) -> str:
+        self._stages.enter(self._stats)
+        try:
+            return next(self._f)
+        finally:
+            self._stages.leave()
+
+
+class StageProfiler:
+    def __init__(self, script: str, input_path: Optional[str] = None, trace_memory: bool = True):
+        self.script = script
+        self.input_path = input_path
+        self.trace_memory = trace_memory
+        self.stages: List[StageStats] = []
+        self._started_at = datetime.now(timezone.utc)
+        self._started = time.perf_counter()
+        self._owns_tracing = trace_memory and not tracemalloc.is_tracing()
+        if self._owns_tracing:
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageStats]:
+        stats = StageStats(name)
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield stats
+        finally:
+            stats.wall_seconds = time.perf_counter() - wall
+            stats.cpu_seconds = time.process_time() - cpu
+            if self.trace_memory:
+                stats.peak_bytes = tracemalloc.get_traced_memory()[1]
+            self.stages.append(stats)
+
+    @contextmanager
+    def streamed(self, names: Sequence[str]) -> Iterator[StreamedStages]:
+        """Time interleaved stages; they are recorded in the order of `names`."""
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        stages = StreamedStages(names)
+        try:
+            yield stages
+        finally:
+            peak = tracemalloc.get_traced_memory()[1] if self.trace_memory else None
+            for name in names:
+                stages.stats[name].peak_bytes = peak
+                self.stages.append(stages.stats[name])
+
+    def report(self) -> Dict:
+        input_bytes = None
+        if self.input_path and os.path.isfile(self.input_path):
+            input_bytes = os.path.getsize(self.input_path)
+        return {
+            "script": self.script,
+            "input": self.input_path,
+            "inputBytes": input_bytes,
+            "startedAt": self._started_at.isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "totalWallSeconds": round(time.perf_counter() - self._started, 6),
+            "stages": [stats.to_dict() for stats in self.stages],
+        }
+
+    def emit(self, destination: str) -> None:
+        """Write the JSON profile to a file, or to stderr for "-"."""
+        if self._owns_tracing:
+            tracemalloc.stop()
+            self._owns_tracing = False
+        text = json.dumps(self.report(), indent=2)
+        if destination == "-":
+            print(text, file=sys.stderr)
+        else:
+            with open(destination, "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+
+
+class _NullStreamedStages:
+    def charge(self, name: str) -> ContextManager[StageStats]:
+        return nullcontext(StageStats(name))
+
+    def wrap(self, name: str, items: Iterable[T]) -> Iterable[T]:
+        return items
+
+    def file(self, name: str) -> None:
+        return None
+
+
+class _NullProfiler:
+    """Stand-in when profiling is off: stages cost one context manager each."""
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageStats]:
+        yield StageStats(name)
+
+    @contextmanager
+    def streamed(self, names: Sequence[str]) -> Iterator[_NullStreamedStages]:
+        # Nothing is wrapped, so the pipeline runs at full speed
+        yield _NullStreamedStages()
+
+
+NULL_PROFILER = _NullProfiler()
+
+
+def add_profile_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="-",
+        metavar="FILE",
+        help="record per-stage time/memory and write a JSON profile to FILE (default: stderr)",
+    )
+    parser.add_argument("--profile-no-memory", action="store_true", help="profile without tracemalloc")
+
+
+def profiler_from_args(args: argparse.Namespace, script: str, input_path: str):
+    if not args.profile:
+        return NULL_PROFILER
+    return StageProfiler(script, input_path, trace_memory=not args.profile_no_memory)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+"""
+Print an analyzer's result for an export as JSON, straight from the result
+cache when the export has been analyzed before with the same configuration.
+
+    python -m workspace_metrics.query countmetric workspaces.json
+    python -m workspace_metrics.query countmetric workspaces.json --field active_as_at_june_2025
+    python -m workspace_metrics.query ticket3.metrics ws.json --field "periods.H1 2025.net_change"
+
+--field takes a dotted path into the result; derived properties such as
+net_change work too.
+"""
+
+import argparse
+import json
+import sys
+from typing import Any, List, Optional
+
+from workspace_metrics.analyzers import ANALYZERS, cached_result
+from workspace_metrics.memo import add_cache_argument, configure_from_args
+from workspace_metrics.results import NoDataError, to_jsonable
+
+
+def resolve_field(result: Any, path: str) -> Any:
+    value = result
+    for part in path.split("."):
+        if isinstance(value, dict):
+            if part not in value:
+                raise KeyError(path)
+            value = value[part]
+        elif hasattr(value, part):
+            value = getattr(value, part)
+        else:
+            raise KeyError(path)
+    return value
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("analyzer", choices=list(ANALYZERS))
+    parser.add_argument("file_path")
+    parser.add_argument("--field", help="dotted path of the value to print")
+    add_cache_argument(parser)
+    args = parser.parse_args(argv)
+    configure_from_args(args)
+
+    try:
+        result = cached_result(args.analyzer, args.file_path)
+    except FileNotFoundError:
+        print(f"Error: File not found at {args.file_path}", file=sys.stderr)
+        return 1
+    except NoDataError:
+        print("No data objects found or successfully parsed from the file.", file=sys.stderr)
+        return 1
+
+    if args.field:
+        try:
+            result = resolve_field(result, args.field)
+        except KeyError:
+            print(f"No field {args.field!r} in the {args.analyzer} result", file=sys.stderr)
+            return 1
+    print(json.dumps(to_jsonable(result), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
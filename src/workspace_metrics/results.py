@@ -0,0 +1,265 @@
+"""
+Typed results of the workspace metric analyzers.
+
+Each analyzer is split into a compute_*() function that scans the export and
+returns one of these, and a render_*() function that prints it. A number such
+as ActiveAsAtResult.active_as_at_june_2025 can then be reused by another
+report, the query CLI or a dashboard without rescanning the export, and
+workspace_metrics.memo can cache results on disk. They live here rather than
+in the scripts so they pickle and unpickle the same way however a script was
+loaded (as __main__, by path from bench, in a batch worker).
+
+Bump RESULTS_VERSION whenever a result's fields or a compute function's
+semantics change; it is part of every cache key.
+"""
+
+from collections import Counter
+from dataclasses import dataclass, field, fields, is_dataclass
+from datetime import date
+from typing import Any, Dict, List, Tuple
+
+RESULTS_VERSION = 3
+
+
+class NoDataError(ValueError):
+    """The export held no documents and no unparseable lines."""
+
+
+@dataclass
+class ExportSummary:
+    """What loading the export skipped, shared by every report's processing summary."""
+
+    processed_entries: int = 0
+    json_line_parse_errors: int = 0
+    missing_created_at: int = 0
+    date_parse_errors: int = 0
+
+
+@dataclass
+class WorkspaceMetricsResult:
+    """metric.py: P1 vs P2 creations, archivals and eonids, plus overall distributions."""
+
+    summary: ExportSummary
+    total_unique_workspaces: int = 0
+    created_p1: int = 0
+    created_p2: int = 0
+    archived_created_p1: int = 0
+    archived_created_p2: int = 0
+    eonids_p1: Counter = field(default_factory=Counter)
+    eonids_p2: Counter = field(default_factory=Counter)
+    instance_counts: Counter = field(default_factory=Counter)
+    read_role_counts: Counter = field(default_factory=Counter)
+    write_role_counts: Counter = field(default_factory=Counter)
+
+
+@dataclass
+class MonthCreationsResult:
+    """somemetric.py: workspaces created in December 2024 and in June 2025."""
+
+    summary: ExportSummary
+    dec_2024_creations: int = 0
+    june_2025_creations: int = 0
+
+
+@dataclass
+class ActiveAsAtResult:
+    """countmetric.py: non-archived workspaces created on or before each cutoff."""
+
+    summary: ExportSummary
+    active_as_at_dec_2024: int = 0
+    active_as_at_june_2025: int = 0
+
+
+@dataclass
+class InterimGrowthResult:
+    """percentagemetric.py: active growth Dec 2024 -> June 2025 and interim retention."""
+
+    summary: ExportSummary
+    active_as_at_dec_2024: int = 0
+    active_as_at_june_2025: int = 0
+    created_in_interim: int = 0
+    archived_from_interim: int = 0
+
+    @property
+    def net_new_active(self) -> int:
+        return self.active_as_at_june_2025 - self.active_as_at_dec_2024
+
+    @property
+    def active_from_interim(self) -> int:
+        return self.created_in_interim - self.archived_from_interim
+
+
+@dataclass
+class GrowthMetricsResult:
+    """detailedmetric.py: active growth and attrition for the year up to the snapshot date."""
+
+    summary: ExportSummary
+    active_end_prev_year: int = 0
+    active_current_snapshot: int = 0
+    created_this_year: int = 0
+    created_this_year_active: int = 0
+    created_this_year_archived: int = 0
+    lost_previously_active: int = 0
+    unhashable_id_skips: int = 0
+
+    @property
+    def net_growth(self) -> int:
+        return self.active_current_snapshot - self.active_end_prev_year
+
+
+@dataclass
+class MonthlyCreationsResult:
+    """othermetric.py: workspaces created per (year, month) inside the configured range."""
+
+    summary: ExportSummary
+    monthly_counts: Dict[Tuple[int, int], int] = field(default_factory=dict)
+
+
+@dataclass
+class PeriodMetrics:
+    """One configured period of ticket3/metrics.py."""
+
+    newly_created: int = 0
+    active_in_period: int = 0
+    archived_in_period: int = 0
+    eonid_counts: Counter = field(default_factory=Counter)
+    cumulative_active_at_start: int = 0
+    cumulative_active_at_end: int = 0
+
+    @property
+    def net_change(self) -> int:
+        return self.cumulative_active_at_end - self.cumulative_active_at_start
+
+
+@dataclass
+class PeriodReportResult:
+    """ticket3/metrics.py: every configured period, in configuration order."""
+
+    periods: Dict[str, PeriodMetrics]
+    total_unique_workspaces: int = 0
+    processed_entries: int = 0
+    oid_fallback_count: int = 0
+
+
+@dataclass
+class DailyMetricsResult:
+    """ticket3/dailymetrics.py: (ISO date, count) rows for both CSVs, plus per-dimension day counts."""
+
+    created_rows: List[Tuple[str, int]]
+    active_rows: List[Tuple[str, int]]
+    records: int = 0
+    # (dimension, value) -> (created per day, active created per day)
+    dimension_counts: Dict[Tuple[str, str], Tuple[Dict[date, int], Dict[date, int]]] = field(default_factory=dict)
+
+
+@dataclass
+class SnapshotDiff:
+    """snapshot_diff: lifecycle event counts between two consecutive snapshots."""
+
+    before_path: str
+    before_date: str
+    after_path: str
+    after_date: str
+    before_workspaces: int = 0
+    after_workspaces: int = 0
+    created: int = 0
+    archived: int = 0
+    unarchived: int = 0
+    deleted: int = 0
+    # Docs in the later snapshot repeating a workspaceId already seen / with no usable workspaceId
+    duplicate_ids: int = 0
+    unidentified: int = 0
+
+
+@dataclass(frozen=True)
+class Estimate:
+    """A value estimated from a sample, with the half-width of its confidence interval."""
+
+    value: float
+    margin: float
+
+    def __str__(self) -> str:
+        return f"{self.value:,.0f} \u00b1 {self.margin:,.0f}"
+
+    def as_percent(self) -> str:
+        return f"{self.value:.1%} \u00b1 {self.margin:.1%}"
+
+
+@dataclass
+class SampleSummary:
+    """How a sampled report's documents were drawn (workspace_metrics.sampling)."""
+
+    population_lines: int
+    sampled_lines: int
+    invalid_lines: int
+    strata: int
+    confidence: float
+    seed: int
+
+
+@dataclass
+class SampledWorkspaceMetricsResult:
+    """metric.py --sample: P1 vs P2 creations, archivals and top eonids, estimated."""
+
+    sample: SampleSummary
+    created_p1: Estimate
+    created_p2: Estimate
+    archived_created_p1: Estimate
+    archived_created_p2: Estimate
+    archived_share_p1: Estimate
+    archived_share_p2: Estimate
+    top_eonids_p1: List[Tuple[str, Estimate]] = field(default_factory=list)
+    top_eonids_p2: List[Tuple[str, Estimate]] = field(default_factory=list)
+
+
+@dataclass
+class SampledPeriodMetrics:
+    """One configured period of ticket3/metrics.py --sample."""
+
+    newly_created: Estimate
+    active_in_period: Estimate
+    archived_in_period: Estimate
+    archived_share: Estimate
+    cumulative_active_at_end: Estimate
+    net_change: Estimate
+    top_eonids: List[Tuple[str, Estimate]] = field(default_factory=list)
+
+
+@dataclass
+class SampledPeriodReportResult:
+    """ticket3/metrics.py --sample: every configured period, in configuration order."""
+
+    sample: SampleSummary
+    periods: Dict[str, SampledPeriodMetrics]
+
+
+def render_processing_summary(summary: ExportSummary) -> None:
+    """The "Data Processing Summary" block every creation-date report ends with."""
+    print("\n--- Data Processing Summary ---")
+    print(f"- Total raw entries processed from file: {summary.processed_entries}")
+    if summary.json_line_parse_errors > 0:
+        print(f"- Lines skipped due to invalid JSON structure: {summary.json_line_parse_errors}")
+    if summary.missing_created_at > 0:
+        print(f"- Entries skipped due to missing 'createdAt.$date': {summary.missing_created_at}")
+    if summary.date_parse_errors > 0:
+        print(f"- Entries skipped due to 'createdAt.$date' parsing errors: {summary.date_parse_errors}")
+
+
+def to_jsonable(value: Any) -> Any:
+    """
+    A result as plain JSON types: dataclasses become objects, tuple keys such
+    as (year, month) become "2024-12".
+    """
+    if is_dataclass(value):
+        return {f.name: to_jsonable(getattr(value, f.name)) for f in fields(value)}
+    if isinstance(value, dict):
+        return {_json_key(k): to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(v) for v in value]
+    return value
+
+
+def _json_key(key: Any) -> str:
+    if isinstance(key, tuple):
+        return "-".join(f"{part:02d}" if isinstance(part, int) else str(part) for part in key)
+    return str(key)
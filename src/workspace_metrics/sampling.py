@@ -0,0 +1,319 @@
+"""
+Approximate reports from a random sample of a JSON Lines export.
+
+A full scan of a 50M-document export takes minutes; most exploratory
+questions ("roughly how many workspaces were created in H1, what share is
+archived, which eonids dominate") are answered to within a percent by a few
+tens of thousands of documents read at random.
+
+The first time an export is sampled, a line-offset index is built: one
+uint64 start offset per line, stored in <cache dir>/line_index/ (see
+workspace_metrics.memo) and reused while the export's size and mtime are
+unchanged. Sampled lines are then read by seeking straight to them.
+
+Lines are drawn without replacement, either uniformly or stratified: the
+export is cut into --strata contiguous ranges of lines, each sampled in
+proportion to its size. Exports are usually written in _id (so creation)
+order, so positional strata also stratify by time and tighten the intervals
+of period counts. Counts are estimated as N_h * share within each stratum,
+with a normal confidence interval including the finite population
+correction; shares (archived / created) use the linearised ratio variance.
+
+The sample size follows from --error, the largest acceptable interval
+half-width on any count as a fraction of the export's lines (worst case
+p = 0.5), unless --sample-size is given.
+
+Only uncompressed exports with one document per line can be sampled (JSON
+Lines, or a JSON array written one element per line).
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import mmap
+import os
+import random
+import re
+import struct
+import tempfile
+from collections import Counter
+from dataclasses import dataclass, field
+from statistics import NormalDist
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from workspace_metrics import memo
+from workspace_metrics.loader import export_compression
+from workspace_metrics.results import Estimate, SampleSummary
+
+DEFAULT_ERROR = 0.005
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_STRATA = 1
+
+_INDEX_HEADER = struct.Struct("<8sQQQ")  # magic, export size, export mtime_ns, lines
+_INDEX_MAGIC = b"WSLIDX01"
+_OFFSET = struct.Struct("<Q")
+_INDEX_CHUNK_BYTES = 16 << 20
+_NEWLINE = re.compile(b"\n")
+# Characters around a document on its line in a one-element-per-line JSON array
+_LINE_PADDING = " \t\r\n,[]"
+
+
+def _index_file(path: str) -> str:
+    name = hashlib.blake2b(os.path.realpath(path).encode("utf-8"), digest_size=16).hexdigest()
+    return os.path.join(memo.result_cache.directory, "line_index", name + ".idx")
+
+
+def _write_index(path: str, size: int, mtime_ns: int, out) -> int:
+    out.write(_INDEX_HEADER.pack(_INDEX_MAGIC, size, mtime_ns, 0))
+    lines = 0
+    position = 0
+    at_line_start = True
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(_INDEX_CHUNK_BYTES)
+            if not chunk:
+                break
+            starts = [position + m.end() for m in _NEWLINE.finditer(chunk)]
+            if at_line_start:
+                starts.insert(0, position)
+            position += len(chunk)
+            at_line_start = bool(starts) and starts[-1] == position
+            if at_line_start:
+                starts.pop()  # Belongs to the next chunk, or is the end of the file
+            out.write(struct.pack(f"<{len(starts)}Q", *starts))
+            lines += len(starts)
+    out.seek(0)
+    out.write(_INDEX_HEADER.pack(_INDEX_MAGIC, size, mtime_ns, lines))
+    out.flush()
+    return lines
+
+
+class LineIndex:
+    """Start offset of every line of an export, persisted beside the result cache."""
+
+    def __init__(self, path: str):
+        self.path = path
+        st = os.stat(path)
+        self._file = self._open(path, st.st_size, st.st_mtime_ns)
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.lines = _INDEX_HEADER.unpack_from(self._map)[3]
+
+    @staticmethod
+    def _open(path: str, size: int, mtime_ns: int):
+        index_path = _index_file(path)
+        try:
+            f = open(index_path, "rb")
+        except FileNotFoundError:
+            pass
+        else:
+            header = f.read(_INDEX_HEADER.size)
+            if len(header) == _INDEX_HEADER.size and _INDEX_HEADER.unpack(header)[:3] == (_INDEX_MAGIC, size, mtime_ns):
+                return f
+            f.close()
+
+        if memo.result_cache.enabled:
+            try:
+                os.makedirs(os.path.dirname(index_path), exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(index_path), suffix=".tmp")
+            except OSError:
+                pass  # Read-only cache directory: index in a temporary file instead
+            else:
+                try:
+                    with os.fdopen(fd, "w+b") as out:
+                        _write_index(path, size, mtime_ns, out)
+                    os.replace(tmp_path, index_path)
+                except BaseException:
+                    os.unlink(tmp_path)
+                    raise
+                return open(index_path, "rb")
+
+        out = tempfile.TemporaryFile()
+        _write_index(path, size, mtime_ns, out)
+        return out
+
+    def offset(self, line: int) -> int:
+        return _OFFSET.unpack_from(self._map, _INDEX_HEADER.size + _OFFSET.size * line)[0]
+
+    def close(self) -> None:
+        self._map.close()
+        self._file.close()
+
+
+@dataclass
+class Stratum:
+    lines: int  # N_h: lines of the export in this stratum
+    drawn: int  # n_h: lines sampled from it, parseable or not
+    items: List[Any] = field(default_factory=list)
+
+
+@dataclass
+class LineSample:
+    """Documents (or, after map(), records) drawn from an export, by stratum."""
+
+    strata: List[Stratum]
+    confidence: float
+    seed: int
+    invalid_lines: int = 0
+
+    @property
+    def population(self) -> int:
+        return sum(s.lines for s in self.strata)
+
+    @property
+    def drawn(self) -> int:
+        return sum(s.drawn for s in self.strata)
+
+    def summary(self) -> SampleSummary:
+        return SampleSummary(self.population, self.drawn, self.invalid_lines, len(self.strata), self.confidence, self.seed)
+
+    def map(self, normalise: Callable[[List[Any]], List[Any]]) -> "LineSample":
+        """The same sample with each stratum's items passed through `normalise` (which may drop some)."""
+        strata = [Stratum(s.lines, s.drawn, normalise(s.items)) for s in self.strata]
+        return LineSample(strata, self.confidence, self.seed, self.invalid_lines)
+
+    def _z(self) -> float:
+        return NormalDist().inv_cdf(0.5 + self.confidence / 2)
+
+    def _estimate(self, hits: List[int]) -> Estimate:
+        total = 0.0
+        variance = 0.0
+        for stratum, c in zip(self.strata, hits):
+            if not stratum.drawn:
+                continue
+            p = c / stratum.drawn
+            total += stratum.lines * p
+            s2 = p * (1 - p) * stratum.drawn / max(stratum.drawn - 1, 1)
+            variance += stratum.lines ** 2 * (1 - stratum.drawn / stratum.lines) * s2 / stratum.drawn
+        return Estimate(total, self._z() * math.sqrt(variance))
+
+    def count(self, predicate: Callable[[Any], bool]) -> Estimate:
+        """Estimated number of documents in the export for which `predicate` holds."""
+        return self._estimate([sum(1 for item in s.items if predicate(item)) for s in self.strata])
+
+    def ratio(self, numerator: Callable[[Any], bool], denominator: Callable[[Any], bool]) -> Estimate:
+        """Estimated share count(numerator) / count(denominator); numerator must imply denominator."""
+        ys = [sum(1 for item in s.items if numerator(item)) for s in self.strata]
+        xs = [sum(1 for item in s.items if denominator(item)) for s in self.strata]
+        y_total = sum(s.lines * y / s.drawn for s, y in zip(self.strata, ys) if s.drawn)
+        x_total = sum(s.lines * x / s.drawn for s, x in zip(self.strata, xs) if s.drawn)
+        if not x_total:
+            return Estimate(0.0, 0.0)
+        r = y_total / x_total
+
+        variance = 0.0
+        for stratum, y, x in zip(self.strata, ys, xs):
+            n = stratum.drawn
+            if n < 2:
+                continue
+            # Residuals d = y - r * x over the stratum's sampled lines (zero for the rest)
+            d_sum = y - r * x
+            d_sq_sum = y * (1 - r) ** 2 + (x - y) * r ** 2
+            s2 = (d_sq_sum - d_sum ** 2 / n) / (n - 1)
+            variance += stratum.lines ** 2 * (1 - n / stratum.lines) * s2 / n
+        return Estimate(r, self._z() * math.sqrt(variance) / x_total)
+
+    def top(self, key: Callable[[Any], Optional[str]], n: int) -> List[Tuple[str, Estimate]]:
+        """The `n` most frequent keys (None is skipped) with their estimated counts."""
+        counters = [Counter(k for k in map(key, s.items) if k is not None) for s in self.strata]
+        keys = set().union(*counters)
+        estimates = {k: self._estimate([c[k] for c in counters]) for k in keys}
+        ranked = sorted(estimates.items(), key=lambda kv: (-kv[1].value, kv[0]))
+        return ranked[:n]
+
+
+def sample_size(population: int, error: float, confidence: float = DEFAULT_CONFIDENCE) -> int:
+    """Lines to draw so that no count's interval half-width exceeds error * population."""
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    n0 = z * z * 0.25 / (error * error)
+    return min(population, math.ceil(n0 / (1 + (n0 - 1) / population))) if population else 0
+
+
+def _parse_line(line: bytes) -> Optional[Dict[str, Any]]:
+    text = line.decode("utf-8", errors="replace").strip(_LINE_PADDING)
+    if not text:
+        return None
+    try:
+        doc = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    return doc if isinstance(doc, dict) else None
+
+
+def draw_sample(
+    path: str,
+    size: Optional[int] = None,
+    error: float = DEFAULT_ERROR,
+    confidence: float = DEFAULT_CONFIDENCE,
+    strata: int = DEFAULT_STRATA,
+    seed: Optional[int] = None,
+) -> LineSample:
+    """
+    Draw `size` lines (default: enough for `error`) from `path` and parse
+    them. Raises ValueError for exports that cannot be sampled.
+    """
+    if export_compression(path):
+        raise ValueError(f"{path} is compressed; sampling needs to seek, so decompress it first")
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    rng = random.Random(seed)
+
+    index = LineIndex(path)
+    try:
+        population = index.lines
+        if not population:
+            raise ValueError(f"{path} is empty")
+        if size is None:
+            size = sample_size(population, error, confidence)
+        size = max(1, min(size, population))
+        strata = max(1, min(strata, size))
+
+        bounds = [population * i // strata for i in range(strata + 1)]
+        chosen: List[Tuple[int, int]] = []
+        sample = LineSample([], confidence, seed)
+        for h in range(strata):
+            lo, hi = bounds[h], bounds[h + 1]
+            drawn = round(size * (hi - lo) / population)
+            drawn = min(hi - lo, max(drawn, 2 if hi - lo >= 2 else 1))
+            sample.strata.append(Stratum(hi - lo, drawn))
+            chosen.extend((line, h) for line in rng.sample(range(lo, hi), drawn))
+
+        chosen.sort()
+        with open(path, "rb") as f:
+            for line, h in chosen:
+                f.seek(index.offset(line))
+                doc = _parse_line(f.readline())
+                if doc is None:
+                    sample.invalid_lines += 1
+                else:
+                    sample.strata[h].items.append(doc)
+    finally:
+        index.close()
+
+    if sample.invalid_lines * 2 > sample.drawn:
+        raise ValueError(f"{path} does not look like one JSON document per line; {sample.invalid_lines} of {sample.drawn} sampled lines did not parse")
+    return sample
+
+
+def add_sample_arguments(parser: argparse.ArgumentParser) -> None:
+    group = parser.add_argument_group("sampling (approximate report)")
+    group.add_argument("--sample", action="store_true", help="estimate from a random sample of lines instead of a full scan")
+    group.add_argument("--error", type=float, default=DEFAULT_ERROR, help="largest interval half-width on a count, as a fraction of all lines (default: %(default)s)")
+    group.add_argument("--confidence", type=float, default=DEFAULT_CONFIDENCE, help="confidence level of the intervals (default: %(default)s)")
+    group.add_argument("--sample-size", type=int, help="lines to draw, overriding --error")
+    group.add_argument("--strata", type=int, default=DEFAULT_STRATA, help="contiguous line ranges sampled proportionally (default: %(default)s, uniform)")
+    group.add_argument("--seed", type=int, help="random seed, to repeat a sample")
+
+
+def sample_from_args(path: str, args: argparse.Namespace) -> LineSample:
+    if not 0 < args.error < 1 or not 0 < args.confidence < 1:
+        raise ValueError("--error and --confidence must be between 0 and 1")
+    return draw_sample(path, args.sample_size, args.error, args.confidence, args.strata, args.seed)
+
+
+def render_sample_summary(summary: SampleSummary) -> None:
+    print(f"Sampled {summary.sampled_lines:,} of {summary.population_lines:,} lines "
+          f"({summary.strata} strat{'um' if summary.strata == 1 else 'a'}, seed {summary.seed}); "
+          f"intervals are {summary.confidence:.0%} confidence")
+    if summary.invalid_lines:
+        print(f"Sampled lines that were not a JSON document: {summary.invalid_lines}")
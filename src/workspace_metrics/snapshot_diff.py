@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+
+"""
+Lifecycle events from consecutive exports.
+
+A single export only says whether a workspace is archived *now*. Comparing
+exports taken at different dates recovers what happened in between:
+
+- created     in the later snapshot, not in the earlier one
+- archived    archived=false before, archived=true after (also emitted for a
+              workspace that was created and archived inside the window)
+- unarchived  archived=true before, archived=false after
+- deleted     in the earlier snapshot, gone from the later one
+
+Each event is bounded by the two snapshot days (not_before, not_after]:
+from 00:00 UTC of the earlier snapshot's day to the end of the later one's,
+since a snapshot may have been taken at any time on its day. A creation
+whose createdAt falls inside the window is pinned to it.
+
+Workspaces are matched on a normalised workspaceId packed into a 128-bit
+integer (plain and $numberLong ids as themselves, $oid ids tagged, anything
+else a tagged 64-bit hash). Every snapshot is streamed (loader.iter_export),
+externally sorted by id once (workspace_metrics.extsort) and the sorted runs
+are sort-merge joined, so memory is bounded by --sort-records rather than
+by the number of workspaces.
+
+    python -m workspace_metrics.snapshot_diff jan.json feb.json mar.json --events events.csv
+    python -m workspace_metrics.snapshot_diff --manifest snapshots.json --json diff.json
+
+Snapshot order and dates follow workspace_metrics.batch (manifest date,
+date in the file name, else mtime).
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import struct
+import sys
+import tempfile
+from dataclasses import asdict
+from datetime import datetime, timezone
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from workspace_metrics.batch import collect_snapshots
+from workspace_metrics.extsort import DEFAULT_MAX_IN_MEMORY, external_sort
+from workspace_metrics.loader import get_timestamp_from_oid, iter_export, parse_iso_datetime
+from workspace_metrics.results import SnapshotDiff
+
+# id high 64 bits, id low 64 bits, archived, created (epoch seconds, or NO_CREATED)
+RECORD_FORMAT = "<QQBq"
+NO_CREATED = -(2 ** 63)
+DAY_SECONDS = 24 * 60 * 60
+
+_MASK64 = (1 << 64) - 1
+_OID_TAG = 1 << 127
+_HASH_TAG = 1 << 126
+_RECORD = struct.Struct(RECORD_FORMAT)
+_READ_RECORDS = 8192
+
+EVENT_COLUMNS = ["event", "workspace_id", "not_before", "not_after", "created_at"]
+
+
+def workspace_key(value: Any) -> Optional[int]:
+    """
+    A workspaceId as a compact integer, or None if it is missing. Equal ids
+    give equal keys across exports; the kinds never collide with each other.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, dict):
+        if "$oid" in value:
+            oid = str(value["$oid"])
+            if len(oid) == 24:
+                try:
+                    return _OID_TAG | int(oid, 16)
+                except ValueError:
+                    pass
+            return _hashed_key(oid)
+        if "$numberLong" in value:
+            value = value["$numberLong"]
+        else:
+            return _hashed_key(json.dumps(value, sort_keys=True))
+    if isinstance(value, int) and 0 <= value <= _MASK64:
+        return value
+    text = str(value)
+    if text.isascii() and text.isdigit() and int(text) <= _MASK64:
+        return int(text)
+    return _hashed_key(text)
+
+
+def _hashed_key(text: str) -> int:
+    return _HASH_TAG | int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def format_key(key: int) -> str:
+    if key & _OID_TAG:
+        return f"{key & ~_OID_TAG:024x}"
+    if key & _HASH_TAG:
+        return f"#{key & _MASK64:016x}"
+    return str(key)
+
+
+def effective_created_epoch(doc: Dict[str, Any]) -> int:
+    """createdAt.$date, else the _id.$oid timestamp, as epoch seconds; NO_CREATED if neither."""
+    created = doc.get("createdAt")
+    if isinstance(created, dict):
+        created = created.get("$date")
+    created_at = parse_iso_datetime(created) if isinstance(created, str) else None
+    if created_at is None:
+        _id = doc.get("_id")
+        created_at = get_timestamp_from_oid(_id.get("$oid") if isinstance(_id, dict) else _id)
+    if created_at is None:
+        return NO_CREATED
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return int(created_at.timestamp())
+
+
+def _snapshot_records(path: str, diff: Optional[SnapshotDiff]) -> Iterator[Tuple[int, int, int, int]]:
+    for doc in iter_export(path):
+        key = workspace_key(doc.get("workspaceId"))
+        if key is None:
+            if diff is not None:
+                diff.unidentified += 1
+            continue
+        yield key >> 64, key & _MASK64, 1 if doc.get("archived") is True else 0, effective_created_epoch(doc)
+
+
+def sort_snapshot(
+    path: str,
+    diff: Optional[SnapshotDiff] = None,
+    max_in_memory: int = DEFAULT_MAX_IN_MEMORY,
+    tmp_dir: Optional[str] = None,
+) -> Tuple[IO[bytes], int]:
+    """
+    One snapshot as a temporary file of packed records sorted by id, one per
+    workspace (of a repeated id, the non-archived then earliest-created copy
+    wins). Returns (file, workspaces).
+    """
+    out = tempfile.TemporaryFile(dir=tmp_dir)
+    count = 0
+    previous = None
+    batch = []
+    for record in external_sort(_snapshot_records(path, diff), RECORD_FORMAT, max_in_memory, tmp_dir):
+        key = record[:2]
+        if key == previous:
+            if diff is not None:
+                diff.duplicate_ids += 1
+            continue
+        previous = key
+        batch.append(_RECORD.pack(*record))
+        count += 1
+        if len(batch) >= _READ_RECORDS:
+            out.write(b"".join(batch))
+            batch.clear()
+    out.write(b"".join(batch))
+    out.seek(0)
+    return out, count
+
+
+def _read_sorted(run: IO[bytes]) -> Iterator[Tuple[int, bool, int]]:
+    run.seek(0)
+    block = _RECORD.size * _READ_RECORDS
+    while True:
+        data = run.read(block)
+        if not data:
+            return
+        for hi, lo, archived, created in _RECORD.iter_unpack(data):
+            yield (hi << 64) | lo, bool(archived), created
+
+
+def diff_sorted(
+    before: Iterator[Tuple[int, bool, int]],
+    after: Iterator[Tuple[int, bool, int]],
+    diff: SnapshotDiff,
+) -> Iterator[Tuple[str, int, int]]:
+    """Sort-merge join of two id-sorted snapshots; yields (event, key, created epoch) and counts into `diff`."""
+    b = next(before, None)
+    a = next(after, None)
+    while b is not None or a is not None:
+        if a is None or (b is not None and b[0] < a[0]):
+            diff.deleted += 1
+            yield "deleted", b[0], b[2]
+            b = next(before, None)
+        elif b is None or a[0] < b[0]:
+            diff.created += 1
+            yield "created", a[0], a[2]
+            if a[1]:
+                diff.archived += 1
+                yield "archived", a[0], a[2]
+            a = next(after, None)
+        else:
+            if a[1] and not b[1]:
+                diff.archived += 1
+                yield "archived", a[0], a[2]
+            elif b[1] and not a[1]:
+                diff.unarchived += 1
+                yield "unarchived", a[0], a[2]
+            b = next(before, None)
+            a = next(after, None)
+
+
+def _day_start_epoch(day: str) -> int:
+    return int(datetime.fromisoformat(day).replace(tzinfo=timezone.utc).timestamp())
+
+
+def _day_end_epoch(day: str) -> int:
+    """00:00 UTC of the following day: everything a snapshot dated `day` can have seen."""
+    return _day_start_epoch(day) + DAY_SECONDS
+
+
+def _iso(epoch: int) -> str:
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def diff_snapshots(
+    snapshots: List[Tuple[str, str]],
+    on_event: Optional[Callable[[List[str]], None]] = None,
+    max_in_memory: int = DEFAULT_MAX_IN_MEMORY,
+    tmp_dir: Optional[str] = None,
+) -> List[SnapshotDiff]:
+    """
+    Diff each consecutive pair of (path, date) snapshots. Every snapshot is
+    read and sorted once; events go to `on_event` as CSV rows (EVENT_COLUMNS).
+    """
+    diffs: List[SnapshotDiff] = []
+    before_path, before_date = snapshots[0]
+    before_run, before_count = sort_snapshot(before_path, None, max_in_memory, tmp_dir)
+    try:
+        for after_path, after_date in snapshots[1:]:
+            diff = SnapshotDiff(before_path, before_date, after_path, after_date, before_workspaces=before_count)
+            after_run, diff.after_workspaces = sort_snapshot(after_path, diff, max_in_memory, tmp_dir)
+
+            window_start = _day_start_epoch(before_date)
+            window_end = _day_end_epoch(after_date)
+            not_before, not_after = _iso(window_start), _iso(window_end)
+            for event, key, created in diff_sorted(_read_sorted(before_run), _read_sorted(after_run), diff):
+                if on_event is None:
+                    continue
+                created_at = _iso(created) if created != NO_CREATED else ""
+                event_not_before, event_not_after = not_before, not_after
+                if created != NO_CREATED and window_start < created <= window_end and event != "deleted":
+                    # Created inside the window: creation is pinned, a later archive cannot precede it
+                    event_not_before = created_at
+                    if event == "created":
+                        event_not_after = created_at
+                on_event([event, format_key(key), event_not_before, event_not_after, created_at])
+
+            diffs.append(diff)
+            before_run.close()
+            before_run, before_count = after_run, diff.after_workspaces
+            before_path, before_date = after_path, after_date
+    finally:
+        before_run.close()
+    return diffs
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("snapshots", nargs="*", help="export paths or glob patterns")
+    parser.add_argument("--manifest", help="JSON or text list of snapshot paths (see workspace_metrics.batch)")
+    parser.add_argument("--events", help="write every event to this CSV")
+    parser.add_argument("--json", help="write the per-pair counts to this file")
+    parser.add_argument("--sort-records", type=int, default=DEFAULT_MAX_IN_MEMORY, help="records sorted in memory before spilling")
+    parser.add_argument("--tmp-dir", help="where sorted runs are spilled (default: system temp)")
+    args = parser.parse_args(argv)
+
+    try:
+        snapshots = collect_snapshots(args.snapshots, args.manifest)
+    except FileNotFoundError as e:
+        parser.error(f"snapshot not found: {e}")
+    if len(snapshots) < 2:
+        parser.error("need at least two snapshots to diff")
+
+    events_file = open(args.events, "w", newline="", encoding="utf-8") if args.events else None
+    try:
+        on_event = None
+        if events_file:
+            writer = csv.writer(events_file)
+            writer.writerow(EVENT_COLUMNS)
+            on_event = writer.writerow
+        diffs = diff_snapshots(snapshots, on_event, args.sort_records, args.tmp_dir)
+    finally:
+        if events_file:
+            events_file.close()
+
+    for diff in diffs:
+        print(f"{diff.before_date} -> {diff.after_date}: {diff.before_workspaces} -> {diff.after_workspaces} workspaces; "
+              f"created {diff.created}, archived {diff.archived}, unarchived {diff.unarchived}, deleted {diff.deleted}")
+        if diff.duplicate_ids or diff.unidentified:
+            print(f"  skipped in {diff.after_path}: {diff.duplicate_ids} repeated workspaceId, {diff.unidentified} without workspaceId")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump([asdict(diff) for diff in diffs], f, indent=2)
+            f.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
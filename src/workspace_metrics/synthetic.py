@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+"""
+Synthetic workspace export generator.
+
+Writes Mongo extended-JSON workspace documents shaped like the real
+p_msde_szr.workspaces exports, as a JSON array or as JSON Lines, streaming to
+disk so any size (10K .. 100M docs) fits in constant memory. Output is
+deterministic for a given seed.
+
+What the data exercises:
+- _id.$oid whose first 8 hex chars are the creation time (the ObjectId fallback)
+- createdAt.$date, missing on a share of docs, unparseable on a few
+- workspaceId as an int, or dict-shaped ({"$oid": ...} / {"$numberLong": ...})
+- eonids drawn from a Zipf-like distribution (a few departments own most
+  workspaces), some missing or string-typed
+- archived more likely the older the workspace
+- instance / readRole / writeRole distributions
+
+    python -m workspace_metrics.synthetic --docs 100000 --format array --out ws_100k.json
+    python -m workspace_metrics.synthetic --docs 10000000 --format jsonl --out ws_10m.jsonl --seed 3
+"""
+
+import argparse
+import bisect
+import itertools
+import json
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, TextIO
+
+# ---------- CONFIG ---------- #
+
+FIRST_CREATED = datetime(2019, 1, 1, tzinfo=timezone.utc)
+LAST_CREATED = datetime(2025, 12, 31, 23, 59, 59, tzinfo=timezone.utc)
+
+INSTANCES = {"prod-us": 0.55, "prod-eu": 0.25, "prod-apac": 0.12, "staging": 0.08}
+READ_ROLES = {"viewer": 0.7, "reader": 0.2, "none": 0.1}
+WRITE_ROLES = {"editor": 0.6, "admin": 0.3, "none": 0.1}
+
+
+@dataclass
+class SyntheticConfig:
+    docs: int
+    seed: int = 7
+    # Share of docs without createdAt (creation time only in _id.$oid)
+    missing_created_at: float = 0.03
+    # Share of docs whose createdAt.$date cannot be parsed
+    bad_created_at: float = 0.001
+    # Share of docs with a dict-shaped workspaceId
+    dict_workspace_id: float = 0.05
+    # Share of docs without an eonid / with a string eonid
+    missing_eonid: float = 0.02
+    string_eonid: float = 0.05
+    distinct_eonids: int = 2000
+    # Zipf exponent of the eonid distribution; higher is more skewed
+    eonid_skew: float = 1.2
+    # Chance a workspace created at FIRST_CREATED is archived; falls linearly to archived_newest
+    archived_oldest: float = 0.6
+    archived_newest: float = 0.05
+
+
+def _weighted_picker(rng: random.Random, weights: Dict[str, float]):
+    names = list(weights)
+    cumulative = list(itertools.accumulate(weights.values()))
+    total = cumulative[-1]
+    return lambda: names[bisect.bisect_left(cumulative, rng.random() * total)]
+
+
+def _format_date(value: datetime) -> str:
+    # Same shape as mongoexport: millisecond precision, Z suffix
+    return value.strftime("%Y-%m-%dT%H:%M:%S.") + f"{value.microsecond // 1000:03d}Z"
+
+
+def generate_documents(config: SyntheticConfig) -> Iterator[Dict]:
+    rng = random.Random(config.seed)
+    pick_instance = _weighted_picker(rng, INSTANCES)
+    pick_read_role = _weighted_picker(rng, READ_ROLES)
+    pick_write_role = _weighted_picker(rng, WRITE_ROLES)
+
+    eonid_weights = [1 / (rank + 1) ** config.eonid_skew for rank in range(config.distinct_eonids)]
+    eonid_cumulative = list(itertools.accumulate(eonid_weights))
+    eonid_total = eonid_cumulative[-1]
+
+    span = (LAST_CREATED - FIRST_CREATED).total_seconds()
+    for n in range(config.docs):
+        # Creation times skew towards recent years (adoption grows over time)
+        age = rng.random() ** 1.6
+        created_at = LAST_CREATED - timedelta(seconds=age * span, microseconds=rng.randrange(1000) * 1000)
+        oid = f"{int(created_at.timestamp()):08x}{rng.getrandbits(64):016x}"
+
+        doc: Dict = {"_id": {"$oid": oid}, "instance": pick_instance()}
+
+        workspace_id = 100000 + n
+        roll = rng.random()
+        if roll < config.dict_workspace_id / 2:
+            doc["workspaceId"] = {"$oid": f"{rng.getrandbits(96):024x}"}
+        elif roll < config.dict_workspace_id:
+            doc["workspaceId"] = {"$numberLong": str(workspace_id)}
+        else:
+            doc["workspaceId"] = workspace_id
+
+        roll = rng.random()
+        if roll >= config.missing_eonid:
+            rank = bisect.bisect_left(eonid_cumulative, rng.random() * eonid_total)
+            eonid = 10000 + rank
+            doc["eonid"] = str(eonid) if roll < config.missing_eonid + config.string_eonid else eonid
+
+        archived_chance = config.archived_newest + (config.archived_oldest - config.archived_newest) * age
+        doc["archived"] = rng.random() < archived_chance
+
+        roll = rng.random()
+        if roll < config.bad_created_at:
+            doc["createdAt"] = {"$date": created_at.strftime("%d/%m/%Y %H:%M")}
+        elif roll >= config.bad_created_at + config.missing_created_at:
+            doc["createdAt"] = {"$date": _format_date(created_at)}
+
+        doc["readRole"] = pick_read_role()
+        doc["writeRole"] = pick_write_role()
+        doc["name"] = f"workspace-{n}"
+        yield doc
+
+
+def write_export(out: TextIO, docs: Iterator[Dict], fmt: str) -> int:
+    """Stream docs to `out` as a JSON array ("array") or JSON Lines ("jsonl"); returns the doc count."""
+    count = 0
+    if fmt == "jsonl":
+        for doc in docs:
+            out.write(json.dumps(doc, separators=(",", ":")))
+            out.write("\n")
+            count += 1
+        return count
+
+    out.write("[\n")
+    for doc in docs:
+        if count:
+            out.write(",\n")
+        out.write(json.dumps(doc, separators=(",", ":")))
+        count += 1
+    out.write("\n]\n")
+    return count
+
+
+def generate_file(path: str, config: SyntheticConfig, fmt: str = "array") -> int:
+    with open(path, "w", encoding="utf-8") as out:
+        return write_export(out, generate_documents(config), fmt)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, required=True)
+    parser.add_argument("--format", choices=["array", "jsonl"], default="array")
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--missing-created-at", type=float, default=SyntheticConfig.missing_created_at)
+    parser.add_argument("--dict-workspace-id", type=float, default=SyntheticConfig.dict_workspace_id)
+    parser.add_argument("--distinct-eonids", type=int, default=SyntheticConfig.distinct_eonids)
+    parser.add_argument("--eonid-skew", type=float, default=SyntheticConfig.eonid_skew)
+    args = parser.parse_args(argv)
+
+    config = SyntheticConfig(
+        docs=args.docs,
+        seed=args.seed,
+        missing_created_at=args.missing_created_at,
+        dict_workspace_id=args.dict_workspace_id,
+        distinct_eonids=args.distinct_eonids,
+        eonid_skew=args.eonid_skew,
+    )
+    count = generate_file(args.out, config, args.format)
+    print(f"Wrote {count} workspaces to {args.out} ({args.format})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import json
+import os
+
+import pytest
+
+from workspace_metrics import batch, memo
+from workspace_metrics.memo import ResultCache
+
+_analyze = batch._analyze
+
+
+def _export(tmp_path, name, docs):
+    path = tmp_path / name
+    path.write_text(json.dumps(docs))
+    return str(path)
+
+
+def _workspace(workspace_id, created, archived=False):
+    return {"workspaceId": workspace_id, "createdAt": {"$date": created}, "archived": archived}
+
+
+def _dies_on_bad_snapshots(analyzer, path):
+    if "bad" in os.path.basename(path):
+        os._exit(1)  # Like the OOM killer: no exception, the worker is just gone
+    return _analyze(analyzer, path)
+
+
+@pytest.fixture
+def snapshots(tmp_path, monkeypatch):
+    monkeypatch.setattr(memo, "result_cache", ResultCache(str(tmp_path / "cache")))
+    paths = [
+        _export(tmp_path, "2024-01-01.json", [_workspace(1, "2024-01-01T00:00:00Z")]),
+        _export(tmp_path, "2024-02-01.json", [_workspace(1, "2024-01-01T00:00:00Z"), _workspace(2, "2024-01-20T00:00:00Z")]),
+    ]
+    return [(path, batch.snapshot_date(path)) for path in paths]
+
+
+def test_unchanged_snapshots_are_not_dispatched_again(tmp_path, snapshots, monkeypatch):
+    first = batch.run_batch("countmetric", snapshots, workers=2, memory_limit_mb=0)
+    assert [entry["cached"] for entry in first] == [False, False]
+    assert all("result" in entry for entry in first)
+
+    dispatched = []
+    analyze_in_pool = batch._analyze_in_pool
+
+    def recording_analyze_in_pool(analyzer, entries, *args):
+        dispatched.extend(entries)
+        return analyze_in_pool(analyzer, entries, *args)
+
+    monkeypatch.setattr(batch, "_analyze_in_pool", recording_analyze_in_pool)
+    _export(tmp_path, "2024-02-01.json", [_workspace(1, "2024-01-01T00:00:00Z", archived=True)])
+    second = batch.run_batch("countmetric", snapshots, workers=2, memory_limit_mb=0)
+
+    assert [entry["cached"] for entry in second] == [True, False]
+    assert [entry["path"] for entry in dispatched] == [snapshots[1][0]]
+    assert second[0]["result"] == first[0]["result"]
+
+
+def test_only_the_snapshot_that_kills_its_worker_fails(tmp_path, snapshots, monkeypatch):
+    bad = _export(tmp_path, "bad-2024-03-01.json", [_workspace(3, "2024-03-01T00:00:00Z")])
+    monkeypatch.setattr(batch, "_analyze", _dies_on_bad_snapshots)
+
+    entries = batch.run_batch("countmetric", snapshots + [(bad, "2024-03-01")], workers=3, memory_limit_mb=0)
+
+    assert "result" in entries[0] and "result" in entries[1]
+    assert entries[2]["error"].startswith("BrokenProcessPool")
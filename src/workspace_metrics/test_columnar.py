@@ -0,0 +1,47 @@
+from datetime import date
+
+import pytest
+
+from workspace_metrics.columnar import columnar_format, open_table_writer, read_table, write_table
+
+pa = pytest.importorskip("pyarrow")
+
+
+def _table():
+    return pa.table({
+        "date": pa.array([date(2024, 1, 1), date(2024, 1, 2)], type=pa.date32()),
+        "created_count": pa.array([3, 0], type=pa.int64()),
+        "eonid": pa.array(["42", "Unknown"], type=pa.string()),
+    })
+
+
+@pytest.mark.parametrize("fmt, compression", [("parquet", "zstd"), ("parquet", "none"), ("arrow", "lz4"), ("arrow", "none")])
+def test_table_round_trips_with_its_types(tmp_path, fmt, compression):
+    path = str(tmp_path / "daily_metrics.bin")  # told apart by magic bytes, not the extension
+    write_table(_table(), path, fmt, compression)
+
+    assert columnar_format(path) == fmt
+    assert read_table(path).equals(_table())
+    assert read_table(path, columns=["created_count"]).column_names == ["created_count"]
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_table_writer_appends_batches(tmp_path, fmt):
+    path = str(tmp_path / f"records.{fmt}")
+    writer = open_table_writer(path, _table().schema, fmt)
+    writer.write(_table())
+    writer.write(_table().slice(1))
+    writer.close()
+
+    assert read_table(path).column("created_count").to_pylist() == [3, 0, 0]
+
+
+def test_rejects_unknown_formats_and_codecs(tmp_path):
+    path = tmp_path / "daily_metrics.json"
+    path.write_text("[]")
+
+    assert columnar_format(str(path)) is None
+    with pytest.raises(ValueError, match="not a Parquet or Arrow IPC file"):
+        read_table(str(path))
+    with pytest.raises(ValueError, match="does not support"):
+        write_table(_table(), str(tmp_path / "daily_metrics.arrow"), "arrow", "snappy")
@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+from workspace_metrics.lifecycle import LifecycleLog, parse_instant
+
+
+def _export(tmp_path, name, docs):
+    path = tmp_path / name
+    path.write_text(json.dumps(docs))
+    return str(path)
+
+
+def _workspace(workspace_id, created, archived=False, eonid=1, instance="prod"):
+    return {
+        "workspaceId": workspace_id,
+        "createdAt": {"$date": created},
+        "archived": archived,
+        "eonid": eonid,
+        "instance": instance,
+    }
+
+
+@pytest.fixture
+def log(tmp_path):
+    log = LifecycleLog(str(tmp_path / "lifecycle.sqlite"))
+    yield log
+    log.close()
+
+
+def test_workspace_first_seen_later_that_day_starts_at_its_created_at(tmp_path, log):
+    feb1 = _export(tmp_path, "feb1.json", [_workspace("w1", "2024-01-01T00:00:00Z")])
+    feb3 = _export(tmp_path, "feb3.json", [
+        _workspace("w1", "2024-01-01T00:00:00Z"),
+        _workspace("w3", "2024-02-03T12:00:00Z", eonid=2),
+    ])
+    log.add_snapshot(feb1, "2024-02-01")
+    log.add_snapshot(feb3, "2024-02-03")
+
+    assert log.active_at(parse_instant("2024-02-03T00:00:00Z")) == 1
+    assert log.active_at(parse_instant("2024-02-03T12:00:00Z")) == 2
+    assert log.active_by(parse_instant("2024-02-03T00:00:00Z"), "eonid") == {"1": 1}
+
+
+def test_archival_takes_effect_at_the_end_of_the_snapshot_day(tmp_path, log):
+    feb1 = _export(tmp_path, "feb1.json", [_workspace("w1", "2024-01-01T00:00:00Z")])
+    feb3 = _export(tmp_path, "feb3.json", [_workspace("w1", "2024-01-01T00:00:00Z", archived=True)])
+    log.add_snapshot(feb1, "2024-02-01")
+    log.add_snapshot(feb3, "2024-02-03")
+
+    assert log.active_at(parse_instant("2024-02-03T23:59:59Z")) == 1
+    assert log.active_at(parse_instant("2024-02-04")) == 0
+
+
+def test_first_snapshot_counts_workspaces_created_on_its_day(tmp_path, log):
+    feb1 = _export(tmp_path, "feb1.json", [
+        _workspace("w1", "2024-02-01T09:00:00Z"),
+        _workspace("w2", "2024-01-01T00:00:00Z", archived=True),
+    ])
+    assert log.add_snapshot(feb1, "2024-02-01") == {"workspaces": 2, "archived": 1}
+
+    assert log.active_at(parse_instant("2024-02-01T08:00:00Z")) == 0
+    assert log.active_at(parse_instant("2024-02-01T09:00:00Z")) == 1
+
+
+def test_add_snapshot_rejects_an_older_snapshot(tmp_path, log):
+    feb1 = _export(tmp_path, "feb1.json", [_workspace("w1", "2024-01-01T00:00:00Z")])
+    log.add_snapshot(feb1, "2024-02-01")
+
+    with pytest.raises(ValueError, match="not newer"):
+        log.add_snapshot(feb1, "2024-01-15")
@@ -0,0 +1,63 @@
+import bz2
+import gzip
+import json
+
+import pytest
+
+from workspace_metrics.loader import MissingDependencyError, export_compression, iter_export, read_export
+
+DOCS = [{"workspaceId": i, "createdAt": {"$date": "2024-01-01T00:00:00Z"}} for i in range(3)]
+JSONL = "".join(json.dumps(doc) + "\n" for doc in DOCS).encode("utf-8")
+
+
+def _zstd_compress(data):
+    try:
+        from compression import zstd  # Python 3.14+
+    except ImportError:
+        zstandard = pytest.importorskip("zstandard")
+        return zstandard.ZstdCompressor().compress(data)
+    return zstd.compress(data)
+
+
+@pytest.mark.parametrize("codec, compress", [("gzip", gzip.compress), ("bz2", bz2.compress), ("zstd", _zstd_compress)])
+def test_compressed_exports_are_detected_by_magic_bytes(tmp_path, codec, compress):
+    path = tmp_path / "workspaces.jsonl"  # the name says nothing about the codec
+    path.write_bytes(compress(JSONL))
+
+    assert export_compression(str(path)) == codec
+    assert list(iter_export(str(path))) == DOCS
+
+
+def test_plain_exports_are_read_as_text(tmp_path):
+    path = tmp_path / "workspaces.json.gz"  # nor does a misleading one
+    path.write_text(json.dumps(DOCS))
+
+    assert export_compression(str(path)) is None
+    assert list(iter_export(str(path))) == DOCS
+
+
+def test_large_compressed_export_streams_through_the_read_ahead(tmp_path, monkeypatch):
+    monkeypatch.setattr("workspace_metrics.loader.DECOMPRESS_CHUNK_BYTES", 64)
+    path = tmp_path / "workspaces.jsonl.gz"
+    path.write_bytes(gzip.compress(JSONL * 50))
+
+    assert read_export(str(path)) == (JSONL * 50).decode("utf-8")
+
+
+def test_zstd_without_a_decoder_names_the_missing_package(tmp_path, monkeypatch):
+    import builtins
+
+    real_import = builtins.__import__
+
+    def no_zstd(name, *args, **kwargs):
+        if name in ("compression", "zstandard"):
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+
+    path = tmp_path / "workspaces.jsonl.zst"
+    path.write_bytes(b"\x28\xb5\x2f\xfd" + bytes(16))
+    monkeypatch.setattr(builtins, "__import__", no_zstd)
+
+    assert export_compression(str(path)) == "zstd"
+    with pytest.raises(MissingDependencyError, match="zstandard"):
+        read_export(str(path))
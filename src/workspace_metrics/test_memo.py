@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from workspace_metrics import memo
+from workspace_metrics.memo import CacheMiss, ResultCache
+
+
+def _export(tmp_path, name, docs):
+    path = tmp_path / name
+    path.write_text(json.dumps(docs))
+    return str(path)
+
+
+class _Compute:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return {"run": self.calls}
+
+
+def test_result_is_reused_across_processes_until_the_export_changes(tmp_path):
+    export = _export(tmp_path, "workspaces.json", [{"workspaceId": 1}])
+    compute = _Compute()
+
+    assert ResultCache(str(tmp_path / "cache")).memoize("metric", (), export, compute) == {"run": 1}
+    # A fresh cache (another process) finds the pickled result on disk
+    assert ResultCache(str(tmp_path / "cache")).memoize("metric", (), export, compute) == {"run": 1}
+
+    _export(tmp_path, "workspaces.json", [{"workspaceId": 1}, {"workspaceId": 2}])
+    assert ResultCache(str(tmp_path / "cache")).memoize("metric", (), export, compute) == {"run": 2}
+    assert compute.calls == 2
+
+
+def test_config_and_results_version_are_part_of_the_key(tmp_path, monkeypatch):
+    export = _export(tmp_path, "workspaces.json", [{"workspaceId": 1}])
+    cache = ResultCache(str(tmp_path / "cache"))
+    compute = _Compute()
+
+    cache.memoize("metric", ("2024-01-01",), export, compute)
+    cache.memoize("metric", ("2024-02-01",), export, compute)
+    assert compute.calls == 2
+
+    monkeypatch.setattr(memo, "RESULTS_VERSION", memo.RESULTS_VERSION + 1)
+    assert cache.memoize("metric", ("2024-01-01",), export, compute) == {"run": 3}
+
+
+def test_lookup_only_never_computes(tmp_path):
+    cached = _export(tmp_path, "cached.json", [{"workspaceId": 1}])
+    fresh = _export(tmp_path, "fresh.json", [{"workspaceId": 2}])
+    cache = ResultCache(str(tmp_path / "cache"))
+    cache.memoize("metric", (), cached, _Compute())
+
+    with cache.lookup_only():
+        assert cache.memoize("metric", (), cached, _Compute()) == {"run": 1}
+        with pytest.raises(CacheMiss):
+            cache.memoize("metric", (), fresh, _Compute())
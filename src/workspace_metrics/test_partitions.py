@@ -0,0 +1,83 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from workspace_metrics.partitions import PartitionStore, convert_export, is_store
+
+pytest.importorskip("pyarrow")
+
+
+def _export(tmp_path, name, docs):
+    path = tmp_path / name
+    path.write_text(json.dumps(docs))
+    return str(path)
+
+
+def _workspace(workspace_id, created, archived=False):
+    return {"workspaceId": workspace_id, "createdAt": {"$date": created}, "archived": archived}
+
+
+def _utc(text):
+    return datetime.fromisoformat(text).replace(tzinfo=timezone.utc)
+
+
+DOCS = [
+    _workspace(1, "2024-01-05T00:00:00Z"),
+    _workspace(2, "2024-02-10T12:00:00Z", archived=True),
+    _workspace(3, "2024-01-20T00:00:00Z", archived=True),
+    _workspace(4, "2024-03-01T00:00:00Z"),
+    {"workspaceId": 5, "_id": {"$oid": "65c0000000000000000000aa"}},  # 2024-02-05, dated from the ObjectId
+    _workspace(2, "2024-02-28T23:59:59Z"),
+    {"workspaceId": 6},  # undated: only counted
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    convert_export(_export(tmp_path, "workspaces.json", DOCS), str(tmp_path / "store"))
+    return str(tmp_path / "store")
+
+
+def test_convert_writes_monthly_partitions_and_export_stats(store):
+    assert is_store(store)
+    partitions = PartitionStore(store)
+    assert [(p.month, p.rows, p.active, p.from_oid) for p in partitions.partitions] == [
+        ("2024-01", 2, 1, 0),
+        ("2024-02", 3, 2, 1),
+        ("2024-03", 1, 1, 0),
+    ]
+    # workspaceId 2 twice; the undated document is not among the distinct ids
+    assert (partitions.documents, partitions.undated, partitions.distinct_workspace_ids) == (7, 1, 5)
+
+
+@pytest.mark.parametrize("start, end", [
+    (None, None),
+    ("2024-02-01", None),
+    ("2024-01-10", "2024-02-10T12:00:00"),
+    ("2024-03-02", None),
+])
+def test_pruned_reads_match_a_filtered_full_scan(store, start, end):
+    start = _utc(start) if start else None
+    end = _utc(end) if end else None
+    full = PartitionStore(store).read().to_pylist()
+    expected = [row for row in full if (start is None or row["created_at"] >= start) and (end is None or row["created_at"] <= end)]
+
+    pruned = PartitionStore(store)
+    assert pruned.read(start, end).to_pylist() == expected
+    assert pruned.partitions_read == len(pruned.overlapping(start, end))
+    for active_only in (False, True):
+        for created_at_only in (False, True):
+            assert pruned.count(start, end, active_only, created_at_only) == sum(
+                1 for row in expected
+                if not (active_only and row["archived"]) and not (created_at_only and row["from_oid"])
+            )
+
+
+def test_whole_partitions_are_counted_from_the_manifest(store):
+    partitions = PartitionStore(store)
+
+    assert partitions.count(_utc("2024-01-01"), _utc("2024-02-29T23:59:59")) == 5
+    assert partitions.count(_utc("2024-01-01"), None, active_only=True) == 4
+    assert partitions.partitions_read == 0
+    assert [row["workspace_id"] for row in partitions.read().to_pylist()] == ["1", "2", "3", "4", "5", "2"]
@@ -0,0 +1,59 @@
+import json
+import time
+
+from workspace_metrics.profiling import NULL_PROFILER, StageProfiler
+
+
+def _slow(items, seconds):
+    for item in items:
+        time.sleep(seconds)
+        yield item
+
+
+def test_stage_records_time_records_and_memory_peak():
+    profiler = StageProfiler("metric.py", trace_memory=True)
+    try:
+        with profiler.stage("decode") as stage:
+            data = [bytes(1 << 16) for _ in range(16)]
+            time.sleep(0.01)
+            stage.records = len(data)
+    finally:
+        profiler.emit("-")
+
+    (stats,) = profiler.report()["stages"]
+    assert stats["name"] == "decode" and stats["records"] == 16
+    assert stats["wallSeconds"] >= 0.01
+    assert stats["recordsPerSecond"] == round(16 / profiler.stages[0].wall_seconds)
+    assert stats["peakAllocMiB"] >= 1
+
+
+def test_streamed_stages_charge_time_to_the_innermost_stage(tmp_path):
+    profiler = StageProfiler("dailymetrics.py", trace_memory=False)
+    with profiler.streamed(("decode", "normalise", "aggregate")) as stages:
+        docs = stages.wrap("decode", _slow(range(5), 0.02))
+        with stages.charge("aggregate") as stage:
+            total = 0
+            for item in stages.wrap("normalise", _slow(docs, 0.01)):
+                time.sleep(0.005)
+                total += item
+            stage.records = 5
+
+    profile = tmp_path / "profile.json"
+    profiler.emit(str(profile))
+    stats = {s["name"]: s for s in json.loads(profile.read_text())["stages"]}
+
+    assert [s["name"] for s in json.loads(profile.read_text())["stages"]] == ["decode", "normalise", "aggregate"]
+    assert stats["decode"]["records"] == stats["normalise"]["records"] == 5
+    # Each stage only pays for its own sleeps, not for the stages it pulls from
+    assert 0.1 <= stats["decode"]["wallSeconds"] < 0.15
+    assert 0.05 <= stats["normalise"]["wallSeconds"] < 0.1
+    assert 0.025 <= stats["aggregate"]["wallSeconds"] < 0.075
+
+
+def test_null_profiler_passes_items_through():
+    items = iter([1, 2, 3])
+    with NULL_PROFILER.streamed(("decode",)) as stages:
+        assert stages.wrap("decode", items) is items
+        assert stages.file("read") is None
+        with stages.charge("decode") as stage:
+            stage.records = 3
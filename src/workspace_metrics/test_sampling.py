@@ -0,0 +1,70 @@
+import json
+import math
+
+import pytest
+
+from workspace_metrics import memo
+from workspace_metrics.memo import ResultCache
+from workspace_metrics.results import Estimate
+from workspace_metrics.sampling import draw_sample, sample_size
+
+POPULATION = 5000
+# Archived workspaces sit in the older half, as in an export written in creation order
+ARCHIVED = {i for i in range(POPULATION // 2) if i % 5 < 3}
+
+
+def _archived(doc):
+    return doc["archived"]
+
+
+@pytest.fixture
+def export(tmp_path, monkeypatch):
+    monkeypatch.setattr(memo, "result_cache", ResultCache(str(tmp_path / "cache")))
+    path = tmp_path / "workspaces.jsonl"
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(POPULATION):
+            f.write(json.dumps({"workspaceId": i, "archived": i in ARCHIVED, "eonid": i % 4}) + "\n")
+    return str(path)
+
+
+def test_sample_size_bounds_the_interval_on_any_count():
+    n = sample_size(1_000_000, error=0.01)
+    assert n == 9513
+    # Worst case p = 0.5, with the finite population correction
+    half_width = 1.96 * math.sqrt(0.25 / n * (1 - n / 1_000_000))
+    assert half_width <= 0.01
+    # A small export is read almost whole
+    assert 95 <= sample_size(100, error=0.01) <= 100
+
+
+def test_intervals_cover_the_true_count_at_their_confidence(export):
+    covered = 0
+    for seed in range(100):
+        estimate = draw_sample(export, size=400, seed=seed).count(_archived)
+        covered += abs(estimate.value - len(ARCHIVED)) <= estimate.margin
+        expected_margin = 1.96 * POPULATION * math.sqrt(0.3 * 0.7 / 400 * (1 - 400 / POPULATION))
+        assert estimate.margin == pytest.approx(expected_margin, rel=0.2)
+    assert covered >= 88
+
+
+def test_stratified_sample_tightens_intervals(export):
+    uniform = draw_sample(export, size=400, seed=1).count(_archived)
+    stratified = draw_sample(export, size=400, strata=2, seed=1).count(_archived)
+
+    assert stratified.margin < uniform.margin * 0.9
+    assert abs(stratified.value - len(ARCHIVED)) <= stratified.margin
+
+
+def test_full_sample_is_exact(export):
+    sample = draw_sample(export, size=POPULATION, seed=3)
+
+    assert sample.count(_archived) == Estimate(len(ARCHIVED), 0.0)
+    assert sample.ratio(_archived, lambda doc: True).value == pytest.approx(len(ARCHIVED) / POPULATION)
+    assert sample.top(lambda doc: str(doc["eonid"]), 2)[0][1].value == POPULATION / 4
+
+
+def test_same_seed_draws_the_same_sample(export):
+    first = draw_sample(export, size=100, seed=42)
+    second = draw_sample(export, size=100, seed=42)
+
+    assert [s.items for s in first.strata] == [s.items for s in second.strata]
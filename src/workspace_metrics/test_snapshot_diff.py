@@ -0,0 +1,59 @@
+import json
+
+from workspace_metrics.snapshot_diff import diff_snapshots, workspace_key
+
+
+def _export(tmp_path, name, docs):
+    path = tmp_path / name
+    path.write_text(json.dumps(docs))
+    return str(path)
+
+
+def _workspace(workspace_id, created, archived=False):
+    return {"workspaceId": workspace_id, "createdAt": {"$date": created}, "archived": archived}
+
+
+def _events(snapshots):
+    rows = []
+    diffs = diff_snapshots(snapshots, rows.append)
+    return diffs, {(row[0], row[1]): row[2:] for row in rows}
+
+
+def test_workspace_key_matches_equal_ids_across_kinds():
+    assert workspace_key(42) == workspace_key("42") == workspace_key({"$numberLong": "42"})
+    assert workspace_key({"$oid": "65b0" * 6}) != workspace_key("65b0" * 6)
+    assert workspace_key(None) is None
+
+
+def test_diff_counts_every_kind_of_event(tmp_path):
+    jan = _export(tmp_path, "jan.json", [
+        _workspace(1, "2024-01-01T00:00:00Z"),
+        _workspace(2, "2024-01-01T00:00:00Z"),
+        _workspace(3, "2024-01-01T00:00:00Z", archived=True),
+    ])
+    feb = _export(tmp_path, "feb.json", [
+        _workspace(1, "2024-01-01T00:00:00Z", archived=True),
+        _workspace(3, "2024-01-01T00:00:00Z"),
+        _workspace(4, "2024-01-20T00:00:00Z"),
+    ])
+
+    diffs, events = _events([(jan, "2024-01-15"), (feb, "2024-02-01")])
+
+    diff = diffs[0]
+    assert (diff.created, diff.archived, diff.unarchived, diff.deleted) == (1, 1, 1, 1)
+    assert set(events) == {("archived", "1"), ("deleted", "2"), ("unarchived", "3"), ("created", "4")}
+
+
+def test_window_runs_to_the_end_of_the_later_snapshot_day(tmp_path):
+    feb1 = _export(tmp_path, "feb1.json", [_workspace(1, "2024-01-01T00:00:00Z")])
+    feb3 = _export(tmp_path, "feb3.json", [
+        _workspace(1, "2024-01-01T00:00:00Z", archived=True),
+        _workspace(3, "2024-02-03T12:00:00Z"),
+    ])
+
+    _, events = _events([(feb1, "2024-02-01"), (feb3, "2024-02-03")])
+
+    # Seen by the 2024-02-03 snapshot, so at any time up to the end of that day
+    assert events[("archived", "1")][:2] == ["2024-02-01T00:00:00Z", "2024-02-04T00:00:00Z"]
+    # Created that day after 00:00: still inside the window, so pinned to its createdAt
+    assert events[("created", "3")] == ["2024-02-03T12:00:00Z", "2024-02-03T12:00:00Z", "2024-02-03T12:00:00Z"]